@@ -10,6 +10,8 @@ from typing import Union
 from bitarray import bitarray
 from bitarray.util import int2ba, ba2int
 
+from okdmr.dmrlib.utils.profiler import profiled
+
 
 class AbstractBitCrcRegister(metaclass=abc.ABCMeta):
     """
@@ -277,6 +279,7 @@ class BitCrcCalculator:
         else:
             self._crc_register = BitCrcRegister(configuration)
 
+    @profiled("crc")
     def calculate_checksum(self, data: bitarray) -> bitarray:
         self._crc_register.init()
         self._crc_register.update(data)
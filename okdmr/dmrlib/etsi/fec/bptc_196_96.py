@@ -5,6 +5,7 @@ from bitarray import bitarray
 
 from okdmr.dmrlib.etsi.fec.hamming_13_9_3 import Hamming1393
 from okdmr.dmrlib.etsi.fec.hamming_15_11_3 import Hamming15113
+from okdmr.dmrlib.utils.profiler import profiled
 
 
 class BPTC19696:
@@ -325,6 +326,7 @@ class BPTC19696:
 
         return out
 
+    @profiled("bptc196.repair")
     @staticmethod
     def repair_if_necessary(bits: bitarray, deinterleaved: bool = False) -> bitarray:
         """
@@ -4,6 +4,8 @@ from typing import Union, List, Dict, Tuple
 from bitarray import bitarray
 from bitarray.util import ba2int
 
+from okdmr.dmrlib.utils.profiler import profiled
+
 
 class Trellis34:
     """
@@ -242,6 +244,7 @@ class Trellis34:
 
         return out
 
+    @profiled("trellis34.decode")
     @staticmethod
     def decode(encoded: bitarray, as_bytes: bool = False) -> Union[bitarray, bytes]:
         """
@@ -25,6 +25,7 @@ from okdmr.dmrlib.utils.bits_interface import BitsInterface
 from okdmr.dmrlib.utils.bytes_interface import BytesInterface
 from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
 from okdmr.kaitai.hytera.ip_site_connect_protocol import IpSiteConnectProtocol
+from okdmr.dmrlib.utils.profiler import profiled
 
 
 class Burst(BytesInterface):
@@ -32,6 +33,7 @@ class Burst(BytesInterface):
     ETSI TS 102 361-1 V2.5.1 (2017-10) - 4.2.2   Burst and frame structure
     """
 
+    @profiled("burst")
     def __init__(
         self,
         full_bits: bitarray = bitarray([0] * 264),
@@ -123,8 +125,14 @@ class Burst(BytesInterface):
         self._target_radio_id: int = 0
         self._target_radio_id_resolve_attempt: bool = False
         self.sequence_no: int = 0
+        self.network_sequence_no: int = 0
+        """ sequence number as received from network, unlike sequence_no it is not renumbered by processing stages """
         self.stream_no: bytes = bytes(4)
         self.transmission_type: TransmissionTypes = TransmissionTypes.Idle
+        self.timestamp: float = 0
+        """ capture (packet) timestamp, 0 if unknown """
+        self.peer: str = ""
+        """ network origin (ip:port) of the packet carrying the burst, empty if unknown """
         self.data: Optional[BitsInterface] = (
             self.extract_data() if self.is_data_or_control else None
         )
@@ -180,10 +188,25 @@ class Burst(BytesInterface):
         self.sequence_no = sequence_no
         return self
 
+    def set_network_sequence_no(self, sequence_no: int) -> "Burst":
+        """
+        Sequence number of received packet, sets also sequence_no, which processing stages can replace
+        """
+        self.network_sequence_no = sequence_no
+        return self.set_sequence_no(sequence_no)
+
     def set_stream_no(self, stream_no: bytes) -> "Burst":
         self.stream_no = stream_no
         return self
 
+    def set_timestamp(self, timestamp: float) -> "Burst":
+        self.timestamp = timestamp
+        return self
+
+    def set_peer(self, peer: str) -> "Burst":
+        self.peer = peer
+        return self
+
     def debug(self, printout: bool = True) -> str:
         self_repr = repr(self)
         if printout:
@@ -270,12 +293,61 @@ class Burst(BytesInterface):
             ),
         )
         b.set_stream_no(mmdvm.stream_id)
-        b.set_sequence_no(mmdvm.sequence_no)
+        b.set_network_sequence_no(mmdvm.sequence_no)
         b.source_radio_id = mmdvm.source_id
         b.target_radio_id = mmdvm.target_id
         b.timeslot = 1 if mmdvm.slot_no == Mmdvm2020.Timeslots.timeslot_1 else 2
+        if (
+            mmdvm.frame_type == Mmdvm2020.FrameTypes.voice_data
+            and 0 < mmdvm.data_type < 6
+        ):
+            # data type of voice frame is index of burst within superframe (B-F)
+            b.set_is_voice(VoiceBursts(VoiceBursts.VoiceBurstA.value + mmdvm.data_type))
         return b
 
+    def as_mmdvm(self, repeater_id: int, private_call: bool = False) -> bytes:
+        """
+        Builds MMDVM/Homebrew DMRD frame (53 bytes), inverse of from_mmdvm
+
+        :param repeater_id: id of repeater (peer) sending the frame
+        :param private_call: call type flag, bursts itself do not carry it
+        """
+        if self.is_data_or_control:
+            frame_type = Mmdvm2020.FrameTypes.data_or_data_sync
+            data_type = self.data_type.value
+        elif self.is_voice_superframe_start or (
+            self.voice_burst == VoiceBursts.VoiceBurstA
+        ):
+            frame_type = Mmdvm2020.FrameTypes.voice_sync
+            data_type = 0
+        else:
+            frame_type = Mmdvm2020.FrameTypes.voice_data
+            data_type = (
+                self.voice_burst.value - VoiceBursts.VoiceBurstA.value
+                if self.voice_burst != VoiceBursts.Unknown
+                else 0
+            )
+        stream_no: int = (
+            int.from_bytes(self.stream_no[:4], byteorder="big")
+            if isinstance(self.stream_no, bytes)
+            else self.stream_no
+        )
+        return (
+            b"DMRD"
+            + (self.sequence_no & 0xFF).to_bytes(1, byteorder="big")
+            + self.source_radio_id.to_bytes(3, byteorder="big")
+            + self.target_radio_id.to_bytes(3, byteorder="big")
+            + repeater_id.to_bytes(4, byteorder="big")
+            + (
+                (0x80 if self.timeslot == 2 else 0)
+                | (0x40 if private_call else 0)
+                | (frame_type.value << 4)
+                | (data_type & 0x0F)
+            ).to_bytes(1, byteorder="big")
+            + stream_no.to_bytes(4, byteorder="big")
+            + self.as_bytes()
+        )
+
     @staticmethod
     def from_hytera_ipsc(ipsc: Union[bytes, IpSiteConnectProtocol]) -> "Burst":
         ipsc: HyteraIPSC = (
@@ -319,7 +391,7 @@ class Burst(BytesInterface):
             )
 
         b.hytera_ipsc = ipsc
-        b.set_sequence_no(ipsc.sequence_number)
+        b.set_network_sequence_no(ipsc.sequence_number)
         b.source_radio_id = ipsc.source_radio_id
         b.target_radio_id = ipsc.destination_radio_id
         b.timeslot = 1 if ipsc.timeslot == Timeslot.Timeslot_1 else 2
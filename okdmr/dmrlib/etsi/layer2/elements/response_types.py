@@ -0,0 +1,31 @@
+import enum
+
+
+@enum.unique
+class ResponseTypes(enum.Enum):
+    """
+    ETSI TS 102 361-1 V2.5.1 (2017-10) - 8.3 Response packet format - Class (2 bits) and Type (3 bits) of
+    Confirmed Response packet Header (C_RHEAD), value is (class << 3) | type
+    """
+
+    ACK = 0b00001
+    NACK_IllegalFormat = 0b01000
+    NACK_PacketCRCError = 0b01001
+    NACK_MemoryFull = 0b01010
+    NACK_ReceivedFSNOutOfSequence = 0b01011
+    NACK_Undeliverable = 0b01100
+    NACK_ReceivedPacketOutOfSequence = 0b01101
+    NACK_InvalidUser = 0b01110
+    SACK = 0b10000
+
+    @classmethod
+    def _missing_(cls, value: object) -> "ResponseTypes":
+        raise ValueError(f"Response class/type is not defined for value {value}")
+
+    @property
+    def response_class(self) -> int:
+        return self.value >> 3
+
+    @property
+    def response_type(self) -> int:
+        return self.value & 0b111
@@ -11,6 +11,9 @@ from okdmr.dmrlib.utils.bits_interface import BitsInterface
 class TalkerAliasDataFormat(BitsInterface, enum.Enum):
     """
     ETSI TS 102 361-2 V2.4.1 (2017-10) - 7.2.18 Talker Alias Data Format
+
+    UnicodeUTF16LE keeps its name for compatibility, ETSI defines the format as UTF-16BE and radios transmit
+    the code units big-endian, so that is what encode/decode use
     """
 
     SevenBitCharacters = 0b00
@@ -22,7 +25,7 @@ class TalkerAliasDataFormat(BitsInterface, enum.Enum):
         if self.value == TalkerAliasDataFormat.SevenBitCharacters.value:
             return string.encode("646")
         elif self.value == TalkerAliasDataFormat.UnicodeUTF16LE.value:
-            return string.encode("utf-16-le")
+            return string.encode("utf-16-be")
         elif self.value == TalkerAliasDataFormat.UnicodeUTF8.value:
             return string.encode("utf8")
         elif self.value == TalkerAliasDataFormat.ISOEightBitCharacters.value:
@@ -32,7 +35,7 @@ class TalkerAliasDataFormat(BitsInterface, enum.Enum):
         if self.value == TalkerAliasDataFormat.SevenBitCharacters.value:
             return raw.decode("646")
         elif self.value == TalkerAliasDataFormat.UnicodeUTF16LE.value:
-            return raw.decode("utf-16-le")
+            return raw.decode("utf-16-be")
         elif self.value == TalkerAliasDataFormat.UnicodeUTF8.value:
             return raw.decode("utf8")
         elif self.value == TalkerAliasDataFormat.ISOEightBitCharacters.value:
@@ -153,10 +153,43 @@ class UDPIPv4CompressedHeader(BitsInterface, BytesInterface):
 
     @staticmethod
     def from_bytes(
-        data: bytes, endian: str = "big"
+        data: Union[bytes, bytearray, memoryview], endian: str = "big"
     ) -> Optional["UDPIPv4CompressedHeader"]:
-        return UDPIPv4CompressedHeader.from_bits(
-            bytes_to_bits(payload=data, endian=endian)
+        if endian != "big":
+            return UDPIPv4CompressedHeader.from_bits(
+                bytes_to_bits(payload=bytes(data), endian=endian)
+            )
+        # all header fields are byte-aligned, so parse them without converting whole payload to bits
+        assert (
+            len(data) >= 5
+        ), f"UDP/IPv4 compressed header must be at least 40 bits, got {len(data) * 8} instead"
+        spid: int = data[3] & 0x7F
+        dpid: int = data[4] & 0x7F
+        extended_headers: int = [spid, dpid].count(
+            UDPPortIdentifier.InExtendedHeader.value
+        )
+        data_start: int = 5 + 2 * extended_headers
+        assert (
+            len(data) >= data_start
+        ), f"With {extended_headers} UDP port(s) in extended header, we need at least {data_start * 8} bits, got {len(data) * 8}"
+
+        return UDPIPv4CompressedHeader(
+            ipv4_identification=int.from_bytes(data[0:2], byteorder="big"),
+            source_ip_address_id=data[2] >> 4,
+            destination_ip_address_id=data[2] & 0x0F,
+            udp_source_port_id=spid,
+            udp_destination_port_id=dpid,
+            extended_header_1=(
+                int.from_bytes(data[5:7], byteorder="big")
+                if extended_headers > 0
+                else None
+            ),
+            extended_header_2=(
+                int.from_bytes(data[7:9], byteorder="big")
+                if extended_headers > 1
+                else None
+            ),
+            user_data=bytes_to_bits(payload=data[data_start:]),
         )
 
     def as_bytes(self, endian: Literal["big", "little"] = "big") -> bytes:
@@ -0,0 +1,301 @@
+import os
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from okdmr.dmrlib.etsi.layer2.elements.data_types import DataTypes
+from okdmr.dmrlib.hytera.hytera_ipsc import HyteraIPSC
+from okdmr.dmrlib.hytera.ipsc_elements.call_type import CallType
+from okdmr.dmrlib.hytera.ipsc_elements.frame_type import FrameType
+from okdmr.dmrlib.hytera.ipsc_elements.packet_type import PacketType
+from okdmr.dmrlib.hytera.ipsc_elements.slot_type import SlotType
+from okdmr.dmrlib.hytera.ipsc_elements.timeslot import Timeslot
+from okdmr.dmrlib.utils.bits_bytes import half_byte_to_bytes
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+from okdmr.dmrlib.utils.profiler import profiled
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
+
+IPSC_FRAME_LENGTH: int = 72
+DMRD_FRAME_LENGTH: int = 53
+
+# DMRD byte 15, frame type (bits 5-4) and data type / voice burst index (bits 3-0)
+_VOICE: int = Mmdvm2020.FrameTypes.voice_data.value << 4
+_VOICE_SYNC: int = Mmdvm2020.FrameTypes.voice_sync.value << 4
+_DATA_SYNC: int = Mmdvm2020.FrameTypes.data_or_data_sync.value << 4
+
+_SLOT_TYPE_TO_DMRD_BITS: Dict[SlotType, int] = {
+    SlotType.PrivacyIndicator: _DATA_SYNC | DataTypes.PIHeader.value,
+    SlotType.VoiceLCHeader: _DATA_SYNC | DataTypes.VoiceLCHeader.value,
+    SlotType.TerminatorWithLC: _DATA_SYNC | DataTypes.TerminatorWithLC.value,
+    SlotType.CSBK: _DATA_SYNC | DataTypes.CSBK.value,
+    SlotType.DataHeader: _DATA_SYNC | DataTypes.DataHeader.value,
+    SlotType.Rate12Data: _DATA_SYNC | DataTypes.Rate12Data.value,
+    SlotType.Rate34Data: _DATA_SYNC | DataTypes.Rate34Data.value,
+    SlotType.VoiceFrameA: _VOICE_SYNC,
+    SlotType.VoiceFrameB: _VOICE | 1,
+    SlotType.VoiceFrameC: _VOICE | 2,
+    SlotType.VoiceFrameD: _VOICE | 3,
+    SlotType.VoiceFrameE: _VOICE | 4,
+    SlotType.VoiceFrameF: _VOICE | 5,
+}
+_TERMINATOR_BITS: int = _SLOT_TYPE_TO_DMRD_BITS[SlotType.TerminatorWithLC]
+
+# enum attribute access is slow, hot path uses plain ints
+_SYNC_OR_WAKEUP_SLOT_TYPES: Tuple[int, ...] = (
+    SlotType.VoiceOrDataSync.value & 0xFF,
+    SlotType.Wakeup.value & 0xFF,
+)
+_WAKEUP_CALL_TYPES: Tuple[int, ...] = (
+    CallType.WakeupCall_2.value,
+    CallType.WakeupCall_c.value,
+)
+_PRIVATE_CALL: int = CallType.PrivateCall.value
+_GROUP_CALL: int = CallType.GroupCall.value
+
+
+class IPSCMMDVMTranslator(LoggingTrait):
+    """
+    Translates Hytera IPSC frames (72 bytes) to MMDVM/Homebrew DMRD frames (53 bytes) and back
+
+    Bursts are not parsed, each direction owns preallocated frame template, constant parts (headers, reserved bytes,
+    repeater id, color code) are written once and only fields that change between frames (sequence, ids, timeslot,
+    slot/data type, payload) are patched, payload byteswap is done by slice assignment
+
+    IPSC does not carry stream ids, so they are generated per timeslot, stream ends with Terminator with LC,
+    IPSC Sync/Wakeup or change of call source/destination, or after stream_timeout seconds without frames,
+    IPSC Sync/Wakeup packets are not DMR data and are never forwarded to MMDVM
+
+    Per-frame latency can be measured with okdmr.dmrlib.utils.profiler (stages "ipsc_to_dmrd" and "dmrd_to_ipsc")
+    """
+
+    def __init__(
+        self,
+        repeater_id: int,
+        color_code: int = 1,
+        stream_timeout: float = 1.0,
+        sync_on_stream_start: bool = False,
+    ):
+        """
+        :param repeater_id: MMDVM repeater (peer) id, written to every DMRD frame
+        :param color_code: written to every IPSC frame, DMRD frames do not carry color code
+        :param stream_timeout: seconds without IPSC frames on timeslot, after which next frame starts new stream
+        :param sync_on_stream_start: precede first IPSC frame of each DMRD stream with IPSC Sync packet
+        """
+        assert 0 <= repeater_id <= 0xFFFFFFFF, f"Invalid repeater id {repeater_id}"
+        assert 0 <= color_code <= 0xF, f"Invalid color code {color_code}"
+        self.repeater_id: int = repeater_id
+        self.color_code: int = color_code
+        self.stream_timeout: float = stream_timeout
+        self.sync_on_stream_start: bool = sync_on_stream_start
+
+        self.dmrd_template: bytearray = bytearray(
+            b"DMRD"
+            + bytes(7)
+            + repeater_id.to_bytes(4, byteorder="big")
+            + bytes(DMRD_FRAME_LENGTH - 15)
+        )
+        self.ipsc_template: bytearray = self.__ipsc_template(
+            packet_type=PacketType.TypeA,
+            slot_type=SlotType.VoiceFrameA,
+            frame_type=FrameType.Data,
+        )
+        self.ipsc_sync_template: bytearray = self.__ipsc_template(
+            packet_type=PacketType.TypeB,
+            slot_type=SlotType.VoiceOrDataSync,
+            frame_type=FrameType.VoiceSync,
+        )
+
+        # IPSC slot type (both bytes are the same) -> DMRD byte 15 without timeslot and call type bits
+        self.dmrd_bits: Dict[int, int] = {
+            slot_type.value & 0xFF: bits
+            for slot_type, bits in _SLOT_TYPE_TO_DMRD_BITS.items()
+        }
+        # DMRD byte 15 without timeslot and call type bits -> IPSC (slot type bytes, packet type)
+        self.ipsc_slot: Dict[int, Tuple[bytes, int]] = {
+            bits: (
+                slot_type.value.to_bytes(2, byteorder="little"),
+                (
+                    PacketType.TerminatorWithLC.value
+                    if slot_type == SlotType.TerminatorWithLC
+                    else PacketType.TypeA.value
+                ),
+            )
+            for slot_type, bits in _SLOT_TYPE_TO_DMRD_BITS.items()
+        }
+        # voice burst A with non-zero data type is sent by some peers
+        self.ipsc_slot.setdefault(_VOICE, self.ipsc_slot[_VOICE_SYNC])
+
+        # per timeslot (index 0 = TS1) state, IPSC -> DMRD
+        self.dmrd_stream: List[Optional[bytes]] = [None, None]
+        self.dmrd_call: List[bytes] = [b"", b""]
+        self.dmrd_sequence: List[int] = [0, 0]
+        self.dmrd_last_frame: List[float] = [0.0, 0.0]
+        # per timeslot state, DMRD -> IPSC
+        self.ipsc_stream: List[bytes] = [b"", b""]
+        self.ipsc_sequence: List[int] = [0, 0]
+
+        self.to_dmrd: int = 0
+        self.to_ipsc: int = 0
+        self.dropped: int = 0
+
+    def __ipsc_template(
+        self, packet_type: PacketType, slot_type: SlotType, frame_type: FrameType
+    ) -> bytearray:
+        template: bytearray = bytearray(
+            HyteraIPSC(
+                call_type=CallType.GroupCall,
+                frame_type=frame_type,
+                packet_type=packet_type,
+                slot_type=slot_type,
+                timeslot=Timeslot.Timeslot_1,
+                sequence_number=0,
+                color_code=0,
+                destination_radio_id=0,
+                source_radio_id=0,
+                payload=bytes(34),
+            ).as_ipsc_bytes()
+        )
+        template[20:22] = half_byte_to_bytes(self.color_code)
+        return template
+
+    @staticmethod
+    def is_ipsc_sync_or_wakeup(ipsc: bytes) -> bool:
+        """
+        Same as Burst.from_hytera_ipsc detection of HyteraIPSCSync / HyteraIPSCWakeup, without parsing
+        """
+        return ipsc[18] in _SYNC_OR_WAKEUP_SLOT_TYPES or ipsc[62] in _WAKEUP_CALL_TYPES
+
+    @profiled("ipsc_to_dmrd")
+    def ipsc_to_dmrd(self, ipsc: bytes) -> Optional[bytes]:
+        """
+        :param ipsc: Hytera IPSC frame (72 bytes)
+        :return: DMRD frame, None if ipsc is Sync/Wakeup or not translatable
+        """
+        if len(ipsc) < IPSC_FRAME_LENGTH:
+            self.dropped += 1
+            return None
+
+        slot: int = 1 if ipsc[16] == 0x22 else 0
+        if self.is_ipsc_sync_or_wakeup(ipsc):
+            # announces upcoming call, next frame on timeslot starts new stream
+            self.dmrd_stream[slot] = None
+            return None
+
+        bits: Optional[int] = self.dmrd_bits.get(ipsc[18])
+        if bits is None:
+            self.dropped += 1
+            return None
+
+        now: float = monotonic()
+        call: bytes = ipsc[63:71]
+        if (
+            self.dmrd_stream[slot] is None
+            or self.dmrd_call[slot] != call
+            or now - self.dmrd_last_frame[slot] > self.stream_timeout
+        ):
+            self.dmrd_stream[slot] = os.urandom(4)
+            self.dmrd_call[slot] = call
+            self.dmrd_sequence[slot] = 0
+        self.dmrd_last_frame[slot] = now
+
+        frame: bytearray = self.dmrd_template
+        frame[4] = self.dmrd_sequence[slot]
+        self.dmrd_sequence[slot] = (self.dmrd_sequence[slot] + 1) & 0xFF
+        # ids are u4le shifted by 8 bits (see IpSiteConnectProtocol), so u3le at 64 and 68 -> u3be
+        frame[5:8] = ipsc[70:67:-1]
+        frame[8:11] = ipsc[66:63:-1]
+        frame[15] = (
+            (0x80 if slot else 0) | (0x40 if ipsc[62] == _PRIVATE_CALL else 0) | bits
+        )
+        frame[16:20] = self.dmrd_stream[slot]
+        # byteswapped 34 bytes -> 33 bytes of burst
+        frame[20:53:2] = ipsc[27:60:2]
+        frame[21:53:2] = ipsc[26:58:2]
+
+        if bits == _TERMINATOR_BITS:
+            self.dmrd_stream[slot] = None
+        self.to_dmrd += 1
+        return bytes(frame)
+
+    @profiled("dmrd_to_ipsc")
+    def dmrd_to_ipsc(self, dmrd: bytes) -> Tuple[bytes, ...]:
+        """
+        :param dmrd: MMDVM DMRD frame (53 bytes, trailing BER/RSSI bytes are ignored)
+        :return: IPSC frames, usually single one, preceded by IPSC Sync on stream start (if sync_on_stream_start),
+                 empty if DMRD frame is not translatable
+        """
+        if len(dmrd) < DMRD_FRAME_LENGTH or dmrd[:4] != b"DMRD":
+            self.dropped += 1
+            return ()
+
+        slot_bits: Optional[Tuple[bytes, int]] = self.ipsc_slot.get(dmrd[15] & 0x3F)
+        if slot_bits is None:
+            # Idle, MBC or Rate 1 data have no IPSC slot type
+            self.dropped += 1
+            return ()
+
+        slot: int = dmrd[15] >> 7
+        timeslot: bytes = b"\x22\x22" if slot else b"\x11\x11"
+        call_type: int = _PRIVATE_CALL if dmrd[15] & 0x40 else _GROUP_CALL
+
+        sync: Optional[bytes] = None
+        stream: bytes = dmrd[16:20]
+        if self.ipsc_stream[slot] != stream:
+            self.ipsc_stream[slot] = stream
+            if self.sync_on_stream_start:
+                sync = self.ipsc_sync(
+                    timeslot=timeslot,
+                    call_type=call_type,
+                    voice=(dmrd[15] & 0x30) != _DATA_SYNC,
+                    source=dmrd[5:8],
+                    destination=dmrd[8:11],
+                )
+
+        frame: bytearray = self.ipsc_template
+        frame[4] = self.ipsc_sequence[slot]
+        self.ipsc_sequence[slot] = (self.ipsc_sequence[slot] + 1) & 0xFF
+        frame[8] = slot_bits[1]
+        frame[16:18] = timeslot
+        frame[18:20] = slot_bits[0]
+        # 33 bytes of burst -> byteswapped 34 bytes, frame[58] stays zero (padding)
+        frame[27:60:2] = dmrd[20:53:2]
+        frame[26:58:2] = dmrd[21:53:2]
+        frame[62] = call_type
+        # u3be ids -> u3le ids at 64 and 68, lowest bytes of u4le fields stay zero
+        frame[64:67] = dmrd[10:7:-1]
+        frame[68:71] = dmrd[7:4:-1]
+
+        self.to_ipsc += 1
+        return (sync, bytes(frame)) if sync else (bytes(frame),)
+
+    def ipsc_sync(
+        self,
+        timeslot: bytes,
+        call_type: int,
+        voice: bool,
+        source: bytes,
+        destination: bytes,
+    ) -> bytes:
+        """
+        IPSC Sync packet (see HyteraIPSCSync), announcing call on timeslot
+
+        :param timeslot: IPSC timeslot bytes (Timeslot value, u2le)
+        :param call_type: CallType value
+        :param voice: voice or data call
+        :param source: u3be source radio id
+        :param destination: u3be destination radio id
+        """
+        slot: int = 1 if timeslot[0] == 0x22 else 0
+        frame: bytearray = self.ipsc_sync_template
+        frame[4] = self.ipsc_sequence[slot]
+        self.ipsc_sequence[slot] = (self.ipsc_sequence[slot] + 1) & 0xFF
+        frame[16:18] = timeslot
+        frame[22:24] = (
+            FrameType.VoiceSync if voice else FrameType.DataSyncOrCSBK
+        ).value.to_bytes(2, byteorder="little")
+        # ids within sync payload are u3be, each byte preceded by zero byte
+        frame[32:37:2] = destination
+        frame[38:43:2] = source
+        frame[62] = call_type
+        frame[64:67] = destination[::-1]
+        frame[68:71] = source[::-1]
+        return bytes(frame)
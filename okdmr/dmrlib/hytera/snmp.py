@@ -2,7 +2,7 @@ import asyncio
 import logging
 import string
 import sys
-from typing import Union, Literal, Dict
+from typing import Union, Literal, Dict, List, Optional
 
 from okdmr.dmrlib.utils.logging_trait import LoggingTrait
 
@@ -118,15 +118,67 @@ class SNMP(LoggingTrait):
         OID_CUR_ZONE_ALIAS,
     ]
 
+    ALL_TELEMETRY: list = [
+        OID_PSU_VOLTAGE,
+        OID_PA_TEMPERATURE,
+        OID_VSWR,
+        OID_TX_FWD_POWER,
+        OID_TX_REF_POWER,
+        OID_RSSI_TS1,
+        OID_RSSI_TS2,
+    ]
+    """ numeric values changing over time, suitable for periodic polling """
+
     OID_WALK_BASE_1: str = "1.3.6.1.4.1.40297.1.2.4"
     OID_WALK_BASE_2: str = "1.3.6.1.4.1.40297.1.2.1.2"
 
+    @staticmethod
+    def convert_value(oid: str, value: any) -> any:
+        if oid in SNMP.ALL_STRINGS:
+            return octet_string_to_utf8(str(value, "utf8"))
+        elif oid in SNMP.ALL_FLOATS and isinstance(value, bytes):
+            return int.from_bytes(value, byteorder="big")
+        return value
+
+    async def get_all(
+        self,
+        ip: str,
+        snmp_community: KNOWN_SNMP_COMMUNITIES = DEFAULT_SNMP_COMMUNITY,
+        timeout_secs: float = 2,
+        port: int = 161,
+        oids: Optional[List[str]] = None,
+    ) -> Dict[str, any]:
+        """
+        Reads all the known OIDs with single multi-OID GET request, raises on failure
+
+        :param ip:
+        :param snmp_community:
+        :param timeout_secs: timeout of the whole request
+        :param port: UDP port of SNMP agent
+        :param oids: subset of OIDs to read, defaults to ALL_KNOWN
+        :return: OID -> converted value
+        """
+        oids = oids or SNMP.ALL_KNOWN
+        # do not import sooner, so it's not required package on install
+        import puresnmp
+
+        client = puresnmp.PyWrapper(
+            client=puresnmp.Client(
+                ip=ip, port=port, credentials=puresnmp.V1(community=snmp_community)
+            )
+        )
+        values: list = await asyncio.wait_for(
+            fut=client.multiget(oids=oids), timeout=timeout_secs
+        )
+        return {oid: SNMP.convert_value(oid, value) for oid, value in zip(oids, values)}
+
     async def walk_ip(
         self,
         ip: str,
         snmp_community: KNOWN_SNMP_COMMUNITIES = DEFAULT_SNMP_COMMUNITY,
         first_try: bool = True,
-        timeout_secs: int = 2,
+        timeout_secs: float = 2,
+        port: int = 161,
     ) -> Dict[str, any]:
         # do not import sooner, so it's not required package on install
         import puresnmp
@@ -139,32 +191,22 @@ class SNMP(LoggingTrait):
         other_community: KNOWN_SNMP_COMMUNITIES = (
             "public" if snmp_community == "hytera" else "hytera"
         )
-        client = puresnmp.PyWrapper(
-            client=puresnmp.Client(
-                ip=ip, credentials=puresnmp.V1(community=snmp_community)
-            )
-        )
 
         # noinspection PyBroadException
         try:
-            for oid in SNMP.ALL_KNOWN:
-                snmp_result = await asyncio.wait_for(
-                    fut=client.get(oid=oid), timeout=timeout_secs
-                )
-
-                if oid in SNMP.ALL_STRINGS:
-                    snmp_result = octet_string_to_utf8(str(snmp_result, "utf8"))
-                elif oid in SNMP.ALL_FLOATS:
-                    snmp_result = int.from_bytes(snmp_result, byteorder="big")
-                snmp_data[oid] = snmp_result
+            snmp_data = await self.get_all(
+                ip=ip,
+                snmp_community=snmp_community,
+                timeout_secs=timeout_secs,
+                port=port,
+            )
             is_success = True
         except ConnectionRefusedError:
             self.log_error("SNMP failed, Connection to port 162 was refused")
         except SystemError as se:
             self.log_error("SNMP failed to obtain repeater info", se)
         except (
-            asyncio.exceptions.CancelledError,
-            puresnmp.api,
+            puresnmp.exc.SnmpError,
             asyncio.exceptions.TimeoutError,
             TimeoutError,
         ) as e:
@@ -173,10 +215,12 @@ class SNMP(LoggingTrait):
                     "Failed with SNMP family %s, trying with %s as well"
                     % (snmp_community, other_community)
                 )
-                await self.walk_ip(
+                snmp_data = await self.walk_ip(
                     ip=ip,
                     first_try=False,
                     snmp_community=other_community,
+                    timeout_secs=timeout_secs,
+                    port=port,
                 )
             else:
                 self.log_error("SNMP failed", e)
@@ -0,0 +1,125 @@
+import asyncio
+from time import time
+from typing import Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+from okdmr.dmrlib.hytera.snmp import (
+    SNMP,
+    KNOWN_SNMP_COMMUNITIES,
+    DEFAULT_SNMP_COMMUNITY,
+)
+from okdmr.dmrlib.storage.repeater import Repeater
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+ENRICHMENT_DONE_CALLBACK_TYPE = Optional[Callable[[Repeater], None]]
+
+
+class SNMPEnrichment(LoggingTrait):
+    """
+    Reads SNMP values of repeaters in background tasks, so packet handling (datagram protocols) is never blocked,
+    results are patched into RepeaterStorage and cached per repeater (and its IP) for ttl seconds
+    """
+
+    def __init__(
+        self,
+        storage: RepeaterStorage,
+        snmp: Optional[SNMP] = None,
+        max_concurrent: int = 8,
+        ttl: float = 300,
+        snmp_community: KNOWN_SNMP_COMMUNITIES = DEFAULT_SNMP_COMMUNITY,
+        timeout_secs: float = 2,
+        port: int = 161,
+    ):
+        """
+        :param storage: repeaters are patched with OID -> value, when the read finishes
+        :param snmp:
+        :param max_concurrent: number of repeaters being read at the same time
+        :param ttl: seconds for which successful read is not repeated, 0 to never expire
+        :param snmp_community: community to try first, the other known community is tried on timeout
+        :param timeout_secs: timeout of single SNMP request
+        :param port: UDP port of repeater SNMP agent
+        """
+        assert (
+            max_concurrent > 0
+        ), f"max_concurrent must be positive, got {max_concurrent}"
+        self.storage: RepeaterStorage = storage
+        self.snmp: SNMP = snmp or SNMP()
+        self.max_concurrent: int = max_concurrent
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.ttl: float = ttl
+        self.snmp_community: KNOWN_SNMP_COMMUNITIES = snmp_community
+        self.timeout_secs: float = timeout_secs
+        self.port: int = port
+        self.cache: Dict[UUID, Tuple[str, Dict[str, any], float]] = {}
+        """ repeater id -> (ip, snmp data, expiration timestamp) """
+        self.pending: Dict[UUID, asyncio.Task] = {}
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        """
+        Created lazily, inside the running event loop, on python 3.8 asyncio primitives bind to the current event
+        loop when constructed
+        """
+        if not self.semaphore:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self.semaphore
+
+    def cached(self, rpt: Repeater, now: Optional[float] = None) -> Optional[Dict]:
+        entry: Optional[Tuple[str, Dict[str, any], float]] = self.cache.get(rpt.id)
+        if not entry:
+            return None
+        if entry[0] != rpt.address_in[0] or (
+            self.ttl and entry[2] < (time() if now is None else now)
+        ):
+            del self.cache[rpt.id]
+            return None
+        return entry[1]
+
+    def enrich(
+        self, rpt: Repeater, callback: ENRICHMENT_DONE_CALLBACK_TYPE = None
+    ) -> Optional[asyncio.Task]:
+        """
+        Schedules SNMP read of repeater on running event loop and returns immediately
+
+        :param rpt:
+        :param callback: called with repeater when enrichment is finished (regardless the result), or immediately
+                         if SNMP is disabled for the repeater or valid cached result exists
+        :return: task reading the repeater, None if there is nothing to read
+        """
+        if not rpt.snmp_enabled or self.cached(rpt) is not None:
+            if callback:
+                callback(rpt)
+            return None
+
+        task: Optional[asyncio.Task] = self.pending.get(rpt.id)
+        if not task:
+            # concurrent requests for the same repeater share single read
+            task = asyncio.get_running_loop().create_task(self.read(rpt))
+            self.pending[rpt.id] = task
+            task.add_done_callback(lambda _: self.pending.pop(rpt.id, None))
+        if callback:
+            task.add_done_callback(lambda _: callback(rpt))
+        return task
+
+    async def read(self, rpt: Repeater) -> Dict[str, any]:
+        ip: str = rpt.address_in[0]
+        async with self.get_semaphore():
+            snmp_data: Dict[str, any] = await self.snmp.walk_ip(
+                ip=ip,
+                snmp_community=self.snmp_community,
+                timeout_secs=self.timeout_secs,
+                port=self.port,
+            )
+        if snmp_data:
+            self.cache[rpt.id] = (ip, snmp_data, time() + self.ttl)
+            self.storage.save(rpt=rpt, patch=snmp_data)
+        return snmp_data
+
+    async def close(self) -> None:
+        """
+        Cancels all the pending reads
+        """
+        tasks = list(self.pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,298 @@
+import asyncio
+import math
+from time import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+import numpy
+
+from okdmr.dmrlib.hytera.snmp import (
+    SNMP,
+    KNOWN_SNMP_COMMUNITIES,
+    DEFAULT_SNMP_COMMUNITY,
+)
+from okdmr.dmrlib.storage.repeater import Repeater
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+GOLDEN_RATIO_FRACTION: float = (math.sqrt(5) - 1) / 2
+""" offsets k * 0.618 (mod 1) are evenly spread over interval, regardless the number of repeaters """
+
+
+class TelemetryStats(NamedTuple):
+    count: int
+    min: float
+    max: float
+    avg: float
+    last: float
+
+
+class TimeSeries:
+    """
+    Fixed size ring buffer of (timestamp, value) samples, oldest samples are overwritten
+    """
+
+    def __init__(self, capacity: int = 1440):
+        """
+        :param capacity: number of samples kept, eg. 1440 is one day of samples polled every minute
+        """
+        assert capacity > 0, f"capacity must be positive, got {capacity}"
+        self.capacity: int = capacity
+        self.timestamps: numpy.ndarray = numpy.zeros(capacity, dtype=numpy.float64)
+        self.values: numpy.ndarray = numpy.zeros(capacity, dtype=numpy.float64)
+        self.position: int = 0
+        """ index where next sample will be written """
+        self.size: int = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, timestamp: float, value: float) -> None:
+        self.timestamps[self.position] = timestamp
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def ordered(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        :return: copies of (timestamps, values) from oldest to newest
+        """
+        if self.size < self.capacity:
+            return self.timestamps[: self.size].copy(), self.values[: self.size].copy()
+        order: numpy.ndarray = numpy.roll(numpy.arange(self.capacity), -self.position)
+        return self.timestamps[order], self.values[order]
+
+    def stats(self, since: Optional[float] = None) -> Optional[TelemetryStats]:
+        """
+        :param since: only samples with timestamp >= since are aggregated
+        :return: None if there are no matching samples
+        """
+        if not self.size:
+            return None
+        # samples are always stored from index 0, order does not matter for aggregates
+        values: numpy.ndarray = self.values[: self.size]
+        if since is not None:
+            values = values[self.timestamps[: self.size] >= since]
+            if not values.size:
+                return None
+        return TelemetryStats(
+            count=int(values.size),
+            min=float(values.min()),
+            max=float(values.max()),
+            avg=float(values.mean()),
+            last=float(self.values[self.position - 1]),
+        )
+
+
+class PollState:
+    """
+    Scheduling state of single repeater
+    """
+
+    def __init__(self, due: float):
+        self.due: float = due
+        self.in_flight: bool = False
+        self.failures: int = 0
+        """ consecutive failed polls """
+        self.latency: Optional[float] = None
+        """ exponentially weighted moving average of successful poll duration """
+        self.series: Dict[str, TimeSeries] = {}
+
+
+class TelemetryPoller(LoggingTrait):
+    """
+    Periodically polls numeric SNMP values (SNMP.ALL_TELEMETRY) of all SNMP-enabled repeaters in RepeaterStorage
+
+    Polls of repeaters are spread over the interval (to avoid bursts of requests), unresponsive repeaters are
+    polled less often (exponential backoff) and slow repeaters get longer timeout
+    """
+
+    def __init__(
+        self,
+        storage: RepeaterStorage,
+        interval: float = 60,
+        capacity: int = 1440,
+        oids: Optional[List[str]] = None,
+        snmp: Optional[SNMP] = None,
+        snmp_community: KNOWN_SNMP_COMMUNITIES = DEFAULT_SNMP_COMMUNITY,
+        timeout_secs: float = 2,
+        max_timeout_secs: float = 10,
+        max_backoff: int = 16,
+        max_concurrent: int = 16,
+        port: int = 161,
+    ):
+        """
+        :param storage: registry of polled repeaters, checked for new/removed repeaters before each round
+        :param interval: seconds between polls of single repeater
+        :param capacity: samples kept per repeater and OID
+        :param oids: polled OIDs, defaults to SNMP.ALL_TELEMETRY
+        :param snmp:
+        :param snmp_community:
+        :param timeout_secs: initial timeout of poll request
+        :param max_timeout_secs: limit of timeout for slow repeaters (4x average latency)
+        :param max_backoff: unresponsive repeater is polled at least once per max_backoff * interval
+        :param max_concurrent: number of polls in progress at the same time
+        :param port: UDP port of repeater SNMP agent
+        """
+        assert interval > 0, f"interval must be positive, got {interval}"
+        self.storage: RepeaterStorage = storage
+        self.interval: float = interval
+        self.capacity: int = capacity
+        self.oids: List[str] = oids or SNMP.ALL_TELEMETRY
+        self.snmp: SNMP = snmp or SNMP()
+        self.snmp_community: KNOWN_SNMP_COMMUNITIES = snmp_community
+        self.timeout_secs: float = timeout_secs
+        self.max_timeout_secs: float = max(max_timeout_secs, timeout_secs)
+        self.max_backoff: int = max_backoff
+        self.max_concurrent: int = max_concurrent
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.port: int = port
+        self.states: Dict[UUID, PollState] = {}
+        self.scheduled: int = 0
+        """ number of repeaters ever scheduled, to compute offset of the next one """
+        self.task: Optional[asyncio.Task] = None
+        self.polls: Dict[UUID, asyncio.Task] = {}
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        """
+        Created on first poll, same as SNMPEnrichment.get_semaphore, so it belongs to the loop running the polls
+        """
+        if not self.semaphore:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self.semaphore
+
+    def series(self, rpt: Repeater, oid: str) -> Optional[TimeSeries]:
+        state: Optional[PollState] = self.states.get(rpt.id)
+        return state.series.get(oid) if state else None
+
+    def stats(
+        self, rpt: Repeater, oid: str, since: Optional[float] = None
+    ) -> Optional[TelemetryStats]:
+        series: Optional[TimeSeries] = self.series(rpt, oid)
+        return series.stats(since=since) if series else None
+
+    def sync(self, now: Optional[float] = None) -> None:
+        """
+        Schedules repeaters newly found in storage, forgets the removed ones
+        """
+        now = time() if now is None else now
+        repeaters: Dict[UUID, Repeater] = {
+            rpt.id: rpt
+            for rpt in self.storage.all()
+            if rpt.snmp_enabled and rpt.address_in[0]
+        }
+        for rpt_id in list(self.states.keys()):
+            if rpt_id not in repeaters:
+                del self.states[rpt_id]
+        for rpt_id in repeaters.keys():
+            if rpt_id not in self.states:
+                offset: float = (self.scheduled * GOLDEN_RATIO_FRACTION) % 1
+                self.states[rpt_id] = PollState(due=now + offset * self.interval)
+                self.scheduled += 1
+
+    def due(self, now: Optional[float] = None) -> List[Repeater]:
+        now = time() if now is None else now
+        return [
+            rpt
+            for rpt in self.storage.all()
+            if rpt.id in self.states
+            and not self.states[rpt.id].in_flight
+            and self.states[rpt.id].due <= now
+        ]
+
+    def timeout(self, state: PollState) -> float:
+        if state.latency is None:
+            return self.timeout_secs
+        return min(self.max_timeout_secs, max(self.timeout_secs, state.latency * 4))
+
+    async def poll(self, rpt: Repeater) -> bool:
+        """
+        Polls single repeater and schedules next poll
+
+        :return: True if values were read
+        """
+        state: Optional[PollState] = self.states.get(rpt.id)
+        if not state:
+            return False
+        state.in_flight = True
+        success: bool = False
+        try:
+            async with self.get_semaphore():
+                started: float = time()
+                values: Dict[str, any] = await self.snmp.get_all(
+                    ip=rpt.address_in[0],
+                    snmp_community=self.snmp_community,
+                    timeout_secs=self.timeout(state),
+                    port=self.port,
+                    oids=self.oids,
+                )
+            finished: float = time()
+            for oid, value in values.items():
+                series: Optional[TimeSeries] = state.series.get(oid)
+                if not series:
+                    series = TimeSeries(capacity=self.capacity)
+                    state.series[oid] = series
+                series.append(finished, float(value))
+            duration: float = finished - started
+            state.latency = (
+                duration
+                if state.latency is None
+                else 0.8 * state.latency + 0.2 * duration
+            )
+            state.failures = 0
+            success = True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            state.failures += 1
+            self.log_debug(
+                f"Telemetry poll of {rpt.address_in[0]} failed ({state.failures}x): {type(e).__name__} {e}"
+            )
+        finally:
+            state.in_flight = False
+
+        # keep the phase within interval, skip rounds that were missed
+        step: float = self.interval * min(2**state.failures, self.max_backoff)
+        now: float = time()
+        state.due += step
+        if state.due <= now:
+            state.due += math.ceil((now - state.due) / step) * step
+        return success
+
+    async def run(self, tick: float = 1) -> None:
+        """
+        Polls repeaters until cancelled
+
+        :param tick: longest sleep between checks, new repeaters in storage are noticed within this time
+        """
+        while True:
+            now: float = time()
+            self.sync(now=now)
+            for rpt in self.due(now=now):
+                self.states[rpt.id].in_flight = True
+                task: asyncio.Task = asyncio.get_running_loop().create_task(
+                    self.poll(rpt)
+                )
+                self.polls[rpt.id] = task
+                task.add_done_callback(
+                    lambda _, rpt_id=rpt.id: self.polls.pop(rpt_id, None)
+                )
+            next_due: float = min(
+                (state.due for state in self.states.values() if not state.in_flight),
+                default=now + tick,
+            )
+            await asyncio.sleep(min(tick, max(0.0, next_due - time())))
+
+    def start(self, tick: float = 1) -> "TelemetryPoller":
+        self.task = asyncio.get_running_loop().create_task(self.run(tick=tick))
+        return self
+
+    async def close(self) -> None:
+        tasks: List[asyncio.Task] = list(self.polls.values())
+        if self.task:
+            tasks.append(self.task)
+            self.task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
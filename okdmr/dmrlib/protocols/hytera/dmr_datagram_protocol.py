@@ -0,0 +1,72 @@
+from asyncio import DatagramProtocol, transports
+from typing import Optional, Callable
+
+from okdmr.dmrlib.protocols.hytera.hytera_repeater_state import (
+    HyteraRepeaterState,
+    HyteraRepeaterStates,
+)
+from okdmr.dmrlib.storage import ADDRESS_TYPE
+from okdmr.dmrlib.storage.repeater import Repeater
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+IPSC_CALLBACK_TYPE = Callable[[bytes, Repeater], None]
+""" (raw Hytera IPSC frame, repeater that sent it) """
+
+
+class DMRDatagramProtocol(DatagramProtocol, LoggingTrait):
+    """
+    Hytera DMR port, repeaters are redirected here by P2P DMR startup request and send IPSC frames,
+    frames are not parsed, only repeaters registered over P2P are accepted
+    """
+
+    def __init__(
+        self,
+        storage: RepeaterStorage,
+        states: Optional[HyteraRepeaterStates] = None,
+        callback: Optional[IPSC_CALLBACK_TYPE] = None,
+    ):
+        """
+        :param storage:
+        :param states: repeater states shared with P2P/RDAC protocols, created for storage if not provided
+        :param callback: called with every IPSC frame received from registered repeater
+        """
+        self.transport: Optional[transports.DatagramTransport] = None
+        self.storage: RepeaterStorage = storage
+        self.states: HyteraRepeaterStates = (
+            states if states is not None else HyteraRepeaterStates(storage=storage)
+        )
+        self.callback: Optional[IPSC_CALLBACK_TYPE] = callback
+        self.received: int = 0
+        self.dropped: int = 0
+
+    def connection_made(self, transport: transports.BaseTransport) -> None:
+        self.transport = transport
+        self.log_debug("connection prepared")
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.log_info("connection lost")
+        if exc:
+            self.log_exception(exc)
+        self.transport = None
+
+    def datagram_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        state: Optional[HyteraRepeaterState] = self.states.get(
+            addr, service=HyteraRepeaterStates.SERVICE_DMR
+        )
+        if state is None or not state.registered:
+            self.dropped += 1
+            return
+        state.dmr_address = addr
+        self.received += 1
+        if self.callback:
+            self.callback(data, state.rpt)
+
+    def send(self, data: bytes, state: HyteraRepeaterState) -> bool:
+        """
+        :return: False if the repeater did not send any DMR data yet (its DMR address is unknown)
+        """
+        if not self.transport or not state.dmr_address:
+            return False
+        self.transport.sendto(data, state.dmr_address)
+        return True
@@ -0,0 +1,86 @@
+from typing import Tuple, Union, Any, Optional, Dict, List, Callable
+
+from okdmr.dmrlib.hytera.pdu.hdap import HDAP, HyteraServiceType
+from okdmr.dmrlib.hytera.pdu.hstrp import HSTRP
+from okdmr.dmrlib.protocols.hytera.hstrp_datagram_protocol import (
+    HSTRPDatagramProtocol,
+    HSTRP_ADDRESS_TYPE,
+)
+from okdmr.dmrlib.protocols.hytera.rrs_datagram_protocol import RRSDatagramProtocol
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+HDAP_HANDLER_TYPE = Callable[[HSTRPDatagramProtocol, HSTRP, HSTRP_ADDRESS_TYPE], None]
+""" (protocol/service that received the pdu, HSTRP with HDAP payload, peer address) """
+
+
+class HDAPDispatcher(LoggingTrait):
+    """
+    Dispatch table of HDAP payloads (by HyteraServiceType) to handlers, shared by all the service endpoints
+    """
+
+    def __init__(self):
+        self.handlers: Dict[HyteraServiceType, List[HDAP_HANDLER_TYPE]] = {}
+        self.counts: Dict[HyteraServiceType, int] = {}
+        self.unhandled: int = 0
+
+    def register(
+        self, service_type: HyteraServiceType, handler: HDAP_HANDLER_TYPE
+    ) -> "HDAPDispatcher":
+        self.handlers.setdefault(service_type, []).append(handler)
+        return self
+
+    def dispatch(
+        self,
+        protocol: HSTRPDatagramProtocol,
+        pdu: HSTRP,
+        addr: HSTRP_ADDRESS_TYPE,
+    ) -> bool:
+        """
+        @return: True if there was at least one handler for the payload service type
+        """
+        service_type: HyteraServiceType = pdu.payload.get_service_type()
+        self.counts[service_type] = self.counts.get(service_type, 0) + 1
+        handlers: Optional[List[HDAP_HANDLER_TYPE]] = self.handlers.get(service_type)
+        if not handlers:
+            self.unhandled += 1
+            return False
+        for handler in handlers:
+            handler(protocol, pdu, addr)
+        return True
+
+
+class HDAPDispatchingTrait:
+    """
+    Passes HDAP payloads received by HSTRPDatagramProtocol (sub)class to dispatcher, must precede the protocol
+    class in bases, so the protocol handles the datagram first
+    """
+
+    def __init__(
+        self, port: int, dispatcher: Optional[HDAPDispatcher] = None, **kwargs
+    ):
+        super().__init__(port=port, **kwargs)
+        self.dispatcher: HDAPDispatcher = dispatcher or HDAPDispatcher()
+
+    def datagram_received(
+        self, data: bytes, addr: Tuple[Union[str, Any], int]
+    ) -> Tuple[bool, Optional[HSTRP]]:
+        was_handled, pdu = super().datagram_received(data=data, addr=addr)
+        if pdu and isinstance(pdu.payload, HDAP):
+            was_handled = self.dispatcher.dispatch(self, pdu, addr) or was_handled
+        return was_handled, pdu
+
+
+class HDAPDatagramProtocol(HDAPDispatchingTrait, HSTRPDatagramProtocol):
+    """
+    HSTRP service endpoint (eg. GPS, TMS, telemetry, call control), HDAP payloads are passed to dispatcher
+    """
+
+    pass
+
+
+class RRSDispatchingDatagramProtocol(HDAPDispatchingTrait, RRSDatagramProtocol):
+    """
+    RRS endpoint, registrations are handled by RRSDatagramProtocol itself, then passed to dispatcher
+    """
+
+    pass
@@ -1,17 +1,112 @@
 import asyncio
-from asyncio import DatagramProtocol, DatagramTransport, BaseTransport
-from copy import deepcopy
+from asyncio import DatagramProtocol, DatagramTransport, BaseTransport, TimerHandle
+from collections import deque
 from datetime import datetime
-from typing import Optional, Tuple, Union, Any
+from time import time
+from typing import Optional, Tuple, Union, Any, Dict, Deque, Set, Callable
 
 from okdmr.dmrlib.hytera.pdu.hdap import HDAP
 from okdmr.dmrlib.hytera.pdu.hstrp import HSTRP, HSTRPPacketType
+from okdmr.dmrlib.utils.deadline_queue import DeadlineQueue
 from okdmr.dmrlib.utils.logging_trait import LoggingTrait
 
+HSTRP_ADDRESS_TYPE = Tuple[Union[str, Any], int]
+HSTRP_DELIVERY_CALLBACK_TYPE = Optional[Callable[[HSTRP, bool], None]]
+HSTRP_DEADLINE_KEY_TYPE = Tuple[Optional[HSTRP_ADDRESS_TYPE], int]
+""" (peer address, S/N of packet to retransmit or HSTRP_LIVENESS) """
+HSTRP_LIVENESS: int = -1
+
+
+class HSTRPPendingSend:
+    """
+    Outgoing HSTRP packet waiting for ACK
+    """
+
+    __slots__ = ("pdu", "data", "addr", "attempts", "callback")
+
+    def __init__(
+        self,
+        pdu: HSTRP,
+        addr: HSTRP_ADDRESS_TYPE,
+        callback: HSTRP_DELIVERY_CALLBACK_TYPE = None,
+    ):
+        self.pdu: HSTRP = pdu
+        self.data: bytes = pdu.as_bytes()
+        """ encoded once, retransmissions send the same bytes """
+        self.addr: HSTRP_ADDRESS_TYPE = addr
+        self.attempts: int = 0
+        self.callback: HSTRP_DELIVERY_CALLBACK_TYPE = callback
+
+
+class HSTRPDuplicateFilter:
+    """
+    Ring of recently received S/Ns, retransmitted packets (our ACK was lost) should not be delivered twice
+    """
+
+    def __init__(self, size: int = 64):
+        self.ring: Deque[int] = deque(maxlen=size)
+        self.seen: Set[int] = set()
+
+    def is_duplicate(self, sn: int) -> bool:
+        """
+        @param sn:
+        @return: True if sn was already received, otherwise remembers the sn and returns False
+        """
+        if sn in self.seen:
+            return True
+        if len(self.ring) == self.ring.maxlen:
+            self.seen.discard(self.ring[0])
+        self.ring.append(sn)
+        self.seen.add(sn)
+        return False
+
+    def clear(self) -> None:
+        self.ring.clear()
+        self.seen.clear()
+
+
+class HSTRPSession:
+    """
+    State of HSTRP connection with single peer (repeater/radio), identified by its address
+    """
+
+    def __init__(
+        self,
+        addr: Optional[HSTRP_ADDRESS_TYPE],
+        window: int = 16,
+        duplicate_ring_size: int = 64,
+    ):
+        self.addr: Optional[HSTRP_ADDRESS_TYPE] = addr
+        self.connected: bool = False
+        self.last_contact: datetime = datetime.now()
+        self.last_heartbeat: datetime = datetime.now()
+        self.sn: int = 0
+        self.window: int = window
+        self.pending: Dict[int, HSTRPPendingSend] = {}
+        """packets sent and waiting for ACK, by S/N"""
+        self.backlog: Deque[HSTRPPendingSend] = deque()
+        """packets waiting for free slot in window"""
+        self.duplicates: HSTRPDuplicateFilter = HSTRPDuplicateFilter(
+            size=duplicate_ring_size
+        )
+        self.data: Dict[str, Any] = {}
+        """per-peer state of application (HDAP) protocols"""
+
+    def increment_sn(self) -> int:
+        # HSTRP S/N is 2-bytes (16-bit) value
+        self.sn = (self.sn + 1) % 0xFFFF
+        return self.sn
+
+    def __repr__(self) -> str:
+        return f"[HSTRPSession {self.addr} {'CONNECTED' if self.connected else 'DISCONNECTED'} S/N:{self.sn} pending:{len(self.pending)}]"
+
 
 class HSTRPDatagramProtocol(DatagramProtocol, LoggingTrait):
     """
     HSTRP Protocol, handling HSTRP itself setup/teardown/timeout and passing data down to application protocol layer
+
+    Single instance (socket) serves any number of peers, each has own HSTRPSession (S/N, liveness, retransmissions),
+    timers of all the sessions are kept in single DeadlineQueue, serviced by single loop timer
     """
 
     T_HEARTBEAT: int = 6
@@ -20,27 +115,129 @@ class HSTRPDatagramProtocol(DatagramProtocol, LoggingTrait):
     """number of max lost/missed heartbeats, exceeding it means connection is considered lost"""
     T_NUMRETRY: int = 3
     """number of retries to deliver single HSTRP packet, not being able (or not receiving ACK in timeout) means HSTRP packet was not-delivered and should be discarded"""
+    T_RETRANSMIT: float = 1
+    """number of seconds to wait for ACK before first retransmission, doubled with each retry"""
+    DUPLICATE_RING_SIZE: int = 64
+    """number of recently received S/Ns remembered per peer"""
 
-    def __init__(self, port: int, be_active_peer: bool = False) -> None:
+    def __init__(
+        self,
+        port: int,
+        be_active_peer: bool = False,
+        window: int = 16,
+        retransmit_timeout: Optional[float] = None,
+        peer: Optional[HSTRP_ADDRESS_TYPE] = None,
+    ) -> None:
+        """
+        @param port:
+        @param be_active_peer:
+        @param window: max number of sent packets (per peer) waiting for ACK, others wait in backlog
+        @param retransmit_timeout: defaults to T_RETRANSMIT
+        @param peer: default peer (eg. repeater we connect to), defaults to remote address of transport
+        """
+        assert window > 0, f"window must be positive, got {window}"
         self.transport: Optional[DatagramTransport] = None
-        self.hstrp_connected: bool = False
-        self.hstrp_last_contact: datetime = datetime.now()
-        self.hstrp_last_heartbeat: datetime = datetime.now()
         self.port: int = port
-        self.sn: int = 0
         self.be_active_peer: bool = be_active_peer
+        self.hstrp_peer: Optional[HSTRP_ADDRESS_TYPE] = peer
+        """default peer, used where address is not provided"""
+        self.window: int = window
+        self.retransmit_timeout: float = (
+            retransmit_timeout if retransmit_timeout is not None else self.T_RETRANSMIT
+        )
+        self.sessions: Dict[Optional[HSTRP_ADDRESS_TYPE], HSTRPSession] = {}
+        self.deadlines: DeadlineQueue[HSTRP_DEADLINE_KEY_TYPE] = DeadlineQueue()
+        self.timer: Optional[TimerHandle] = None
+        self.timer_deadline: float = 0
 
-    def hstrp_increment_sn(self) -> int:
-        # HSTRP S/N is 2-bytes (16-bit) value
-        self.sn = (self.sn + 1) % 0xFFFF
-        return self.sn
-
-    def hstrp_set_connected(self, connected: bool = True) -> None:
-        if connected != self.hstrp_connected:
-            self.log_info(
-                f"HSTRP({self.port}) {'CONNECTED' if connected else 'DISCONNECTED'}"
+    def hstrp_session(
+        self, addr: Optional[HSTRP_ADDRESS_TYPE] = None, create: bool = True
+    ) -> Optional[HSTRPSession]:
+        """
+        @param addr: peer address, defaults to hstrp_peer
+        @param create: create session if it does not exist yet
+        @return: session of the peer
+        """
+        addr = addr or self.hstrp_peer
+        session: Optional[HSTRPSession] = self.sessions.get(addr)
+        if not session and create:
+            session = HSTRPSession(
+                addr=addr,
+                window=self.window,
+                duplicate_ring_size=self.DUPLICATE_RING_SIZE,
             )
-            self.hstrp_connected = connected
+            self.sessions[addr] = session
+            # sessions that are never connected, or go silent, are dropped by liveness check
+            self.hstrp_schedule((addr, HSTRP_LIVENESS), time() + self.T_HEARTBEAT)
+        return session
+
+    @property
+    def sn(self) -> int:
+        return self.hstrp_session().sn
+
+    @property
+    def hstrp_connected(self) -> bool:
+        return self.hstrp_session().connected
+
+    @property
+    def hstrp_last_contact(self) -> datetime:
+        return self.hstrp_session().last_contact
+
+    @property
+    def hstrp_last_heartbeat(self) -> datetime:
+        return self.hstrp_session().last_heartbeat
+
+    def hstrp_increment_sn(self, addr: Optional[HSTRP_ADDRESS_TYPE] = None) -> int:
+        return self.hstrp_session(addr).increment_sn()
+
+    def hstrp_set_connected(
+        self, connected: bool = True, addr: Optional[HSTRP_ADDRESS_TYPE] = None
+    ) -> None:
+        session: HSTRPSession = self.hstrp_session(addr)
+        if connected == session.connected:
+            return
+        self.log_info(
+            f"HSTRP({self.port}) {session.addr} {'CONNECTED' if connected else 'DISCONNECTED'}"
+        )
+        session.connected = connected
+        if connected:
+            # peer (re)started, its S/N sequence starts over
+            session.duplicates.clear()
+            self.hstrp_session_connected(session)
+        else:
+            self.hstrp_drop_session(session)
+            self.hstrp_session_disconnected(session)
+
+    def hstrp_drop_session(self, session: HSTRPSession) -> None:
+        """
+        Stops tracking the session, its pending and backlog packets are failed (callbacks notified with
+        delivered=False) without sending anything more to the peer
+        """
+        pending: Dict[int, HSTRPPendingSend] = session.pending
+        backlog: Deque[HSTRPPendingSend] = session.backlog
+        session.pending = {}
+        session.backlog = deque()
+        for sn in pending.keys():
+            self.deadlines.cancel((session.addr, sn))
+        self.deadlines.cancel((session.addr, HSTRP_LIVENESS))
+        if self.sessions.get(session.addr) is session:
+            del self.sessions[session.addr]
+        # callbacks may send again, that goes to new session, not the dropped one
+        for entry in (*pending.values(), *backlog):
+            if entry.callback:
+                entry.callback(entry.pdu, False)
+
+    def hstrp_session_connected(self, session: HSTRPSession) -> None:
+        """
+        Override to initialize application protocol state of the peer
+        """
+        pass
+
+    def hstrp_session_disconnected(self, session: HSTRPSession) -> None:
+        """
+        Override to clean up application protocol state of the peer, session is already removed from sessions
+        """
+        pass
 
     def hstrp_send_ack(
         self, addr: Tuple[Union[str, any], int], request: HSTRP, reject: bool = False
@@ -53,10 +250,20 @@ class HSTRPDatagramProtocol(DatagramProtocol, LoggingTrait):
         @param reject:
         @return: ACK HSTRP object
         """
-        ack: HSTRP = deepcopy(request)
-        ack.pkt_type.is_ack = not reject
-        ack.pkt_type.is_reject = reject
-        ack.payload = None
+        # request (and its options) is not modified, so it's shared instead of copied
+        ack: HSTRP = HSTRP(
+            pkt_type=HSTRPPacketType(
+                have_options=request.pkt_type.have_options,
+                is_reject=reject,
+                is_close=request.pkt_type.is_close,
+                is_connect=request.pkt_type.is_connect,
+                is_heartbeat=request.pkt_type.is_heartbeat,
+                is_ack=not reject,
+            ),
+            sn=request.sn,
+            options=request.options,
+            version=request.version,
+        )
         if self.transport:
             self.transport.sendto(data=ack.as_bytes(), addr=addr)
         return ack
@@ -69,11 +276,160 @@ class HSTRPDatagramProtocol(DatagramProtocol, LoggingTrait):
         @return:
         """
         hb: HSTRP = HSTRP(pkt_type=HSTRPPacketType(is_heartbeat=True), sn=0)
+        session: Optional[HSTRPSession] = self.hstrp_session(addr, create=False)
+        if session:
+            session.last_heartbeat = datetime.now()
         if self.transport:
             # self.log_debug(f"hstrp_send_heartbeat {repr(hb)}")
             self.transport.sendto(data=hb.as_bytes(), addr=addr)
         return hb
 
+    def hstrp_send_reliable(
+        self,
+        pdu: HSTRP,
+        addr: Optional[HSTRP_ADDRESS_TYPE] = None,
+        callback: HSTRP_DELIVERY_CALLBACK_TYPE = None,
+    ) -> HSTRP:
+        """
+        Will send pdu (or queue it, if the window is full) and retransmit it until ACK is received or T_NUMRETRY
+        retries are exhausted
+
+        @param pdu: S/N should be assigned by hstrp_increment_sn (of the same peer)
+        @param addr: defaults to hstrp_peer
+        @param callback: called with (pdu, delivered) when ACK/REJECT is received or delivery fails
+        @return: pdu
+        """
+        session: HSTRPSession = self.hstrp_session(addr)
+        entry = HSTRPPendingSend(pdu=pdu, addr=session.addr, callback=callback)
+        if len(session.pending) < session.window:
+            self.hstrp_transmit(session, entry)
+        else:
+            session.backlog.append(entry)
+        return pdu
+
+    def hstrp_transmit(
+        self,
+        session: HSTRPSession,
+        entry: HSTRPPendingSend,
+        now: Optional[float] = None,
+    ) -> None:
+        session.pending[entry.pdu.sn] = entry
+        if self.transport:
+            self.transport.sendto(data=entry.data, addr=entry.addr)
+        # exponential backoff
+        self.hstrp_schedule(
+            (session.addr, entry.pdu.sn),
+            (time() if now is None else now)
+            + self.retransmit_timeout * (2**entry.attempts),
+        )
+        entry.attempts += 1
+
+    def hstrp_resolve(
+        self,
+        sn: int,
+        delivered: bool,
+        addr: Optional[HSTRP_ADDRESS_TYPE] = None,
+    ) -> Optional[HSTRPPendingSend]:
+        """
+        Removes packet from pending, notifies its callback and sends next packet from backlog
+
+        @param sn:
+        @param delivered:
+        @param addr: peer address, defaults to hstrp_peer
+        @return: resolved pending packet, None if S/N was not pending
+        """
+        session: Optional[HSTRPSession] = self.hstrp_session(addr, create=False)
+        entry: Optional[HSTRPPendingSend] = (
+            session.pending.pop(sn, None) if session else None
+        )
+        if not entry:
+            return None
+        self.deadlines.cancel((session.addr, sn))
+        if entry.callback:
+            entry.callback(entry.pdu, delivered)
+        while session.backlog and len(session.pending) < session.window:
+            self.hstrp_transmit(session, session.backlog.popleft())
+        return entry
+
+    def hstrp_process_timers(self, now: Optional[float] = None) -> None:
+        """
+        Retransmits packets without ACK, discards those out of retries, sends heartbeats and checks liveness,
+        for all the peers
+
+        @param now: current timestamp, defaults to time()
+        """
+        now = time() if now is None else now
+        for addr, sn in self.deadlines.pop_expired(now):
+            session: Optional[HSTRPSession] = self.sessions.get(addr)
+            if not session:
+                continue
+            if sn == HSTRP_LIVENESS:
+                self.hstrp_check_liveness(session, now=now)
+                continue
+            entry: Optional[HSTRPPendingSend] = session.pending.get(sn)
+            if not entry:
+                continue
+            if entry.attempts > self.T_NUMRETRY:
+                self.log_warning(
+                    f"HSTRP({self.port}) {addr} S/N:{sn} not delivered after {entry.attempts} attempts"
+                )
+                self.hstrp_resolve(sn, delivered=False, addr=addr)
+            else:
+                self.hstrp_transmit(session, entry, now=now)
+
+    def hstrp_check_liveness(self, session: HSTRPSession, now: float) -> None:
+        if now - session.last_contact.timestamp() > self.T_HEARTBEAT * self.T_NUMBEAT:
+            if session.connected:
+                self.log_warning(
+                    f"HSTRP({self.port}) {session.addr} missed {self.T_NUMBEAT} heartbeats"
+                )
+                self.hstrp_set_connected(connected=False, addr=session.addr)
+            else:
+                # never connected and silent, packets queued for it are failed
+                self.hstrp_drop_session(session)
+            return
+        if (
+            session.connected
+            and session.addr
+            and now - session.last_heartbeat.timestamp() >= self.T_HEARTBEAT
+        ):
+            self.hstrp_send_heartbeat(session.addr)
+        self.hstrp_schedule(
+            (session.addr, HSTRP_LIVENESS),
+            max(session.last_heartbeat.timestamp(), now) + self.T_HEARTBEAT,
+        )
+
+    def hstrp_schedule(self, key: HSTRP_DEADLINE_KEY_TYPE, deadline: float) -> None:
+        self.deadlines.schedule(key, deadline)
+        self.hstrp_arm_timer()
+
+    def hstrp_arm_timer(self) -> None:
+        """
+        Schedules hstrp_process_timers for the earliest deadline, only if running in event loop
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        earliest: Optional[Tuple[float, HSTRP_DEADLINE_KEY_TYPE]] = (
+            self.deadlines.peek()
+        )
+        if not earliest:
+            return
+        if self.timer:
+            if self.timer_deadline <= earliest[0]:
+                return
+            self.timer.cancel()
+        self.timer_deadline = earliest[0]
+        self.timer = loop.call_later(
+            max(0.0, earliest[0] - time()), self.hstrp_on_timer
+        )
+
+    def hstrp_on_timer(self) -> None:
+        self.timer = None
+        self.hstrp_process_timers()
+        self.hstrp_arm_timer()
+
     def connection_made(self, transport: BaseTransport) -> None:
         assert isinstance(
             transport, BaseTransport
@@ -84,20 +440,35 @@ class HSTRPDatagramProtocol(DatagramProtocol, LoggingTrait):
             )
             self.transport.close()
         self.transport = transport
+        if not self.hstrp_peer:
+            # transport connected to remote_addr
+            self.hstrp_peer = transport.get_extra_info("peername")
 
     def connection_lost(self, exc: Union[Exception, None]) -> None:
-        self.hstrp_connected = False
+        for session in list(self.sessions.values()):
+            if session.connected:
+                self.hstrp_set_connected(connected=False, addr=session.addr)
+        self.sessions.clear()
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
 
     async def periodic_maintenance(self) -> None:
+        """
+        Connects to the default peer (hstrp_peer) and reconnects if the connection is lost, other peers are
+        expected to connect to us
+        """
         self.log_info(f"periodic maintenance START")
         while asyncio.get_running_loop() and not asyncio.get_running_loop().is_closed():
-            if not self.hstrp_connected:
+            if not self.hstrp_peer:
+                self.log_warning(f"HSTRP({self.port}) no peer to connect to")
+            elif not self.hstrp_connected:
                 self.log_info(f"sending connect")
                 self.transport.sendto(
                     data=HSTRP(
                         pkt_type=HSTRPPacketType(is_connect=True), sn=0
                     ).as_bytes(),
-                    addr=("192.168.22.18", self.port),
+                    addr=self.hstrp_peer,
                 )
             await asyncio.sleep(5)
         self.log_info(f"periodic maintenance STOP")
@@ -128,38 +499,57 @@ class HSTRPDatagramProtocol(DatagramProtocol, LoggingTrait):
             self.log_warning(f"received non HSTRP on {self.transport}")
             return was_handled, None
 
-        self.hstrp_last_contact = datetime.now()
+        session: HSTRPSession = self.hstrp_session(addr)
+        session.last_contact = datetime.now()
 
-        if pdu.pkt_type.is_connect:
+        if pdu.pkt_type.is_ack:
+            # received confirmation from peer
+            was_handled = True
+            was_confirmed = True
+            if pdu.pkt_type.is_connect:
+                # peer accepted our connection request (periodic_maintenance)
+                self.hstrp_set_connected(connected=True, addr=addr)
+            elif not pdu.pkt_type.is_close:
+                self.hstrp_resolve(pdu.sn, delivered=True, addr=addr)
+        elif pdu.pkt_type.is_connect:
             # connection request
             was_handled = True
             was_confirmed = True
-            self.hstrp_set_connected(connected=True)
+            if session.connected:
+                # peer restarted without closing, its S/N sequence starts over
+                session.duplicates.clear()
+            self.hstrp_set_connected(connected=True, addr=addr)
             self.hstrp_send_ack(addr, pdu)
         elif pdu.pkt_type.is_heartbeat:
             # heartbeat
             was_handled = True
             # HEARTBEAT is not confirmed protocol
             was_confirmed = True
-            if self.hstrp_connected:
-                # TODO use T_HEARTBEAT and send own heartbeats (not-just copy peer timer/heartbeats)
+            if (
+                session.connected
+                and time() - session.last_heartbeat.timestamp() >= self.T_HEARTBEAT
+            ):
+                # answer only peer that did not hear from us for T_HEARTBEAT, answering every heartbeat would
+                # bounce them between two endpoints, own heartbeats are sent by hstrp_check_liveness
                 self.hstrp_send_heartbeat(addr)
         elif pdu.pkt_type.is_close:
             # connection teardown
-            self.hstrp_set_connected(connected=False)
+            if session.connected:
+                self.hstrp_set_connected(connected=False, addr=addr)
             was_handled = True
             # CLOSE is not confirmed protocol
             was_confirmed = True
             # confirm connection closing hstrp message
             self.hstrp_send_ack(addr, pdu)
-        elif pdu.pkt_type.is_ack:
-            # received confirmation from peer
-            was_handled = True
-            was_confirmed = True
         elif pdu.pkt_type.is_reject:
             was_handled = True
-            self.log_warning(f"peer REJECT-ed our request S/N:{pdu.sn}")
+            self.log_warning(f"peer {addr} REJECT-ed our request S/N:{pdu.sn}")
             self.log_warning(repr(pdu))
+            self.hstrp_resolve(pdu.sn, delivered=False, addr=addr)
+        elif session.duplicates.is_duplicate(pdu.sn):
+            # our ACK was lost, confirm again, but do not deliver to upper layers
+            self.hstrp_send_ack(addr, pdu)
+            return True, None
 
         if not was_confirmed and not pdu.pkt_type.is_ack:
             # confirm all hstrp incoming messages, that are not confirmations
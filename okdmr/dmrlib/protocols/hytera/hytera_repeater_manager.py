@@ -0,0 +1,143 @@
+import asyncio
+from asyncio import DatagramProtocol
+from typing import Optional, List, Dict
+
+from okdmr.dmrlib.hytera.snmp_enrichment import SNMPEnrichment
+from okdmr.dmrlib.protocols.hytera.dmr_datagram_protocol import (
+    DMRDatagramProtocol,
+    IPSC_CALLBACK_TYPE,
+)
+from okdmr.dmrlib.protocols.hytera.hytera_repeater_state import (
+    HyteraRepeaterState,
+    HyteraRepeaterStates,
+)
+from okdmr.dmrlib.protocols.hytera.p2p_datagram_protocol import P2PDatagramProtocol
+from okdmr.dmrlib.protocols.hytera.rdac_datagram_protocol import (
+    RDACDatagramProtocol,
+    RDAC_FINISHED_CALLBACK_TYPE,
+)
+from okdmr.dmrlib.storage import ADDRESS_TYPE
+from okdmr.dmrlib.storage.repeater import Repeater
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+
+class HyteraRepeaterManager(LoggingTrait):
+    """
+    Serves P2P, RDAC and DMR ports of Hytera repeaters together, on single event loop
+
+    All three protocols share one HyteraRepeaterStates, so repeater registered over P2P is recognized on RDAC and
+    DMR ports, repeaters not heard from (on any port) for idle_timeout seconds are removed
+    """
+
+    def __init__(
+        self,
+        storage: Optional[RepeaterStorage] = None,
+        local_ip: str = "0.0.0.0",
+        p2p_port: int = 50000,
+        dmr_port: int = 50001,
+        rdac_port: int = 50002,
+        idle_timeout: float = 60,
+        dmr_callback: Optional[IPSC_CALLBACK_TYPE] = None,
+        rdac_callback: Optional[RDAC_FINISHED_CALLBACK_TYPE] = None,
+        snmp: Optional[SNMPEnrichment] = None,
+    ):
+        """
+        :param storage: registry of repeaters, new one is created if not provided
+        :param local_ip: address all the ports are bound to
+        :param p2p_port: 0 to bind ephemeral port (so do dmr_port and rdac_port), repeaters are redirected to
+                         the ports actually bound
+        :param idle_timeout: seconds after which silent repeater is removed
+        :param dmr_callback: called with every IPSC frame received from registered repeater
+        :param rdac_callback: called with repeater id, after RDAC identification and SNMP read finished
+        :param snmp: shared SNMP enrichment service, created for storage if not provided
+        """
+        self.storage: RepeaterStorage = (
+            storage if storage is not None else RepeaterStorage()
+        )
+        self.local_ip: str = local_ip
+        self.idle_timeout: float = idle_timeout
+        self.snmp: SNMPEnrichment = snmp or SNMPEnrichment(storage=self.storage)
+        self.states: HyteraRepeaterStates = HyteraRepeaterStates(storage=self.storage)
+        self.p2p: P2PDatagramProtocol = P2PDatagramProtocol(
+            storage=self.storage,
+            p2p_port=p2p_port,
+            rdac_port=rdac_port,
+            dmr_port=dmr_port,
+            snmp=self.snmp,
+            states=self.states,
+        )
+        self.rdac: RDACDatagramProtocol = RDACDatagramProtocol(
+            storage=self.storage,
+            callback=rdac_callback,
+            snmp=self.snmp,
+            states=self.states,
+        )
+        self.dmr: DMRDatagramProtocol = DMRDatagramProtocol(
+            storage=self.storage, states=self.states, callback=dmr_callback
+        )
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def protocols(self) -> Dict[str, DatagramProtocol]:
+        return {"p2p": self.p2p, "dmr": self.dmr, "rdac": self.rdac}
+
+    async def start(self) -> "HyteraRepeaterManager":
+        """
+        Binds all the ports and starts removing idle repeaters
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            for name, port in (
+                ("p2p", self.p2p.p2p_port),
+                ("dmr", self.p2p.dmr_port),
+                ("rdac", self.p2p.rdac_port),
+            ):
+                protocol: DatagramProtocol = self.protocols[name]
+                await loop.create_datagram_endpoint(
+                    lambda: protocol, local_addr=(self.local_ip, port)
+                )
+                self.log_debug(f"{name} listening on {self.local_addr(name)}")
+        except OSError:
+            await self.close()
+            raise
+        # ephemeral ports are known only after bind
+        self.p2p.p2p_port = self.local_addr("p2p")[1]
+        self.p2p.dmr_port = self.local_addr("dmr")[1]
+        self.p2p.rdac_port = self.local_addr("rdac")[1]
+        self.task = loop.create_task(self.periodic_maintenance())
+        return self
+
+    async def close(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for protocol in self.protocols.values():
+            if protocol.transport and not protocol.transport.is_closing():
+                protocol.transport.close()
+        await self.snmp.close()
+
+    def local_addr(self, name: str) -> Optional[ADDRESS_TYPE]:
+        """
+        :param name: one of p2p, dmr, rdac
+        """
+        transport = self.protocols[name].transport
+        return transport.get_extra_info("sockname") if transport else None
+
+    def remove_idle(self, now: Optional[float] = None) -> List[HyteraRepeaterState]:
+        return self.states.remove_idle(timeout=self.idle_timeout, now=now)
+
+    async def periodic_maintenance(self) -> None:
+        while not asyncio.get_running_loop().is_closed():
+            await asyncio.sleep(min(5.0, self.idle_timeout / 2))
+            self.remove_idle()
+
+    def send_dmr(self, data: bytes, rpt: Repeater) -> bool:
+        """
+        Sends IPSC frame to repeater DMR port
+
+        :return: False if the repeater is unknown or did not send any DMR data yet
+        """
+        state: Optional[HyteraRepeaterState] = self.states.by_id.get(rpt.id)
+        return self.dmr.send(data, state) if state else False
@@ -0,0 +1,211 @@
+from time import time
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from okdmr.dmrlib.storage import ADDRESS_TYPE, ADDRESS_EMPTY
+from okdmr.dmrlib.storage.repeater import Repeater
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+
+class HyteraRepeaterState:
+    """
+    Connection state of single Hytera repeater, shared by P2P, RDAC and DMR (IPSC) protocols
+    """
+
+    STORAGE_ATTR_IS_REGISTERED: str = "p2p_is_registered"
+    """ kept in sync with registered, for consumers of RepeaterStorage """
+
+    RDAC_STEP_START: int = 0
+    RDAC_STEP_FINISHED: int = 14
+
+    def __init__(self, rpt: Repeater):
+        self.rpt: Repeater = rpt
+        self.registered: bool = bool(rpt.attr(self.STORAGE_ATTR_IS_REGISTERED))
+        self.rdac_step: int = self.RDAC_STEP_START
+        self.rdac_started: float = 0.0
+        self.rdac_finished: float = 0.0
+        self.dmr_address: Optional[ADDRESS_TYPE] = None
+        """ address repeater sends DMR (IPSC) data from, DMR data for repeater are sent there """
+        self.addresses: Set[ADDRESS_TYPE] = set()
+        """ all (ip, port) this repeater sent datagrams from, on any of the ports """
+        self.last_seen: float = time()
+
+    def register(self) -> None:
+        self.registered = True
+        self.rpt.attr(self.STORAGE_ATTR_IS_REGISTERED, True)
+
+    @property
+    def rdac_done(self) -> bool:
+        return self.rdac_step == self.RDAC_STEP_FINISHED
+
+    def rdac_reset(self, now: Optional[float] = None) -> None:
+        self.rdac_step = self.RDAC_STEP_START
+        self.rdac_started = time() if now is None else now
+        self.rdac_finished = 0.0
+
+    def is_idle(self, timeout: float, now: Optional[float] = None) -> bool:
+        return (time() if now is None else now) - self.last_seen > timeout
+
+    def __repr__(self) -> str:
+        return (
+            f"[HyteraRepeater {self.rpt.dmr_id} {self.rpt.callsign} {self.rpt.address_in[0]} "
+            f"registered {self.registered} rdac step {self.rdac_step}]"
+        )
+
+
+class HyteraRepeaterStates(LoggingTrait):
+    """
+    Cache of HyteraRepeaterState by (ip, port) each datagram comes from, so protocols resolve repeater with single
+    dict lookup, repeater is matched in RepeaterStorage only for yet unknown address (by full address_in)
+
+    Repeater uses different source port for each of P2P, RDAC and DMR, and more repeaters can share single IP
+    (behind NAT), so unknown RDAC/DMR address is matched to repeater registered (over P2P) from the same IP, that
+    was redirected to the service, or to the only repeater registered from the IP
+    """
+
+    SERVICE_RDAC: str = "rdac"
+    SERVICE_DMR: str = "dmr"
+
+    def __init__(self, storage: RepeaterStorage):
+        self.storage: RepeaterStorage = storage
+        self.by_address: Dict[ADDRESS_TYPE, HyteraRepeaterState] = {}
+        self.by_id: Dict[UUID, HyteraRepeaterState] = {}
+        self.registered_by_ip: Dict[str, Dict[int, HyteraRepeaterState]] = {}
+        """ ip -> registered P2P port -> state """
+        self.redirects: Dict[Tuple[str, str], List[HyteraRepeaterState]] = {}
+        """ (ip, service) -> repeaters redirected to service port, which did not send from it yet, in order """
+
+    def get(
+        self,
+        address: ADDRESS_TYPE,
+        auto_create: bool = False,
+        service: Optional[str] = None,
+    ) -> Optional[HyteraRepeaterState]:
+        """
+        :param address: (ip, port) the datagram was received from
+        :param auto_create: create repeater (in storage) if no repeater is known for the address
+        :param service: SERVICE_RDAC or SERVICE_DMR, to match unknown address to registered repeater on the same IP,
+                        used only without auto_create
+        :return: state of repeater with last_seen updated, None if repeater is unknown
+        """
+        state: Optional[HyteraRepeaterState] = self.by_address.get(address)
+        if state is None:
+            state = self.__resolve(
+                address=address, auto_create=auto_create, service=service
+            )
+            if state is None:
+                return None
+        elif service and self.redirects:
+            # repeater reconnected from already known address
+            self.discard_redirect(state, service)
+        state.last_seen = time()
+        return state
+
+    def __resolve(
+        self, address: ADDRESS_TYPE, auto_create: bool, service: Optional[str]
+    ) -> Optional[HyteraRepeaterState]:
+        state: Optional[HyteraRepeaterState] = None
+        rpt: Optional[Repeater] = self.storage.match_incoming(
+            address=address, auto_create=auto_create
+        )
+        if rpt is not None:
+            state = self.by_id.get(rpt.id)
+            if state is None:
+                state = HyteraRepeaterState(rpt=rpt)
+                self.by_id[rpt.id] = state
+                if state.registered:
+                    self.index_registered(state)
+                self.log_debug(f"New repeater {address[0]}:{address[1]}")
+        elif service and not auto_create:
+            state = self.match_registered(address[0], service)
+        if state is None:
+            return None
+        if state.rpt.address_out == ADDRESS_EMPTY:
+            state.rpt.address_out = address
+        state.addresses.add(address)
+        self.by_address[address] = state
+        return state
+
+    def index_registered(self, state: HyteraRepeaterState) -> None:
+        (ip, port) = state.rpt.address_in
+        self.registered_by_ip.setdefault(ip, {})[port] = state
+
+    def register(self, state: HyteraRepeaterState) -> None:
+        """
+        Repeater registered over P2P, from its address_in
+        """
+        state.register()
+        self.index_registered(state)
+
+    def redirect(self, state: HyteraRepeaterState, service: str) -> None:
+        """
+        Repeater was redirected (over P2P) to service port, next unknown address on that port and IP belongs to it
+        """
+        pending: List[HyteraRepeaterState] = self.redirects.setdefault(
+            (state.rpt.address_in[0], service), []
+        )
+        if state not in pending:
+            pending.append(state)
+
+    def discard_redirect(self, state: HyteraRepeaterState, service: str) -> None:
+        key: Tuple[str, str] = (state.rpt.address_in[0], service)
+        pending: Optional[List[HyteraRepeaterState]] = self.redirects.get(key)
+        if pending and state in pending:
+            pending.remove(state)
+            if not pending:
+                del self.redirects[key]
+
+    def match_registered(self, ip: str, service: str) -> Optional[HyteraRepeaterState]:
+        pending: Optional[List[HyteraRepeaterState]] = self.redirects.get((ip, service))
+        if pending:
+            state: HyteraRepeaterState = pending.pop(0)
+            if not pending:
+                del self.redirects[(ip, service)]
+            return state
+        registered: Dict[int, HyteraRepeaterState] = self.registered_by_ip.get(ip, {})
+        if len(registered) == 1:
+            return next(iter(registered.values()))
+        # not redirected and more repeaters registered behind the same IP, cannot tell which one it is
+        return None
+
+    def remove(self, state: HyteraRepeaterState) -> None:
+        """
+        Forgets the repeater, including its record in RepeaterStorage
+        """
+        if self.by_id.pop(state.rpt.id, None) is None:
+            return
+        for address in state.addresses:
+            if self.by_address.get(address) is state:
+                del self.by_address[address]
+        (ip, port) = state.rpt.address_in
+        registered: Dict[int, HyteraRepeaterState] = self.registered_by_ip.get(ip, {})
+        if registered.get(port) is state:
+            del registered[port]
+            if not registered:
+                del self.registered_by_ip[ip]
+        for service in (self.SERVICE_RDAC, self.SERVICE_DMR):
+            self.discard_redirect(state, service)
+        self.storage.remove(state.rpt)
+
+    def remove_idle(
+        self, timeout: float, now: Optional[float] = None
+    ) -> List[HyteraRepeaterState]:
+        """
+        :param timeout: repeaters not heard from for this many seconds are removed
+        :return: removed repeaters
+        """
+        now = time() if now is None else now
+        idle: List[HyteraRepeaterState] = [
+            state for state in self.by_id.values() if state.is_idle(timeout, now)
+        ]
+        for state in idle:
+            self.log_info(f"Removing {state}, no packet for {timeout}s")
+            self.remove(state)
+        return idle
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def all(self) -> List[HyteraRepeaterState]:
+        return list(self.by_id.values())
@@ -1,7 +1,12 @@
 from asyncio import DatagramProtocol, DatagramTransport, BaseTransport
 from socket import socket
-from typing import Optional
+from typing import Optional, Dict, Callable
 
+from okdmr.dmrlib.hytera.snmp_enrichment import SNMPEnrichment
+from okdmr.dmrlib.protocols.hytera.hytera_repeater_state import (
+    HyteraRepeaterState,
+    HyteraRepeaterStates,
+)
 from okdmr.dmrlib.storage import ADDRESS_TYPE
 from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
 from okdmr.dmrlib.utils.logging_trait import LoggingTrait
@@ -21,19 +26,36 @@ class P2PDatagramProtocol(DatagramProtocol, LoggingTrait):
         PACKET_TYPE_REQUEST_REGISTRATION,
     ]
 
-    STORAGE_ATTR_IS_REGISTERED = "p2p_is_registered"
+    STORAGE_ATTR_IS_REGISTERED = HyteraRepeaterState.STORAGE_ATTR_IS_REGISTERED
 
     def __init__(
         self,
         storage: RepeaterStorage,
         p2p_port: int = 50000,
         rdac_port: int = 50002,
+        snmp: Optional[SNMPEnrichment] = None,
+        states: Optional[HyteraRepeaterStates] = None,
+        dmr_port: Optional[int] = None,
     ):
-        """ """
+        """
+        :param snmp: shared SNMP enrichment service, created for storage if not provided
+        :param states: repeater states shared with RDAC/DMR protocols, created for storage if not provided
+        :param dmr_port: port repeaters are redirected to for DMR data, defaults to port of repeater address_in
+        """
         self.p2p_port: int = p2p_port
         self.rdac_port: int = rdac_port
+        self.dmr_port: Optional[int] = dmr_port
         self.transport: Optional[DatagramTransport] = None
         self.storage: RepeaterStorage = storage
+        self.snmp: SNMPEnrichment = snmp or SNMPEnrichment(storage=storage)
+        self.states: HyteraRepeaterStates = (
+            states if states is not None else HyteraRepeaterStates(storage=storage)
+        )
+        self.handlers: Dict[int, Callable[[bytes, ADDRESS_TYPE], None]] = {
+            self.PACKET_TYPE_REQUEST_REGISTRATION: self.handle_registration,
+            self.PACKET_TYPE_REQUEST_RDAC_STARTUP: self.handle_rdac_request,
+            self.PACKET_TYPE_REQUEST_DMR_STARTUP: self.handle_dmr_request,
+        }
 
     @staticmethod
     def packet_is_command(data: bytes) -> bool:
@@ -62,21 +84,34 @@ class P2PDatagramProtocol(DatagramProtocol, LoggingTrait):
         data[15] = 0x5A
         data.append(0x01)
 
-        rpt = self.storage.match_incoming(address=address, auto_create=True)
+        state = self.states.get(address, auto_create=True)
 
-        self.transport.sendto(data, rpt.address_out)
+        self.transport.sendto(data, state.rpt.address_out)
 
-        rpt.read_snmp_values(self.storage)
-        rpt.attr(self.STORAGE_ATTR_IS_REGISTERED, True)
+        self.snmp.enrich(state.rpt)
+        self.states.register(state)
 
-    def handle_rdac_request(self, data: bytes, address: ADDRESS_TYPE) -> None:
-        rpt = self.storage.match_incoming(address)
-        if not rpt or not rpt.attr(self.STORAGE_ATTR_IS_REGISTERED):
+    def registered_state(
+        self, address: ADDRESS_TYPE, request: str
+    ) -> Optional[HyteraRepeaterState]:
+        """
+        Rejects the request (resets the repeater connection) if the repeater is not registered
+        """
+        state = self.states.get(address)
+        if not state or not state.registered:
             self.log_debug(
-                f"Rejecting RDAC request for not-registered repeater {address[0]}"
+                f"Rejecting {request} request for not-registered repeater {address[0]}"
             )
             self.transport.sendto(bytes([0x00]), address)
+            return None
+        return state
+
+    def handle_rdac_request(self, data: bytes, address: ADDRESS_TYPE) -> None:
+        state = self.registered_state(address, request="RDAC")
+        if not state:
             return
+        rpt = state.rpt
+        state.rdac_reset()
 
         data = bytearray(data)
         # set RDAC id
@@ -90,6 +125,7 @@ class P2PDatagramProtocol(DatagramProtocol, LoggingTrait):
         self.log_debug("RDAC Accept for %s:%s" % address)
 
         # redirect repeater to correct RDAC port
+        self.states.redirect(state, HyteraRepeaterStates.SERVICE_RDAC)
         data = self.get_redirect_packet(data, self.rdac_port)
         self.transport.sendto(data, rpt.address_out)
 
@@ -106,36 +142,29 @@ class P2PDatagramProtocol(DatagramProtocol, LoggingTrait):
         return data
 
     def handle_dmr_request(self, data: bytes, address: ADDRESS_TYPE) -> None:
-        rpt = self.storage.match_incoming(address)
-        if not rpt or not rpt.attr(self.STORAGE_ATTR_IS_REGISTERED):
-            self.log_debug(
-                f"Rejecting DMR request for not-registered repeater {address[0]}"
-            )
-            self.transport.sendto(bytes([0x00]), address)
+        state = self.registered_state(address, request="DMR")
+        if not state:
             return
 
-        response_address = (address[0], self.p2p_port)
-
         data = bytearray(data)
         # set DMR id
         data[4] += 1
         data[13] = 0x01
         data.append(0x01)
 
-        self.transport.sendto(data, response_address)
+        self.transport.sendto(data, address)
         self.log_debug("DMR Accept for %s:%s" % address)
 
         # use configured
-        data = self.get_redirect_packet(data, rpt.address_in[1])
-        self.transport.sendto(data, response_address)
+        self.states.redirect(state, HyteraRepeaterStates.SERVICE_DMR)
+        data = self.get_redirect_packet(
+            data,
+            self.dmr_port if self.dmr_port is not None else state.rpt.address_in[1],
+        )
+        self.transport.sendto(data, address)
 
     def handle_ping(self, data: bytes, address: ADDRESS_TYPE) -> None:
-        rpt = self.storage.match_incoming(address=address)
-        if not rpt or not rpt.attr(self.STORAGE_ATTR_IS_REGISTERED):
-            self.log_debug(
-                f"Rejecting ping request for not-registered repeater {address[0]}"
-            )
-            self.transport.sendto(bytes([0x00]), address)
+        if not self.registered_state(address, request="ping"):
             return
         data = bytearray(data)
         data[12] = 0xFF
@@ -155,23 +184,18 @@ class P2PDatagramProtocol(DatagramProtocol, LoggingTrait):
         self.log_debug("connection prepared")
 
     def datagram_received(self, data: bytes, address: ADDRESS_TYPE) -> None:
-        packet_type = self.command_get_type(data)
-        is_command = self.packet_is_command(data)
-        self.log_debug(f"datagram_received {data.hex()} from: {address}")
-        # must be handled outside
-        # self.settings.ensure_repeater_data(address)
-        if is_command:
-            if packet_type not in self.KNOWN_PACKET_TYPES:
-                if not self.packet_is_ack(data):
-                    self.log_error("Received %s bytes from %s" % (len(data), address))
-                    self.log_error(data.hex())
-                    self.log_error("Idle packet of type:%s received" % packet_type)
-            if packet_type == self.PACKET_TYPE_REQUEST_REGISTRATION:
-                self.handle_registration(data, address)
-            elif packet_type == self.PACKET_TYPE_REQUEST_RDAC_STARTUP:
-                self.handle_rdac_request(data, address)
-            elif packet_type == self.PACKET_TYPE_REQUEST_DMR_STARTUP:
-                self.handle_dmr_request(data, address)
+        if self.packet_is_command(data):
+            handler: Optional[Callable[[bytes, ADDRESS_TYPE], None]] = (
+                self.handlers.get(self.command_get_type(data))
+            )
+            if handler:
+                handler(data, address)
+            elif not self.packet_is_ack(data):
+                self.log_error("Received %s bytes from %s" % (len(data), address))
+                self.log_error(data.hex())
+                self.log_error(
+                    "Idle packet of type:%s received" % self.command_get_type(data)
+                )
         elif self.packet_is_ping(data):
             self.handle_ping(data, address)
         else:
@@ -1,14 +1,21 @@
 from asyncio import DatagramProtocol, transports
 from binascii import hexlify
+from time import time
 from typing import Optional, Dict, Callable
 from uuid import UUID
 
+from okdmr.dmrlib.hytera.snmp_enrichment import SNMPEnrichment
+from okdmr.dmrlib.protocols.hytera.hytera_repeater_state import (
+    HyteraRepeaterState,
+    HyteraRepeaterStates,
+)
 from okdmr.dmrlib.storage import ADDRESS_TYPE
 from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
 from okdmr.dmrlib.utils.logging_trait import LoggingTrait
 
 
 RDAC_FINISHED_CALLBACK_TYPE = Callable[[UUID], None]
+RDAC_STEP_TYPE = Callable[[bytes, ADDRESS_TYPE, HyteraRepeaterState], None]
 
 
 class RDACDatagramProtocol(DatagramProtocol, LoggingTrait):
@@ -194,47 +201,93 @@ class RDACDatagramProtocol(DatagramProtocol, LoggingTrait):
     STORAGE_ATTR_TX_FREQ: str = "tx_freq"
 
     def __init__(
-        self, storage: RepeaterStorage, callback: RDAC_FINISHED_CALLBACK_TYPE = None
+        self,
+        storage: RepeaterStorage,
+        callback: RDAC_FINISHED_CALLBACK_TYPE = None,
+        snmp: Optional[SNMPEnrichment] = None,
+        states: Optional[HyteraRepeaterStates] = None,
     ):
+        """
+        :param storage:
+        :param callback: called with repeater id, after RDAC identification and SNMP read finished
+        :param snmp: shared SNMP enrichment service, created for storage if not provided
+        :param states: repeater states (holding RDAC step of each repeater) shared with P2P/DMR protocols,
+                       created for storage if not provided
+        """
         self.transport: Optional[transports.DatagramTransport] = None
         self.callback: RDAC_FINISHED_CALLBACK_TYPE = callback
         self.storage: RepeaterStorage = storage
-        self.step: Dict[str, int] = dict()
+        self.snmp: SNMPEnrichment = snmp or SNMPEnrichment(storage=storage)
+        self.states: HyteraRepeaterStates = (
+            states if states is not None else HyteraRepeaterStates(storage=storage)
+        )
+        self.steps: Dict[int, RDAC_STEP_TYPE] = {
+            0: self.step0,
+            1: self.step1,
+            2: self.step2,
+            3: self.step3,
+            4: self.step4,
+            5: self.step5,
+            6: self.step6,
+            7: self.step7,
+            8: self.step8,
+            10: self.step10,
+            11: self.step11,
+            12: self.step12,
+            13: self.step13,
+            14: self.step14,
+        }
+        """ current RDAC step of repeater -> handler of datagram received in that step """
 
-    def step0(self, _: bytes, address: ADDRESS_TYPE) -> None:
+    def step0(
+        self, _: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         self.log_debug("RDAC identification started")
-        self.step[address[0]] = 1
+        state.rdac_reset()
+        state.rdac_step = 1
         self.transport.sendto(self.STEP0_REQUEST, address)
 
-    def step1(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step1(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP0_RESPONSE)] == self.STEP0_RESPONSE:
-            self.step[address[0]] = 2
+            state.rdac_step = 2
             self.transport.sendto(self.STEP1_REQUEST, address)
 
-    def step2(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step2(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP1_RESPONSE)] == self.STEP1_RESPONSE:
-            self.step[address[0]] = 3
+            state.rdac_step = 3
 
-    def step3(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step3(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP2_RESPONSE)] == self.STEP2_RESPONSE:
-            self.storage.match_incoming(
-                address=address,
+            self.storage.save(
+                state.rpt,
                 patch={"dmr_id": int.from_bytes(data[18:21], byteorder="little")},
             )
-            self.step[address[0]] = 4
+            state.rdac_step = 4
             self.transport.sendto(self.STEP3_REQUEST, address)
 
-    def step4(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step4(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP3_RESPONSE)] == self.STEP3_RESPONSE:
-            self.step[address[0]] = 5
+            state.rdac_step = 5
             self.transport.sendto(self.STEP4_REQUEST_1, address)
             self.transport.sendto(self.STEP4_REQUEST_2, address)
 
-    def step5(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step5(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP4_RESPONSE_1)] == self.STEP4_RESPONSE_1:
-            self.step[address[0]] = 6
+            state.rdac_step = 6
 
-    def step6(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step6(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP4_RESPONSE_2)] == self.STEP4_RESPONSE_2:
             hytera_callsign: str = (
                 data[88:108]
@@ -264,9 +317,9 @@ class RDACDatagramProtocol(DatagramProtocol, LoggingTrait):
                 .strip(b"\x00")
                 .decode("utf-8")
             )
-            self.step[address[0]] = 7
+            state.rdac_step = 7
             self.storage.save(
-                self.storage.match_incoming(address=address),
+                state.rpt,
                 {
                     self.STORAGE_ATTR_FIRMWARE: hytera_firmware,
                     self.STORAGE_ATTR_HARDWARE: hytera_hardware,
@@ -277,24 +330,30 @@ class RDACDatagramProtocol(DatagramProtocol, LoggingTrait):
             self.transport.sendto(self.STEP6_REQUEST_1, address)
             self.transport.sendto(self.STEP6_REQUEST_2, address)
 
-    def step7(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step7(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP6_RESPONSE)] == self.STEP6_RESPONSE:
-            self.step[address[0]] = 8
+            state.rdac_step = 8
             self.transport.sendto(self.STEP7_REQUEST, address)
 
-    def step8(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step8(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP7_RESPONSE_1)] == self.STEP7_RESPONSE_1:
-            self.step[address[0]] = 10
+            state.rdac_step = 10
 
-    def step10(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step10(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP7_RESPONSE_2)] == self.STEP7_RESPONSE_2:
             hytera_repeater_mode = data[26]
             self.log_error(f"Unknown HyteraRepeaterMode value {hytera_repeater_mode}")
             tx_freq = int.from_bytes(data[29:33], byteorder="little")
             rq_freq = int.from_bytes(data[33:37], byteorder="little")
-            self.step[address[0]] = 11
-            self.storage.match_incoming(
-                address=address,
+            state.rdac_step = 11
+            self.storage.save(
+                state.rpt,
                 patch={
                     self.STORAGE_ATTR_RX_FREQ: tx_freq,
                     self.STORAGE_ATTR_TX_FREQ: rq_freq,
@@ -302,28 +361,37 @@ class RDACDatagramProtocol(DatagramProtocol, LoggingTrait):
             )
             self.transport.sendto(self.STEP10_REQUEST, address)
 
-    def step11(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step11(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP10_RESPONSE_1)] == self.STEP10_RESPONSE_1:
-            self.step[address[0]] = 12
+            state.rdac_step = 12
 
-    def step12(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step12(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP10_RESPONSE_2)] == self.STEP10_RESPONSE_2:
-            self.step[address[0]] = 13
+            state.rdac_step = 13
             self.transport.sendto(self.STEP12_REQUEST_1, address)
             self.transport.sendto(self.STEP12_REQUEST_2, address)
 
-    def step13(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step13(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         if data[: len(self.STEP12_RESPONSE)] == self.STEP12_RESPONSE:
-            self.step[address[0]] = 14
+            state.rdac_step = 14
+            state.rdac_finished = time()
             self.log_debug("rdac completed identification")
 
-            rpt = self.storage.match_incoming(address=address)
-            rpt.read_snmp_values()
-
-            if self.callback:
-                self.callback(rpt.id)
+            # SNMP is read in background, not to block other repeaters
+            self.snmp.enrich(
+                state.rpt,
+                callback=(lambda r: self.callback(r.id)) if self.callback else None,
+            )
 
-    def step14(self, data: bytes, address: ADDRESS_TYPE) -> None:
+    def step14(
+        self, data: bytes, address: ADDRESS_TYPE, state: HyteraRepeaterState
+    ) -> None:
         pass
 
     def connection_lost(self, exc: Optional[Exception]) -> None:
@@ -336,13 +404,14 @@ class RDACDatagramProtocol(DatagramProtocol, LoggingTrait):
         self.log_debug("connection prepared")
 
     def datagram_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
-        self.storage.match_incoming(address=addr, auto_create=True)
-
-        if not self.step.get(addr[0]):
-            self.step[addr[0]] = 0
+        # repeater registered over P2P, or standalone RDAC connection (created by its address)
+        state: HyteraRepeaterState = self.states.get(
+            addr, service=HyteraRepeaterStates.SERVICE_RDAC
+        ) or self.states.get(addr, auto_create=True)
+        step: int = state.rdac_step
 
-        if len(data) == 1 and self.step[addr[0]] != 14:
-            if self.step[addr[0]] == 4:
+        if len(data) == 1 and step != 14:
+            if step == 4:
                 self.log_error(
                     "check repeater zone programming, if Digital IP"
                     "Multi-Site Connect mode allows data pass from timeslots"
@@ -350,13 +419,12 @@ class RDACDatagramProtocol(DatagramProtocol, LoggingTrait):
             self.log_error(
                 "restart process if response is protocol reset and current step is not 14"
             )
-            self.step[addr[0]] = 0
-            self.step0(data, addr)
-        elif len(data) != 1 and self.step[addr[0]] == 14:
+            self.step0(data, addr, state)
+        elif len(data) != 1 and step == 14:
             self.log_error("RDAC finished, received extra data %s" % hexlify(data))
-        elif len(data) == 1 and self.step[addr[0]] == 14:
+        elif len(data) == 1 and step == 14:
             if data[0] == 0x00:
                 # no data available response
                 self.transport.sendto(bytes(0x41), addr)
         else:
-            getattr(self, "step%d" % self.step[addr[0]])(data, addr)
+            self.steps[step](data, addr, state)
@@ -1,4 +1,4 @@
-from typing import Tuple, Union, Any, Optional, Dict
+from typing import Tuple, Union, Any, Optional, Dict, Set
 
 from okdmr.dmrlib.hytera.pdu.hstrp import HSTRP, HSTRPPacketType
 from okdmr.dmrlib.hytera.pdu.radio_registration_service import (
@@ -7,14 +7,28 @@ from okdmr.dmrlib.hytera.pdu.radio_registration_service import (
     RRSTypes,
     RRSResult,
 )
-from okdmr.dmrlib.protocols.hytera.hstrp_datagram_protocol import HSTRPDatagramProtocol
+from okdmr.dmrlib.protocols.hytera.hstrp_datagram_protocol import (
+    HSTRPDatagramProtocol,
+    HSTRPSession,
+)
 
 
 class RRSDatagramProtocol(HSTRPDatagramProtocol):
-    def __init__(self, port: int, be_active_peer: bool = False):
-        super().__init__(port=port, be_active_peer=be_active_peer)
+    SESSION_RADIOS: str = "rrs_radios"
+    """ key of HSTRPSession.data, IPs of radios registered through the peer (repeater) """
+
+    def __init__(self, port: int, be_active_peer: bool = False, **kwargs):
+        super().__init__(port=port, be_active_peer=be_active_peer, **kwargs)
         self.registry: Dict[str, RRSRadioState] = {}
 
+    def session_radios(self, session: HSTRPSession) -> Set[str]:
+        return session.data.setdefault(self.SESSION_RADIOS, set())
+
+    def hstrp_session_disconnected(self, session: HSTRPSession) -> None:
+        # radios registered through the lost repeater are no longer reachable
+        for radio_ip in self.session_radios(session):
+            self.registry[radio_ip] = RRSRadioState.Offline
+
     def rrs_confirm(self, pdu: HSTRP, addr: Tuple[Union[str, Any], int]):
         assert isinstance(pdu.payload, RadioRegistrationService)
         rrs = RadioRegistrationService(
@@ -28,9 +42,9 @@ class RRSDatagramProtocol(HSTRPDatagramProtocol):
                 have_options=True,
             ),
             payload=rrs,
-            sn=self.hstrp_increment_sn(),
+            sn=self.hstrp_increment_sn(addr),
         )
-        self.transport.sendto(data=hstrp.as_bytes(), addr=addr)
+        self.hstrp_send_reliable(pdu=hstrp, addr=addr)
 
     def datagram_received(
         self, data: bytes, addr: Tuple[Union[str, Any], int]
@@ -48,11 +62,13 @@ class RRSDatagramProtocol(HSTRPDatagramProtocol):
         if rrs.opcode == RRSTypes.RadioRegistrationRequest:
             was_handled = True
             self.registry[rrs.radio_ip.as_ip()] = RRSRadioState.Online
+            self.session_radios(self.hstrp_session(addr)).add(rrs.radio_ip.as_ip())
             self.rrs_confirm(pdu, addr)
             self.log_info(f"Radio {rrs.radio_ip.radio_id} is {rrs.radio_state.name}")
         elif rrs.opcode == RRSTypes.RadioGoingOffline:
             was_handled = True
             self.registry[rrs.radio_ip.as_ip()] = RRSRadioState.Offline
+            self.session_radios(self.hstrp_session(addr)).discard(rrs.radio_ip.as_ip())
             self.log_info(f"Radio {rrs.radio_ip.radio_id} went Offline")
 
         if not was_handled:
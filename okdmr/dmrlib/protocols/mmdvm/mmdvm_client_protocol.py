@@ -1,13 +1,17 @@
 import asyncio
 import struct
 from asyncio import transports, Queue, DatagramProtocol
-from binascii import hexlify, a2b_hex
 from dataclasses import dataclass
 from hashlib import sha256
 from socket import socket
-from typing import Optional, Callable, Tuple
+from time import time
+from typing import Optional, Callable, Tuple, List
 
+from kaitaistruct import KaitaiStructError
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
 from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
 
 
 @dataclass
@@ -18,6 +22,8 @@ class MMDVMClientConfiguration:
     """ repeater_id  """
     callsign: str
     """ callsign string eg. OK4DMR """
+    password: str = "passw0rd"
+    """ shared secret, used to answer master login challenge """
     rx_freq: int = 0
     """ freq in Hz, 9 numbers """
     tx_freq: int = 0
@@ -36,84 +42,206 @@ class MMDVMClientConfiguration:
     """ at most 20 chars """
     description: str = ""
     """ at most 20 chars """
+    slots: int = 3
+    """ 1 - TS1 only, 2 - TS2 only, 3 - both timeslots, 4 - simplex """
     url: str = ""
     """ at most 124 chars """
     software_id: str = ""
     """ at most 40 chars """
     package_id: str = ""
     """ at most 40 chars """
+    options: str = ""
+    """ sent to master (RPTO) after login, eg. static talkgroups "TS1=2,9;TS2=230" """
 
 
 class MMDVMClientProtocol(DatagramProtocol, LoggingTrait):
+    """
+    MMDVM/Homebrew repeater (peer) side, logs in to the master, keeps the connection alive and reconnects (with
+    exponential backoff) when master rejects us, closes the connection or stops responding
+
+    Outgoing DMRD frames (bytes, see send_burst) are taken from queue_outgoing only when logged in, received
+    DMRD frames are put to queue_incoming as Burst objects
+    """
+
     CON_NEW: int = 1
     CON_LOGIN_REQUEST_SENT: int = 2
     CON_LOGIN_RESPONSE_SENT: int = 3
     CON_LOGIN_SUCCESSFULL: int = 4
     CON_AUTHENTICATION_FAILED: int = 5
+    CON_CONFIGURATION_SENT: int = 6
 
     def __init__(
         self,
         config: MMDVMClientConfiguration,
-        connection_lost_callback: Callable,
+        connection_lost_callback: Optional[Callable[[], None]],
         queue_outgoing: Queue,
         queue_incoming: Queue,
+        keepalive_interval: float = 5,
+        keepalive_timeout: float = 30,
+        handshake_timeout: float = 5,
+        backoff_initial: float = 1,
+        backoff_max: float = 60,
+        batch_size: int = 64,
     ) -> None:
+        """
+        :param config:
+        :param connection_lost_callback: called when transport (socket) is closed
+        :param queue_outgoing: DMRD frames (bytes) to be sent to master
+        :param queue_incoming: received DMRD frames as Burst objects
+        :param keepalive_interval: seconds between pings, once logged in
+        :param keepalive_timeout: connection is considered lost, if master does not respond for this long
+        :param handshake_timeout: seconds to wait for master to respond during login
+        :param backoff_initial: delay before first reconnect, doubled with each consecutive failure
+        :param backoff_max: longest delay between reconnects
+        :param batch_size: max number of queued frames sent without yielding to event loop
+        """
+        assert batch_size > 0, f"batch_size must be positive, got {batch_size}"
         self.config: MMDVMClientConfiguration = config
         self.transport: Optional[transports.DatagramTransport] = None
-        self.connection_lost_callback = connection_lost_callback
+        self.connection_lost_callback: Optional[Callable[[], None]] = (
+            connection_lost_callback
+        )
+        self.connection_status: int = self.CON_NEW
+        self.queue_outgoing: Queue = queue_outgoing
+        self.queue_incoming: Queue = queue_incoming
+        self.keepalive_interval: float = keepalive_interval
+        self.keepalive_timeout: float = keepalive_timeout
+        self.handshake_timeout: float = handshake_timeout
+        self.backoff_initial: float = backoff_initial
+        self.backoff_max: float = backoff_max
+        self.batch_size: int = batch_size
+        self.failures: int = 0
+        """ consecutive failed login attempts / lost connections """
+        self.next_attempt: float = 0
+        """ timestamp of next login attempt, when connection_status is CON_NEW """
+        self.last_sent: float = 0
+        """ timestamp of last control packet (login, ping) sent """
+        self.last_received: float = 0
+        """ timestamp of last packet received from master """
+        self.logged_in: Optional[asyncio.Event] = None
+        """ set while logged in to master, created by start(), so it belongs to the running event loop """
+        self.tasks: List[asyncio.Task] = []
+
+    async def start(self) -> "MMDVMClientProtocol":
+        """
+        Opens socket to config.upstream_addr and starts maintenance and send queue tasks
+        """
+        loop = asyncio.get_running_loop()
+        self.logged_in = asyncio.Event()
+        await loop.create_datagram_endpoint(
+            lambda: self, remote_addr=self.config.upstream_addr
+        )
+        self.tasks = [
+            loop.create_task(self.periodic_maintenance()),
+            loop.create_task(self.send_mmdvm_from_queue()),
+        ]
+        return self
+
+    async def close(self) -> None:
+        """
+        Sends closing to master (if logged in), stops the tasks and closes the socket
+        """
+        self.disconnect()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+        if self.transport and not self.transport.is_closing():
+            self.transport.close()
+
+    def set_logged_in(self, logged_in: bool) -> None:
+        if not self.logged_in:
+            return
+        if logged_in:
+            self.logged_in.set()
+        else:
+            self.logged_in.clear()
+
+    def backoff(self) -> float:
+        if not self.failures:
+            return 0
+        return min(self.backoff_initial * 2 ** (self.failures - 1), self.backoff_max)
+
+    def connection_failed(self, reason: str) -> None:
+        """
+        Login attempt failed or established connection was lost, next login attempt is delayed by backoff
+        """
         self.connection_status = self.CON_NEW
-        self.queue_outgoing = queue_outgoing
-        self.queue_incoming = queue_incoming
+        self.set_logged_in(False)
+        self.failures += 1
+        self.next_attempt = time() + self.backoff()
+        self.log_warning(
+            f"{reason}, reconnecting in {self.backoff():.1f}s (failure {self.failures})"
+        )
 
-    async def periodic_maintenance(self) -> None:
-        while not asyncio.get_running_loop().is_closed():
-            await asyncio.sleep(5)
-            if self.connection_status == self.CON_NEW:
-                self.send_login_request()
-            elif self.connection_status == self.CON_LOGIN_REQUEST_SENT:
+    def check_connection(self, now: Optional[float] = None) -> None:
+        """
+        Single step of connection state machine, called periodically by periodic_maintenance
+        """
+        now = time() if now is None else now
+        if not self.transport or self.transport.is_closing():
+            return
+        if self.connection_status == self.CON_AUTHENTICATION_FAILED:
+            self.connection_failed("Master did not accept our credentials")
+        if self.connection_status == self.CON_NEW:
+            if now >= self.next_attempt:
                 self.send_login_request()
-            elif self.connection_status == self.CON_LOGIN_SUCCESSFULL:
+        elif self.connection_status == self.CON_LOGIN_SUCCESSFULL:
+            if now - self.last_received > self.keepalive_timeout:
+                self.connection_failed(
+                    f"Master did not respond for {self.keepalive_timeout}s"
+                )
+            elif now - self.last_sent >= self.keepalive_interval:
                 self.send_ping()
-            elif self.connection_status == self.CON_AUTHENTICATION_FAILED:
-                self.connection_status = self.CON_NEW
-                self.send_login_request()
+        elif now - self.last_sent > self.handshake_timeout:
+            self.connection_failed(
+                f"Master did not respond to login (status {self.connection_status})"
+            )
+
+    async def periodic_maintenance(self) -> None:
+        tick: float = min(
+            1.0, self.keepalive_interval, self.handshake_timeout, self.backoff_initial
+        )
+        while not asyncio.get_running_loop().is_closed():
+            self.check_connection()
+            await asyncio.sleep(tick)
 
     async def send_mmdvm_from_queue(self) -> None:
+        """
+        Drains queue_outgoing in batches, waits (without dropping frames) while not logged in
+        """
         while not asyncio.get_running_loop().is_closed():
             packet: bytes = await self.queue_outgoing.get()
+            await self.logged_in.wait()
+            batch: List[bytes] = [packet]
+            while len(batch) < self.batch_size and not self.queue_outgoing.empty():
+                batch.append(self.queue_outgoing.get_nowait())
             if self.transport and not self.transport.is_closing():
-                self.transport.sendto(packet)
-                mmdvm: Mmdvm = Mmdvm.from_bytes(packet)
-                self.log_debug(
-                    common_log_format(
-                        proto="HHB->MMDVM",
-                        from_ip_port=(),
-                        to_ip_port=(),
-                        use_color=True,
-                        packet_data=mmdvm.command_data,
-                        dmrdata_hash=(
-                            get_dmr_data_hash(mmdvm.command_data.dmr_data)
-                            if isinstance(mmdvm.command_data, Mmdvm.TypeDmrData)
-                            else ""
-                        ),
-                    )
-                )
+                for packet in batch:
+                    self.transport.sendto(packet)
             else:
-                if not self.transport:
-                    self.log_info(
-                        f"Not sending packet, waiting for Hytera repeater to connect first"
-                    )
-                elif self.transport and self.transport.is_closing():
-                    self.log_info(
-                        f"Not sending packet due to MMDVM socket closing/being closed"
-                    )
+                self.log_info(
+                    f"Not sending {len(batch)} packets due to MMDVM socket closing/being closed"
+                )
+            # get() does not suspend while the queue is not empty, let others (and receiving side) run
+            await asyncio.sleep(0)
+
+    def send_burst(self, burst: Burst, private_call: bool = False) -> None:
+        """
+        Queues burst to be sent to master as DMRD frame
+        """
+        self.queue_outgoing.put_nowait(
+            burst.as_mmdvm(
+                repeater_id=self.config.repeater_id, private_call=private_call
+            )
+        )
 
     def connection_made(self, transport: transports.BaseTransport) -> None:
         self.log_debug("MMDVM socket connected")
         if not self.transport or self.transport.is_closing():
             self.log_debug("Setting transport")
             self.transport = transport
-            if self.connection_status is not self.CON_LOGIN_SUCCESSFULL:
+            if self.connection_status != self.CON_LOGIN_SUCCESSFULL:
                 self.send_login_request()
         else:
             self.log_debug("ignoring new transport")
@@ -126,122 +254,140 @@ class MMDVMClientProtocol(DatagramProtocol, LoggingTrait):
     def connection_lost(self, exc: Optional[Exception]) -> None:
         self.log_debug("MMDVM socket closed")
         self.connection_status = self.CON_NEW
+        self.set_logged_in(False)
         if exc:
             self.log_exception(exc)
-        self.connection_lost_callback()
+        if self.connection_lost_callback:
+            self.connection_lost_callback()
 
     def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
-        packet = Mmdvm.from_bytes(data)
+        try:
+            packet: Mmdvm2020 = Mmdvm2020.from_bytes(data)
+        except (KaitaiStructError, EOFError, UnicodeDecodeError):
+            self.log_error(f"Could not decode MMDVM from {addr}: {data.hex()}")
+            return
+        self.last_received = time()
         is_handled: bool = False
-        if isinstance(packet.command_data, Mmdvm.TypeMasterNotAccept):
+        if isinstance(packet.command_data, Mmdvm2020.TypeDmrData):
+            self.queue_incoming.put_nowait(
+                Burst.from_mmdvm(packet.command_data)
+                .set_timestamp(self.last_received)
+                .set_peer(f"{addr[0]}:{addr[1]}")
+            )
+            is_handled = True
+        elif isinstance(packet.command_data, Mmdvm2020.TypeMasterNotAccept):
             if self.connection_status == self.CON_LOGIN_REQUEST_SENT:
-                self.connection_status = self.CON_NEW
-                self.log_error("Master did not accept our login request")
-                is_handled = True
+                self.connection_failed("Master did not accept our login request")
             elif self.connection_status == self.CON_LOGIN_RESPONSE_SENT:
-                self.connection_status = self.CON_NEW
-                self.log_error("Master did not accept our password challenge response")
-                is_handled = True
-            elif self.connection_status == self.CON_LOGIN_SUCCESSFULL:
-                self.connection_status = self.CON_NEW
-                self.log_info("Connection timed-out or was interrupted, do login again")
-                self.send_login_request()
-                is_handled = True
-        elif isinstance(packet.command_data, Mmdvm.TypeMasterRepeaterAck):
+                self.connection_status = self.CON_AUTHENTICATION_FAILED
+                self.check_connection()
+            else:
+                self.connection_failed(
+                    "Connection timed-out or was interrupted, do login again"
+                )
+            is_handled = True
+        elif isinstance(packet.command_data, Mmdvm2020.TypeMasterRepeaterAck):
             if self.connection_status == self.CON_LOGIN_REQUEST_SENT:
-                self.log_info("Sending Login Response")
                 self.send_login_response(packet.command_data.repeater_id_or_challenge)
                 is_handled = True
             elif self.connection_status == self.CON_LOGIN_RESPONSE_SENT:
                 self.log_info("Master Login Accept")
-                self.connection_status = self.CON_LOGIN_SUCCESSFULL
                 self.send_configuration()
                 is_handled = True
-            elif self.connection_status == self.CON_LOGIN_SUCCESSFULL:
+            elif self.connection_status == self.CON_CONFIGURATION_SENT:
                 self.log_info("Master accepted our configuration")
+                self.connection_status = self.CON_LOGIN_SUCCESSFULL
+                self.failures = 0
+                self.set_logged_in(True)
+                if self.config.options:
+                    self.send_options()
                 is_handled = True
-        elif isinstance(packet.command_data, Mmdvm.TypeMasterPong):
+            elif self.connection_status == self.CON_LOGIN_SUCCESSFULL:
+                is_handled = True
+        elif isinstance(packet.command_data, Mmdvm2020.TypeMasterPong):
             self.log_debug("Master PONG received")
             is_handled = True
-            pass
-        elif isinstance(packet.command_data, Mmdvm.TypeMasterClosing):
-            self.log_info("Master Closing connection")
-            self.connection_status = self.CON_NEW
-            is_handled = True
-        elif isinstance(packet.command_data, Mmdvm.TypeDmrData):
-            self.queue_incoming.put_nowait(packet)
+        elif isinstance(packet.command_data, Mmdvm2020.TypeMasterClosing):
+            self.connection_failed("Master closing connection")
             is_handled = True
         if not is_handled:
             self.log_error(
-                f"UNHANDLED {packet.__class__.__name__} {packet.command_data.__class__.__name__} {hexlify(data)} status {self.connection_status}"
+                f"UNHANDLED {packet.command_prefix} {packet.command_data.__class__.__name__} {data.hex()} status {self.connection_status}"
             )
 
+    def send(self, packet: bytes) -> None:
+        """
+        Control packets are sent directly, not to wait behind queued DMRD frames
+        """
+        if self.transport and not self.transport.is_closing():
+            self.transport.sendto(packet)
+            self.last_sent = time()
+
     def send_login_request(self) -> None:
         self.log_info("Sending Login Request")
         self.connection_status = self.CON_LOGIN_REQUEST_SENT
-        self.queue_outgoing.put_nowait(
-            struct.pack(">4sI", b"RPTL", self.settings.get_repeater_dmrid())
-        )
+        self.send(struct.pack(">4sI", b"RPTL", self.config.repeater_id))
 
     def send_login_response(self, challenge: int) -> None:
         self.log_info("Sending Login Response (Challenge response)")
         self.connection_status = self.CON_LOGIN_RESPONSE_SENT
-        challenge_response = struct.pack(
-            ">4sI32s",
-            b"RPTK",
-            self.settings.get_repeater_dmrid(),
-            a2b_hex(
+        self.send(
+            struct.pack(
+                ">4sI32s",
+                b"RPTK",
+                self.config.repeater_id,
                 sha256(
-                    b"".join(
-                        [
-                            challenge.to_bytes(length=4, byteorder="big"),
-                            self.settings.hb_password.encode(),
-                        ]
-                    )
-                ).hexdigest()
-            ),
+                    challenge.to_bytes(length=4, byteorder="big")
+                    + self.config.password.encode()
+                ).digest(),
+            )
         )
-        self.queue_outgoing.put_nowait(challenge_response)
 
-    def send_configuration(self) -> None:
-        self.log_info(f"Sending self configuration to master")
-        packet = struct.pack(
+    def configuration_packet(self) -> bytes:
+        return struct.pack(
             ">4sI8s9s9s2s2s8s9s3s20s19s1s124s40s40s",
             b"RPTC",
-            self.settings.get_repeater_dmrid(),
-            self.settings.get_repeater_callsign()[0:8].ljust(8).encode(),
-            self.settings.get_repeater_rx_freq()[0:9].rjust(9, "0").encode(),
-            self.settings.get_repeater_tx_freq()[0:9].rjust(9, "0").encode(),
-            str(self.settings.hb_tx_power & 0xFFFF).rjust(2, "0").encode(),
-            str(self.settings.hb_color_code & 0xF).rjust(2, "0").encode(),
-            self.settings.hb_latitude[0:8].rjust(8, "0").encode(),
-            self.settings.hb_longitude[0:9].rjust(9, "0").encode(),
-            str(min(max(self.settings.hb_antenna_height, 0), 999))[0:3]
-            .rjust(3, "0")
-            .encode(),
-            self.settings.hb_location[0:20].ljust(20).encode(),
-            self.settings.hb_description[0:19].ljust(19).encode(),
-            self.settings.hb_timeslots[0:1].encode(),
-            self.settings.hb_url[0:124].ljust(124).encode(),
-            self.settings.hb_software_id[0:40].ljust(40).encode(),
-            self.settings.hb_package_id[0:40].ljust(40).encode(),
+            self.config.repeater_id,
+            self.config.callsign[0:8].ljust(8).encode(),
+            str(self.config.rx_freq)[0:9].rjust(9, "0").encode(),
+            str(self.config.tx_freq)[0:9].rjust(9, "0").encode(),
+            str(min(max(self.config.tx_power, 0), 99)).rjust(2, "0").encode(),
+            str(self.config.color_code & 0xF).rjust(2, "0").encode(),
+            self.config.latitude[0:8].rjust(8, "0").encode(),
+            self.config.longitude[0:9].rjust(9, "0").encode(),
+            str(min(max(self.config.height, 0), 999)).rjust(3, "0").encode(),
+            self.config.location[0:20].ljust(20).encode(),
+            self.config.description[0:19].ljust(19).encode(),
+            str(self.config.slots)[0:1].encode(),
+            self.config.url[0:124].ljust(124).encode(),
+            self.config.software_id[0:40].ljust(40).encode(),
+            self.config.package_id[0:40].ljust(40).encode(),
         )
 
-        self.queue_outgoing.put_nowait(packet)
+    def send_configuration(self) -> None:
+        self.log_info(
+            f"Sending configuration to master, repeater {self.config.repeater_id} {self.config.callsign}"
+        )
+        self.connection_status = self.CON_CONFIGURATION_SENT
+        self.send(self.configuration_packet())
 
-        config: Mmdvm = Mmdvm.from_bytes(packet)
-        log_mmdvm_configuration(logger=self.get_logger(), packet=config)
+    def send_options(self) -> None:
+        self.log_info(f"Sending options to master: {self.config.options}")
+        self.send(
+            struct.pack(">4sI", b"RPTO", self.config.repeater_id)
+            + self.config.options.encode()
+        )
 
     def send_ping(self) -> None:
         self.log_debug("Sending PING")
-        packet = struct.pack(">7sI", b"RPTPING", self.settings.get_repeater_dmrid())
-        self.queue_outgoing.put_nowait(packet)
+        self.send(struct.pack(">7sI", b"RPTPING", self.config.repeater_id))
 
     def send_closing(self) -> None:
         self.log_info("Closing MMDVM connection")
-        packet = struct.pack(">5sI", b"RPTCL", self.settings.get_repeater_dmrid())
-        self.queue_outgoing.put_nowait(packet)
+        self.send(struct.pack(">5sI", b"RPTCL", self.config.repeater_id))
 
     def disconnect(self) -> None:
-        if self.transport and not self.transport.is_closing():
+        if self.connection_status == self.CON_LOGIN_SUCCESSFULL:
             self.send_closing()
+        self.connection_status = self.CON_NEW
+        self.set_logged_in(False)
@@ -0,0 +1,368 @@
+import asyncio
+import os
+from asyncio import transports, DatagramProtocol
+from hashlib import sha256
+from time import time
+from typing import Optional, Callable, Tuple, Dict, Set, List, Iterable
+from uuid import UUID
+
+from kaitaistruct import KaitaiStructError
+
+from okdmr.dmrlib.storage import ADDRESS_TYPE
+from okdmr.dmrlib.storage.repeater import Repeater
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
+
+ROUTE_TYPE = Tuple[int, int]
+""" (destination id - talkgroup or radio, timeslot 1/2) """
+DMRD_CALLBACK_TYPE = Callable[[bytes, Repeater], None]
+""" (raw DMRD frame, repeater that sent it) """
+
+
+class MMDVMPeer:
+    """
+    Session of single repeater (peer) connected to the master
+    """
+
+    STATUS_CHALLENGE_SENT: int = 1
+    STATUS_AUTHENTICATED: int = 2
+    STATUS_CONNECTED: int = 3
+
+    def __init__(self, rpt: Repeater, challenge: bytes):
+        self.rpt: Repeater = rpt
+        self.addr: ADDRESS_TYPE = rpt.address_in
+        self.status: int = self.STATUS_CHALLENGE_SENT
+        self.challenge: bytes = challenge
+        self.last_seen: float = time()
+        self.subscriptions: Set[ROUTE_TYPE] = set()
+        self.outgoing: List[bytes] = []
+        """ frames to be sent in next flush """
+
+    @staticmethod
+    def parse_options(options: str) -> Set[ROUTE_TYPE]:
+        """
+        Parses RPTO options in common (HBlink/FreeDMR) format, eg. "TS1=2,9;TS2=230,231", unknown keys are ignored
+        """
+        routes: Set[ROUTE_TYPE] = set()
+        for option in options.replace(" ", "").split(";"):
+            key, _, values = option.partition("=")
+            if key.upper() not in ("TS1", "TS2"):
+                continue
+            timeslot: int = int(key[2])
+            for value in values.split(","):
+                if value.isdigit():
+                    routes.add((int(value), timeslot))
+        return routes
+
+    def __repr__(self) -> str:
+        return f"[MMDVMPeer {self.rpt.dmr_id} {self.rpt.callsign} {self.addr[0]}:{self.addr[1]} status {self.status}]"
+
+
+class MMDVMMasterProtocol(DatagramProtocol, LoggingTrait):
+    """
+    MMDVM/Homebrew master (server), repeaters (peers) log in using RPTL/RPTK/RPTC handshake and are tracked in
+    RepeaterStorage (matched by address_in index on every packet)
+
+    DMRD frames are not parsed, only destination id and timeslot are read from fixed offsets and the frame is
+    forwarded unchanged to peers subscribed to (destination, timeslot), using routing table precomputed when
+    peers log in/out or change subscriptions; frames for each peer are collected and sent once per event loop
+    iteration
+    """
+
+    def __init__(
+        self,
+        password: str = "passw0rd",
+        storage: Optional[RepeaterStorage] = None,
+        peer_timeout: float = 30,
+        default_subscriptions: Iterable[ROUTE_TYPE] = (),
+        dmrd_callback: Optional[DMRD_CALLBACK_TYPE] = None,
+    ) -> None:
+        """
+        :param password: shared secret of all the peers
+        :param storage: registry of connected peers, new one is created if not provided
+        :param peer_timeout: peer is removed if nothing is received from it for this long
+        :param default_subscriptions: routes (destination, timeslot) assigned to every peer on login
+        :param dmrd_callback: called with every DMRD frame received from connected peer
+        """
+        self.password: bytes = password.encode()
+        self.storage: RepeaterStorage = (
+            storage if storage is not None else RepeaterStorage()
+        )
+        self.peer_timeout: float = peer_timeout
+        self.default_subscriptions: Set[ROUTE_TYPE] = set(default_subscriptions)
+        self.dmrd_callback: Optional[DMRD_CALLBACK_TYPE] = dmrd_callback
+        self.transport: Optional[transports.DatagramTransport] = None
+        self.peers: Dict[UUID, MMDVMPeer] = {}
+        self.routes: Dict[ROUTE_TYPE, Tuple[MMDVMPeer, ...]] = {}
+        self.pending: List[MMDVMPeer] = []
+        """ peers with frames waiting for flush """
+        self.flush_scheduled: bool = False
+        self.received: int = 0
+        self.forwarded: int = 0
+        self.dropped: int = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self, local_addr: ADDRESS_TYPE) -> "MMDVMMasterProtocol":
+        """
+        Binds master socket and starts removing timed-out peers
+        """
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=local_addr)
+        self.task = loop.create_task(self.periodic_maintenance())
+        return self
+
+    async def close(self) -> None:
+        """
+        Tells all the peers the master is closing and closes the socket
+        """
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for peer in list(self.peers.values()):
+            self.send_control(b"MSTCL", peer.rpt.dmr_id, peer.addr)
+            self.remove_peer(peer, reason="master closing")
+        if self.transport and not self.transport.is_closing():
+            self.transport.close()
+
+    @property
+    def local_addr(self) -> Optional[ADDRESS_TYPE]:
+        return self.transport.get_extra_info("sockname") if self.transport else None
+
+    def connection_made(self, transport: transports.BaseTransport) -> None:
+        self.transport = transport
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if exc:
+            self.log_exception(exc)
+        self.transport = None
+
+    def peer(self, addr: ADDRESS_TYPE) -> Optional[MMDVMPeer]:
+        rpt: Optional[Repeater] = self.storage.match_attr("address_in", addr)
+        return self.peers.get(rpt.id) if rpt else None
+
+    def subscribe(self, peer: MMDVMPeer, routes: Iterable[ROUTE_TYPE]) -> None:
+        added: Set[ROUTE_TYPE] = set(routes) - peer.subscriptions
+        peer.subscriptions.update(added)
+        if peer.status == MMDVMPeer.STATUS_CONNECTED:
+            self.routes_add(peer, added)
+
+    def unsubscribe(self, peer: MMDVMPeer, routes: Iterable[ROUTE_TYPE]) -> None:
+        removed: Set[ROUTE_TYPE] = set(routes) & peer.subscriptions
+        peer.subscriptions.difference_update(removed)
+        if peer.status == MMDVMPeer.STATUS_CONNECTED:
+            self.routes_remove(peer, removed)
+
+    def routes_add(self, peer: MMDVMPeer, routes: Iterable[ROUTE_TYPE]) -> None:
+        # only affected routes are updated, so (re)connecting peer does not depend on number of other peers
+        for route in routes:
+            self.routes[route] = self.routes.get(route, ()) + (peer,)
+
+    def routes_remove(self, peer: MMDVMPeer, routes: Iterable[ROUTE_TYPE]) -> None:
+        for route in routes:
+            remaining: Tuple[MMDVMPeer, ...] = tuple(
+                subscriber
+                for subscriber in self.routes.get(route, ())
+                if subscriber is not peer
+            )
+            if remaining:
+                self.routes[route] = remaining
+            else:
+                self.routes.pop(route, None)
+
+    def rebuild_routes(self) -> None:
+        """
+        Recomputes whole routing table, (destination, timeslot) -> subscribed connected peers, needed only if
+        subscriptions of peers were modified directly
+        """
+        routes: Dict[ROUTE_TYPE, List[MMDVMPeer]] = {}
+        for peer in self.peers.values():
+            if peer.status != MMDVMPeer.STATUS_CONNECTED:
+                continue
+            for route in peer.subscriptions:
+                routes.setdefault(route, []).append(peer)
+        self.routes = {route: tuple(peers) for route, peers in routes.items()}
+
+    def remove_peer(self, peer: MMDVMPeer, reason: str) -> None:
+        if self.peers.pop(peer.rpt.id, None) is None:
+            return
+        self.log_info(f"Removing {peer}: {reason}")
+        self.storage.remove(peer.rpt)
+        if peer.status == MMDVMPeer.STATUS_CONNECTED:
+            self.routes_remove(peer, peer.subscriptions)
+
+    def check_peers(self, now: Optional[float] = None) -> None:
+        now = time() if now is None else now
+        for peer in list(self.peers.values()):
+            if now - peer.last_seen > self.peer_timeout:
+                self.remove_peer(peer, reason=f"no packet for {self.peer_timeout}s")
+
+    async def periodic_maintenance(self) -> None:
+        while not asyncio.get_running_loop().is_closed():
+            await asyncio.sleep(min(5.0, self.peer_timeout / 2))
+            self.check_peers()
+
+    def send_control(
+        self, command: bytes, repeater_id: int, addr: ADDRESS_TYPE
+    ) -> None:
+        if self.transport:
+            self.transport.sendto(
+                command + repeater_id.to_bytes(4, byteorder="big"), addr
+            )
+
+    def flush(self) -> None:
+        """
+        Sends all the frames collected during last event loop iteration
+        """
+        self.flush_scheduled = False
+        pending, self.pending = self.pending, []
+        if not self.transport:
+            return
+        sendto = self.transport.sendto
+        for peer in pending:
+            frames, peer.outgoing = peer.outgoing, []
+            for frame in frames:
+                sendto(frame, peer.addr)
+
+    def datagram_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        command: bytes = data[:4]
+        if command == b"DMRD":
+            self.dmrd_received(data, addr)
+        elif command == b"RPTL":
+            self.login_request_received(data, addr)
+        elif command == b"RPTK":
+            self.login_response_received(data, addr)
+        elif data[:5] == b"RPTCL":
+            peer: Optional[MMDVMPeer] = self.peer(addr)
+            if peer:
+                self.remove_peer(peer, reason="peer closing")
+        elif command == b"RPTC":
+            self.configuration_received(data, addr)
+        elif data[:7] == b"RPTPING":
+            self.ping_received(data, addr)
+        elif command == b"RPTO":
+            self.options_received(data, addr)
+        else:
+            self.log_debug(f"Unhandled packet from {addr}: {data.hex()}")
+
+    def dmrd_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        # hot path, keep lookups and allocations to minimum
+        self.received += 1
+        peer: Optional[MMDVMPeer] = self.peer(addr)
+        if peer is None or peer.status != MMDVMPeer.STATUS_CONNECTED or len(data) < 53:
+            self.dropped += 1
+            if peer is None:
+                self.send_control(b"MSTNAK", int.from_bytes(data[11:15], "big"), addr)
+            return
+        peer.last_seen = time()
+        if self.dmrd_callback:
+            self.dmrd_callback(data, peer.rpt)
+        subscribers: Tuple[MMDVMPeer, ...] = self.routes.get(
+            (int.from_bytes(data[8:11], "big"), 2 if data[15] & 0x80 else 1), ()
+        )
+        for subscriber in subscribers:
+            if subscriber is peer:
+                continue
+            if not subscriber.outgoing:
+                self.pending.append(subscriber)
+            subscriber.outgoing.append(data)
+            self.forwarded += 1
+        if self.pending and not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def login_request_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        repeater_id: int = int.from_bytes(data[4:8], "big")
+        for previous in {self.peer(addr), self.peer_by_dmr_id(repeater_id)} - {None}:
+            # repeater restarted or changed address
+            self.remove_peer(previous, reason="new login request")
+        rpt: Repeater = self.storage.create_repeater(
+            dmr_id=repeater_id, address_in=addr, address_out=addr
+        )
+        rpt.snmp_enabled = False
+        self.storage.add(rpt)
+        peer = MMDVMPeer(rpt=rpt, challenge=os.urandom(4))
+        self.peers[rpt.id] = peer
+        self.log_info(f"Login request from {peer}")
+        if self.transport:
+            self.transport.sendto(b"RPTACK" + peer.challenge, addr)
+
+    def peer_by_dmr_id(self, repeater_id: int) -> Optional[MMDVMPeer]:
+        rpt: Optional[Repeater] = self.storage.match_attr("dmr_id", repeater_id)
+        return self.peers.get(rpt.id) if rpt else None
+
+    def login_response_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        repeater_id: int = int.from_bytes(data[4:8], "big")
+        peer: Optional[MMDVMPeer] = self.peer(addr)
+        if (
+            not peer
+            or peer.status != MMDVMPeer.STATUS_CHALLENGE_SENT
+            or peer.rpt.dmr_id != repeater_id
+        ):
+            self.send_control(b"MSTNAK", repeater_id, addr)
+            return
+        if data[8:40] != sha256(peer.challenge + self.password).digest():
+            self.remove_peer(peer, reason="invalid password")
+            self.send_control(b"MSTNAK", repeater_id, addr)
+            return
+        peer.status = MMDVMPeer.STATUS_AUTHENTICATED
+        peer.last_seen = time()
+        self.send_control(b"RPTACK", repeater_id, addr)
+
+    def configuration_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        peer: Optional[MMDVMPeer] = self.peer(addr)
+        if not peer or peer.status == MMDVMPeer.STATUS_CHALLENGE_SENT:
+            self.send_control(b"MSTNAK", int.from_bytes(data[4:8], "big"), addr)
+            return
+        try:
+            config = Mmdvm2020.from_bytes(data).command_data.data
+        except (KaitaiStructError, EOFError, UnicodeDecodeError):
+            self.log_error(f"Invalid configuration from {peer}: {data.hex()}")
+            self.send_control(b"MSTNAK", peer.rpt.dmr_id, addr)
+            return
+        self.storage.save(
+            peer.rpt,
+            patch={
+                "callsign": config.call_sign.strip(),
+                "rx_freq": config.rx_freq,
+                "tx_freq": config.tx_freq,
+                "color_code": config.color_code,
+                "location": config.location.strip(),
+                "description": config.description.strip(),
+                "slots": config.slots,
+                "url": config.url.strip(),
+                "software_id": config.software_id.strip(),
+                "package_id": config.package_id.strip(),
+            },
+        )
+        peer.last_seen = time()
+        if peer.status != MMDVMPeer.STATUS_CONNECTED:
+            peer.status = MMDVMPeer.STATUS_CONNECTED
+            peer.subscriptions.update(self.default_subscriptions)
+            self.routes_add(peer, peer.subscriptions)
+            self.log_info(f"Connected {peer}")
+        self.send_control(b"RPTACK", peer.rpt.dmr_id, addr)
+
+    def options_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        peer: Optional[MMDVMPeer] = self.peer(addr)
+        if not peer or peer.status != MMDVMPeer.STATUS_CONNECTED:
+            self.send_control(b"MSTNAK", int.from_bytes(data[4:8], "big"), addr)
+            return
+        peer.last_seen = time()
+        # options replace previous subscriptions of the peer, default subscriptions are kept
+        subscriptions: Set[ROUTE_TYPE] = self.default_subscriptions | (
+            MMDVMPeer.parse_options(data[8:].decode("ascii", errors="ignore"))
+        )
+        self.unsubscribe(peer, peer.subscriptions - subscriptions)
+        self.subscribe(peer, subscriptions)
+        self.send_control(b"RPTACK", peer.rpt.dmr_id, addr)
+
+    def ping_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        repeater_id: int = int.from_bytes(data[7:11], "big")
+        peer: Optional[MMDVMPeer] = self.peer(addr)
+        if not peer or peer.status != MMDVMPeer.STATUS_CONNECTED:
+            self.send_control(b"MSTNAK", repeater_id, addr)
+            return
+        peer.last_seen = time()
+        self.send_control(b"MSTPONG", repeater_id, addr)
@@ -115,6 +115,7 @@ class Repeater:
         patch_self: bool = True,
     ) -> Dict[str, any]:
         """
+        Blocking read, must not be called from running event loop, use SNMPEnrichment there
 
         Returns:
 
@@ -1,6 +1,6 @@
 import logging
 from logging import Logger
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, Hashable
 from uuid import UUID
 
 from okdmr.dmrlib.storage import ADDRESS_TYPE, ADDRESS_EMPTY
@@ -10,11 +10,26 @@ from okdmr.dmrlib.storage.repeater import Repeater
 class RepeaterStorage:
     """
     OK-DMR Generic Repeater Storage
+
+    Repeaters are indexed by attributes in INDEXED_ATTRS (and by IP of address_in), so matching incoming datagrams
+    does not depend on number of stored repeaters, indexes are updated through save/patch/match_incoming,
+    if you modify indexed attributes of stored Repeater directly, call reindex afterwards
     """
 
+    INDEXED_ATTRS: Tuple[str, ...] = ("address_in", "dmr_id", "callsign", "id")
+    INDEX_IP_INCOMING: str = "address_in_ip"
+    """ name of the index, holding IP part of address_in """
+
     def __init__(self, logger: Logger = None):
         self.__repeaters: Dict[UUID, Repeater] = dict()
         self.__logger = logging.getLogger("StorageInterface") if not logger else logger
+        self.__indexes: Dict[str, Dict[Hashable, Dict[UUID, Repeater]]] = {
+            index_name: dict()
+            for index_name in self.INDEXED_ATTRS + (self.INDEX_IP_INCOMING,)
+        }
+        """ index name -> value -> repeaters with such value (in order of indexing) """
+        self.__indexed_values: Dict[UUID, Dict[str, Hashable]] = dict()
+        """ values under which is each repeater indexed, so it can be removed even after direct modification """
 
     def match_incoming(
         self,
@@ -27,10 +42,42 @@ class RepeaterStorage:
         if not found and auto_create:
             found = self.create_repeater(dmr_id=None, address_in=address)
             # store the newly created repeater
-            self.__repeaters[found.id] = found
+            self.add(found)
 
         return self.save(rpt=found, patch=patch)
 
+    def add(self, rpt: Repeater) -> Repeater:
+        """
+        Will store (or replace stored with the same id) Repeater and index it
+
+        Args:
+            rpt:
+
+        Returns:
+            Repeater/rpt
+        """
+        if rpt.id in self.__repeaters:
+            self.__unindex(self.__repeaters[rpt.id])
+        self.__repeaters[rpt.id] = rpt
+        self.__index(rpt)
+        return rpt
+
+    def remove(self, rpt: Repeater) -> bool:
+        """
+        Will remove Repeater from storage and indexes
+
+        Args:
+            rpt:
+
+        Returns:
+            True if the repeater was stored, False otherwise
+        """
+        if rpt.id not in self.__repeaters:
+            return False
+        self.__unindex(rpt)
+        del self.__repeaters[rpt.id]
+        return True
+
     def save(self, rpt: Repeater, patch: Dict[str, any] = {}) -> Repeater:
         """
         Will save modified Repeater in the storage, and return it right after
@@ -43,12 +90,84 @@ class RepeaterStorage:
 
         """
         if len(patch):
+            if rpt.id in self.__repeaters:
+                self.__unindex(self.__repeaters[rpt.id])
             self.__repeaters.update({rpt.id: rpt.patch(patch=patch)})
+            self.__index(rpt)
         return rpt
 
+    def reindex(self, rpt: Repeater) -> Repeater:
+        """
+        Will update indexes of stored Repeater, after its indexed attributes were modified directly
+
+        Args:
+            rpt:
+
+        Returns:
+            Repeater/rpt
+        """
+        if rpt.id in self.__repeaters:
+            self.__unindex(rpt)
+            self.__index(rpt)
+        return rpt
+
+    def __index_values(self, rpt: Repeater) -> Dict[str, Hashable]:
+        values: Dict[str, Hashable] = {
+            attr_name: getattr(rpt, attr_name) for attr_name in self.INDEXED_ATTRS
+        }
+        values[self.INDEX_IP_INCOMING] = rpt.address_in[0] if rpt.address_in else None
+        return values
+
+    def __index(self, rpt: Repeater) -> None:
+        values: Dict[str, Hashable] = self.__index_values(rpt)
+        for index_name, value in list(values.items()):
+            try:
+                matching: Dict[UUID, Repeater] = self.__indexes[index_name].setdefault(
+                    value, dict()
+                )
+            except TypeError:
+                # unhashable values are never indexed
+                del values[index_name]
+                continue
+            matching[rpt.id] = rpt
+            if (
+                len(matching) > 1
+                and value
+                and value != ADDRESS_EMPTY
+                and index_name != self.INDEX_IP_INCOMING
+            ):
+                # duplicates are detected once, when indexing, not on every match
+                # multiple repeaters behind single (NAT) IP are expected
+                self.__logger.critical(
+                    f"index {index_name} found duplicate for value {value}"
+                )
+        self.__indexed_values[rpt.id] = values
+
+    def __unindex(self, rpt: Repeater) -> None:
+        for index_name, value in self.__indexed_values.pop(rpt.id, {}).items():
+            matching: Optional[Dict[UUID, Repeater]] = self.__indexes[index_name].get(
+                value
+            )
+            if matching is None:
+                continue
+            matching.pop(rpt.id, None)
+            if not matching:
+                del self.__indexes[index_name][value]
+
+    def __match_index(self, index_name: str, value: any) -> Optional[Repeater]:
+        try:
+            matching: Optional[Dict[UUID, Repeater]] = self.__indexes[index_name].get(
+                value
+            )
+        except TypeError:
+            # unhashable values are never indexed
+            return None
+        return next(iter(matching.values())) if matching else None
+
     def match_attr(self, attr_name: str, match_value: any) -> Optional[Repeater]:
         """
         Will match any Repeater attribute (by attr_name) against match_value
+        Attributes in INDEXED_ATTRS are matched using index, others by iterating all the stored repeaters
 
         Args:
             attr_name:
@@ -57,6 +176,9 @@ class RepeaterStorage:
         Returns:
             Repeater or None if matchin fails
         """
+        if attr_name in self.__indexes:
+            return self.__match_index(attr_name, match_value)
+
         found: Optional[Repeater] = None
         for repeater in self.__repeaters.values():
             if getattr(repeater, attr_name) == match_value:
@@ -69,16 +191,7 @@ class RepeaterStorage:
         return found
 
     def match_ip_incoming(self, ip: str) -> Optional[Repeater]:
-        found: Optional[Repeater] = None
-        for repeater in self.__repeaters.values():
-            if repeater.address_in[0] == ip:
-                if not found:
-                    found = repeater
-                else:
-                    self.__logger.critical(
-                        f"match_ip_incoming found duplicate for IP:{ip}"
-                    )
-        return found
+        return self.__match_index(self.INDEX_IP_INCOMING, ip)
 
     def match_uuid(self, uuid: UUID) -> Optional[Repeater]:
         """
@@ -88,7 +201,7 @@ class RepeaterStorage:
         Returns:
             Repeater or None if matching fails
         """
-        found = self.match_attr("id", uuid)
+        found = self.__repeaters.get(uuid)
         if not found:
             raise SystemError(f"match_uuid failed for {uuid}")
         return found
@@ -0,0 +1,323 @@
+from typing import Any, BinaryIO, Callable, List, Literal, Optional, Tuple
+
+import numpy
+from bitarray.util import ba2int
+from scapy.layers.inet import IP, UDP
+
+from okdmr.dmrlib.etsi.crc.crc16 import CRC16
+from okdmr.dmrlib.etsi.fec.bptc_196_96 import BPTC19696
+from okdmr.dmrlib.etsi.fec.reed_solomon_12_9_4 import ReedSolomon1294
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.crc_masks import CrcMasks
+from okdmr.dmrlib.etsi.layer2.elements.data_types import DataTypes
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+from okdmr.dmrlib.utils.parsing import try_parse_packet
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
+from okdmr.kaitai.hytera.ip_site_connect_protocol import IpSiteConnectProtocol
+
+EXPORT_FORMATS = Literal["npy", "parquet"]
+
+BURST_EXPORT_DTYPE: numpy.dtype = numpy.dtype(
+    [
+        ("timestamp", "<f8"),
+        ("src_ip", "S15"),
+        ("src_port", "<u2"),
+        ("dst_ip", "S15"),
+        ("dst_port", "<u2"),
+        ("protocol", "S5"),
+        ("timeslot", "u1"),
+        ("sequence_no", "u1"),
+        ("sync", "S20"),
+        ("data_type", "S24"),
+        ("voice_burst", "S12"),
+        ("colour_code", "i1"),
+        ("source", "<u4"),
+        ("target", "<u4"),
+        ("fec_corrected_bits", "<i2"),
+        ("crc_ok", "i1"),
+        ("stream_id", "<u4"),
+    ]
+)
+"""
+One row per burst, fixed width so batches are plain numpy record arrays,
+colour_code / fec_corrected_bits / crc_ok use -1 where not applicable to the burst
+"""
+
+BPTC_DATA_TYPES: Tuple[DataTypes, ...] = (
+    DataTypes.PIHeader,
+    DataTypes.VoiceLCHeader,
+    DataTypes.TerminatorWithLC,
+    DataTypes.CSBK,
+    DataTypes.MBCHeader,
+    DataTypes.MBCContinuation,
+    DataTypes.DataHeader,
+    DataTypes.Rate12Data,
+    DataTypes.Idle,
+    DataTypes.UnifiedSingleBlockData,
+)
+
+
+def fec_corrected_bits(burst: Burst) -> int:
+    """
+    Number of bits changed by BPTC(196,96) error correction, -1 for bursts not protected by BPTC
+    """
+    if not burst.is_data_or_control or burst.data_type not in BPTC_DATA_TYPES:
+        return -1
+    original = burst.info_bits_original
+    repaired = BPTC19696.repair_if_necessary(original.copy())
+    return (original ^ repaired).count(1)
+
+
+def crc_ok(burst: Burst) -> int:
+    """
+    :return: 1 if CRC/checksum of burst payload matches, 0 if not, -1 if the burst payload has no checksum
+    """
+    if not burst.is_data_or_control or burst.info_bits_deinterleaved is None:
+        return -1
+
+    bits = burst.info_bits_deinterleaved
+    if burst.data_type == DataTypes.CSBK:
+        return int(
+            CRC16.check(bits[0:80].tobytes(), ba2int(bits[80:96]), CrcMasks.CSBK)
+        )
+    elif burst.data_type in (DataTypes.VoiceLCHeader, DataTypes.TerminatorWithLC):
+        mask = (
+            CrcMasks.VoiceLCHeader
+            if burst.data_type == DataTypes.VoiceLCHeader
+            else CrcMasks.TerminatorWithLC
+        )
+        return int(
+            ReedSolomon1294.check(
+                bits[0:96].tobytes(), mask.value.to_bytes(3, byteorder="big")
+            )
+        )
+    elif hasattr(burst.data, "crc_ok"):
+        return int(burst.data.crc_ok)
+    elif hasattr(burst.data, "crc9_ok") and burst.data.is_confirmed():
+        return int(burst.data.crc9_ok)
+
+    return -1
+
+
+class BurstExportWriter:
+    """
+    Collects rows into preallocated record batch of fixed size, full batches are passed to write_batch,
+    so the memory used does not depend on capture size
+    """
+
+    def __init__(self, path: str, batch_size: int = 65_536):
+        """
+
+        :param path: output file
+        :param batch_size: number of rows held in memory before writing
+        """
+        assert batch_size > 0, f"batch_size must be positive, got {batch_size}"
+        self.path: str = path
+        self.batch: numpy.ndarray = numpy.zeros(batch_size, dtype=BURST_EXPORT_DTYPE)
+        self.batch_rows: int = 0
+        self.rows_written: int = 0
+
+    def append(self, row: Tuple) -> None:
+        """
+        :param row: tuple of values in order of BURST_EXPORT_DTYPE fields
+        """
+        self.batch[self.batch_rows] = row
+        self.batch_rows += 1
+        if self.batch_rows == len(self.batch):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.batch_rows:
+            self.write_batch(self.batch[: self.batch_rows])
+            self.rows_written += self.batch_rows
+            self.batch_rows = 0
+
+    def write_batch(self, batch: numpy.ndarray) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        self.flush()
+
+    @staticmethod
+    def create(
+        path: str,
+        export_format: Optional[EXPORT_FORMATS] = None,
+        batch_size: int = 65_536,
+    ) -> "BurstExportWriter":
+        """
+        :param path:
+        :param export_format: None to choose by file extension (.parquet, anything else is npy)
+        :param batch_size:
+        """
+        if not export_format:
+            export_format = "parquet" if path.endswith(".parquet") else "npy"
+        if export_format == "npy":
+            return NumpyBurstExportWriter(path=path, batch_size=batch_size)
+        elif export_format == "parquet":
+            return ParquetBurstExportWriter(path=path, batch_size=batch_size)
+
+        raise ValueError(f"Unknown export format {export_format}")
+
+
+class NumpyBurstExportWriter(BurstExportWriter):
+    """
+    Writes standard .npy file (1-D structured array), batches are appended as raw records and the header (with
+    total shape) is rewritten on close, result can be opened with numpy.load(path, mmap_mode="r") without
+    loading whole file into memory
+    """
+
+    HEADER_SIZE: int = 512
+    """ fixed header size, large enough for any row count, keeps data 64-byte aligned """
+
+    def __init__(self, path: str, batch_size: int = 65_536):
+        super().__init__(path=path, batch_size=batch_size)
+        self.file: BinaryIO = open(path, "wb")
+        self.file.write(self.make_header(rows=0))
+
+    @staticmethod
+    def make_header(rows: int) -> bytes:
+        header: bytes = repr(
+            {
+                "descr": numpy.lib.format.dtype_to_descr(BURST_EXPORT_DTYPE),
+                "fortran_order": False,
+                "shape": (rows,),
+            }
+        ).encode("latin1")
+        # magic (6) + version (2) + header length (2)
+        header_len: int = NumpyBurstExportWriter.HEADER_SIZE - 10
+        assert len(header) < header_len, "npy header does not fit reserved space"
+        header = header.ljust(header_len - 1, b" ") + b"\n"
+        return (
+            b"\x93NUMPY\x01\x00" + header_len.to_bytes(2, byteorder="little") + header
+        )
+
+    def write_batch(self, batch: numpy.ndarray) -> None:
+        self.file.write(batch.tobytes())
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        super().close()
+        self.file.seek(0)
+        self.file.write(self.make_header(rows=self.rows_written))
+        self.file.close()
+
+
+class ParquetBurstExportWriter(BurstExportWriter):
+    """
+    Parquet export, each batch is written as single row group, requires optional pyarrow package
+    """
+
+    def __init__(self, path: str, batch_size: int = 65_536):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError(
+                "Parquet export requires pyarrow, install it or use npy export format"
+            )
+        super().__init__(path=path, batch_size=batch_size)
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema(
+            [
+                (
+                    name,
+                    (
+                        pyarrow.string()
+                        if BURST_EXPORT_DTYPE[name].kind == "S"
+                        else pyarrow.from_numpy_dtype(BURST_EXPORT_DTYPE[name])
+                    ),
+                )
+                for name in BURST_EXPORT_DTYPE.names
+            ]
+        )
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_batch(self, batch: numpy.ndarray) -> None:
+        columns: List[Any] = [
+            (
+                numpy.char.decode(batch[name], "ascii")
+                if BURST_EXPORT_DTYPE[name].kind == "S"
+                else batch[name]
+            )
+            for name in BURST_EXPORT_DTYPE.names
+        ]
+        self.writer.write_table(
+            self.pyarrow.Table.from_arrays(columns, schema=self.schema)
+        )
+
+    def close(self) -> None:
+        if self.writer is None:
+            return
+        super().close()
+        self.writer.close()
+        self.writer = None
+
+
+class BurstExporter(LoggingTrait):
+    """
+    PcapTool (or LiveCapture) callback, decodes IPSC/MMDVM bursts and appends one export row for each
+    """
+
+    def __init__(
+        self,
+        writer: BurstExportWriter,
+        burst_listener: Optional[Callable[[Burst, str], Any]] = None,
+    ):
+        """
+        :param writer:
+        :param burst_listener: called with (burst, protocol) for every exported burst
+        """
+        self.writer: BurstExportWriter = writer
+        self.burst_listener: Optional[Callable[[Burst, str], Any]] = burst_listener
+
+    def process_packet(self, data: bytes, packet: IP) -> Optional[Burst]:
+        pkt = try_parse_packet(udpdata=data)
+        if isinstance(pkt, IpSiteConnectProtocol):
+            burst: Burst = Burst.from_hytera_ipsc(pkt)
+            protocol: str = "IPSC"
+            sequence_no: int = pkt.sequence_number
+        elif isinstance(pkt, Mmdvm2020) and isinstance(
+            pkt.command_data, Mmdvm2020.TypeDmrData
+        ):
+            burst: Burst = Burst.from_mmdvm(pkt.command_data)
+            protocol: str = "MMDVM"
+            sequence_no: int = pkt.command_data.sequence_no
+        else:
+            return None
+
+        if self.burst_listener:
+            self.burst_listener(burst, protocol)
+        udp: UDP = packet.getlayer(UDP)
+        self.writer.append(
+            (
+                float(packet.time),
+                packet.src,
+                udp.sport,
+                packet.dst,
+                udp.dport,
+                protocol,
+                burst.timeslot,
+                sequence_no & 0xFF,
+                burst.sync_or_embedded_signalling.name,
+                burst.data_type.name,
+                burst.voice_burst.name,
+                burst.colour_code if burst.has_emb or burst.has_slot_type else -1,
+                burst.source_radio_id,
+                burst.target_radio_id,
+                fec_corrected_bits(burst),
+                crc_ok(burst),
+                (
+                    burst.stream_no
+                    if isinstance(burst.stream_no, int)
+                    else int.from_bytes(burst.stream_no, byteorder="big")
+                ),
+            )
+        )
+        return burst
+
+    def close(self) -> None:
+        self.writer.close()
+        self.log_info(
+            f"Exported {self.writer.rows_written} bursts to {self.writer.path}"
+        )
@@ -0,0 +1,170 @@
+from time import perf_counter
+from typing import Callable, Dict, Optional, Tuple
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.tools.burst_export import crc_ok, fec_corrected_bits
+from okdmr.dmrlib.transmission.queued_observer import QueuedObserver
+from okdmr.dmrlib.transmission.stream_demultiplexer import StreamDemultiplexer
+from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
+from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
+from okdmr.dmrlib.utils.metrics import (
+    CounterChild,
+    HistogramChild,
+    MetricsRegistry,
+)
+
+
+class BurstCounters:
+    """
+    Children of per (peer, timeslot) metrics, resolved once for each repeater timeslot
+    """
+
+    def __init__(self, metrics: "DecodingMetrics", peer: str, timeslot: int):
+        self.fec_corrected_bits: CounterChild = metrics.fec_corrected_bits.labels(
+            peer, timeslot
+        )
+        self.fec_uncorrectable: CounterChild = metrics.fec_uncorrectable.labels(
+            peer, timeslot
+        )
+        self.by_data_type: Dict[str, CounterChild] = {}
+        self.crc_failures_by_data_type: Dict[str, CounterChild] = {}
+
+
+class DecodingMetrics:
+    """
+    Live decoding statistics, per repeater (network peer) and timeslot, see MetricsRegistry/MetricsServer
+
+    Counters are updated by process_burst (burst_listener of PcapTool.debug_packet and its callbacks), latency by callbacks wrapped with
+    instrument(), sizes of tables and queues are evaluated only when scraped
+    """
+
+    def __init__(
+        self, registry: Optional[MetricsRegistry] = None, fec_statistics: bool = False
+    ):
+        """
+        :param registry: new registry is created if not provided
+        :param fec_statistics: count FEC corrected bits and CRC failures, costs additional BPTC decoding of each
+                               data/control burst
+        """
+        self.registry: MetricsRegistry = registry or MetricsRegistry()
+        self.fec_statistics: bool = fec_statistics
+        self.packets = self.registry.counter(
+            "dmr_packets_total", "DMR packets decoded to burst", ("protocol",)
+        )
+        self.bursts = self.registry.counter(
+            "dmr_bursts_total",
+            "Bursts by repeater, timeslot and data type",
+            ("peer", "timeslot", "data_type"),
+        )
+        self.fec_corrected_bits = self.registry.counter(
+            "dmr_fec_corrected_bits_total",
+            "Bits corrected by BPTC(196,96)",
+            ("peer", "timeslot"),
+        )
+        self.fec_uncorrectable = self.registry.counter(
+            "dmr_fec_uncorrectable_total",
+            "BPTC(196,96) protected bursts with CRC failure after correction",
+            ("peer", "timeslot"),
+        )
+        self.crc_failures = self.registry.counter(
+            "dmr_crc_failures_total",
+            "Bursts with CRC/checksum mismatch",
+            ("peer", "timeslot", "data_type"),
+        )
+        self.decode_latency = self.registry.histogram(
+            "dmr_decode_latency_seconds",
+            "Time spent decoding and processing single packet",
+        )
+        self.terminals = self.registry.gauge(
+            "dmr_terminals", "Terminals tracked by transmission watcher"
+        )
+        self.active_transmissions = self.registry.gauge(
+            "dmr_active_transmissions", "Voice and data transmissions in progress"
+        )
+        self.queue_depth = self.registry.gauge(
+            "dmr_observer_queue_depth", "Events waiting in queued observer", ("name",)
+        )
+        self.by_protocol: Dict[str, CounterChild] = {}
+        self.by_timeslot: Dict[Tuple[str, int], BurstCounters] = {}
+        self.latency: HistogramChild = self.decode_latency.labels()
+
+    def process_burst(self, burst: Burst, protocol: str = "") -> Burst:
+        packets: Optional[CounterChild] = self.by_protocol.get(protocol)
+        if not packets:
+            packets = self.packets.labels(protocol)
+            self.by_protocol[protocol] = packets
+        packets.inc()
+
+        counters: Optional[BurstCounters] = self.by_timeslot.get(
+            (burst.peer, burst.timeslot)
+        )
+        if not counters:
+            counters = BurstCounters(self, burst.peer, burst.timeslot)
+            self.by_timeslot[(burst.peer, burst.timeslot)] = counters
+
+        data_type: str = "Voice" if burst.is_vocoder else burst.data_type.name
+        bursts: Optional[CounterChild] = counters.by_data_type.get(data_type)
+        if not bursts:
+            bursts = self.bursts.labels(burst.peer, burst.timeslot, data_type)
+            counters.by_data_type[data_type] = bursts
+        bursts.inc()
+
+        if self.fec_statistics and not burst.is_vocoder:
+            corrected: int = fec_corrected_bits(burst)
+            if corrected > 0:
+                counters.fec_corrected_bits.inc(corrected)
+            if crc_ok(burst) == 0:
+                if corrected >= 0:
+                    counters.fec_uncorrectable.inc()
+                failures: Optional[CounterChild] = (
+                    counters.crc_failures_by_data_type.get(data_type)
+                )
+                if not failures:
+                    failures = self.crc_failures.labels(
+                        burst.peer, burst.timeslot, data_type
+                    )
+                    counters.crc_failures_by_data_type[data_type] = failures
+                failures.inc()
+        return burst
+
+    def instrument(self, callback: Callable) -> Callable:
+        """
+        Wrap packet callback (data, packet), to measure decode latency
+        """
+
+        def instrumented(*args, **kwargs):
+            start: float = perf_counter()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                self.latency.observe(perf_counter() - start)
+
+        return instrumented
+
+    def watch_transmission_watcher(
+        self, watcher: TransmissionWatcher
+    ) -> "DecodingMetrics":
+        def active_transmissions() -> int:
+            # copy is made atomically, the scrape runs in other thread than decoding
+            return sum(
+                1
+                for terminal in list(watcher.terminals.values())
+                for timeslot in list(terminal.timeslots.values())
+                if timeslot.transmission.type != TransmissionTypes.Idle
+            )
+
+        self.terminals.set_function(lambda: len(watcher.terminals))
+        self.active_transmissions.set_function(active_transmissions)
+        return self
+
+    def watch_stream_demultiplexer(
+        self, demultiplexer: StreamDemultiplexer
+    ) -> "DecodingMetrics":
+        self.active_transmissions.set_function(lambda: len(demultiplexer.streams))
+        return self
+
+    def watch_queued_observer(
+        self, name: str, observer: QueuedObserver
+    ) -> "DecodingMetrics":
+        self.queue_depth.labels(name).set_function(observer.queue.qsize)
+        return self
@@ -12,6 +12,7 @@ from okdmr.dmrlib.etsi.layer3.pdu.udp_ipv4_compressed_header import (
 from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
 from okdmr.dmrlib.utils.protocol_tool import ProtocolTool
 from okdmr.dmrlib.tools.pcap_tool import EmbeddedExtractor
+from okdmr.dmrlib.tools.pipeline import dsd_bursts
 
 
 class DmrlibTool(ProtocolTool):
@@ -64,37 +65,17 @@ class DmrlibTool(ProtocolTool):
         emb_extractor: EmbeddedExtractor = EmbeddedExtractor()
 
         with open(args.file, "r") as file:
-            while True:
-                line = file.readline()
-                if not line:
-                    break
+            for b in dsd_bursts(file, on_error=print):
+                try:
+                    from scapy.layers.inet import IP, UDP
+                    from scapy.packet import Raw
 
-                parts = line.split(" ")
-                if len(parts) == 3:
-                    timeslot = int(parts[0])
-                    burst_type = int(parts[1])
-                    burst_data = bytes.fromhex(parts[2])
-                    if burst_type not in (99, 98):
-                        try:
-                            from scapy.layers.inet import IP, UDP
-                            from scapy.packet import Raw
-
-                            b = Burst.from_bytes(
-                                data=burst_data,
-                                burst_type=(
-                                    BurstTypes.Vocoder
-                                    if burst_type == 10
-                                    else BurstTypes.DataAndControl
-                                ),
-                            )
-                            b.timeslot = timeslot
-
-                            b = watcher.process_burst(b)
-                            if b:
-                                print(repr(b))
-                                emb_extractor.process_packet(
-                                    data=b.as_bytes(),
-                                    packet=IP() / UDP() / Raw(burst_data),
-                                )
-                        except Exception as e:
-                            print(e)
+                    b = watcher.process_burst(b)
+                    if b:
+                        print(repr(b))
+                        emb_extractor.process_packet(
+                            data=b.as_bytes(),
+                            packet=IP() / UDP() / Raw(b.as_bytes()),
+                        )
+                except Exception as e:
+                    print(e)
@@ -1,15 +1,25 @@
 import asyncio
 import logging
+import os
 import sys
-import traceback
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
-from asyncio import DatagramProtocol, AbstractEventLoop
+from asyncio import AbstractEventLoop, DatagramTransport
 from dataclasses import dataclass
+from signal import SIGINT, SIGTERM
 from socket import AddressFamily
-from threading import Thread
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple, List, Any
 
-from okdmr.dmrlib.protocols.hytera.rrs_datagram_protocol import RRSDatagramProtocol
+from okdmr.dmrlib.hytera.pdu.hdap import HyteraServiceType
+from okdmr.dmrlib.hytera.pdu.hstrp import HSTRP
+from okdmr.dmrlib.protocols.hytera.hdap_datagram_protocol import (
+    HDAPDispatcher,
+    HDAPDatagramProtocol,
+    RRSDispatchingDatagramProtocol,
+)
+from okdmr.dmrlib.protocols.hytera.hstrp_datagram_protocol import (
+    HSTRPDatagramProtocol,
+    HSTRP_ADDRESS_TYPE,
+)
 from okdmr.dmrlib.utils.logging_trait import LoggingTrait
 
 
@@ -21,6 +31,7 @@ class HRNPClientConfiguration:
 
     # custom
     repeater_ip: str
+    local_ip: str
     # cps
     rrs1: int
     rrs2: int
@@ -41,46 +52,142 @@ class HRNPClientConfiguration:
 
 
 class HRNPClient(LoggingTrait):
-    def __init__(self, config: HRNPClientConfiguration) -> None:
+    SERVICES: Dict[str, Tuple[str, Optional[HyteraServiceType]]] = {
+        "rrs1": ("Radio Registration Service TS1", HyteraServiceType.RRS),
+        "rrs2": ("Radio Registration Service TS2", HyteraServiceType.RRS),
+        "gps1": ("Radio GPS Service TS1", HyteraServiceType.LP),
+        "gps2": ("Radio GPS Service TS2", HyteraServiceType.LP),
+        "tel1": ("Radio Telemetry TS1", HyteraServiceType.TP),
+        "tel2": ("Radio Telemetry TS2", HyteraServiceType.TP),
+        "tms1": ("Text Messaging Service TS1", HyteraServiceType.TMP),
+        "tms2": ("Text Messaging Service TS2", HyteraServiceType.TMP),
+        "rcc1": ("Radio Call Control TS1", HyteraServiceType.RCP),
+        "rcc2": ("Radio Call Control TS2", HyteraServiceType.RCP),
+        "rvs1": ("Radio Voice Service TS1", None),
+        "rvs2": ("Radio Voice Service TS2", None),
+        "e2e1": ("E2E Encrypted Data TS1", None),
+        "e2e2": ("E2E Encrypted Data TS2", None),
+        "sdmp1": ("Self-Defined Message Protocol (SDMP) TS1", None),
+        "sdmp2": ("Self-Defined Message Protocol (SDMP) TS2", None),
+    }
+    """ configuration field -> (description, expected HDAP service), all the services are carried over HSTRP,
+    except voice (RTP), which is not implemented yet """
+    NOT_HSTRP_SERVICES: Tuple[str, ...] = ("rvs1", "rvs2")
+
+    def __init__(
+        self,
+        config: HRNPClientConfiguration,
+        dispatcher: Optional[HDAPDispatcher] = None,
+        **protocol_kwargs,
+    ) -> None:
+        """
+        :param config:
+        :param dispatcher: shared dispatch table, default handlers (log_pdu) are registered if not provided
+        :param protocol_kwargs: passed to constructor of each service protocol (eg. window, retransmit_timeout)
+        """
         self.log_info(f"HRNP Client staring, config: {repr(config)}")
         self.is_running: bool = False
         self.config: HRNPClientConfiguration = config
-        self.services: Dict[int, DatagramProtocol] = {}
+        self.protocol_kwargs: Dict[str, Any] = protocol_kwargs
+        self.services: Dict[int, HSTRPDatagramProtocol] = {}
         """ dict port -> protocol handle """
+        self.transports: Dict[int, DatagramTransport] = {}
+        self.tasks: List[asyncio.Task] = []
         self.loop: Optional[AbstractEventLoop] = None
+        self.stopped: Optional[asyncio.Event] = None
+        self.dispatcher: HDAPDispatcher = dispatcher or self.default_dispatcher()
+
+    def default_dispatcher(self) -> HDAPDispatcher:
+        dispatcher = HDAPDispatcher()
+        dispatcher.register(HyteraServiceType.LP, self.log_pdu)
+        dispatcher.register(HyteraServiceType.TMP, self.log_pdu)
+        dispatcher.register(HyteraServiceType.RCP, self.log_pdu)
+        dispatcher.register(HyteraServiceType.TP, self.log_pdu)
+        # registrations are confirmed by RRSDatagramProtocol itself
+        dispatcher.register(HyteraServiceType.RRS, self.log_pdu)
+        return dispatcher
+
+    def log_pdu(
+        self, protocol: HSTRPDatagramProtocol, pdu: HSTRP, addr: HSTRP_ADDRESS_TYPE
+    ) -> None:
+        self.log_info(f"[{protocol.port}] {addr} {repr(pdu.payload)}")
 
     def stop(self) -> None:
+        """
+        Can be called from any thread or signal handler
+        """
         self.is_running = False
+        if self.loop and self.stopped and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopped.set)
 
-    async def go(self) -> None:
+    def create_protocol(self, name: str, port: int) -> HSTRPDatagramProtocol:
+        if self.SERVICES[name][1] == HyteraServiceType.RRS:
+            return RRSDispatchingDatagramProtocol(
+                port=port, dispatcher=self.dispatcher, **self.protocol_kwargs
+            )
+        return HDAPDatagramProtocol(
+            port=port, dispatcher=self.dispatcher, **self.protocol_kwargs
+        )
+
+    async def start(self) -> None:
+        """
+        Opens all configured service endpoints and starts their maintenance (connecting to repeater) as tasks
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
         self.is_running = True
+        for name, (description, _) in self.SERVICES.items():
+            port: int = getattr(self.config, name)
+            if name in self.NOT_HSTRP_SERVICES:
+                self.log_info(f"{description} on port {port} is not implemented")
+                continue
+            if port in self.services:
+                self.log_warning(
+                    f"{description} port {port} is already used by other service"
+                )
+                continue
+            protocol: HSTRPDatagramProtocol = self.create_protocol(name, port)
+            try:
+                transport, _ = await self.loop.create_datagram_endpoint(
+                    lambda: protocol,
+                    local_addr=(self.config.local_ip, port),
+                    remote_addr=(self.config.repeater_ip, port),
+                    reuse_port=True,
+                    family=AddressFamily.AF_INET,
+                )
+            except OSError:
+                # endpoints opened so far must not be left bound and maintained
+                await self.close()
+                raise
+            self.services[port] = protocol
+            self.transports[port] = transport
+            self.tasks.append(
+                self.loop.create_task(
+                    protocol.periodic_maintenance(), name=f"HRNP {name}"
+                )
+            )
+            self.log_debug(f"{description} listening on port {port}")
 
-        rrs1proto = RRSDatagramProtocol(self.config.rrs1)
-        rrs2proto = RRSDatagramProtocol(self.config.rrs2)
-        # Radio Registration Service handler
-        (
-            self.services[self.config.rrs1],
-            _,
-        ) = await asyncio.get_event_loop().create_datagram_endpoint(
-            lambda: rrs1proto,
-            local_addr=("0.0.0.0", self.config.rrs1),
-            remote_addr=(self.config.repeater_ip, self.config.rrs1),
-            reuse_port=True,
-            family=AddressFamily.AF_INET,
-        )
-        (
-            self.services[self.config.rrs2],
-            _,
-        ) = await asyncio.get_event_loop().create_datagram_endpoint(
-            lambda: rrs2proto,
-            local_addr=("0.0.0.0", self.config.rrs2),
-            remote_addr=(self.config.repeater_ip, self.config.rrs2),
-            reuse_port=True,
-            family=AddressFamily.AF_INET,
-        )
-
-        await asyncio.get_event_loop().create_task(rrs1proto.periodic_maintenance())
-        await asyncio.get_event_loop().create_task(rrs2proto.periodic_maintenance())
+    async def close(self) -> None:
+        self.is_running = False
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+        for transport in self.transports.values():
+            transport.close()
+        self.transports.clear()
+        self.services.clear()
+
+    async def go(self) -> None:
+        """
+        Serves all the services until stop() is called
+        """
+        try:
+            await self.start()
+            await self.stopped.wait()
+        finally:
+            await self.close()
 
     @staticmethod
     def args() -> ArgumentParser:
@@ -89,6 +196,13 @@ class HRNPClient(LoggingTrait):
         )
 
         args.add_argument("repeater_ip", type=str, help="Repeater IP address")
+        args.add_argument(
+            "--local-ip",
+            type=str,
+            default="0.0.0.0",
+            dest="local_ip",
+            help="Local IP address to bind service ports to",
+        )
         # args.add_argument("--1", type=int, default=30_00, help=" TS1")
         # args.add_argument("--2", type=int, default=30_00, help=" TS2")
         args.add_argument(
@@ -154,18 +268,14 @@ class HRNPClient(LoggingTrait):
             format="[%(asctime)s] [%(levelname)s] [{ %(message)s }]",
             datefmt="%X",
         )
-        mainlog = logging.getLogger("hrnp-connect-entry")
-        app_thread = None
-        app = None
-        try:
-            parsed = HRNPClient.args().parse_args(sys.argv[1:])
-            config = HRNPClientConfiguration(**vars(parsed))
-            app = HRNPClient(config=config)
-            app_thread = Thread(target=lambda: asyncio.run(app.go(), debug=True))
-            app_thread.start()
-            mainlog.info("Thread started")
-            app_thread.join()
-        except Exception:
-            traceback.print_last(file=sys.stderr)
-        finally:
-            app.stop()
+        parsed = HRNPClient.args().parse_args(sys.argv[1:])
+        config = HRNPClientConfiguration(**vars(parsed))
+        app = HRNPClient(config=config)
+
+        async def serve() -> None:
+            if os.name != "nt":
+                for signal in (SIGINT, SIGTERM):
+                    asyncio.get_running_loop().add_signal_handler(signal, app.stop)
+            await app.go()
+
+        asyncio.run(serve())
@@ -0,0 +1,300 @@
+import asyncio
+import os
+import socket
+import time
+from asyncio import AbstractEventLoop, Queue
+from typing import Any, Callable, List, Dict, Optional, Tuple
+
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.packet import Raw
+from scapy.utils import PcapWriter
+
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+ETH_P_ALL: int = 0x0003
+"""Linux if_ether.h, every packet (used to mirror traffic from SPAN/monitor interface)"""
+
+
+class RollingPcapWriter:
+    """
+    Writes captured packets into series of pcap files, starting new file (and removing the oldest ones) once the
+    current file reaches max_packets
+    """
+
+    def __init__(
+        self, path_prefix: str, max_packets: int = 100_000, max_files: int = 0
+    ):
+        """
+
+        :param path_prefix: files are named "{path_prefix}.{index}.pcap"
+        :param max_packets: number of packets after which the file is rotated
+        :param max_files: number of files to keep on disk, 0 means keep all
+        """
+        assert max_packets > 0, f"max_packets must be positive, got {max_packets}"
+        self.path_prefix: str = path_prefix
+        self.max_packets: int = max_packets
+        self.max_files: int = max_files
+        self.files: List[str] = []
+        self.file_index: int = 0
+        self.packets_in_file: int = 0
+        self.writer: Optional[PcapWriter] = None
+
+    def rotate(self) -> None:
+        self.close()
+        filename: str = f"{self.path_prefix}.{self.file_index}.pcap"
+        self.file_index += 1
+        self.packets_in_file = 0
+        self.writer = PcapWriter(filename)
+        self.files.append(filename)
+
+        if self.max_files and len(self.files) > self.max_files:
+            os.unlink(self.files.pop(0))
+
+    def write(self, packet: Ether) -> None:
+        if not self.writer or self.packets_in_file >= self.max_packets:
+            self.rotate()
+        self.writer.write(packet)
+        self.packets_in_file += 1
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+
+class LiveCapture(LoggingTrait):
+    """
+    Live counterpart of PcapTool.iter_pcap, receives UDP datagrams either on bound (listening) UDP ports or from raw
+    AF_PACKET socket (traffic mirrored to SPAN interface) and feeds them to the same callbacks (data, packet)
+    """
+
+    def __init__(
+        self,
+        callback: Callable,
+        listen_ports: List[int] = (),
+        listen_ip: str = "0.0.0.0",
+        interface: Optional[str] = None,
+        ports_whitelist: List[int] = (),
+        ports_blacklist: List[int] = (),
+        ip_whitelist: List[str] = (),
+        print_raw: bool = False,
+        batch_size: int = 64,
+        queue_size: int = 128,
+        pcap_writer: Optional[RollingPcapWriter] = None,
+        tick: Optional[Callable[[float], Any]] = None,
+        tick_interval: float = 1.0,
+    ):
+        """
+
+        :param callback: same callback signature as for PcapTool.iter_pcap (data: bytes, packet: IP)
+        :param listen_ports: UDP ports to bind and receive on
+        :param listen_ip: address to bind the listen_ports on
+        :param interface: name of interface for raw capture (requires CAP_NET_RAW), None to disable
+        :param batch_size: max number of datagrams read from single socket in one loop iteration
+        :param queue_size: max number of batches waiting for callback processing, when full, sockets are not read
+                           until the queue gets drained (packets then wait or get dropped in kernel buffers)
+        :param pcap_writer: optional writer to store all accepted packets
+        :param tick: called with current time() every tick_interval seconds, also when no packets are received,
+                     eg. TransmissionWatcher.expire to end calls with lost terminator
+        :param tick_interval: seconds between tick calls
+        """
+        assert (
+            len(listen_ports) or interface
+        ), "LiveCapture requires at least one listen port or interface"
+        self.callback: Callable = callback
+        self.listen_ports: List[int] = list(listen_ports)
+        self.listen_ip: str = listen_ip
+        self.interface: Optional[str] = interface
+        self.ports_whitelist: List[int] = list(ports_whitelist)
+        self.ports_blacklist: List[int] = list(ports_blacklist)
+        self.ip_whitelist: List[str] = list(ip_whitelist)
+        self.print_raw: bool = print_raw
+        self.batch_size: int = batch_size
+        self.queue_size: int = queue_size
+        self.pcap_writer: Optional[RollingPcapWriter] = pcap_writer
+        self.tick: Optional[Callable[[float], Any]] = tick
+        self.tick_interval: float = tick_interval
+
+        self.statistics: Dict[int, int] = dict()
+        self.bound_addresses: List[Tuple[str, int]] = []
+        self.batches_paused: int = 0
+        """ number of times the sockets reading was paused due to full queue """
+        self.sockets: List[socket.socket] = []
+        self.queue: Optional[Queue] = None
+        self.loop: Optional[AbstractEventLoop] = None
+        self.is_running: bool = False
+        self.is_reading: bool = False
+
+    def open_sockets(self) -> None:
+        for port in self.listen_ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.listen_ip, port))
+            sock.setblocking(False)
+            self.bound_addresses.append(sock.getsockname())
+            self.sockets.append(sock)
+
+        if self.interface:
+            # noinspection PyUnresolvedReferences
+            sock = socket.socket(
+                socket.AF_PACKET, socket.SOCK_RAW, socket.ntohs(ETH_P_ALL)
+            )
+            sock.bind((self.interface, 0))
+            sock.setblocking(False)
+            self.sockets.append(sock)
+
+    def close_sockets(self) -> None:
+        self.pause_reading()
+        for sock in self.sockets:
+            sock.close()
+        self.sockets.clear()
+
+    def resume_reading(self) -> None:
+        if self.is_reading or not self.loop:
+            return
+        for sock in self.sockets:
+            self.loop.add_reader(sock.fileno(), self.read_batch, sock)
+        self.is_reading = True
+
+    def pause_reading(self) -> None:
+        if not self.is_reading or not self.loop:
+            return
+        for sock in self.sockets:
+            self.loop.remove_reader(sock.fileno())
+        self.is_reading = False
+
+    def read_batch(self, sock: socket.socket) -> None:
+        """
+        Drain up to batch_size datagrams from the socket in single event-loop callback, Python does not expose
+        recvmmsg(2), so this is the closest equivalent to it
+        """
+        batch: List[Tuple[bytes, IP]] = []
+        is_raw: bool = sock.family != socket.AF_INET
+        now: float = time.time()
+        for _ in range(self.batch_size):
+            try:
+                data, addr = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            packet: Optional[IP] = (
+                self.raw_to_ip(data) if is_raw else self.udp_to_ip(data, addr, sock)
+            )
+            if packet:
+                packet.time = now
+                batch.append((bytes(packet.getlayer(UDP).payload), packet))
+
+        if not batch:
+            return
+
+        self.queue.put_nowait(batch)
+        if self.queue.full():
+            # backpressure, stop reading until consumer catches up
+            self.batches_paused += 1
+            self.pause_reading()
+
+    @staticmethod
+    def udp_to_ip(data: bytes, addr: Tuple[str, int], sock: socket.socket) -> IP:
+        local_ip, local_port = sock.getsockname()[:2]
+        return (
+            IP(src=addr[0], dst=local_ip)
+            / UDP(sport=addr[1], dport=local_port)
+            / Raw(load=data)
+        )
+
+    @staticmethod
+    def raw_to_ip(frame: bytes) -> Optional[IP]:
+        ether = Ether(frame)
+        if not ether.haslayer(UDP) or not ether.haslayer(IP):
+            return None
+        return ether.getlayer(IP)
+
+    def process_batch(self, batch: List[Tuple[bytes, IP]]) -> None:
+        # to avoid circular dependency problem import must be local/inline
+        from okdmr.dmrlib.tools.pcap_tool import PcapTool
+
+        for data, packet in batch:
+            udp_layer = packet.getlayer(UDP)
+            self.statistics[udp_layer.sport] = (
+                self.statistics.get(udp_layer.sport, 0) + 1
+            )
+            self.statistics[udp_layer.dport] = (
+                self.statistics.get(udp_layer.dport, 0) + 1
+            )
+            if not PcapTool.is_udp_packet_accepted(
+                ip_layer=packet,
+                udp_layer=udp_layer,
+                ports_whitelist=self.ports_whitelist,
+                ports_blacklist=self.ports_blacklist,
+                ip_whitelist=self.ip_whitelist,
+            ):
+                continue
+
+            if self.pcap_writer:
+                self.pcap_writer.write(Ether() / packet)
+
+            PcapTool.run_callback(
+                callback=self.callback,
+                data=data,
+                packet=packet,
+                print_raw=self.print_raw,
+            )
+
+    async def run(self, duration: Optional[float] = None) -> Dict[int, int]:
+        """
+        Capture until stop() is called or duration (seconds) elapses
+
+        :param duration: None to capture indefinitely
+        :return: port statistics (same as PcapTool.iter_pcap)
+        """
+        self.loop = asyncio.get_running_loop()
+        self.queue = Queue(maxsize=self.queue_size)
+        self.is_running = True
+        self.open_sockets()
+        self.resume_reading()
+        self.log_info(
+            f"Live capture started on {self.bound_addresses} interface {self.interface}"
+        )
+
+        deadline: Optional[float] = (
+            self.loop.time() + duration if duration is not None else None
+        )
+        next_tick: float = self.loop.time() + self.tick_interval
+        try:
+            while self.is_running:
+                timeout: Optional[float] = (
+                    max(0.0, deadline - self.loop.time()) if deadline else None
+                )
+                if self.tick:
+                    timeout = min(
+                        max(0.0, next_tick - self.loop.time()),
+                        self.tick_interval if timeout is None else timeout,
+                    )
+                try:
+                    batch = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+                    self.process_batch(batch)
+                except asyncio.TimeoutError:
+                    if deadline and self.loop.time() >= deadline:
+                        break
+                if self.tick and self.loop.time() >= next_tick:
+                    self.tick(time.time())
+                    next_tick = self.loop.time() + self.tick_interval
+                if not self.is_reading and self.queue.qsize() <= self.queue_size // 2:
+                    self.resume_reading()
+        finally:
+            self.is_running = False
+            self.close_sockets()
+            # process what was already received
+            while not self.queue.empty():
+                self.process_batch(self.queue.get_nowait())
+            if self.pcap_writer:
+                self.pcap_writer.close()
+            self.log_info("Live capture stopped")
+
+        return self.statistics
+
+    def stop(self) -> None:
+        self.is_running = False
+        if self.queue is not None and self.loop and self.queue.empty():
+            # wake up the consumer waiting on empty queue
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, [])
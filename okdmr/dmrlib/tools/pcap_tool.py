@@ -1,8 +1,10 @@
+import asyncio
+import functools
 import logging
 import sys
 import traceback
-from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
-from typing import Callable, List, Dict, Optional, Tuple
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, Namespace
+from typing import Any, Callable, List, Dict, Optional, Tuple
 
 from bitarray import bitarray
 from kaitaistruct import KaitaiStruct
@@ -13,16 +15,25 @@ from okdmr.dmrlib.etsi.layer2.elements.preemption_power_indicator import (
     PreemptionPowerIndicator,
 )
 from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
+from okdmr.dmrlib.tools.burst_export import BurstExporter, BurstExportWriter
+from okdmr.dmrlib.tools.decoding_metrics import DecodingMetrics
+from okdmr.dmrlib.tools.pipeline import pcap_payloads
+from okdmr.dmrlib.transmission.stream_demultiplexer import StreamDemultiplexer
 from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
+from okdmr.dmrlib.utils.metrics import MetricsServer
+from okdmr.dmrlib.utils.output_sink import (
+    get_output_sink,
+    set_output_sink,
+    OutputSink,
+)
 from okdmr.dmrlib.utils.parsing import try_parse_packet
+from okdmr.dmrlib.utils.profiler import PROFILER
 from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
 from okdmr.kaitai.hytera.ip_site_connect_heartbeat import IpSiteConnectHeartbeat
 from okdmr.kaitai.hytera.ip_site_connect_protocol import IpSiteConnectProtocol
 from okdmr.kaitai.tools.prettyprint import prettyprint
 from scapy.data import UDP_SERVICES
 from scapy.layers.inet import UDP, IP
-from scapy.layers.l2 import Ether
-from scapy.utils import PcapReader
 
 
 class EmbeddedExtractor:
@@ -30,12 +41,20 @@ class EmbeddedExtractor:
     Helper class, collects
     """
 
-    def __init__(self):
+    def __init__(self, burst_listener: Optional[Callable[[Burst, str], Any]] = None):
+        """
+        :param burst_listener: called with (burst, protocol) for every decoded burst
+        """
         self.data: Dict[str, Tuple[LCSS, bitarray]] = {}
+        self.burst_listener: Optional[Callable[[Burst, str], Any]] = burst_listener
 
     def process_packet(self, data: bytes, packet: IP) -> Optional[FullLinkControl]:
         burst: Optional[Burst] = PcapTool.debug_packet(
-            data=data, packet=packet, hide_unknown=True, silent=True
+            data=data,
+            packet=packet,
+            hide_unknown=True,
+            silent=True,
+            listener=self.burst_listener,
         )
 
         if (
@@ -63,23 +82,31 @@ class EmbeddedExtractor:
                 bits=_bits, include_cs5=True
             )
             full_lc = FullLinkControl.from_bits(_vbptc_bits)
-            print(repr(full_lc))
+            get_output_sink().write(full_lc, flow=key)
 
         self.data[key] = (burst.emb.link_control_start_stop, _bits)
         return full_lc
 
 
 class IPSCAnalyze:
-    def __init__(self):
+    def __init__(self, burst_listener: Optional[Callable[[Burst, str], Any]] = None):
+        """
+        :param burst_listener: called with (burst, protocol) for every decoded burst
+        """
         self.map: Dict[
             Tuple[IpSiteConnectProtocol.SlotTypes, IpSiteConnectProtocol.FrameTypes],
             Dict[str, int],
         ] = dict()
+        self.burst_listener: Optional[Callable[[Burst, str], Any]] = burst_listener
 
     def process_packet(self, data: bytes, packet: IP) -> None:
         kaitai_pkt: Optional[KaitaiStruct] = try_parse_packet(udpdata=data)
         burst: Optional[Burst] = PcapTool.debug_packet(
-            data=data, packet=packet, hide_unknown=True, silent=True
+            data=data,
+            packet=packet,
+            hide_unknown=True,
+            silent=True,
+            listener=self.burst_listener,
         )
         if isinstance(kaitai_pkt, IpSiteConnectProtocol) and burst:
             stats_key = (kaitai_pkt.slot_type, kaitai_pkt.frame_type)
@@ -140,27 +167,51 @@ class PcapTool:
 
     @staticmethod
     def debug_packet(
-        data: bytes, packet: IP, hide_unknown: bool = False, silent: bool = False
+        data: bytes,
+        packet: IP,
+        hide_unknown: bool = False,
+        silent: bool = False,
+        listener: Optional[Callable[[Burst, str], Any]] = None,
     ) -> Optional[Burst]:
+        """
+        :param listener: called with (burst, protocol) for every decoded burst, eg. DecodingMetrics.process_burst
+        """
         pkt = try_parse_packet(udpdata=data)
         burst: Optional[Burst] = None
-        ip_str: str = (
-            f"{packet.src}:{packet.getlayer(UDP).sport}\t-> {packet.dst}:{packet.getlayer(UDP).dport}\t"
-        )
         if isinstance(pkt, IpSiteConnectProtocol):
-            burst: Burst = Burst.from_hytera_ipsc(pkt)
+            burst: Burst = (
+                Burst.from_hytera_ipsc(pkt)
+                .set_timestamp(float(packet.time))
+                .set_peer(f"{packet.src}:{packet.getlayer(UDP).sport}")
+            )
+            if listener:
+                listener(burst, "IPSC")
             if not silent:
-                print(
-                    f"{ip_str} IPSC TS:{1 if pkt.timeslot_raw == IpSiteConnectProtocol.Timeslots.timeslot_1 else 2} "
-                    f"SEQ: {pkt.sequence_number} {repr(burst)}"
+                get_output_sink().write(
+                    burst,
+                    src=f"{packet.src}:{packet.getlayer(UDP).sport}",
+                    dst=f"{packet.dst}:{packet.getlayer(UDP).dport}",
+                    protocol="IPSC",
+                    timeslot=burst.timeslot,
+                    sequence_no=pkt.sequence_number,
                 )
         elif isinstance(pkt, Mmdvm2020):
             if isinstance(pkt.command_data, Mmdvm2020.TypeDmrData):
-                burst: Burst = Burst.from_mmdvm(pkt.command_data)
+                burst: Burst = (
+                    Burst.from_mmdvm(pkt.command_data)
+                    .set_timestamp(float(packet.time))
+                    .set_peer(f"{packet.src}:{packet.getlayer(UDP).sport}")
+                )
+                if listener:
+                    listener(burst, "MMDVM")
                 if not silent:
-                    print(
-                        f"{ip_str} MMDVM TS:{1 if pkt.command_data.slot_no == Mmdvm2020.Timeslots.timeslot_1 else 2} "
-                        f"SEQ: {pkt.command_data.sequence_no} {repr(burst)}"
+                    get_output_sink().write(
+                        burst,
+                        src=f"{packet.src}:{packet.getlayer(UDP).sport}",
+                        dst=f"{packet.dst}:{packet.getlayer(UDP).dport}",
+                        protocol="MMDVM",
+                        timeslot=burst.timeslot,
+                        sequence_no=pkt.command_data.sequence_no,
                     )
         elif isinstance(pkt, IpSiteConnectHeartbeat):
             pass
@@ -179,6 +230,20 @@ class PcapTool:
 
         return burst
 
+    @staticmethod
+    def chain_callbacks(*callbacks: Optional[Callable]) -> Callable:
+        """
+        :param callbacks: None values are skipped
+        :return: callable invoking all the callbacks with same arguments, returns result of the first one
+        """
+        chained: List[Callable] = [c for c in callbacks if c is not None]
+
+        def chain(*args, **kwargs):
+            results = [c(*args, **kwargs) for c in chained]
+            return results[0] if results else None
+
+        return chain
+
     # noinspection PyUnusedLocal
     @staticmethod
     def void_packet_callback(data: bytes, packet: IP):
@@ -282,69 +347,91 @@ class PcapTool:
             # set default callback if not provided
             callback = PcapTool.void_packet_callback
 
-        for file in files:
-            with PcapReader(file) as reader:
-                for pkt in reader:
-                    if isinstance(pkt, Ether) and pkt.haslayer(UDP):
-                        ip_layer = pkt.getlayer(IP)
-                        udp_layer = pkt.getlayer(UDP)
-
-                        statistics[udp_layer.sport] = (
-                            statistics.get(udp_layer.sport, 0) + 1
-                        )
-                        statistics[udp_layer.dport] = (
-                            statistics.get(udp_layer.dport, 0) + 1
-                        )
-
-                        if len(ip_whitelist):
-                            # if no whitelisted ips, do not filter
-                            if ip_layer and ip_layer.src not in ip_whitelist:
-                                continue
-
-                        if len(ports_whitelist):
-                            # if no ports whitelisted, do not filter
-                            if (
-                                udp_layer.sport not in ports_whitelist
-                                and udp_layer.dport not in ports_whitelist
-                            ):
-                                # skip packets on non-whitelisted ports
-                                continue
-
-                        if len(ports_blacklist):
-                            # if no ports blacklisted, do not filter
-                            if (
-                                udp_layer.sport in ports_blacklist
-                                or udp_layer.dport in ports_blacklist
-                            ):
-                                # skip packets on blacklisted ports
-                                continue
-
-                        if not ip_layer or not hasattr(udp_layer, "load"):
-                            # skip udp packets without any payload
-                            continue
-
-                        try:
-                            if print_raw:
-                                print(udp_layer.load.hex())
-
-                            callback(data=udp_layer.load, packet=ip_layer)
-                        except BaseException as e:
-                            if isinstance(e, SystemExit) or isinstance(
-                                e, KeyboardInterrupt
-                            ):
-                                # if keyboard interrupt (user trying to stop the tool) or system exit (forced exit from underlying data handling) is caught
-                                # do not ignore and raise up
-                                raise e
-                            print("=" * 30, file=sys.stderr)
-                            print(
-                                f'Callback raised exception "{e}" for data {udp_layer.load.hex()}',
-                                file=sys.stderr,
-                            )
-                            traceback.print_exc()
-                            print("=" * 30, file=sys.stderr)
+        for payload in pcap_payloads(
+            files=files,
+            statistics=statistics,
+            ports_whitelist=ports_whitelist,
+            ports_blacklist=ports_blacklist,
+            ip_whitelist=ip_whitelist,
+        ):
+            PcapTool.run_callback(
+                callback=callback,
+                data=payload.data,
+                packet=payload.packet,
+                print_raw=print_raw,
+            )
 
         return statistics
 
+    @staticmethod
+    def is_udp_packet_accepted(
+        ip_layer: Optional[IP],
+        udp_layer: UDP,
+        ports_whitelist: List[int] = [],
+        ports_blacklist: List[int] = [],
+        ip_whitelist: List[str] = [],
+    ) -> bool:
+        """
+        Apply the ip/ports filters on single UDP packet
+
+        :param ip_layer:
+        :param udp_layer:
+        :param ports_whitelist:
+        :param ports_blacklist:
+        :param ip_whitelist:
+        :return: True if packet should be passed to callback
+        """
+        if len(ip_whitelist):
+            # if no whitelisted ips, do not filter
+            if ip_layer and ip_layer.src not in ip_whitelist:
+                return False
+
+        if len(ports_whitelist):
+            # if no ports whitelisted, do not filter
+            if (
+                udp_layer.sport not in ports_whitelist
+                and udp_layer.dport not in ports_whitelist
+            ):
+                # skip packets on non-whitelisted ports
+                return False
+
+        if len(ports_blacklist):
+            # if no ports blacklisted, do not filter
+            if udp_layer.sport in ports_blacklist or udp_layer.dport in ports_blacklist:
+                # skip packets on blacklisted ports
+                return False
+
+        if not ip_layer or not hasattr(udp_layer, "load"):
+            # skip udp packets without any payload
+            return False
+
+        return True
+
+    @staticmethod
+    def run_callback(
+        callback: Callable, data: bytes, packet: IP, print_raw: bool = False
+    ) -> None:
+        """
+        Run callback on single UDP payload, errors from callback are printed to stderr and otherwise ignored
+        """
+        try:
+            if print_raw:
+                print(data.hex())
+
+            callback(data=data, packet=packet)
+        except BaseException as e:
+            if isinstance(e, SystemExit) or isinstance(e, KeyboardInterrupt):
+                # if keyboard interrupt (user trying to stop the tool) or system exit (forced exit from underlying data handling) is caught
+                # do not ignore and raise up
+                raise e
+            print("=" * 30, file=sys.stderr)
+            print(
+                f'Callback raised exception "{e}" for data {data.hex()}',
+                file=sys.stderr,
+            )
+            traceback.print_exc()
+            print("=" * 30, file=sys.stderr)
+
     @staticmethod
     def _arguments() -> ArgumentParser:
         parser = ArgumentParser(
@@ -352,7 +439,10 @@ class PcapTool:
             formatter_class=ArgumentDefaultsHelpFormatter,
         )
         parser.add_argument(
-            "files", type=str, nargs="+", help="PCAP or PCAPNG file to be read"
+            "files",
+            type=str,
+            nargs="*",
+            help="PCAP or PCAPNG file to be read, not required in live capture mode",
         )
         parser.add_argument(
             "--ports",
@@ -429,6 +519,69 @@ class PcapTool:
             dest="debug_vocoder_bytes",
             help="Effective only with --observe-transmissions, will print voice bytes in format ready for vocoder decode",
         )
+        parser.add_argument(
+            "--demultiplex-streams",
+            action="store_true",
+            default=False,
+            dest="demultiplex_streams",
+            help="Effective only with --observe-transmissions, track transmissions per (peer, stream id, timeslot) instead of per target, for bridged networks",
+        )
+        parser.add_argument(
+            "--idle-timeout",
+            dest="idle_timeout",
+            type=float,
+            default=0,
+            help="Effective only with --observe-transmissions, seconds after which idle terminal is forgotten, 0 to keep all",
+        )
+        parser.add_argument(
+            "--max-terminals",
+            dest="max_terminals",
+            type=int,
+            default=0,
+            help="Effective only with --observe-transmissions, max number of tracked terminals, 0 for unlimited",
+        )
+        parser.add_argument(
+            "--voice-hang-time",
+            dest="voice_hang_time",
+            type=float,
+            default=TransmissionWatcher.DEFAULT_VOICE_HANG_TIME,
+            help="Effective only with --observe-transmissions, seconds (packet time) after last burst when voice call without terminator is ended, 0 to disable",
+        )
+        parser.add_argument(
+            "--data-timeout",
+            dest="data_timeout",
+            type=float,
+            default=TransmissionWatcher.DEFAULT_DATA_TIMEOUT,
+            help="Effective only with --observe-transmissions, seconds (packet time) after last burst when incomplete data transmission is aborted, 0 to disable",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            default=False,
+            dest="profile",
+            help="Measure time spent in decoding stages (parsing, FEC, CRC, transmissions, observers) and print per-stage totals at the end",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            dest="metrics_port",
+            type=int,
+            default=None,
+            help="Serve live decoding metrics (Prometheus text format) over HTTP on given TCP port",
+        )
+        parser.add_argument(
+            "--metrics-listen",
+            dest="metrics_listen",
+            type=str,
+            default="0.0.0.0",
+            help="Effective only with --metrics-port, local IP address to bind the metrics endpoint on",
+        )
+        parser.add_argument(
+            "--metrics-fec",
+            action="store_true",
+            default=False,
+            dest="metrics_fec",
+            help="Effective only with --metrics-port, count FEC corrected bits and CRC failures, costs additional BPTC decoding of each data/control burst",
+        )
         parser.add_argument(
             "--verbose",
             "-v",
@@ -452,8 +605,141 @@ class PcapTool:
             default=[],
             help='Filter traffic by "ORIGIN" IP address(es)',
         )
+        parser.add_argument(
+            "--output",
+            dest="output",
+            type=str,
+            default=None,
+            help='Write decoded records to file instead of stdout ("-" for stdout)',
+        )
+        parser.add_argument(
+            "--output-format",
+            dest="output_format",
+            type=str,
+            choices=["text", "ndjson", "csv", "none"],
+            default="text",
+            help="Format of decoded records output, none disables the textual output completely",
+        )
+        parser.add_argument(
+            "--listen",
+            dest="listen_ports",
+            type=int,
+            nargs="+",
+            default=[],
+            help="Live capture, bind and receive on given UDP port(s) instead of reading files",
+        )
+        parser.add_argument(
+            "--listen-ip",
+            dest="listen_ip",
+            type=str,
+            default="0.0.0.0",
+            help="Effective only with --listen, local IP address to bind UDP port(s) on",
+        )
+        parser.add_argument(
+            "--interface",
+            "-i",
+            dest="interface",
+            type=str,
+            default=None,
+            help="Live capture, mirror all UDP traffic from given (SPAN/monitor) interface, requires CAP_NET_RAW",
+        )
+        parser.add_argument(
+            "--duration",
+            dest="duration",
+            type=float,
+            default=None,
+            help="Effective only in live capture mode, stop capture after given number of seconds",
+        )
+        parser.add_argument(
+            "--write-pcap",
+            dest="write_pcap",
+            type=str,
+            default=None,
+            help='Effective only in live capture mode, write accepted packets to rolling pcap files "PREFIX.N.pcap"',
+        )
+        parser.add_argument(
+            "--rotate-packets",
+            dest="rotate_packets",
+            type=int,
+            default=100_000,
+            help="Effective only with --write-pcap, number of packets per single pcap file",
+        )
+        parser.add_argument(
+            "--export",
+            dest="export",
+            type=str,
+            default=None,
+            help="Export one row per burst into columnar file (numpy .npy or .parquet) for analytics",
+        )
+        parser.add_argument(
+            "--export-format",
+            dest="export_format",
+            type=str,
+            choices=["npy", "parquet"],
+            default=None,
+            help="Effective only with --export, by default chosen by file extension, parquet requires pyarrow",
+        )
+        parser.add_argument(
+            "--export-batch-size",
+            dest="export_batch_size",
+            type=int,
+            default=65_536,
+            help="Effective only with --export, number of rows held in memory before written to file",
+        )
         return parser
 
+    @staticmethod
+    def live_capture(
+        args: Namespace,
+        callback: Callable,
+        finish_callback: Optional[Callable],
+        tick: Optional[Callable[[float], Any]] = None,
+    ) -> Dict[int, int]:
+        """
+        Run live capture (UDP listen ports and/or raw interface) with given callbacks until interrupted
+
+        :param args: parsed PcapTool arguments
+        :param callback:
+        :param finish_callback:
+        :param tick: called periodically with current time, to expire transmissions when capture goes silent
+        :return: port statistics
+        """
+        # to avoid circular dependency problem import must be local/inline
+        from okdmr.dmrlib.tools.live_capture import LiveCapture, RollingPcapWriter
+
+        capture = LiveCapture(
+            callback=callback,
+            listen_ports=args.listen_ports,
+            listen_ip=args.listen_ip,
+            interface=args.interface,
+            ports_whitelist=args.whitelist_ports,
+            ports_blacklist=args.blacklist_ports,
+            ip_whitelist=args.filter_ip,
+            print_raw=args.print_raw,
+            pcap_writer=(
+                RollingPcapWriter(
+                    path_prefix=args.write_pcap, max_packets=args.rotate_packets
+                )
+                if args.write_pcap
+                else None
+            ),
+            tick=tick,
+        )
+        try:
+            asyncio.run(capture.run(duration=args.duration))
+        except KeyboardInterrupt:
+            pass
+
+        if finish_callback:
+            finish_callback()
+        if not args.no_statistics:
+            PcapTool.print_statistics(
+                statistics=capture.statistics,
+                ports_blacklist=args.blacklist_ports,
+                ports_whitelist=args.whitelist_ports,
+            )
+        return capture.statistics
+
     @staticmethod
     def main(
         arguments: List[str] = [], return_stats: bool = False
@@ -469,34 +755,127 @@ class PcapTool:
             # routine argument necessary for api usage or unit-testing
             arguments = sys.argv[1:]
 
-        args = PcapTool._arguments().parse_args(arguments)
+        parser = PcapTool._arguments()
+        args = parser.parse_args(arguments)
+        is_live: bool = bool(len(args.listen_ports) or args.interface)
+        if not is_live and not len(args.files):
+            parser.error(
+                "at least one file is required, unless --listen or --interface is used"
+            )
 
         logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
 
-        callback: Callable = PcapTool.debug_packet
-        finish_callback: Optional[Callable] = None
-        ipsc_analyze = IPSCAnalyze()
-        watcher = TransmissionWatcher().set_debug_voice_bytes(
-            do_debug=args.debug_vocoder_bytes
+        metrics: Optional[DecodingMetrics] = (
+            DecodingMetrics(fec_statistics=args.metrics_fec)
+            if args.metrics_port is not None
+            else None
         )
+        listener: Optional[Callable[[Burst, str], Any]] = (
+            metrics.process_burst if metrics else None
+        )
+        callback: Callable = (
+            functools.partial(PcapTool.debug_packet, listener=listener)
+            if listener
+            else PcapTool.debug_packet
+        )
+        finish_callback: Optional[Callable] = None
+        tick: Optional[Callable[[float], Any]] = None
+        ipsc_analyze = IPSCAnalyze(burst_listener=listener)
         if args.extract_embedded_lc:
-            callback = EmbeddedExtractor().process_packet
+            callback = EmbeddedExtractor(burst_listener=listener).process_packet
+        elif args.observe_transmissions and args.demultiplex_streams:
+            demultiplexer = StreamDemultiplexer(
+                voice_hang_time=args.voice_hang_time,
+                data_timeout=args.data_timeout,
+                burst_listener=listener,
+            )
+            callback = demultiplexer.process_packet
+            finish_callback = demultiplexer.end_all_streams
+            tick = demultiplexer.expire_streams
+            if metrics:
+                metrics.watch_stream_demultiplexer(demultiplexer)
         elif args.observe_transmissions:
+            watcher = TransmissionWatcher(
+                idle_timeout=args.idle_timeout,
+                max_terminals=args.max_terminals,
+                voice_hang_time=args.voice_hang_time,
+                data_timeout=args.data_timeout,
+                burst_listener=listener,
+            ).set_debug_voice_bytes(do_debug=args.debug_vocoder_bytes)
             callback = watcher.process_packet
             finish_callback = watcher.end_all_transmissions
+            tick = watcher.expire
+            if metrics:
+                metrics.watch_transmission_watcher(watcher)
         elif args.analyze_ipsc:
             callback = ipsc_analyze.process_packet
 
-        stats = PcapTool.print_pcap(
-            files=args.files,
-            ports_whitelist=args.whitelist_ports,
-            ports_blacklist=args.blacklist_ports,
-            ip_whitelist=args.filter_ip,
-            print_statistics=not args.no_statistics,
-            print_raw=args.print_raw,
-            callback=callback,
-            finish_callback=finish_callback,
+        if args.export:
+            export_only: bool = not (
+                args.extract_embedded_lc
+                or args.observe_transmissions
+                or args.analyze_ipsc
+            )
+            exporter = BurstExporter(
+                writer=BurstExportWriter.create(
+                    path=args.export,
+                    export_format=args.export_format,
+                    batch_size=args.export_batch_size,
+                ),
+                # when chained, bursts are already reported by the selected mode callback
+                burst_listener=listener if export_only else None,
+            )
+            if export_only:
+                # export only, without describing each burst
+                callback = exporter.process_packet
+                finish_callback = exporter.close
+            else:
+                callback = PcapTool.chain_callbacks(callback, exporter.process_packet)
+                finish_callback = PcapTool.chain_callbacks(
+                    finish_callback, exporter.close
+                )
+
+        if args.profile:
+            PROFILER.reset().enable()
+
+        metrics_server: Optional[MetricsServer] = None
+        if metrics:
+            callback = metrics.instrument(callback)
+            metrics_server = MetricsServer(
+                registry=metrics.registry,
+                host=args.metrics_listen,
+                port=args.metrics_port,
+            ).start_in_thread()
+
+        previous_sink: OutputSink = set_output_sink(
+            OutputSink.create(output_format=args.output_format, path=args.output)
         )
+        try:
+            if is_live:
+                stats = PcapTool.live_capture(
+                    args=args,
+                    callback=callback,
+                    finish_callback=finish_callback,
+                    tick=tick,
+                )
+            else:
+                stats = PcapTool.print_pcap(
+                    files=args.files,
+                    ports_whitelist=args.whitelist_ports,
+                    ports_blacklist=args.blacklist_ports,
+                    ip_whitelist=args.filter_ip,
+                    print_statistics=not args.no_statistics,
+                    print_raw=args.print_raw,
+                    callback=callback,
+                    finish_callback=finish_callback,
+                )
+        finally:
+            set_output_sink(previous_sink).close()
+            if args.profile:
+                PROFILER.disable()
+                print(PROFILER.format_report())
+            if metrics_server:
+                metrics_server.stop_thread()
 
         if args.analyze_ipsc:
             ipsc_analyze.print_stats()
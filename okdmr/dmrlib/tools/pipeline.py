@@ -0,0 +1,347 @@
+"""
+Lazy pipeline stages, each stage takes iterable of previous stage output and returns iterator, so the stages
+can be freely composed, measured (see measure) or moved to background thread (see prefetch), eg.
+
+    bursts = parse_bursts(pcap_payloads(files=["capture.pcapng"]))
+    for burst in process_bursts(bursts, watcher.process_burst):
+        ...
+"""
+
+import asyncio
+import queue
+from threading import Event, Thread
+from time import perf_counter
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.utils import PcapReader
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.burst_types import BurstTypes
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class UdpPayload(NamedTuple):
+    data: bytes
+    packet: IP
+    """ IP layer with UDP, time of capture is held in packet.time """
+
+
+class StageStatistics:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.items: int = 0
+        self.seconds: float = 0
+        """ time spent producing the items, including time of upstream stages """
+
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0
+
+    def __repr__(self) -> str:
+        return f"[{self.name}] [ITEMS {self.items}] [{self.seconds:.3f} s] [{self.items_per_second():.0f}/s]"
+
+
+def pcap_udp_packets(
+    files: Iterable[str], statistics: Optional[Dict[int, int]] = None
+) -> Iterator[Tuple[Optional[IP], UDP]]:
+    """
+    Source stage, all UDP packets of pcap/pcapng files
+
+    :param files:
+    :param statistics: if provided, packets count is updated per sport/dport number
+    """
+    for file in files:
+        with PcapReader(file) as reader:
+            for pkt in reader:
+                if isinstance(pkt, Ether) and pkt.haslayer(UDP):
+                    ip_layer = pkt.getlayer(IP)
+                    udp_layer = pkt.getlayer(UDP)
+                    if ip_layer:
+                        # capture timestamp is held only by the outermost layer
+                        ip_layer.time = pkt.time
+
+                    if statistics is not None:
+                        statistics[udp_layer.sport] = (
+                            statistics.get(udp_layer.sport, 0) + 1
+                        )
+                        statistics[udp_layer.dport] = (
+                            statistics.get(udp_layer.dport, 0) + 1
+                        )
+                    yield ip_layer, udp_layer
+
+
+def accepted_payloads(
+    packets: Iterable[Tuple[Optional[IP], UDP]],
+    ports_whitelist: List[int] = (),
+    ports_blacklist: List[int] = (),
+    ip_whitelist: List[str] = (),
+) -> Iterator[UdpPayload]:
+    """
+    Filter stage, see PcapTool.is_udp_packet_accepted
+    """
+    # to avoid circular dependency problem import must be local/inline
+    from okdmr.dmrlib.tools.pcap_tool import PcapTool
+
+    for ip_layer, udp_layer in packets:
+        if PcapTool.is_udp_packet_accepted(
+            ip_layer=ip_layer,
+            udp_layer=udp_layer,
+            ports_whitelist=list(ports_whitelist),
+            ports_blacklist=list(ports_blacklist),
+            ip_whitelist=list(ip_whitelist),
+        ):
+            yield UdpPayload(data=udp_layer.load, packet=ip_layer)
+
+
+def pcap_payloads(
+    files: Iterable[str],
+    statistics: Optional[Dict[int, int]] = None,
+    ports_whitelist: List[int] = (),
+    ports_blacklist: List[int] = (),
+    ip_whitelist: List[str] = (),
+) -> Iterator[UdpPayload]:
+    """
+    Source stage, UDP payloads of pcap/pcapng files matching the filters
+    """
+    return accepted_payloads(
+        pcap_udp_packets(files=files, statistics=statistics),
+        ports_whitelist=ports_whitelist,
+        ports_blacklist=ports_blacklist,
+        ip_whitelist=ip_whitelist,
+    )
+
+
+async def live_payloads(
+    duration: Optional[float] = None, **capture_arguments: Any
+) -> AsyncIterator[UdpPayload]:
+    """
+    Async source stage, UDP payloads received by LiveCapture, capture is stopped when the iteration ends
+
+    :param duration: seconds to capture, None to capture until the consumer stops iterating
+    :param capture_arguments: LiveCapture arguments (listen_ports, interface, filters, ...) except callback
+    """
+    # to avoid circular dependency problem import must be local/inline
+    from okdmr.dmrlib.tools.live_capture import LiveCapture
+
+    received: asyncio.Queue = asyncio.Queue()
+    capture = LiveCapture(
+        callback=lambda data, packet: received.put_nowait(UdpPayload(data, packet)),
+        **capture_arguments,
+    )
+    task: asyncio.Task = asyncio.create_task(capture.run(duration=duration))
+    try:
+        while True:
+            getter: asyncio.Future = asyncio.ensure_future(received.get())
+            done, _ = await asyncio.wait(
+                {getter, task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            # capture ended, deliver the rest of received payloads
+            while not received.empty():
+                yield received.get_nowait()
+            return
+    finally:
+        capture.stop()
+        await task
+
+
+def dsd_bursts(
+    lines: Iterable[str], on_error: Optional[Callable[[Exception], None]] = None
+) -> Iterator[Burst]:
+    """
+    Source stage, bursts from DSD-FME structured DSP output (dsd-fme "-Q" option),
+    each line is "timeslot burst_type hex", CACH (98) and reverse channel (99) bursts are skipped
+
+    :param lines: eg. opened file
+    :param on_error: called with exception of unparseable line, if None the exception is raised
+    """
+    for line in lines:
+        parts = line.split(" ")
+        if len(parts) != 3:
+            continue
+        try:
+            burst_type = int(parts[1])
+            if burst_type in (99, 98):
+                continue
+            burst = Burst.from_bytes(
+                data=bytes.fromhex(parts[2]),
+                burst_type=(
+                    BurstTypes.Vocoder
+                    if burst_type == 10
+                    else BurstTypes.DataAndControl
+                ),
+            )
+            burst.timeslot = int(parts[0])
+        except Exception as e:
+            if not on_error:
+                raise
+            on_error(e)
+            continue
+        yield burst
+
+
+def parse_bursts(
+    payloads: Iterable[UdpPayload], silent: bool = True, hide_unknown: bool = True
+) -> Iterator[Burst]:
+    """
+    Parse stage, IPSC / MMDVM payloads to bursts, see PcapTool.debug_packet, other payloads are dropped
+    """
+    # to avoid circular dependency problem import must be local/inline
+    from okdmr.dmrlib.tools.pcap_tool import PcapTool
+
+    for payload in payloads:
+        burst: Optional[Burst] = PcapTool.debug_packet(
+            data=payload.data,
+            packet=payload.packet,
+            hide_unknown=hide_unknown,
+            silent=silent,
+        )
+        if burst:
+            yield burst
+
+
+def process_bursts(
+    bursts: Iterable[Burst], *processors: Callable[[Burst], Optional[Burst]]
+) -> Iterator[Burst]:
+    """
+    Processing stage, burst is passed through processors in order (eg. TransmissionWatcher.process_burst,
+    StreamDemultiplexer.process_burst, VoiceFrameAssembler.process_burst), processor returning None drops the burst
+    """
+    for burst in bursts:
+        for processor in processors:
+            burst = processor(burst)
+            if not burst:
+                break
+        else:
+            yield burst
+
+
+async def async_process(
+    items: AsyncIterable[T], processor: Callable[[T], Optional[R]]
+) -> AsyncIterator[R]:
+    """
+    Async counterpart of process_bursts for single processor and any items
+    """
+    async for item in items:
+        result: Optional[R] = processor(item)
+        if result is not None:
+            yield result
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    assert batch_size > 0, f"batch_size must be positive, got {batch_size}"
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def unbatched(batches: Iterable[List[T]]) -> Iterator[T]:
+    for batch in batches:
+        yield from batch
+
+
+_END = object()
+PREFETCH_POLL: float = 0.1
+""" seconds, how often prefetch producer blocked on full queue checks whether consumer is still iterating """
+
+
+def prefetch(
+    items: Iterable[T], queue_size: int = 64, batch_size: int = 256
+) -> Iterator[T]:
+    """
+    Run upstream stages in background thread, items are passed in batches, so the queue synchronization is not
+    paid per item, exception raised upstream is re-raised in consumer
+
+    :param items: upstream stage, iterated only from the background thread
+    :param queue_size: max number of batches waiting, upstream is blocked when consumer does not keep up
+    :param batch_size: max number of items passed at once
+
+    When consumer stops iterating early (break, exception), the background thread stops within PREFETCH_POLL
+    seconds, upstream is not iterated further
+    """
+    handover: queue.Queue = queue.Queue(maxsize=queue_size)
+    stopped: Event = Event()
+
+    def put(item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                handover.put(item, timeout=PREFETCH_POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for batch in batched(items, batch_size):
+                if not put(batch):
+                    return
+            put(_END)
+        except BaseException as e:
+            put(e)
+
+    Thread(target=produce, name="PipelinePrefetch", daemon=True).start()
+    try:
+        while True:
+            batch = handover.get()
+            if batch is _END:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+            yield from batch
+    finally:
+        stopped.set()
+
+
+def measure(items: Iterable[T], statistics: StageStatistics) -> Iterator[T]:
+    """
+    Count items and time spent producing them, to benchmark single stage, feed it with materialized
+    output of previous stage (eg. list) so the upstream time is not included
+    """
+    iterator: Iterator[T] = iter(items)
+    while True:
+        start: float = perf_counter()
+        try:
+            item: T = next(iterator)
+        except StopIteration:
+            statistics.seconds += perf_counter() - start
+            return
+        statistics.seconds += perf_counter() - start
+        statistics.items += 1
+        yield item
+
+
+def consume(items: Iterable[Any]) -> int:
+    """
+    Sink, drain the pipeline
+
+    :return: number of items
+    """
+    count: int = 0
+    for _ in items:
+        count += 1
+    return count
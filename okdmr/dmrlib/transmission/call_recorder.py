@@ -0,0 +1,352 @@
+import json
+import os
+import struct
+from datetime import datetime, timezone
+from time import time
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    IO,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.data_types import DataTypes
+from okdmr.dmrlib.etsi.layer2.elements.flcos import FLCOs
+from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
+from okdmr.dmrlib.transmission.transmission_observer_interface import (
+    TransmissionObserverInterface,
+)
+from okdmr.dmrlib.utils.background_writer import BackgroundWriter
+from okdmr.dmrlib.utils.deadline_queue import DeadlineQueue
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+FSYNC_POLICIES = Literal["never", "batch", "call"]
+
+RECORD_HEADER: struct.Struct = struct.Struct(">BdI")
+""" record type (uint8), timestamp (float64), payload length (uint32), followed by payload """
+
+RECORD_METADATA: int = 1
+""" JSON, call metadata from voice header (or first burst in case of late entry) """
+RECORD_BURST: int = 2
+""" raw 33-byte burst (voice header and vocoder bursts) """
+RECORD_TERMINATOR: int = 3
+""" raw 33-byte terminator with LC burst """
+RECORD_END: int = 4
+""" JSON, call summary, last record of complete file """
+
+
+class CallRecord(NamedTuple):
+    record_type: int
+    timestamp: float
+    payload: bytes
+
+
+def encode_record(record_type: int, timestamp: float, payload: bytes) -> bytes:
+    return RECORD_HEADER.pack(record_type, timestamp, len(payload)) + payload
+
+
+def read_call_file(path: str) -> Iterator[CallRecord]:
+    """
+    Read records of call file, truncated trailing record (eg. crash during write) is ignored
+    """
+    with open(path, "rb") as f:
+        while True:
+            header: bytes = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            (record_type, timestamp, length) = RECORD_HEADER.unpack(header)
+            payload: bytes = f.read(length)
+            if len(payload) < length:
+                return
+            yield CallRecord(
+                record_type=record_type, timestamp=timestamp, payload=payload
+            )
+
+
+def find_calls(
+    index_path: str,
+    target: Optional[int] = None,
+    source: Optional[int] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    :return: index entries (one per finished call) matching all the given conditions
+    """
+    calls: List[Dict[str, Any]] = []
+    if not os.path.exists(index_path):
+        return calls
+    with open(index_path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            call: Dict[str, Any] = json.loads(line)
+            if target is not None and call["target"] != target:
+                continue
+            if source is not None and call["source"] != source:
+                continue
+            if since is not None and call["end"] < since:
+                continue
+            if until is not None and call["start"] > until:
+                continue
+            calls.append(call)
+    return calls
+
+
+class RecordedCall:
+    def __init__(self, path: str, start: float):
+        self.path: str = path
+        self.start: float = start
+        self.last: float = start
+        self.bursts: int = 0
+        self.source: int = 0
+        self.target: int = 0
+        self.is_group: bool = True
+        self.has_header: bool = False
+
+
+class CallRecorder(TransmissionObserverInterface, LoggingTrait):
+    """
+    Archives every voice call into its own file of length-prefixed records (see RECORD_* constants), files are
+    written by background thread, so the decoding loop only serializes the burst and enqueues it
+
+    Finished calls are appended to index file (NDJSON, one line per call) for lookup by target/source/time,
+    see find_calls
+    """
+
+    INDEX_FILE: str = "index.ndjson"
+
+    def __init__(
+        self,
+        directory: str,
+        fsync: FSYNC_POLICIES = "call",
+        call_timeout: float = 3.0,
+        queue_size: int = 10_000,
+    ):
+        """
+
+        :param directory: calls are stored in directory/YYYYMMDD/ subdirectories
+        :param fsync: "never" leaves it on OS, "batch" syncs files written by each batch,
+                      "call" syncs call file and index when call ends
+        :param call_timeout: seconds (packet time) without burst, after which call without terminator is finished
+        :param queue_size: max number of records waiting for write, recording blocks when exceeded
+        """
+        if fsync not in ("never", "batch", "call"):
+            raise ValueError(f"Unknown fsync policy {fsync}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory: str = directory
+        self.index_path: str = os.path.join(directory, self.INDEX_FILE)
+        self.fsync: FSYNC_POLICIES = fsync
+        self.call_timeout: float = call_timeout
+        self.calls: Dict[bytes, RecordedCall] = {}
+        self.deadlines: DeadlineQueue[bytes] = DeadlineQueue()
+        self.calls_recorded: int = 0
+        # following is accessed only from writer thread
+        self.files: Dict[str, BinaryIO] = {}
+        self.index: Optional[IO] = None
+        self.writer: BackgroundWriter = BackgroundWriter(
+            handler=self.write_batch,
+            flush=self.flush_files,
+            queue_size=queue_size,
+            name="CallRecorder",
+        )
+        self.writer.start()
+
+    def call_path(self, stream_no: bytes, start: float) -> str:
+        started: datetime = datetime.fromtimestamp(start, tz=timezone.utc)
+        return os.path.join(
+            self.directory,
+            started.strftime("%Y%m%d"),
+            f"{started.strftime('%H%M%S')}-{stream_no.hex()}.dmrcall",
+        )
+
+    def voice_burst_received(
+        self,
+        stream_no: bytes,
+        voice_header: Optional[FullLinkControl],
+        burst: Burst,
+    ):
+        now: float = burst.timestamp or time()
+        self.finish_idle_calls(now)
+
+        is_terminator: bool = burst.data_type == DataTypes.TerminatorWithLC
+        call: Optional[RecordedCall] = self.calls.get(stream_no)
+        if not call:
+            if is_terminator:
+                # repeated terminator of already finished call
+                return
+            call = RecordedCall(path=self.call_path(stream_no, now), start=now)
+            self.calls[stream_no] = call
+            self.deadlines.schedule(stream_no, now + self.call_timeout)
+        call.last = now
+
+        if not call.has_header and (voice_header or not call.bursts):
+            self.update_metadata(call, voice_header, burst)
+            self.writer.submit(
+                (
+                    call.path,
+                    encode_record(
+                        RECORD_METADATA,
+                        now,
+                        json.dumps(
+                            {
+                                "source": call.source,
+                                "target": call.target,
+                                "is_group": call.is_group,
+                                "timeslot": burst.timeslot,
+                                "peer": burst.peer,
+                                "stream_no": stream_no.hex(),
+                                "late_entry": not voice_header,
+                            }
+                        ).encode(),
+                    ),
+                )
+            )
+
+        call.bursts += 1
+        self.writer.submit(
+            (
+                call.path,
+                encode_record(
+                    RECORD_TERMINATOR if is_terminator else RECORD_BURST,
+                    now,
+                    burst.as_bytes(),
+                ),
+            )
+        )
+        if is_terminator:
+            self.finish_call(stream_no, reason="terminator")
+
+    @staticmethod
+    def update_metadata(
+        call: RecordedCall, voice_header: Optional[FullLinkControl], burst: Burst
+    ) -> None:
+        if voice_header:
+            call.has_header = True
+            call.source = voice_header.source_address
+            call.is_group = (
+                voice_header.full_link_control_opcode == FLCOs.GroupVoiceChannelUser
+            )
+            call.target = (
+                voice_header.group_address
+                if call.is_group
+                else voice_header.target_address
+            )
+        else:
+            call.source = burst.source_radio_id
+            call.target = burst.target_radio_id
+
+    def finish_call(self, stream_no: bytes, reason: str) -> None:
+        call: Optional[RecordedCall] = self.calls.pop(stream_no, None)
+        self.deadlines.cancel(stream_no)
+        if not call:
+            return
+        summary: Dict[str, Any] = {
+            "file": os.path.relpath(call.path, self.directory),
+            "start": call.start,
+            "end": call.last,
+            "source": call.source,
+            "target": call.target,
+            "is_group": call.is_group,
+            "bursts": call.bursts,
+            "reason": reason,
+        }
+        self.writer.submit(
+            (
+                call.path,
+                encode_record(RECORD_END, call.last, json.dumps(summary).encode()),
+            )
+        )
+        self.writer.submit((None, summary))
+        self.calls_recorded += 1
+
+    def finish_idle_calls(self, now: Optional[float] = None) -> int:
+        """
+        Evaluated with every received burst, for live capture this should be also called periodically (eg. as
+        LiveCapture tick), so calls without terminator are finished when the capture goes silent, recorder wrapped
+        in QueuedObserver must be called through its queue, queued.enqueue("finish_idle_calls", now=now)
+
+        :param now: current timestamp (packet clock), defaults to time()
+        :return: number of calls finished for inactivity
+        """
+        now = time() if now is None else now
+        finished: int = 0
+        while True:
+            item = self.deadlines.peek()
+            if not item or item[0] > now:
+                return finished
+            stream_no: bytes = item[1]
+            actual: float = self.calls[stream_no].last + self.call_timeout
+            if actual > now:
+                self.deadlines.schedule(stream_no, actual)
+                continue
+            self.finish_call(stream_no, reason="timeout")
+            finished += 1
+
+    def write_batch(self, batch: List[Tuple[Optional[str], Any]]) -> None:
+        """
+        Called from writer thread, items are (call file path, record bytes) or (None, index entry)
+        """
+        written: Dict[str, BinaryIO] = {}
+        for path, item in batch:
+            if path is None:
+                self.write_index(item)
+                continue
+            f: Optional[BinaryIO] = self.files.get(path)
+            if not f:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                f = open(path, "ab")
+                self.files[path] = f
+            f.write(item)
+            written[path] = f
+            if item[0] == RECORD_END:
+                self.close_file(path)
+                written.pop(path)
+        if self.fsync == "batch":
+            for f in written.values():
+                f.flush()
+                os.fsync(f.fileno())
+            if self.index:
+                self.index.flush()
+                os.fsync(self.index.fileno())
+
+    def write_index(self, entry: Dict[str, Any]) -> None:
+        if not self.index:
+            self.index = open(self.index_path, "a")
+        self.index.write(json.dumps(entry) + "\n")
+        if self.fsync == "call":
+            self.index.flush()
+            os.fsync(self.index.fileno())
+
+    def close_file(self, path: str) -> None:
+        f: BinaryIO = self.files.pop(path)
+        if self.fsync == "call":
+            f.flush()
+            os.fsync(f.fileno())
+        f.close()
+
+    def flush_files(self) -> None:
+        for f in self.files.values():
+            f.flush()
+        if self.index:
+            self.index.flush()
+
+    def close(self) -> None:
+        """
+        Finish all calls in progress, write pending records and stop the writer
+        """
+        for stream_no in list(self.calls.keys()):
+            self.finish_call(stream_no, reason="closed")
+        self.writer.close()
+        for path in list(self.files.keys()):
+            self.close_file(path)
+        if self.index:
+            self.index.close()
+            self.index = None
@@ -0,0 +1,174 @@
+import copy
+import queue
+from threading import Thread
+from time import monotonic
+from typing import Any, Dict, List, Literal, NamedTuple, Optional, Tuple
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.pdu.data_header import DataHeader
+from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
+from okdmr.dmrlib.transmission.transmission_observer_interface import (
+    TransmissionObserverInterface,
+)
+from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
+from okdmr.dmrlib.utils.bits_interface import BitsInterface
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+QUEUE_POLICIES = Literal["block", "drop"]
+
+
+class ObserverEvent(NamedTuple):
+    """
+    Immutable snapshot of single observer notification
+    """
+
+    method: str
+    kwargs: Tuple[Tuple[str, Any], ...]
+    enqueued_at: float
+
+
+class QueuedObserver(TransmissionObserverInterface, LoggingTrait):
+    """
+    Wraps observer, so its notifications are delivered from own worker thread through bounded queue, instead of
+    synchronously from the packet processing path, opt-in by adding the wrapper instead of the observer itself
+
+    watcher.add_observer(QueuedObserver(DatabaseWriter(), policy="drop"))
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        observer: TransmissionObserverInterface,
+        queue_size: int = 1_000,
+        policy: QUEUE_POLICIES = "block",
+    ):
+        """
+
+        :param observer: wrapped observer, its methods are called only from the worker thread
+        :param queue_size: max number of events waiting for delivery
+        :param policy: when queue is full, "block" waits (backpressure on packet path), "drop" discards the event
+        """
+        if policy not in ("block", "drop"):
+            raise ValueError(f"Unknown queue policy {policy}")
+        if not isinstance(observer, TransmissionObserverInterface):
+            raise ValueError(
+                f'observer is not TransmissionObserverInterface, got "{type(observer)}" instead'
+            )
+        self.observer: TransmissionObserverInterface = observer
+        self.policy: QUEUE_POLICIES = policy
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+        self.events_queued: int = 0
+        self.events_dropped: int = 0
+        self.events_delivered: int = 0
+        self.max_queue_depth: int = 0
+        self.total_latency: float = 0
+        """ seconds, sum of time between event being queued and the observer finishing it """
+        self.max_latency: float = 0
+
+        self.worker: Thread = Thread(
+            target=self.run,
+            name=f"QueuedObserver({observer.__class__.__name__})",
+            daemon=True,
+        )
+        self.worker.start()
+
+    def enqueue(self, method: str, **kwargs: Any) -> None:
+        event = ObserverEvent(
+            method=method, kwargs=tuple(kwargs.items()), enqueued_at=monotonic()
+        )
+        if self.policy == "drop":
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self.events_dropped += 1
+                return
+        else:
+            self.queue.put(event)
+        self.events_queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def run(self) -> None:
+        while True:
+            event = self.queue.get()
+            if event is self._STOP:
+                return
+            # noinspection PyBroadException
+            try:
+                getattr(self.observer, event.method)(**dict(event.kwargs))
+            except:
+                self.get_logger().exception(
+                    f"{event.method} observer raised following exception"
+                )
+            latency: float = monotonic() - event.enqueued_at
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.events_delivered += 1
+
+    def close(self) -> None:
+        """
+        Deliver all queued events and stop the worker
+        """
+        if self.worker.is_alive():
+            self.queue.put(self._STOP)
+            self.worker.join()
+
+    def get_statistics(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "events_queued": self.events_queued,
+            "events_dropped": self.events_dropped,
+            "events_delivered": self.events_delivered,
+            "avg_latency": (
+                self.total_latency / self.events_delivered
+                if self.events_delivered
+                else 0
+            ),
+            "max_latency": self.max_latency,
+        }
+
+    def transmission_started(self, transmission_type: TransmissionTypes):
+        self.enqueue("transmission_started", transmission_type=transmission_type)
+
+    def data_transmission_ended(
+        self, transmission_header: DataHeader, blocks: List[BitsInterface]
+    ):
+        # snapshot, the transmission may reuse or modify its blocks after returning
+        self.enqueue(
+            "data_transmission_ended",
+            transmission_header=transmission_header,
+            blocks=tuple(blocks),
+        )
+
+    def data_transmission_payload(
+        self, transmission_header: DataHeader, payload: memoryview
+    ):
+        # the view is valid only during the call
+        self.enqueue(
+            "data_transmission_payload",
+            transmission_header=transmission_header,
+            payload=memoryview(bytes(payload)),
+        )
+
+    def voice_transmission_ended(
+        self, voice_header: FullLinkControl, blocks: List[BitsInterface]
+    ):
+        self.enqueue(
+            "voice_transmission_ended", voice_header=voice_header, blocks=tuple(blocks)
+        )
+
+    def voice_burst_received(
+        self,
+        stream_no: bytes,
+        voice_header: Optional[FullLinkControl],
+        burst: Burst,
+    ):
+        # shallow copy, attributes (sequence/stream number) are further modified by the processing pipeline
+        self.enqueue(
+            "voice_burst_received",
+            stream_no=stream_no,
+            voice_header=voice_header,
+            burst=copy.copy(burst),
+        )
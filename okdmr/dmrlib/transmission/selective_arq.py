@@ -0,0 +1,315 @@
+from typing import List, Optional, Sequence, Type, Union
+
+from bitarray import bitarray
+
+from okdmr.dmrlib.etsi.crc.crc32 import CRC32
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.data_packet_formats import DataPacketFormats
+from okdmr.dmrlib.etsi.layer2.elements.full_message_flag import FullMessageFlag
+from okdmr.dmrlib.etsi.layer2.elements.response_types import ResponseTypes
+from okdmr.dmrlib.etsi.layer2.pdu.data_header import DataHeader
+from okdmr.dmrlib.etsi.layer2.pdu.rate12_data import Rate12Data
+from okdmr.dmrlib.etsi.layer2.pdu.rate1_data import Rate1Data
+from okdmr.dmrlib.etsi.layer2.pdu.rate34_data import Rate34Data
+from okdmr.dmrlib.transmission.transmission_generator import TransmissionGenerator
+from okdmr.dmrlib.utils.bits_bytes import bits_to_bytes, bytes_to_bits
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+DataBlock = Union[Rate12Data, Rate34Data, Rate1Data]
+
+
+def is_confirmed_header(header: DataHeader) -> bool:
+    return (
+        isinstance(header, DataHeader)
+        and header.data_packet_format == DataPacketFormats.DataPacketConfirmed
+    )
+
+
+def copy_confirmed_header(
+    header: DataHeader, blocks_to_follow: int, full_message_flag: FullMessageFlag
+) -> DataHeader:
+    """
+    Confirmed data header (C_HEAD) with the same transfer identification (LLIDs, N(S), SAP), CRC is recalculated
+    """
+    return DataHeader(
+        dpf=DataPacketFormats.DataPacketConfirmed,
+        is_group=header.is_group,
+        is_response_requested=header.is_response_requested,
+        pad_octet_count=header.pad_octet_count,
+        sap_identifier=header.sap_identifier,
+        llid_destination=header.llid_destination,
+        llid_source=header.llid_source,
+        full_message_flag=full_message_flag,
+        blocks_to_follow=blocks_to_follow,
+        resynchronize_flag=header.resynchronize_flag,
+        send_sequence_number=header.send_sequence_number,
+        fragment_sequence_number=header.fragment_sequence_number,
+    )
+
+
+class SelectiveARQReceiver(LoggingTrait):
+    """
+    Receiving side of confirmed data delivery with selective retransmission (SARQ),
+    ETSI TS 102 361-1 V2.5.1 (2017-10) - 8.3 Response packet format
+
+    Tracks which data block serial numbers (DBSN) of transfer were received with valid CRC9, blocks from
+    retransmissions (C_HEAD with SubsequentTry, same LLIDs and N(S)) are merged into the original transfer,
+    so only missing blocks need to be requested again (selective ACK)
+
+    Selective ACK bitmap is carried in unconfirmed Rate 1/2 data blocks following the response header,
+    bit N (MSB first) is 1 if block with DBSN N was received correctly, 0 if it has to be retransmitted
+    """
+
+    def __init__(self):
+        self.header: Optional[DataHeader] = None
+        """ header of first try of the transfer """
+        self.blocks_total: int = 0
+        self.received: bitarray = bitarray()
+        self.blocks: List[Optional[DataBlock]] = []
+        self.retransmissions: int = 0
+        self.blocks_rejected: int = 0
+
+    def is_same_transfer(self, header: DataHeader) -> bool:
+        return (
+            self.header is not None
+            and header.full_message_flag == FullMessageFlag.SubsequentTry
+            and header.llid_source == self.header.llid_source
+            and header.llid_destination == self.header.llid_destination
+            and header.send_sequence_number == self.header.send_sequence_number
+        )
+
+    def process_header(self, header: DataHeader) -> bool:
+        """
+        :return: True if header is retransmission of current transfer, False if it starts new transfer
+        """
+        assert is_confirmed_header(
+            header
+        ), f"SARQ requires confirmed data header, got {header}"
+        if self.is_same_transfer(header):
+            self.retransmissions += 1
+            return True
+
+        self.header = header
+        self.blocks_total = header.blocks_to_follow
+        self.received = bitarray(self.blocks_total)
+        self.received.setall(0)
+        self.blocks = [None] * self.blocks_total
+        self.retransmissions = 0
+        self.blocks_rejected = 0
+        return False
+
+    def process_block(self, block: DataBlock) -> bool:
+        """
+        Block type (last / not last) is decided by its DBSN, not by position in current try, because
+        retransmission can end with block, that was not last in the original transfer
+        :return: True if block was stored
+        """
+        if not block.is_confirmed() or block.dbsn >= self.blocks_total:
+            self.blocks_rejected += 1
+            return False
+
+        is_last: bool = block.dbsn == self.blocks_total - 1
+        if block.is_last_block() != is_last:
+            block = block.convert(
+                type(block.packet_type).resolve(confirmed=True, last=is_last)
+            )
+        if not block.crc9_ok:
+            self.blocks_rejected += 1
+            return False
+
+        self.blocks[block.dbsn] = block
+        self.received[block.dbsn] = 1
+        return True
+
+    def missing_blocks(self) -> List[int]:
+        """
+        :return: serial numbers of blocks, that were not yet received correctly
+        """
+        return list(self.received.search(bitarray("0")))
+
+    def user_data(self) -> bytes:
+        """
+        :return: data of all blocks, including padding octets
+        """
+        assert self.received.all(), f"blocks {self.missing_blocks()} are missing"
+        return b"".join(block.data for block in self.blocks)
+
+    def crc32_ok(self) -> bool:
+        if not self.blocks_total or not self.received.all():
+            return False
+        expected: int = int.from_bytes(
+            CRC32.calculate(self.user_data()).to_bytes(4, byteorder="little"),
+            byteorder="big",
+        )
+        return self.blocks[-1].crc32 == expected
+
+    def is_complete(self) -> bool:
+        return self.crc32_ok()
+
+    def payload(self) -> bytes:
+        """
+        :return: user data without padding octets
+        """
+        user_data: bytes = self.user_data()
+        return user_data[: len(user_data) - self.header.pad_octet_count]
+
+    def get_response_type(self) -> ResponseTypes:
+        if self.received.all():
+            return (
+                ResponseTypes.ACK
+                if self.crc32_ok()
+                else ResponseTypes.NACK_PacketCRCError
+            )
+        return ResponseTypes.SACK
+
+    def get_bitmap(self) -> bytes:
+        return bits_to_bytes(self.received)
+
+    def generate_response(self, colour_code: int = 1) -> List[Burst]:
+        """
+        :return: response header burst, followed by selective ACK bitmap blocks if some blocks are missing
+        """
+        assert self.header, "No transfer to respond to"
+        response_type: ResponseTypes = self.get_response_type()
+        bitmap_bursts: List[Burst] = []
+        if response_type == ResponseTypes.SACK:
+            bitmap_bursts, _ = TransmissionGenerator.generate_data_bursts(
+                packet_type=Rate12Data,
+                userdata=self.get_bitmap(),
+                colour_code=colour_code,
+                is_confirmed=False,
+            )
+        response_header: DataHeader = DataHeader(
+            dpf=DataPacketFormats.ResponsePacket,
+            sap_identifier=self.header.sap_identifier,
+            llid_destination=self.header.llid_source,
+            llid_source=self.header.llid_destination,
+            full_message_flag=FullMessageFlag.FirstTryToCompletePacket,
+            blocks_to_follow=len(bitmap_bursts),
+            response_class=response_type.response_class,
+            response_type=response_type.response_type,
+            response_status=self.header.send_sequence_number,
+        )
+        return [
+            TransmissionGenerator.generate_data_header_burst(response_header)
+        ] + bitmap_bursts
+
+
+class SelectiveARQSender(LoggingTrait):
+    """
+    Sending side of confirmed data delivery with selective retransmission, keeps generated data bursts,
+    so on selective ACK only the blocks marked as missing are transmitted again
+    """
+
+    def __init__(
+        self,
+        data_header: DataHeader,
+        userdata: bytes,
+        packet_type: Union[Type[Rate1Data], Type[Rate12Data], Type[Rate34Data]],
+        colour_code: int = 1,
+        max_retries: int = 4,
+    ):
+        """
+
+        :param data_header: confirmed data header with pad_octet_count and blocks_to_follow matching the userdata
+        :param userdata:
+        :param packet_type:
+        :param colour_code:
+        :param max_retries: how many retransmissions are attempted before giving up
+        """
+        assert is_confirmed_header(
+            data_header
+        ), f"SARQ requires confirmed data header, got {data_header}"
+        self.header: DataHeader = data_header
+        self.colour_code: int = colour_code
+        self.max_retries: int = max_retries
+        self.retries: int = 0
+        self.data_bursts, pad_octet_count = TransmissionGenerator.generate_data_bursts(
+            packet_type=packet_type,
+            userdata=userdata,
+            colour_code=colour_code,
+            is_confirmed=True,
+        )
+        assert (
+            data_header.pad_octet_count == pad_octet_count
+        ), f"POC expected {data_header.pad_octet_count} generated {pad_octet_count}"
+        assert data_header.blocks_to_follow == len(
+            self.data_bursts
+        ), f"BTF expected {data_header.blocks_to_follow} generated {len(self.data_bursts)}"
+        self.acknowledged: bool = False
+        self.failed: bool = False
+        self.blocks_sent: int = 0
+
+    def initial_bursts(self) -> List[Burst]:
+        self.blocks_sent += len(self.data_bursts)
+        return [
+            TransmissionGenerator.generate_data_header_burst(self.header)
+        ] + self.data_bursts
+
+    def retransmission_bursts(self, dbsns: Sequence[int]) -> List[Burst]:
+        """
+        :param dbsns: serial numbers of blocks to send again
+        :return: header (SubsequentTry) followed by requested blocks
+        """
+        header: DataHeader = copy_confirmed_header(
+            self.header,
+            blocks_to_follow=len(dbsns),
+            full_message_flag=FullMessageFlag.SubsequentTry,
+        )
+        self.blocks_sent += len(dbsns)
+        return [TransmissionGenerator.generate_data_header_burst(header)] + [
+            self.data_bursts[dbsn] for dbsn in dbsns
+        ]
+
+    def parse_bitmap(self, bitmap_blocks: Sequence[Rate12Data]) -> List[int]:
+        """
+        :return: serial numbers of blocks marked (bit 0) as not received
+        """
+        bits: bitarray = bytes_to_bits(b"".join(block.data for block in bitmap_blocks))
+        assert len(bits) >= len(
+            self.data_bursts
+        ), f"Selective ACK bitmap must have at least {len(self.data_bursts)} bits, got {len(bits)}"
+        return list(bits[: len(self.data_bursts)].search(bitarray("0")))
+
+    def process_response(
+        self, response_header: DataHeader, bitmap_blocks: Sequence[Rate12Data] = ()
+    ) -> List[Burst]:
+        """
+        :param response_header: C_RHEAD received from the destination
+        :param bitmap_blocks: data blocks following selective ACK response header
+        :return: bursts to retransmit, empty if transfer is finished (acknowledged or failed) or response was ignored
+        """
+        if (
+            response_header.data_packet_format != DataPacketFormats.ResponsePacket
+            or response_header.response_status != self.header.send_sequence_number
+            or response_header.llid_source != self.header.llid_destination
+        ):
+            self.log_warning(
+                f"Ignoring response not matching transfer {response_header}"
+            )
+            return []
+
+        response_type: ResponseTypes = ResponseTypes(
+            (response_header.response_class << 3) | response_header.response_type
+        )
+        if response_type == ResponseTypes.ACK:
+            self.acknowledged = True
+            return []
+
+        if self.retries >= self.max_retries:
+            self.log_warning(
+                f"Transfer N(S) {self.header.send_sequence_number} failed after {self.retries} retries"
+            )
+            self.failed = True
+            return []
+        self.retries += 1
+
+        if response_type == ResponseTypes.SACK:
+            missing: List[int] = self.parse_bitmap(bitmap_blocks)
+            if not missing:
+                self.acknowledged = True
+                return []
+            return self.retransmission_bursts(missing)
+
+        # NACK, whole packet has to be sent again
+        return self.retransmission_bursts(range(len(self.data_bursts)))
@@ -0,0 +1,263 @@
+from time import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Union
+
+from scapy.layers.inet import IP
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.data_types import DataTypes
+from okdmr.dmrlib.etsi.layer2.pdu.data_header import DataHeader
+from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
+from okdmr.dmrlib.transmission.transmission import Transmission
+from okdmr.dmrlib.transmission.transmission_observer_interface import (
+    TransmissionObserverInterface,
+    WithObservers,
+)
+from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
+from okdmr.dmrlib.utils.bits_interface import BitsInterface
+from okdmr.dmrlib.utils.deadline_queue import DeadlineQueue
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+from okdmr.dmrlib.utils.output_sink import get_output_sink
+
+
+class StreamKey(NamedTuple):
+    peer: str
+    """ network origin of the stream, ip:port """
+    stream_no: int
+    timeslot: int
+
+    @staticmethod
+    def from_burst(burst: Burst) -> "StreamKey":
+        stream_no: Union[int, bytes] = burst.stream_no
+        return StreamKey(
+            peer=burst.peer,
+            stream_no=(
+                stream_no
+                if isinstance(stream_no, int)
+                else int.from_bytes(stream_no, byteorder="big")
+            ),
+            timeslot=burst.timeslot,
+        )
+
+
+class Stream(WithObservers):
+    """
+    State of single stream (one call or data transfer from one network peer), has its own Transmission, so
+    concurrent streams to the same target do not share any state
+    """
+
+    def __init__(
+        self, key: StreamKey, observers: List[TransmissionObserverInterface] = ()
+    ):
+        super().__init__(observers=observers)
+        self.key: StreamKey = key
+        self.source_radio_id: int = 0
+        self.target_radio_id: int = 0
+        self.first_packet_received: float = 0
+        self.last_packet_received: float = 0
+        self.bursts_received: int = 0
+        self.ended: bool = False
+        self.transmission: Transmission = Transmission(self)
+
+    def voice_transmission_ended(
+        self, voice_header: FullLinkControl, blocks: List[BitsInterface]
+    ):
+        super().voice_transmission_ended(voice_header=voice_header, blocks=blocks)
+        self.ended = True
+
+    def data_transmission_ended(
+        self, transmission_header: DataHeader, blocks: List[BitsInterface]
+    ):
+        super().data_transmission_ended(
+            transmission_header=transmission_header, blocks=blocks
+        )
+        self.ended = True
+
+    def process_burst(self, burst: Burst, now: float) -> Burst:
+        if not self.bursts_received:
+            self.first_packet_received = now
+        self.last_packet_received = now
+        self.bursts_received += 1
+        # sequence number is kept as received, later stages use it to detect bursts lost in transport
+        return self.transmission.process_packet(burst)
+
+    def __repr__(self) -> str:
+        return (
+            f"[STREAM {self.key.peer} {self.key.stream_no:08X} TS{self.key.timeslot}] "
+            f"[{self.source_radio_id} -> {self.target_radio_id}] "
+            f"[{self.transmission.type.name}] [BURSTS {self.bursts_received}]"
+        )
+
+
+class StreamDemultiplexer(LoggingTrait, WithObservers):
+    """
+    Alternative to TransmissionWatcher for bridged networks, bursts are routed by (peer, stream_no, timeslot)
+    instead of target id, so concurrent calls to the same talkgroup from different repeaters are tracked
+    separately, streams are additionally indexed by target and source id for queries
+
+    Hytera IPSC does not carry stream id, its streams are separated only by peer and timeslot
+    """
+
+    def __init__(
+        self,
+        observers: List[TransmissionObserverInterface] = (),
+        voice_hang_time: float = 3.0,
+        data_timeout: float = 10.0,
+        burst_listener: Optional[Callable[[Burst, str], Any]] = None,
+    ):
+        """
+        :param observers:
+        :param voice_hang_time: seconds (packet time) after last burst, when voice stream is ended
+        :param data_timeout: seconds (packet time) after last burst, when data stream is aborted
+        :param burst_listener: called with (burst, protocol) for every burst decoded by process_packet
+        """
+        super().__init__(observers=observers)
+        self.voice_hang_time: float = voice_hang_time
+        self.data_timeout: float = data_timeout
+        self.streams: Dict[StreamKey, Stream] = {}
+        self.by_target: Dict[int, Set[StreamKey]] = {}
+        self.by_source: Dict[int, Set[StreamKey]] = {}
+        self.deadlines: DeadlineQueue[StreamKey] = DeadlineQueue()
+        """ streams by inactivity deadline, refreshed lazily, only when the scheduled deadline is reached """
+        self.streams_created: int = 0
+        self.streams_ended: int = 0
+        self.streams_timed_out: int = 0
+        self.burst_listener: Optional[Callable[[Burst, str], Any]] = burst_listener
+
+    def get_stream_timeout(self, stream: Stream) -> float:
+        if stream.transmission.type == TransmissionTypes.DataTransmission:
+            return self.data_timeout
+        # voice, or late entry stream without header
+        return self.voice_hang_time
+
+    @staticmethod
+    def _index(index: Dict[int, Set[StreamKey]], radio_id: int, key: StreamKey):
+        index.setdefault(radio_id, set()).add(key)
+
+    @staticmethod
+    def _unindex(index: Dict[int, Set[StreamKey]], radio_id: int, key: StreamKey):
+        keys: Optional[Set[StreamKey]] = index.get(radio_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[radio_id]
+
+    def update_indexes(self, stream: Stream, burst: Burst) -> None:
+        """
+        Addresses can become known only later in the stream (late entry, embedded LC), index is updated on change
+        """
+        if burst.target_radio_id and burst.target_radio_id != stream.target_radio_id:
+            self._unindex(self.by_target, stream.target_radio_id, stream.key)
+            stream.target_radio_id = burst.target_radio_id
+            self._index(self.by_target, stream.target_radio_id, stream.key)
+        if burst.source_radio_id and burst.source_radio_id != stream.source_radio_id:
+            self._unindex(self.by_source, stream.source_radio_id, stream.key)
+            stream.source_radio_id = burst.source_radio_id
+            self._index(self.by_source, stream.source_radio_id, stream.key)
+
+    def get_stream(self, key: StreamKey) -> Optional[Stream]:
+        return self.streams.get(key)
+
+    def streams_to_target(self, target_radio_id: int) -> List[Stream]:
+        return [self.streams[key] for key in self.by_target.get(target_radio_id, ())]
+
+    def streams_from_source(self, source_radio_id: int) -> List[Stream]:
+        return [self.streams[key] for key in self.by_source.get(source_radio_id, ())]
+
+    def remove_stream(self, key: StreamKey) -> Optional[Stream]:
+        stream: Optional[Stream] = self.streams.pop(key, None)
+        self.deadlines.cancel(key)
+        if stream:
+            self._unindex(self.by_target, stream.target_radio_id, key)
+            self._unindex(self.by_source, stream.source_radio_id, key)
+        return stream
+
+    def end_stream(self, key: StreamKey, stale: bool = False) -> None:
+        """
+        End stream transmission (observers are notified) and stop tracking it
+
+        :param key:
+        :param stale: stream timed out, incomplete data transmission is discarded instead of delivered
+        """
+        stream: Optional[Stream] = self.remove_stream(key)
+        if stream:
+            if stale:
+                stream.transmission.end_stale_transmission()
+            else:
+                stream.transmission.end_transmissions()
+            self.streams_ended += 1
+
+    def expire_streams(self, now: Optional[float] = None) -> int:
+        """
+        Evaluated with every processed burst, for live capture this should be also called periodically (with
+        current time), so streams end when the capture goes silent
+
+        :param now: current timestamp (packet clock), defaults to time()
+        :return: number of streams ended for inactivity
+        """
+        now = time() if now is None else now
+        expired: int = 0
+        while True:
+            item = self.deadlines.peek()
+            if not item or item[0] > now:
+                return expired
+            key: StreamKey = item[1]
+            stream: Stream = self.streams[key]
+            actual: float = stream.last_packet_received + self.get_stream_timeout(
+                stream
+            )
+            if actual > now:
+                self.deadlines.schedule(key, actual)
+                continue
+            self.end_stream(key, stale=True)
+            self.streams_timed_out += 1
+            expired += 1
+
+    def process_burst(self, burst: Burst) -> Optional[Burst]:
+        if not burst:
+            return None
+        now: float = burst.timestamp or time()
+        self.expire_streams(now)
+
+        key: StreamKey = StreamKey.from_burst(burst)
+        stream: Optional[Stream] = self.streams.get(key)
+        if not stream:
+            if burst.data_type == DataTypes.TerminatorWithLC:
+                # terminator repeated after the stream already ended, must not open new (orphan) stream
+                return burst
+            stream = Stream(key=key, observers=self.observers)
+            self.streams[key] = stream
+            self.streams_created += 1
+        self.update_indexes(stream, burst)
+
+        out: Burst = stream.process_burst(burst, now)
+
+        if stream.ended:
+            self.remove_stream(key)
+            self.streams_ended += 1
+        elif key not in self.deadlines:
+            self.deadlines.schedule(key, now + self.get_stream_timeout(stream))
+        return out
+
+    def process_packet(self, data: bytes, packet: IP) -> None:
+        # to avoid circular dependency problem import must be local/inline
+        from okdmr.dmrlib.tools.pcap_tool import PcapTool
+
+        burst: Optional[Burst] = PcapTool.debug_packet(
+            data=data, packet=packet, silent=True, listener=self.burst_listener
+        )
+        if burst:
+            processed_burst: Optional[Burst] = self.process_burst(burst)
+            if processed_burst:
+                get_output_sink().write(processed_burst)
+
+    def end_all_streams(self) -> None:
+        for key in list(self.streams.keys()):
+            self.end_stream(key)
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {
+            "streams_live": len(self.streams),
+            "streams_created": self.streams_created,
+            "streams_ended": self.streams_ended,
+            "streams_timed_out": self.streams_timed_out,
+        }
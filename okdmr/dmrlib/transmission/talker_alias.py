@@ -0,0 +1,335 @@
+from collections import OrderedDict
+from time import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from bitarray import bitarray
+from bitarray.util import ba2int
+
+from okdmr.dmrlib.etsi.fec.vbptc_128_72 import VBPTC12873
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.data_types import DataTypes
+from okdmr.dmrlib.etsi.layer2.elements.feature_set_ids import FeatureSetIDs
+from okdmr.dmrlib.etsi.layer2.elements.flcos import FLCOs
+from okdmr.dmrlib.etsi.layer2.elements.lcss import LCSS
+from okdmr.dmrlib.etsi.layer2.elements.preemption_power_indicator import (
+    PreemptionPowerIndicator,
+)
+from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
+from okdmr.dmrlib.etsi.layer3.elements.talker_alias_data_format import (
+    TalkerAliasDataFormat,
+)
+from okdmr.dmrlib.transmission.stream_demultiplexer import StreamKey
+from okdmr.dmrlib.utils.bits_bytes import bits_to_bytes, bytes_to_bits
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+TALKER_ALIAS_BLOCKS: Tuple[FLCOs, ...] = (
+    FLCOs.TalkerAliasBlock1,
+    FLCOs.TalkerAliasBlock2,
+    FLCOs.TalkerAliasBlock3,
+)
+
+TALKER_ALIAS_CHARACTER_BITS: Dict[TalkerAliasDataFormat, int] = {
+    TalkerAliasDataFormat.SevenBitCharacters: 7,
+    TalkerAliasDataFormat.ISOEightBitCharacters: 8,
+    TalkerAliasDataFormat.UnicodeUTF8: 8,
+    TalkerAliasDataFormat.UnicodeUTF16LE: 16,
+}
+""" bits per unit of Talker Alias Data Length, for UTF-8 the length is number of bytes """
+
+
+def talker_alias_blocks_needed(header: FullLinkControl) -> int:
+    """
+    :return: number of Talker Alias blocks (0-3) following the header, that carry rest of the alias
+    """
+    bits: int = (
+        TALKER_ALIAS_CHARACTER_BITS[header.talker_alias_data_format]
+        * header.talker_alias_data_length
+    )
+    # 7-bit format uses the MSB bit of header as well (49 bits), other formats use only the 48 bits (6 bytes)
+    header_bits: int = (
+        49
+        if header.talker_alias_data_format == TalkerAliasDataFormat.SevenBitCharacters
+        else 48
+    )
+    return min(max(0, -(-(bits - header_bits) // 56)), len(TALKER_ALIAS_BLOCKS))
+
+
+def decode_talker_alias(header: FullLinkControl, blocks: List[bytes]) -> str:
+    """
+    ETSI TS 102 361-2 V2.4.1 (2017-10) - 7.2.18 Talker Alias Data Format
+
+    :param header: Talker Alias header LC
+    :param blocks: talker_alias_data of blocks 1-3 in order, at least talker_alias_blocks_needed(header)
+    """
+    data_format: TalkerAliasDataFormat = header.talker_alias_data_format
+    length: int = header.talker_alias_data_length
+    raw: bytes = header.talker_alias_data + b"".join(blocks)
+    if data_format == TalkerAliasDataFormat.SevenBitCharacters:
+        bits: bitarray = bitarray([header.talker_alias_data_msb]) + bytes_to_bits(raw)
+        raw = bytes(
+            ba2int(bits[i * 7 : (i + 1) * 7])
+            for i in range(min(length, len(bits) // 7))
+        )
+    else:
+        raw = raw[: length * TALKER_ALIAS_CHARACTER_BITS[data_format] // 8]
+    return data_format.decode(raw)
+
+
+def encode_talker_alias(
+    alias: str,
+    data_format: TalkerAliasDataFormat = TalkerAliasDataFormat.ISOEightBitCharacters,
+) -> List[FullLinkControl]:
+    """
+    :return: Talker Alias header LC followed by blocks needed to carry the alias
+    :raises ValueError: if encoded alias does not fit header and 3 blocks
+    """
+    raw: bytes = data_format.encode(alias)
+    if data_format == TalkerAliasDataFormat.SevenBitCharacters:
+        bits: bitarray = bitarray(
+            "".join(format(character, "07b") for character in raw)
+        )
+        length: int = len(raw)
+    else:
+        bits: bitarray = bitarray([0]) + bytes_to_bits(raw)
+        length: int = len(raw) * 8 // TALKER_ALIAS_CHARACTER_BITS[data_format]
+    # 49 bits of header and 56 bits of each of 3 blocks
+    if len(bits) > 49 + 56 * len(TALKER_ALIAS_BLOCKS):
+        raise ValueError(f"Talker alias {alias} is too long for {data_format.name}")
+    bits += bitarray([0] * (49 + 56 * len(TALKER_ALIAS_BLOCKS) - len(bits)))
+    lcs: List[FullLinkControl] = [
+        FullLinkControl(
+            protect_flag=0,
+            flco=FLCOs.TalkerAliasHeader,
+            fid=FeatureSetIDs.StandardizedFID,
+            crc=bitarray([0] * 24),
+            talker_alias_data_format=data_format,
+            talker_alias_data_length=length,
+            talker_alias_data_msb=bits[0],
+            talker_alias_data=bits_to_bytes(bits[1:49]),
+        )
+    ]
+    for i in range(talker_alias_blocks_needed(lcs[0])):
+        lcs.append(
+            FullLinkControl(
+                protect_flag=0,
+                flco=TALKER_ALIAS_BLOCKS[i],
+                fid=FeatureSetIDs.StandardizedFID,
+                crc=bitarray([0] * 24),
+                talker_alias_data=bits_to_bytes(bits[49 + i * 56 : 49 + (i + 1) * 56]),
+            )
+        )
+    return lcs
+
+
+class TalkerAliasCache:
+    """
+    Source radio id -> alias, bounded LRU with time-to-live of each entry
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 86_400):
+        """
+        :param max_size: least recently used aliases are dropped above this count
+        :param ttl: seconds after which alias is considered outdated, 0 to never expire
+        """
+        assert max_size > 0, f"max_size must be positive, got {max_size}"
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.entries: OrderedDict[int, Tuple[str, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def put(self, source_radio_id: int, alias: str, now: Optional[float] = None):
+        self.entries[source_radio_id] = (
+            alias,
+            (time() if now is None else now) + self.ttl,
+        )
+        self.entries.move_to_end(source_radio_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(self, source_radio_id: int, now: Optional[float] = None) -> Optional[str]:
+        entry: Optional[Tuple[str, float]] = self.entries.get(source_radio_id)
+        if not entry:
+            return None
+        if self.ttl and entry[1] < (time() if now is None else now):
+            del self.entries[source_radio_id]
+            return None
+        self.entries.move_to_end(source_radio_id)
+        return entry[0]
+
+
+class TalkerAliasAssembler:
+    """
+    Collects Talker Alias header and blocks of single stream, LCs can arrive in any order and repeatedly
+    """
+
+    def __init__(self):
+        self.source_radio_id: int = 0
+        self.header: Optional[FullLinkControl] = None
+        self.blocks: Dict[FLCOs, bytes] = {}
+        self.alias: Optional[str] = None
+
+    def reset(self) -> None:
+        self.header = None
+        self.blocks = {}
+        self.alias = None
+
+    def process_lc(self, lc: FullLinkControl) -> Optional[str]:
+        """
+        :return: alias, when it gets complete with this LC, None otherwise
+        """
+        flco: FLCOs = lc.full_link_control_opcode
+        if flco in (FLCOs.GroupVoiceChannelUser, FLCOs.UnitToUnitVoiceChannelUser):
+            if lc.source_address != self.source_radio_id:
+                self.reset()
+                self.source_radio_id = lc.source_address
+            return None
+        elif flco == FLCOs.TalkerAliasHeader:
+            if self.header and self.header.as_bits() != lc.as_bits():
+                # other alias (talker changed), blocks of the previous one are not valid
+                self.reset()
+            self.header = lc
+        elif flco in TALKER_ALIAS_BLOCKS:
+            self.blocks[flco] = lc.talker_alias_data
+        else:
+            return None
+
+        if self.alias or not self.header or not self.source_radio_id:
+            return None
+        needed: Tuple[FLCOs, ...] = TALKER_ALIAS_BLOCKS[
+            : talker_alias_blocks_needed(self.header)
+        ]
+        if any(block not in self.blocks for block in needed):
+            return None
+        try:
+            self.alias = decode_talker_alias(
+                self.header, [self.blocks[block] for block in needed]
+            )
+        except UnicodeDecodeError:
+            self.reset()
+            return None
+        return self.alias
+
+
+class TalkerAliasCollector(LoggingTrait):
+    """
+    Voice pipeline stage, reassembles embedded LC of voice bursts (and takes full LC of voice header/terminator)
+    per stream, completed talker aliases are stored by source id in TalkerAliasCache, so they can be looked up
+    in later calls without waiting for all the LC blocks again
+    """
+
+    def __init__(self, cache: Optional[TalkerAliasCache] = None):
+        """
+        :param cache: its max_size and ttl also bound the number and lifetime of streams being assembled,
+                      so streams without terminator are forgotten
+        """
+        self.cache: TalkerAliasCache = (
+            cache if cache is not None else TalkerAliasCache()
+        )
+        self.assemblers: Dict[Hashable, TalkerAliasAssembler] = {}
+        self.embedded: Dict[Hashable, bitarray] = {}
+        """ embedded LC fragments collected per stream """
+        self.streams: OrderedDict[Hashable, float] = OrderedDict()
+        """ last activity of streams in assemblers/embedded, least recently active first """
+        self.aliases_decoded: int = 0
+
+    def touch(self, key: Hashable, now: Optional[float] = None) -> None:
+        self.streams[key] = time() if now is None else now
+        self.streams.move_to_end(key)
+
+    def expire_streams(self, now: Optional[float] = None) -> int:
+        """
+        Forget streams above cache max_size or inactive for cache ttl
+
+        :param now: current timestamp (packet clock), defaults to time()
+        :return: number of streams forgotten
+        """
+        now = time() if now is None else now
+        expired: int = 0
+        while self.streams:
+            key, last = next(iter(self.streams.items()))
+            if len(self.streams) <= self.cache.max_size and (
+                not self.cache.ttl or last + self.cache.ttl >= now
+            ):
+                return expired
+            self.end_stream(key)
+            expired += 1
+        return expired
+
+    def lookup(
+        self, source_radio_id: int, now: Optional[float] = None
+    ) -> Optional[str]:
+        return self.cache.get(source_radio_id, now)
+
+    def process_lc(
+        self, key: Hashable, lc: FullLinkControl, now: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        :param key: stream identification, eg. StreamKey
+        :return: alias, when completed by this LC
+        """
+        assembler: Optional[TalkerAliasAssembler] = self.assemblers.get(key)
+        if not assembler:
+            assembler = TalkerAliasAssembler()
+            self.assemblers[key] = assembler
+        self.touch(key, now)
+        alias: Optional[str] = assembler.process_lc(lc)
+        if alias:
+            self.aliases_decoded += 1
+            self.cache.put(assembler.source_radio_id, alias, now)
+            self.log_debug(f"[TALKER ALIAS] [{assembler.source_radio_id}] {alias}")
+        return alias
+
+    def process_embedded(
+        self, key: Hashable, burst: Burst, now: Optional[float] = None
+    ) -> Optional[FullLinkControl]:
+        """
+        :return: full LC once all 4 embedded fragments are received
+        """
+        if (
+            not burst.has_emb
+            or burst.emb.link_control_start_stop == LCSS.SingleFragmentLCorCSBK
+            or burst.emb.preemption_and_power_control_indicator
+            == PreemptionPowerIndicator.CarriesReverseChannelInformation
+        ):
+            return None
+        if burst.emb.link_control_start_stop == LCSS.FirstFragmentLC:
+            self.embedded[key] = bitarray()
+            self.touch(key, now)
+        fragments: Optional[bitarray] = self.embedded.get(key)
+        if fragments is None:
+            # first fragment was not received
+            return None
+        fragments += burst.embedded_signalling_bits
+        if burst.emb.link_control_start_stop != LCSS.LastFragmentLCorCSBK:
+            return None
+        del self.embedded[key]
+        if len(fragments) != 128:
+            return None
+        try:
+            return FullLinkControl.from_bits(
+                VBPTC12873.deinterleave_data_bits(bits=fragments, include_cs5=True)
+            )
+        except (KeyError, ValueError):
+            return None
+
+    def process_burst(self, burst: Burst) -> Burst:
+        key: StreamKey = StreamKey.from_burst(burst)
+        now: float = burst.timestamp or time()
+        self.expire_streams(now)
+        lc: Optional[FullLinkControl] = None
+        if burst.is_vocoder:
+            lc = self.process_embedded(key, burst, now)
+        elif burst.data_type in (DataTypes.VoiceLCHeader, DataTypes.TerminatorWithLC):
+            lc = burst.data if isinstance(burst.data, FullLinkControl) else None
+        if lc:
+            self.process_lc(key, lc, now)
+        if burst.data_type == DataTypes.TerminatorWithLC:
+            self.end_stream(key)
+        return burst
+
+    def end_stream(self, key: Hashable) -> None:
+        self.assemblers.pop(key, None)
+        self.embedded.pop(key, None)
+        self.streams.pop(key, None)
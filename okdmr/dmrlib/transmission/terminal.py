@@ -39,6 +39,17 @@ class Terminal(WithObservers):
         """
         return self.timeslots[timeslot].process_burst(burst)
 
+    @property
+    def last_packet_received(self) -> float:
+        return max(ts.last_packet_received for ts in self.timeslots.values())
+
+    def end_transmissions(self) -> None:
+        """
+        End transmissions in progress on both timeslots, observers get notified as usual
+        """
+        for timeslot in self.timeslots.values():
+            timeslot.transmission.end_transmissions()
+
     def debug(self, printout: bool = True) -> str:
         status: str = f"[ID: {self.id}]\n"
         for ts in self.timeslots.values():
@@ -46,7 +46,8 @@ class Timeslot(WithObservers):
         return self.rx_sequence
 
     def process_burst(self, dmrdata: Burst) -> Burst:
-        self.last_packet_received = time()
+        # packet clock, so the timeouts behave the same in live capture and in pcap replay at any speed
+        self.last_packet_received = dmrdata.timestamp or time()
         if (
             not dmrdata.is_voice_superframe_start
             or dmrdata.sync_or_embedded_signalling == SyncPatterns.Reserved
@@ -22,9 +22,10 @@ from okdmr.dmrlib.transmission.transmission_observer_interface import (
     WithObservers,
 )
 from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
-from okdmr.dmrlib.utils.bits_bytes import bytes_to_bits
 from okdmr.dmrlib.utils.bits_interface import BitsInterface
 from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+from okdmr.dmrlib.utils.output_sink import get_output_sink
+from okdmr.dmrlib.utils.profiler import profiled
 
 
 class Transmission(WithObservers, LoggingTrait):
@@ -46,6 +47,10 @@ class Transmission(WithObservers, LoggingTrait):
         self.blocks: List[BitsInterface] = list()
         self.header: Optional[DataHeader] = None
         self.stream_no: bytes = secrets.token_bytes(4)
+        self.user_data: bytearray = bytearray()
+        """ reassembly buffer of data blocks payload, allocated once the first data block size is known """
+        self.user_data_length: int = 0
+        self.data_blocks_received: int = 0
 
     def new_transmission(self, newtype: TransmissionTypes):
         if (
@@ -62,10 +67,18 @@ class Transmission(WithObservers, LoggingTrait):
         self.blocks = list()
         self.header = None
         self.stream_no = secrets.token_bytes(4)
+        # not cleared in place, observers may still hold views of the previous buffer
+        self.user_data = bytearray()
+        self.user_data_length = 0
+        self.data_blocks_received = 0
 
         if newtype != TransmissionTypes.Idle:
             self.transmission_started(transmission_type=newtype)
 
+    @property
+    def voice_header(self) -> Optional[FullLinkControl]:
+        return self.header if isinstance(self.header, FullLinkControl) else None
+
     def ensure_transmission(self, transmission_type: TransmissionTypes):
         if not self.type == transmission_type:
             self.new_transmission(transmission_type)
@@ -121,9 +134,35 @@ class Transmission(WithObservers, LoggingTrait):
         #    f"[CSBK] received {self.blocks_received} / {self.blocks_expected} expected"
         # )
 
+    def store_user_data(self, data: Union[Rate12Data, Rate34Data, Rate1Data]):
+        """
+        Write payload of data block at its offset in reassembly buffer, confirmed blocks are placed by their
+        serial number (so retransmitted blocks overwrite the original ones), unconfirmed in order of reception
+        """
+        index: int = data.dbsn if data.is_confirmed() else self.data_blocks_received
+        self.data_blocks_received += 1
+        size: int = len(data.data)
+        # last block is 4 bytes (CRC32) shorter than the others
+        block_size: int = size + 4 if data.is_last_block() else size
+        if not self.user_data:
+            blocks_to_follow: int = (
+                self.header.get_blocks_to_follow() or 0
+                if isinstance(self.header, DataHeader)
+                else 0
+            )
+            self.user_data = bytearray(max(blocks_to_follow * block_size - 4, 0))
+
+        offset: int = index * block_size
+        if offset + size > len(self.user_data):
+            # block count not announced by header, or more blocks than announced
+            self.user_data.extend(bytes(offset + size - len(self.user_data)))
+        memoryview(self.user_data)[offset : offset + size] = data.data
+        self.user_data_length = max(self.user_data_length, offset + size)
+
     def process_data(self, data: Union[Rate12Data, Rate34Data, Rate1Data]):
         self.blocks_received += 1
         self.blocks.append(data)
+        self.store_user_data(data)
         if data.is_last_block():
             self.end_data_transmission()
 
@@ -172,23 +211,16 @@ class Transmission(WithObservers, LoggingTrait):
         self.data_transmission_ended(self.header, self.blocks)
         self.log_info(repr(self.header))
 
-        user_data: bytes = b""
-        for block in self.blocks:
-            if (
-                isinstance(block, Rate12Data)
-                or isinstance(block, Rate34Data)
-                or isinstance(block, Rate1Data)
-            ):
-                user_data += block.data
+        user_data: memoryview = memoryview(self.user_data)[: self.user_data_length]
+        self.data_transmission_payload(self.header, user_data)
 
         if (
             hasattr(self.header, "sap_identifier")
             and self.header.sap_identifier == SAPIdentifier.UDP_IP_compression
             and len(user_data) >= 5
         ):
-            # print(f"udp/ipv4 compressed {user_data.hex()}")
-            udp_ip = UDPIPv4CompressedHeader.from_bits(bits=bytes_to_bits(user_data))
-            print(repr(udp_ip))
+            udp_ip = UDPIPv4CompressedHeader.from_bytes(user_data)
+            get_output_sink().write(udp_ip)
 
         # print("\n" * 3)
 
@@ -218,21 +250,42 @@ class Transmission(WithObservers, LoggingTrait):
 
         return burst
 
+    @profiled("transmission")
     def process_packet(self, burst: Burst) -> Burst:
+        if burst.is_vocoder and self.type == TransmissionTypes.Idle:
+            # late entry, voice header was not received, call gets its own stream_no same as with header
+            self.new_transmission(TransmissionTypes.VoiceTransmission)
         burst = self.fix_voice_burst_type(burst)
 
         lc_info_bits = BPTC19696.deinterleave_data_bits(
             burst.full_bits[:98] + burst.full_bits[166:]
         )
+        if burst.is_vocoder:
+            self.voice_burst_received(
+                stream_no=self.stream_no, voice_header=self.voice_header, burst=burst
+            )
+
         if burst.data_type == DataTypes.VoiceLCHeader:
             self.log_info("voice header %s" % lc_info_bits.tobytes().hex())
             self.process_voice_header(FullLinkControl.from_bits(lc_info_bits))
+            self.voice_burst_received(
+                stream_no=self.stream_no, voice_header=self.voice_header, burst=burst
+            )
         elif burst.data_type == DataTypes.DataHeader:
             self.process_data_header(DataHeader.from_bits(lc_info_bits))
         elif burst.data_type == DataTypes.CSBK:
             self.process_csbk(CSBK.from_bits(lc_info_bits))
         elif burst.data_type == DataTypes.TerminatorWithLC:
             self.log_info("voice terminator %s" % lc_info_bits.tobytes().hex())
+            # forwarded also without voice transmission, so observers can end the call they track by stream_no
+            self.voice_burst_received(
+                stream_no=self.stream_no,
+                voice_header=self.voice_header,
+                burst=burst,
+            )
+            if self.type == TransmissionTypes.VoiceTransmission and not self.header:
+                # late entry, terminator carries the same link control as the missed voice header
+                self.header = FullLinkControl.from_bits(lc_info_bits)
             self.blocks_received += 1
             self.end_voice_transmission()
         elif burst.data_type in [
@@ -279,6 +332,20 @@ class Transmission(WithObservers, LoggingTrait):
 
         return burst
 
+    def end_stale_transmission(self):
+        """
+        Called when no burst was received for the transmission in time, voice call (terminator was probably lost)
+        is ended as usual, incomplete data transmission is discarded
+        """
+        if self.type == TransmissionTypes.VoiceTransmission:
+            self.log_info("[VOICE HANG TIME EXPIRED]")
+            self.end_voice_transmission()
+        elif self.type == TransmissionTypes.DataTransmission:
+            self.log_warning(
+                f"[DATA TIMEOUT] aborting transmission with {self.blocks_received}/{self.blocks_expected} blocks"
+            )
+            self.new_transmission(TransmissionTypes.Idle)
+
     def end_transmissions(self):
         if self.type == TransmissionTypes.DataTransmission:
             self.end_data_transmission()
@@ -177,9 +177,13 @@ class TransmissionGenerator:
             userdata_slice: bytes = userdata[
                 i * octets_per_block : i * octets_per_block + octets_per_block
             ]
-            block_type = last_slice_type if i == (num_bursts - 1) else slice_type
+            is_last: bool = i == (num_bursts - 1)
+            # CRC32 is carried only by the last block, confirmed blocks are numbered by DBSN (modulo 128)
             block = packet_type(
-                packet_type=block_type, data=userdata_slice, crc32=userdata_crc32
+                packet_type=last_slice_type if is_last else slice_type,
+                data=userdata_slice,
+                dbsn=(i & 0x7F) if is_confirmed else 0,
+                crc32=userdata_crc32 if is_last else 0,
             )
             # TODO better burst from contained data init
             burst = Burst(burst_type=BurstTypes.DataAndControl)
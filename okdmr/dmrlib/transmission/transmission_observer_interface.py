@@ -1,10 +1,12 @@
 import logging
 from typing import List, Optional
 
+from okdmr.dmrlib.etsi.layer2.burst import Burst
 from okdmr.dmrlib.etsi.layer2.pdu.data_header import DataHeader
 from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
 from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
 from okdmr.dmrlib.utils.bits_interface import BitsInterface
+from okdmr.dmrlib.utils.profiler import profiled
 
 
 class TransmissionObserverInterface:
@@ -41,6 +43,36 @@ class TransmissionObserverInterface:
         """
         pass
 
+    def data_transmission_payload(
+        self, transmission_header: DataHeader, payload: memoryview
+    ):
+        """
+        Get reassembled user data (payload of all data blocks, without CRC) of ended data transmission,
+        called right after data_transmission_ended
+
+        @param transmission_header:
+        @param payload: zero-copy view of transmission buffer, use bytes(payload) to keep the data after returning
+        @return:
+        """
+        pass
+
+    def voice_burst_received(
+        self,
+        stream_no: bytes,
+        voice_header: Optional[FullLinkControl],
+        burst: Burst,
+    ):
+        """
+        Get notified about every burst of voice transmission (voice header, vocoder bursts and terminator),
+        vocoder bursts are passed even if the voice header was not received (late entry)
+
+        @param stream_no: identifies the transmission, changes with every new transmission of the timeslot
+        @param voice_header: None for late entry
+        @param burst: serialize (eg. burst.as_bytes()) if kept after returning, burst object is further processed
+        @return:
+        """
+        pass
+
 
 class WithObservers(TransmissionObserverInterface):
     def __init__(self, observers: Optional[List[TransmissionObserverInterface]]):
@@ -69,6 +101,7 @@ class WithObservers(TransmissionObserverInterface):
         self.observers.remove(observer)
         return self
 
+    @profiled("observers")
     def voice_transmission_ended(
         self, voice_header: FullLinkControl, blocks: List[BitsInterface]
     ):
@@ -83,6 +116,7 @@ class WithObservers(TransmissionObserverInterface):
                     "voice_transmission_ended observer raised following exception"
                 )
 
+    @profiled("observers")
     def data_transmission_ended(
         self, transmission_header: DataHeader, blocks: List[BitsInterface]
     ):
@@ -97,6 +131,22 @@ class WithObservers(TransmissionObserverInterface):
                     "data_transmission_ended observer raised following exception"
                 )
 
+    @profiled("observers")
+    def data_transmission_payload(
+        self, transmission_header: DataHeader, payload: memoryview
+    ):
+        for observer in self.observers:
+            # noinspection PyBroadException
+            try:
+                observer.data_transmission_payload(
+                    transmission_header=transmission_header, payload=payload
+                )
+            except:
+                logging.getLogger(self.__class__.__name__).exception(
+                    "data_transmission_payload observer raised following exception"
+                )
+
+    @profiled("observers")
     def transmission_started(self, transmission_type: TransmissionTypes):
         for observer in self.observers:
             # noinspection PyBroadException
@@ -106,3 +156,21 @@ class WithObservers(TransmissionObserverInterface):
                 logging.getLogger(self.__class__.__name__).exception(
                     "transmission_started observer raised following exception"
                 )
+
+    @profiled("observers")
+    def voice_burst_received(
+        self,
+        stream_no: bytes,
+        voice_header: Optional[FullLinkControl],
+        burst: Burst,
+    ):
+        for observer in self.observers:
+            # noinspection PyBroadException
+            try:
+                observer.voice_burst_received(
+                    stream_no=stream_no, voice_header=voice_header, burst=burst
+                )
+            except:
+                logging.getLogger(self.__class__.__name__).exception(
+                    "voice_burst_received observer raised following exception"
+                )
@@ -1,4 +1,5 @@
-from typing import Dict, Optional, List
+from time import time
+from typing import Any, Callable, Dict, Optional, List, Tuple
 
 from scapy.layers.inet import IP
 
@@ -6,40 +7,195 @@ from okdmr.dmrlib.etsi.layer2.burst import Burst
 from okdmr.dmrlib.hytera.hytera_ipsc_sync import HyteraIPSCSync
 from okdmr.dmrlib.hytera.hytera_ipsc_wakeup import HyteraIPSCWakeup
 from okdmr.dmrlib.transmission.terminal import Terminal
+from okdmr.dmrlib.transmission.timeslot import Timeslot
+from okdmr.dmrlib.transmission.transmission import Transmission
 from okdmr.dmrlib.transmission.transmission_observer_interface import (
     TransmissionObserverInterface,
     WithObservers,
 )
+from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
+from okdmr.dmrlib.utils.deadline_queue import DeadlineQueue
 from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+from okdmr.dmrlib.utils.output_sink import get_output_sink
 
 
 class TransmissionWatcher(LoggingTrait, WithObservers):
-    def __init__(self, observers: List[TransmissionObserverInterface] = ()) -> None:
+    DEFAULT_VOICE_HANG_TIME: float = 3.0
+    DEFAULT_DATA_TIMEOUT: float = 10.0
+
+    def __init__(
+        self,
+        observers: List[TransmissionObserverInterface] = (),
+        idle_timeout: float = 0,
+        max_terminals: int = 0,
+        voice_hang_time: float = DEFAULT_VOICE_HANG_TIME,
+        data_timeout: float = DEFAULT_DATA_TIMEOUT,
+        burst_listener: Optional[Callable[[Burst, str], Any]] = None,
+    ) -> None:
+        """
+        All the timeouts are evaluated against burst (packet capture) timestamps, not the wall clock
+
+        :param observers:
+        :param idle_timeout: seconds without traffic after which the terminal is evicted, 0 to keep terminals forever
+        :param max_terminals: max number of tracked terminals, least recently active is evicted when exceeded,
+                              0 for unlimited
+        :param voice_hang_time: seconds after last burst, when voice call without terminator is ended, 0 to disable
+        :param data_timeout: seconds after last burst, when incomplete data transmission is aborted, 0 to disable
+        :param burst_listener: called with (burst, protocol) for every burst decoded by process_packet
+        """
         super().__init__(observers=observers)
         self.terminals: Dict[int, Terminal] = {}
         self.last_stream_no: bytes = b""
         self.debug_voice_bytes: bool = False
+        self.idle_timeout: float = idle_timeout
+        self.max_terminals: int = max_terminals
+        self.deadlines: DeadlineQueue[int] = DeadlineQueue()
+        """ terminals by idle deadline, entries are refreshed lazily, only when the scheduled deadline is reached """
+        self.terminals_created: int = 0
+        self.terminals_evicted: int = 0
+        self.voice_hang_time: float = voice_hang_time
+        self.data_timeout: float = data_timeout
+        self.transmission_deadlines: DeadlineQueue[Tuple[int, int]] = DeadlineQueue()
+        """ (dmrid, timeslot) of active transmissions, refreshed lazily same as terminals deadlines """
+        self.transmissions_timed_out: int = 0
+        self.burst_listener: Optional[Callable[[Burst, str], Any]] = burst_listener
 
     def set_debug_voice_bytes(self, do_debug: bool = True) -> "TransmissionWatcher":
         self.debug_voice_bytes = do_debug
         return self
 
-    def ensure_terminal(self, dmrid: int) -> None:
+    def ensure_terminal(self, dmrid: int, now: Optional[float] = None) -> None:
         if dmrid not in self.terminals:
+            if self.max_terminals and len(self.terminals) >= self.max_terminals:
+                (_deadline, oldest) = self.next_eviction_candidate()
+                self.evict_terminal(oldest)
             self.terminals[dmrid] = Terminal(dmrid, self.observers)
+            self.terminals_created += 1
+            if self.idle_timeout or self.max_terminals:
+                self.deadlines.schedule(
+                    dmrid, (time() if now is None else now) + self.idle_timeout
+                )
+
+    def next_eviction_candidate(self) -> Optional[Tuple[float, int]]:
+        """
+        :return: (deadline, dmrid) of least recently active terminal, None if there are no terminals
+        """
+        while True:
+            item = self.deadlines.peek()
+            if not item:
+                return None
+            (deadline, dmrid) = item
+            actual: float = (
+                self.terminals[dmrid].last_packet_received + self.idle_timeout
+            )
+            if actual <= deadline:
+                return item
+            # terminal was active since scheduled, move it back in the queue
+            self.deadlines.schedule(dmrid, actual)
+
+    def evict_terminal(self, dmrid: int) -> None:
+        """
+        End open transmissions (observers are notified) and stop tracking the terminal
+        """
+        terminal: Optional[Terminal] = self.terminals.pop(dmrid, None)
+        self.deadlines.cancel(dmrid)
+        if terminal:
+            terminal.end_transmissions()
+            self.terminals_evicted += 1
+            self.log_debug(f"Evicted terminal {dmrid}")
+
+    def evict_idle_terminals(self, now: Optional[float] = None) -> int:
+        """
+        :param now: current timestamp, defaults to time()
+        :return: number of terminals evicted
+        """
+        if not self.idle_timeout:
+            return 0
+        now = time() if now is None else now
+        evicted: int = 0
+        while True:
+            item = self.next_eviction_candidate()
+            if not item or item[0] > now:
+                return evicted
+            self.evict_terminal(item[1])
+            evicted += 1
+
+    def get_transmission_timeout(self, transmission: Transmission) -> float:
+        if transmission.type == TransmissionTypes.VoiceTransmission:
+            return self.voice_hang_time
+        elif transmission.type == TransmissionTypes.DataTransmission:
+            return self.data_timeout
+        return 0
+
+    def watch_transmission(self, dmrid: int, timeslot: int) -> None:
+        key: Tuple[int, int] = (dmrid, timeslot)
+        if key in self.transmission_deadlines:
+            return
+        ts: Timeslot = self.terminals[dmrid].timeslots[timeslot]
+        timeout: float = self.get_transmission_timeout(ts.transmission)
+        if timeout:
+            self.transmission_deadlines.schedule(key, ts.last_packet_received + timeout)
+
+    def expire_transmissions(self, now: Optional[float] = None) -> int:
+        """
+        End voice calls over hang time and abort timed out data transmissions
+
+        :param now: current timestamp (packet clock), defaults to time()
+        :return: number of transmissions ended
+        """
+        now = time() if now is None else now
+        expired: int = 0
+        while True:
+            item = self.transmission_deadlines.peek()
+            if not item or item[0] > now:
+                return expired
+            (dmrid, timeslot) = item[1]
+            terminal: Optional[Terminal] = self.terminals.get(dmrid)
+            ts: Optional[Timeslot] = terminal.timeslots[timeslot] if terminal else None
+            timeout: float = self.get_transmission_timeout(ts.transmission) if ts else 0
+            if not timeout:
+                # terminal evicted or transmission already ended
+                self.transmission_deadlines.cancel(item[1])
+                continue
+            actual: float = ts.last_packet_received + timeout
+            if actual > now:
+                self.transmission_deadlines.schedule(item[1], actual)
+                continue
+            self.transmission_deadlines.cancel(item[1])
+            ts.transmission.end_stale_transmission()
+            self.transmissions_timed_out += 1
+            expired += 1
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        Evict idle terminals and end timed out transmissions, for live capture this should be called periodically,
+        because process_burst evaluates the timeouts only when next burst arrives
+
+        :param now: current timestamp, defaults to time()
+        :return: number of terminals evicted and transmissions ended
+        """
+        now = time() if now is None else now
+        return self.evict_idle_terminals(now) + self.expire_transmissions(now)
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {
+            "terminals_live": len(self.terminals),
+            "terminals_created": self.terminals_created,
+            "terminals_evicted": self.terminals_evicted,
+            "transmissions_timed_out": self.transmissions_timed_out,
+        }
 
     def process_packet(self, data: bytes, packet: IP) -> None:
         # to avoid circular dependency problem import must be local/inline
         from okdmr.dmrlib.tools.pcap_tool import PcapTool
 
         burst: Optional[Burst] = PcapTool.debug_packet(
-            data=data, packet=packet, silent=True
+            data=data, packet=packet, silent=True, listener=self.burst_listener
         )
         if burst:
             processed_burst: Burst = self.process_burst(burst)
             if processed_burst:
-                print(processed_burst)
-                print(processed_burst.as_bytes().hex())
+                get_output_sink().write(processed_burst, hex_dump=True)
             if self.debug_voice_bytes and burst.is_vocoder:
                 import logging
 
@@ -65,12 +221,16 @@ class TransmissionWatcher(LoggingTrait, WithObservers):
                 )
                 self.log_warning(repr(burst))
                 return None
-        self.ensure_terminal(burst.target_radio_id)
-        return self.terminals[burst.target_radio_id].process_incoming_burst(
+        now: float = burst.timestamp or time()
+        self.evict_idle_terminals(now)
+        self.expire_transmissions(now)
+        self.ensure_terminal(burst.target_radio_id, now)
+        out: Burst = self.terminals[burst.target_radio_id].process_incoming_burst(
             burst=burst, timeslot=burst.timeslot
         )
+        self.watch_transmission(burst.target_radio_id, burst.timeslot)
+        return out
 
     def end_all_transmissions(self) -> None:
         for terminal in self.terminals.values():
-            for timeslot in terminal.timeslots.values():
-                timeslot.transmission.end_transmissions()
+            terminal.end_transmissions()
@@ -0,0 +1,200 @@
+from time import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+import numpy
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.data_types import DataTypes
+from okdmr.dmrlib.transmission.stream_demultiplexer import StreamKey
+from okdmr.dmrlib.utils.deadline_queue import DeadlineQueue
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+AMBE_FRAMES_PER_BURST: int = 3
+AMBE_FRAME_BYTES: int = 9
+BURST_BYTES: int = 33
+
+AMBE_FRAME_BITS_INDEX: numpy.ndarray = numpy.concatenate(
+    (numpy.arange(0, 108), numpy.arange(156, 264))
+).reshape(AMBE_FRAMES_PER_BURST, 72)
+"""
+ETSI TS 102 361-1 V2.5.1 (2017-10) - 5.1.2 Vocoder burst, indexes of bits of the three 72-bit AMBE+2 frames
+in 264-bit burst (108 bits before and 108 bits after the 48-bit SYNC/EMB in the burst center)
+"""
+
+
+def extract_ambe_frames(bursts: numpy.ndarray) -> numpy.ndarray:
+    """
+    :param bursts: uint8 array of shape [N, 33], raw vocoder bursts
+    :return: uint8 array of shape [N * 3, 9], AMBE+2 frames in order of transmission
+    """
+    bits: numpy.ndarray = numpy.unpackbits(bursts, axis=-1)
+    return numpy.packbits(bits[:, AMBE_FRAME_BITS_INDEX], axis=-1).reshape(
+        -1, AMBE_FRAME_BYTES
+    )
+
+
+class VoiceFrameBatch(NamedTuple):
+    key: StreamKey
+    source_radio_id: int
+    target_radio_id: int
+    frames: numpy.ndarray
+    """ uint8 [N, 9], AMBE+2 frames, zeroed for missing bursts """
+    missing: numpy.ndarray
+    """ bool [N], True for frames of bursts lost in transport (gap in sequence numbers) """
+
+
+class VoiceStreamState:
+    """
+    Preallocated batch of single voice stream, raw bursts are collected and split to frames when the batch is emitted
+    """
+
+    def __init__(self, batch_size: int):
+        self.bursts: numpy.ndarray = numpy.zeros((batch_size, BURST_BYTES), numpy.uint8)
+        self.missing: numpy.ndarray = numpy.zeros(batch_size, dtype=bool)
+        self.count: int = 0
+        self.last_sequence_no: Optional[int] = None
+        """ network sequence number of last burst, stages like StreamDemultiplexer or Timeslot can renumber sequence_no """
+        self.source_radio_id: int = 0
+        self.target_radio_id: int = 0
+        self.last_packet_received: float = 0
+
+
+class VoiceFrameAssembler(LoggingTrait):
+    """
+    Voice pipeline stage, splits vocoder bursts of each stream (see StreamKey) into AMBE+2 frames and passes them
+    in batches to callback (vocoder, recorder, ...), bursts missing according to sequence numbers are emitted as
+    zeroed frames flagged in the missing mask, so jitter buffer / decoder can conceal the loss
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[VoiceFrameBatch], None],
+        batch_size: int = 6,
+        max_gap: int = 18,
+        voice_hang_time: float = 3.0,
+    ):
+        """
+
+        :param callback: receives batches of frames, arrays are owned by the callback
+        :param batch_size: number of bursts (each 3 frames) per batch, 6 is single superframe (360 ms of audio)
+        :param max_gap: max number of missing bursts to fill in, larger gap in sequence numbers is considered
+                        resynchronization and is not filled
+        :param voice_hang_time: seconds (packet time) after last burst, when stream without terminator is ended
+                                and its remaining frames emitted, 0 to disable
+        """
+        assert batch_size > 0, f"batch_size must be positive, got {batch_size}"
+        self.callback: Callable[[VoiceFrameBatch], None] = callback
+        self.batch_size: int = batch_size
+        self.max_gap: int = max_gap
+        self.voice_hang_time: float = voice_hang_time
+        self.streams: Dict[StreamKey, VoiceStreamState] = {}
+        self.deadlines: DeadlineQueue[StreamKey] = DeadlineQueue()
+        """ streams by hang time deadline, refreshed lazily, only when the scheduled deadline is reached """
+        self.frames_emitted: int = 0
+        self.frames_missing: int = 0
+        self.streams_timed_out: int = 0
+
+    def append(self, key: StreamKey, state: VoiceStreamState, burst: Optional[bytes]):
+        """
+        :param burst: raw burst bytes, None for missing burst
+        """
+        if burst is None:
+            state.bursts[state.count] = 0
+            state.missing[state.count] = True
+        else:
+            state.bursts[state.count] = numpy.frombuffer(burst, dtype=numpy.uint8)
+            state.missing[state.count] = False
+        state.count += 1
+        if state.count == self.batch_size:
+            self.emit(key, state)
+
+    def emit(self, key: StreamKey, state: VoiceStreamState) -> None:
+        if not state.count:
+            return
+        frames: numpy.ndarray = extract_ambe_frames(state.bursts[: state.count])
+        missing: numpy.ndarray = numpy.repeat(
+            state.missing[: state.count], AMBE_FRAMES_PER_BURST
+        )
+        state.count = 0
+        self.frames_emitted += len(frames)
+        self.frames_missing += int(missing.sum())
+        self.callback(
+            VoiceFrameBatch(
+                key=key,
+                source_radio_id=state.source_radio_id,
+                target_radio_id=state.target_radio_id,
+                frames=frames,
+                missing=missing,
+            )
+        )
+
+    def count_missing(self, state: VoiceStreamState, sequence_no: int) -> int:
+        if state.last_sequence_no is None:
+            return 0
+        gap: int = ((sequence_no - state.last_sequence_no) & 0xFF) - 1
+        return gap if 0 < gap <= self.max_gap else 0
+
+    def expire_streams(self, now: Optional[float] = None) -> int:
+        """
+        End streams without burst for voice_hang_time (terminator was probably lost), for live capture this should
+        be also called periodically, so the frames are emitted when the capture goes silent
+
+        :param now: current timestamp (packet clock), defaults to time()
+        :return: number of streams ended
+        """
+        now = time() if now is None else now
+        expired: int = 0
+        while True:
+            item = self.deadlines.peek()
+            if not item or item[0] > now:
+                return expired
+            key: StreamKey = item[1]
+            actual: float = (
+                self.streams[key].last_packet_received + self.voice_hang_time
+            )
+            if actual > now:
+                self.deadlines.schedule(key, actual)
+                continue
+            self.end_stream(key)
+            self.streams_timed_out += 1
+            expired += 1
+
+    def process_burst(self, burst: Burst) -> Burst:
+        now: float = burst.timestamp or time()
+        if self.voice_hang_time:
+            self.expire_streams(now)
+        key: StreamKey = StreamKey.from_burst(burst)
+        state: Optional[VoiceStreamState] = self.streams.get(key)
+
+        if burst.is_vocoder:
+            if not state:
+                state = VoiceStreamState(batch_size=self.batch_size)
+                self.streams[key] = state
+            state.last_packet_received = now
+            if self.voice_hang_time and key not in self.deadlines:
+                self.deadlines.schedule(key, now + self.voice_hang_time)
+            for _ in range(self.count_missing(state, burst.network_sequence_no)):
+                self.append(key, state, None)
+            state.source_radio_id = burst.source_radio_id or state.source_radio_id
+            state.target_radio_id = burst.target_radio_id or state.target_radio_id
+            self.append(key, state, burst.full_bits.tobytes())
+        elif state and burst.data_type == DataTypes.TerminatorWithLC:
+            self.end_stream(key)
+            return burst
+
+        if state:
+            state.last_sequence_no = burst.network_sequence_no
+        return burst
+
+    def end_stream(self, key: StreamKey) -> None:
+        """
+        Emit remaining frames of the stream and forget it
+        """
+        state: Optional[VoiceStreamState] = self.streams.pop(key, None)
+        self.deadlines.cancel(key)
+        if state:
+            self.emit(key, state)
+
+    def close(self) -> None:
+        for key in list(self.streams.keys()):
+            self.end_stream(key)
@@ -0,0 +1,98 @@
+import queue
+from threading import Thread
+from typing import Any, Callable, List, Optional
+
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+
+class BackgroundWriter(Thread, LoggingTrait):
+    """
+    Daemon thread, that collects submitted items into batches and passes them to handler, so the producer (packet
+    decoding loop) does not wait on formatting or disk/terminal I/O
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], None],
+        flush: Optional[Callable[[], None]] = None,
+        queue_size: int = 10_000,
+        batch_size: int = 512,
+        flush_interval: float = 1.0,
+        name: str = "BackgroundWriter",
+    ):
+        """
+
+        :param handler: called from writer thread with batch (list) of submitted items
+        :param flush: called from writer thread, when there is no more work, at most every flush_interval seconds
+        :param queue_size: max number of items waiting, submit() will block when the queue is full
+        :param batch_size: max number of items passed to single handler call
+        :param flush_interval: seconds
+        """
+        super().__init__(name=name, daemon=True)
+        self.handler: Callable[[List[Any]], None] = handler
+        self.flush: Optional[Callable[[], None]] = flush
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.items_written: int = 0
+
+    def submit(self, item: Any) -> None:
+        """
+        Enqueue single item, blocks if the writer is not keeping up (backpressure)
+        """
+        self.queue.put(item)
+
+    def run(self) -> None:
+        is_dirty: bool = False
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval if is_dirty else None)
+            except queue.Empty:
+                self.do_flush()
+                is_dirty = False
+                continue
+
+            batch: List[Any] = []
+            stop: bool = item is self._STOP
+            if not stop:
+                batch.append(item)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                # noinspection PyBroadException
+                try:
+                    self.handler(batch)
+                except:
+                    self.get_logger().exception("BackgroundWriter handler failed")
+                self.items_written += len(batch)
+                is_dirty = True
+
+            if stop:
+                self.do_flush()
+                return
+
+    def do_flush(self) -> None:
+        if self.flush:
+            # noinspection PyBroadException
+            try:
+                self.flush()
+            except:
+                self.get_logger().exception("BackgroundWriter flush failed")
+
+    def close(self) -> None:
+        """
+        Write all pending items and stop the thread
+        """
+        if self.is_alive():
+            self.queue.put(self._STOP)
+            self.join()
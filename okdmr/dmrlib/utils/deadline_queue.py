@@ -0,0 +1,84 @@
+import heapq
+import itertools
+from typing import Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+class DeadlineQueue(Generic[K]):
+    """
+    Min-heap of keys ordered by deadline (timestamp), with O(log n) schedule and O(1) cancel, rescheduled and
+    cancelled keys leave stale heap entries, that are skipped when reached (lazy invalidation) and cleaned up
+    when they outnumber the live ones
+    """
+
+    def __init__(self):
+        self.heap: List[Tuple[float, int, K]] = []
+        self.entries: Dict[K, Tuple[float, int]] = {}
+        self.counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.entries
+
+    def get(self, key: K) -> Optional[float]:
+        """
+        :return: deadline of key or None if key is not scheduled
+        """
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def schedule(self, key: K, deadline: float) -> None:
+        """
+        Schedule key, or reschedule if already present
+        """
+        entry: Tuple[float, int] = (deadline, next(self.counter))
+        self.entries[key] = entry
+        heapq.heappush(self.heap, (entry[0], entry[1], key))
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.compact()
+
+    def cancel(self, key: K) -> bool:
+        """
+        :return: True if key was scheduled
+        """
+        return self.entries.pop(key, None) is not None
+
+    def is_stale(self, item: Tuple[float, int, K]) -> bool:
+        return self.entries.get(item[2]) != (item[0], item[1])
+
+    def compact(self) -> None:
+        self.heap = [(d, seq, key) for key, (d, seq) in self.entries.items()]
+        heapq.heapify(self.heap)
+
+    def peek(self) -> Optional[Tuple[float, K]]:
+        """
+        :return: (deadline, key) with the earliest deadline, without removing it, None if empty
+        """
+        while self.heap and self.is_stale(self.heap[0]):
+            heapq.heappop(self.heap)
+        return (self.heap[0][0], self.heap[0][2]) if self.heap else None
+
+    def pop(self) -> Optional[Tuple[float, K]]:
+        """
+        :return: (deadline, key) with the earliest deadline, None if empty
+        """
+        item = self.peek()
+        if item:
+            heapq.heappop(self.heap)
+            del self.entries[item[1]]
+        return item
+
+    def pop_expired(self, now: float) -> List[K]:
+        """
+        :return: all keys with deadline lower than or equal to now, in order of deadlines
+        """
+        expired: List[K] = []
+        while True:
+            item = self.peek()
+            if not item or item[0] > now:
+                return expired
+            self.pop()
+            expired.append(item[1])
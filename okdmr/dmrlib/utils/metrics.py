@@ -0,0 +1,363 @@
+"""
+Metrics registry with Prometheus text exposition format (version 0.0.4, also accepted by OpenMetrics scrapers)
+
+Hot path only increments attributes of per-label-set child objects (resolve the child once with labels() and keep
+it), the exposition text is generated only when scraped
+"""
+
+import asyncio
+import math
+from bisect import bisect_left
+from threading import Thread
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from okdmr.dmrlib.utils.logging_trait import LoggingTrait
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+)
+""" seconds, suited for single packet decoding latency """
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            f'{name}="{escape_label_value(value)}"'
+            for name, value in zip(names, values)
+        )
+        + "}"
+    )
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value: float = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """
+        Value is evaluated only when scraped, for values that are costly to keep updated (eg. size of tables)
+        """
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function else self.value
+
+
+class HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds: Tuple[float, ...] = upper_bounds
+        self.counts: List[int] = [0] * (len(upper_bounds) + 1)
+        """ preallocated, non-cumulative counts per bucket, last one is +Inf """
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+MetricChild = Union[CounterChild, GaugeChild, HistogramChild]
+
+
+class Metric:
+    TYPE: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], MetricChild] = {}
+        if not self.labelnames:
+            self.children[()] = self.make_child()
+
+    def make_child(self) -> MetricChild:
+        raise NotImplementedError()
+
+    def labels(self, *values: Union[str, int]) -> MetricChild:
+        """
+        :return: child for given label values (in order of labelnames), created on first use
+        """
+        key: Tuple[str, ...] = tuple(str(value) for value in values)
+        child: Optional[MetricChild] = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} expects labels {self.labelnames}, got {values}"
+                )
+            child = self.make_child()
+            self.children[key] = child
+        return child
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """
+        :return: (sample name, formatted labels, value)
+        """
+        raise NotImplementedError()
+
+    def exposition(self) -> str:
+        lines: List[str] = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    TYPE: str = "counter"
+
+    def make_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.children[()].inc(amount)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, format_labels(self.labelnames, key), child.value)
+            for key, child in list(self.children.items())
+        ]
+
+
+class Gauge(Metric):
+    TYPE: str = "gauge"
+
+    def make_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.children[()].set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.children[()].set_function(function)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, format_labels(self.labelnames, key), child.get())
+            for key, child in list(self.children.items())
+        ]
+
+
+class Histogram(Metric):
+    TYPE: str = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.upper_bounds: Tuple[float, ...] = tuple(
+            sorted(bucket for bucket in buckets if not math.isinf(bucket))
+        )
+        assert self.upper_bounds, "Histogram requires at least one finite bucket"
+        super().__init__(name=name, documentation=documentation, labelnames=labelnames)
+
+    def make_child(self) -> HistogramChild:
+        return HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float) -> None:
+        self.children[()].observe(value)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples: List[Tuple[str, str, float]] = []
+        for key, child in list(self.children.items()):
+            cumulative: int = 0
+            for upper_bound, count in zip(
+                self.upper_bounds + (math.inf,), list(child.counts)
+            ):
+                cumulative += count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        format_labels(
+                            self.labelnames + ("le",),
+                            key + (format_value(upper_bound),),
+                        ),
+                        cumulative,
+                    )
+                )
+            labels: str = format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum", labels, child.sum))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        self.metrics.pop(name, None)
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def exposition(self) -> str:
+        return "".join(metric.exposition() for metric in list(self.metrics.values()))
+
+
+class MetricsServer(LoggingTrait):
+    """
+    Minimal asyncio HTTP server, serves registry exposition on GET /metrics
+    """
+
+    CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(
+        self, registry: MetricsRegistry, host: str = "0.0.0.0", port: int = 9100
+    ):
+        """
+        :param registry:
+        :param host: address to bind
+        :param port: TCP port, 0 to let OS choose one (see bound_port)
+        """
+        self.registry: MetricsRegistry = registry
+        self.host: str = host
+        self.port: int = port
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[Thread] = None
+        self.scrapes: int = 0
+
+    @property
+    def bound_port(self) -> int:
+        return self.server.sockets[0].getsockname()[1] if self.server else 0
+
+    async def start(self) -> "MetricsServer":
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.log_info(f"Metrics available on http://{self.host}:{self.bound_port}/")
+        return self
+
+    async def close(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line: bytes = await reader.readline()
+            # skip request headers
+            while (await reader.readline()).strip():
+                pass
+            parts: List[str] = request_line.decode("ascii", errors="replace").split()
+            if len(parts) < 2 or parts[0] not in ("GET", "HEAD"):
+                status, body = "405 Method Not Allowed", b""
+            elif parts[1].split("?")[0] in ("/", "/metrics"):
+                self.scrapes += 1
+                status, body = "200 OK", self.registry.exposition().encode()
+            else:
+                status, body = "404 Not Found", b""
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: {self.CONTENT_TYPE}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: close\r\n\r\n"
+                ).encode()
+                + (body if parts and parts[0] == "GET" else b"")
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def start_in_thread(self) -> "MetricsServer":
+        """
+        Serve from own event loop in daemon thread, for synchronous (eg. pcap file) processing
+        """
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.start())
+        self.thread = Thread(
+            target=self.loop.run_forever, name="MetricsServer", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop_thread(self) -> None:
+        if not self.loop:
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self.thread = None
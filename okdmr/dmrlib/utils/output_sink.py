@@ -0,0 +1,223 @@
+import csv
+import io
+import json
+import sys
+from typing import Any, Dict, IO, List, Literal, Optional
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.utils.background_writer import BackgroundWriter
+
+OUTPUT_FORMATS = Literal["text", "ndjson", "csv", "none"]
+
+
+class OutputSink:
+    """
+    Destination for decoded records (bursts, link controls, layer 3 pdus, ...) produced by tools,
+    records are passed as objects together with context fields, and serialized only by the sink
+    """
+
+    def write(self, record: Any, **fields: Any) -> None:
+        """
+        :param record: decoded object
+        :param fields: context (eg. src, dst, protocol, timeslot, sequence_no), hex_dump=True adds burst bytes
+                       in hex on separate line of textual output
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def create(
+        output_format: OUTPUT_FORMATS = "text", path: Optional[str] = None
+    ) -> "OutputSink":
+        """
+        :param output_format:
+        :param path: file to write to, None or "-" for stdout
+        """
+        if output_format == "none":
+            return NullSink()
+        if output_format == "text" and (not path or path == "-"):
+            return PrintSink()
+
+        stream: IO = (
+            sys.stdout
+            if not path or path == "-"
+            else open(path, "w", buffering=1024 * 1024, newline="")
+        )
+        if output_format == "ndjson":
+            return NDJSONSink(stream=stream)
+        elif output_format == "csv":
+            return CSVSink(stream=stream)
+        elif output_format == "text":
+            return TextSink(stream=stream)
+
+        raise ValueError(f"Unknown output format {output_format}")
+
+
+def format_text(record: Any, fields: Dict[str, Any]) -> str:
+    prefix: str = ""
+    if "src" in fields:
+        prefix += f"{fields['src']}\t-> {fields.get('dst')}\t "
+    if "protocol" in fields:
+        prefix += f"{fields['protocol']} TS:{fields.get('timeslot')} SEQ: {fields.get('sequence_no')} "
+    if fields.get("hex_dump") and isinstance(record, Burst):
+        return f"{prefix}{repr(record)}\n{record.as_bytes().hex()}"
+    return prefix + repr(record)
+
+
+def record_to_dict(record: Any, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flatten record into dict of json/csv serializable values
+    """
+    out: Dict[str, Any] = {"record": type(record).__name__}
+    out.update(fields)
+    # burst bytes are always part of the record
+    out.pop("hex_dump", None)
+    if isinstance(record, Burst):
+        out.update(
+            {
+                "timeslot": record.timeslot,
+                "sequence_no": record.sequence_no,
+                "stream_no": record.stream_no.hex(),
+                "source": record.source_radio_id,
+                "target": record.target_radio_id,
+                "sync": record.sync_or_embedded_signalling.name,
+                "data_type": record.data_type.name,
+                "voice_burst": record.voice_burst.name,
+                "colour_code": (
+                    record.colour_code
+                    if record.has_emb or record.has_slot_type
+                    else None
+                ),
+                "burst": record.full_bits.tobytes().hex(),
+                "repr": repr(record.data) if record.data else None,
+            }
+        )
+    else:
+        out["repr"] = repr(record)
+    return out
+
+
+class NullSink(OutputSink):
+    """
+    Discards everything, used when only side effects (statistics, observers, exports) are wanted
+    """
+
+    pass
+
+
+class PrintSink(OutputSink):
+    """
+    Synchronous textual output to stdout, default sink, keeps the original tools output
+    """
+
+    def write(self, record: Any, **fields: Any) -> None:
+        print(format_text(record, fields))
+
+
+class BufferedSink(OutputSink):
+    """
+    Records are queued and serialized+written in background thread, through buffered stream
+    """
+
+    def __init__(self, stream: IO, queue_size: int = 10_000):
+        self.stream: IO = stream
+        self.writer: BackgroundWriter = BackgroundWriter(
+            handler=self.write_batch,
+            flush=self.stream.flush,
+            queue_size=queue_size,
+            name=self.__class__.__name__,
+        )
+        self.writer.start()
+
+    def write(self, record: Any, **fields: Any) -> None:
+        self.writer.submit((record, fields))
+
+    def serialize(self, record: Any, fields: Dict[str, Any]) -> str:
+        raise NotImplementedError()
+
+    def write_batch(self, batch: List[Any]) -> None:
+        self.stream.write(
+            "".join(self.serialize(record, fields) for record, fields in batch)
+        )
+
+    def close(self) -> None:
+        self.writer.close()
+        if self.stream not in (sys.stdout, sys.stderr):
+            self.stream.close()
+
+
+class TextSink(BufferedSink):
+    def serialize(self, record: Any, fields: Dict[str, Any]) -> str:
+        return format_text(record, fields) + "\n"
+
+
+class NDJSONSink(BufferedSink):
+    """
+    Newline delimited JSON, one object per record
+    """
+
+    def serialize(self, record: Any, fields: Dict[str, Any]) -> str:
+        return json.dumps(record_to_dict(record, fields), default=str) + "\n"
+
+
+class CSVSink(BufferedSink):
+    """
+    CSV with fixed columns (see COLUMNS) and header row, values not applicable to record are left empty
+    """
+
+    COLUMNS: List[str] = [
+        "record",
+        "src",
+        "dst",
+        "flow",
+        "protocol",
+        "timeslot",
+        "sequence_no",
+        "stream_no",
+        "source",
+        "target",
+        "sync",
+        "data_type",
+        "voice_burst",
+        "colour_code",
+        "burst",
+        "repr",
+    ]
+
+    def __init__(self, stream: IO, queue_size: int = 10_000):
+        self.buffer: io.StringIO = io.StringIO()
+        self.csv: csv.DictWriter = csv.DictWriter(
+            self.buffer, fieldnames=self.COLUMNS, extrasaction="ignore"
+        )
+        self.csv.writeheader()
+        super().__init__(stream=stream, queue_size=queue_size)
+
+    def write_batch(self, batch: List[Any]) -> None:
+        for record, fields in batch:
+            self.csv.writerow(record_to_dict(record, fields))
+        self.stream.write(self.buffer.getvalue())
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+
+_output_sink: OutputSink = PrintSink()
+
+
+def get_output_sink() -> OutputSink:
+    """
+    Sink used by tools and decoders instead of printing directly
+    """
+    return _output_sink
+
+
+def set_output_sink(sink: Optional[OutputSink]) -> OutputSink:
+    """
+    :param sink: None to restore default PrintSink
+    :return: previously set sink (not closed)
+    """
+    global _output_sink
+    previous: OutputSink = _output_sink
+    _output_sink = sink if sink else PrintSink()
+    return previous
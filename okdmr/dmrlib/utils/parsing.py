@@ -13,6 +13,7 @@ from okdmr.kaitai.hytera.hytera_simple_transport_reliability_protocol import (
 from okdmr.kaitai.hytera.ip_site_connect_heartbeat import IpSiteConnectHeartbeat
 from okdmr.kaitai.hytera.ip_site_connect_protocol import IpSiteConnectProtocol
 from okdmr.kaitai.hytera.real_time_transport_protocol import RealTimeTransportProtocol
+from okdmr.dmrlib.utils.profiler import PROFILER, profiled
 
 
 def parse_hytera_data(bytedata: bytes) -> KaitaiStruct:
@@ -46,6 +47,7 @@ def parse_hytera_data(bytedata: bytes) -> KaitaiStruct:
         return HyteraDmrApplicationProtocol.from_bytes(bytedata)
 
 
+@profiled("parse")
 def try_parse_packet(udpdata: bytes) -> Optional[KaitaiStruct]:
     try:
         # known unsupported, that incidentally gets decoded as Hytera IPSC packet
@@ -80,4 +82,5 @@ def try_parse_packet(udpdata: bytes) -> Optional[KaitaiStruct]:
         ):
             traceback.print_exc()
 
+    PROFILER.count("parse.failed")
     return None
@@ -0,0 +1,252 @@
+import functools
+import sys
+import threading
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, TypeVar
+
+import numpy
+
+F = TypeVar("F", bound=Callable)
+
+
+class StageSnapshot(NamedTuple):
+    calls: int
+    total_ns: int
+    p50_ns: float
+    p99_ns: float
+    """ percentiles are calculated from the last Profiler.max_samples calls """
+
+
+class ProfileSnapshot(NamedTuple):
+    elapsed_ns: int
+    """ wall time since the profiler was enabled """
+    stages: Dict[str, StageSnapshot]
+    counters: Dict[str, int]
+
+
+class StageTimings:
+    def __init__(self, max_samples: int):
+        self.calls: int = 0
+        self.total_ns: int = 0
+        self.max_samples: int = max_samples
+        self.samples: List[int] = []
+
+    def record(self, duration_ns: int) -> None:
+        if self.calls < self.max_samples:
+            self.samples.append(duration_ns)
+        else:
+            # ring buffer of most recent samples
+            self.samples[self.calls % self.max_samples] = duration_ns
+        self.calls += 1
+        self.total_ns += duration_ns
+
+    def snapshot(self) -> StageSnapshot:
+        p50, p99 = (
+            numpy.percentile(self.samples, (50, 99)) if self.samples else (0.0, 0.0)
+        )
+        return StageSnapshot(
+            calls=self.calls,
+            total_ns=self.total_ns,
+            p50_ns=float(p50),
+            p99_ns=float(p99),
+        )
+
+
+class ProfiledHook:
+    """
+    Function instrumented by profiled decorator, the timing wrapper is installed in place of the original function
+    only while the profiler is enabled, so disabled profiler adds nothing to the instrumented calls
+
+    Methods (including staticmethods, with profiled as the outer decorator) are swapped on the class they are
+    defined in, module level functions are swapped in every loaded module, that holds reference to them
+    """
+
+    def __init__(self, profiler: "Profiler", original: Any, stage: str):
+        self.original: Any = original
+        """ function or staticmethod """
+        self.stage: str = stage
+        func: Callable = (
+            original.__func__ if isinstance(original, staticmethod) else original
+        )
+        wrapper: Callable = profiler.timed(func, stage)
+        self.wrapper: Any = (
+            staticmethod(wrapper) if isinstance(original, staticmethod) else wrapper
+        )
+        self.owner: Optional[type] = None
+        self.name: str = func.__name__
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        # decorated in class body, the original stays in place until the profiler is enabled
+        self.owner = owner
+        self.name = name
+        setattr(owner, name, self.original)
+
+    @staticmethod
+    def is_method(func: Callable) -> bool:
+        path: List[str] = func.__qualname__.split(".")
+        return len(path) > 1 and path[-2] != "<locals>"
+
+
+class Profiler:
+    """
+    Per-stage timings (monotonic ns) and hot-path counters of decoding pipeline, disabled by default,
+    instrumented functions (see profiled) are replaced by timing wrappers only while enabled, disabled profiler
+    costs single attribute check per count() call
+    """
+
+    def __init__(self, max_samples: int = 100_000):
+        """
+        :param max_samples: per stage, number of most recent call durations kept for percentiles
+        """
+        self.enabled: bool = False
+        self.max_samples: int = max_samples
+        self.stages: Dict[str, StageTimings] = {}
+        self.counters: Dict[str, int] = {}
+        self.started_ns: int = 0
+        self.hooks: List[ProfiledHook] = []
+        self.local: threading.local = threading.local()
+
+    @property
+    def active(self) -> Set[str]:
+        """
+        Stages being timed in current thread, nested calls of the same stage (eg. observers of observers) are not
+        timed twice
+        """
+        active: Optional[Set[str]] = getattr(self.local, "active", None)
+        if active is None:
+            active = set()
+            self.local.active = active
+        return active
+
+    def timed(self, func: Callable, stage: str) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            active: Set[str] = self.active
+            if stage in active:
+                return func(*args, **kwargs)
+            active.add(stage)
+            start: int = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, perf_counter_ns() - start)
+                active.discard(stage)
+
+        return wrapper
+
+    def swap_hooks(self, install: bool) -> None:
+        """
+        :param install: True to replace originals by wrappers, False to restore originals
+        """
+        functions: Dict[int, ProfiledHook] = {}
+        for hook in self.hooks:
+            (current, replacement) = (
+                (hook.original, hook.wrapper)
+                if install
+                else (hook.wrapper, hook.original)
+            )
+            if hook.owner is not None:
+                if hook.owner.__dict__.get(hook.name) is current:
+                    setattr(hook.owner, hook.name, replacement)
+            else:
+                functions[id(current)] = hook
+        if not functions:
+            return
+        for module in list(sys.modules.values()):
+            namespace: Optional[Dict[str, Any]] = getattr(module, "__dict__", None)
+            if not namespace:
+                continue
+            for name, value in list(namespace.items()):
+                hook: Optional[ProfiledHook] = functions.get(id(value))
+                if hook is not None:
+                    namespace[name] = hook.wrapper if install else hook.original
+
+    def enable(self) -> "Profiler":
+        if not self.enabled:
+            self.started_ns = perf_counter_ns()
+            self.enabled = True
+            self.swap_hooks(install=True)
+        return self
+
+    def disable(self) -> "Profiler":
+        if self.enabled:
+            self.enabled = False
+            self.swap_hooks(install=False)
+        return self
+
+    def reset(self) -> "Profiler":
+        self.stages = {}
+        self.counters = {}
+        self.started_ns = perf_counter_ns()
+        return self
+
+    def record(self, stage: str, duration_ns: int) -> None:
+        timings: StageTimings = self.stages.get(stage)
+        if not timings:
+            timings = StageTimings(max_samples=self.max_samples)
+            self.stages[stage] = timings
+        timings.record(duration_ns)
+
+    def count(self, counter: str, increment: int = 1) -> None:
+        if self.enabled:
+            self.counters[counter] = self.counters.get(counter, 0) + increment
+
+    def snapshot(self) -> ProfileSnapshot:
+        return ProfileSnapshot(
+            elapsed_ns=perf_counter_ns() - self.started_ns if self.started_ns else 0,
+            stages={
+                stage: timings.snapshot() for stage, timings in self.stages.items()
+            },
+            counters=dict(self.counters),
+        )
+
+    def format_report(self, packets_stage: str = "parse") -> str:
+        """
+        :param packets_stage: stage, which calls are counted as processed packets
+        """
+        snapshot: ProfileSnapshot = self.snapshot()
+        elapsed_s: float = snapshot.elapsed_ns / 1e9
+        lines: List[str] = [
+            f"| {'STAGE':<24} | {'CALLS':>10} | {'TOTAL ms':>10} | {'p50 us':>9} | {'p99 us':>9} | {'CALLS/s':>10} |"
+        ]
+        for stage, timings in sorted(
+            snapshot.stages.items(), key=lambda item: -item[1].total_ns
+        ):
+            lines.append(
+                f"| {stage:<24} | {timings.calls:>10} | {timings.total_ns / 1e6:>10.1f} "
+                f"| {timings.p50_ns / 1e3:>9.1f} | {timings.p99_ns / 1e3:>9.1f} "
+                f"| {timings.calls / elapsed_s if elapsed_s else 0:>10.0f} |"
+            )
+        for counter, value in sorted(snapshot.counters.items()):
+            lines.append(f"| {counter:<24} | {value:>10} |")
+        packets: int = (
+            snapshot.stages[packets_stage].calls
+            if packets_stage in snapshot.stages
+            else 0
+        )
+        lines.append(
+            f"{packets} packets in {elapsed_s:.3f} s, {packets / elapsed_s if elapsed_s else 0:.0f} packets/s"
+        )
+        return "\n".join(lines)
+
+
+PROFILER: Profiler = Profiler()
+
+
+def profiled(stage: str) -> Callable[[F], F]:
+    """
+    Decorator, time the calls of function as given stage of PROFILER, when it is enabled, only the outermost call
+    is timed if the stage is nested, the original function is called directly while PROFILER is disabled
+
+    For staticmethod, profiled must be the outer decorator (above @staticmethod)
+    """
+
+    def decorator(func: F) -> F:
+        hook: ProfiledHook = ProfiledHook(profiler=PROFILER, original=func, stage=stage)
+        PROFILER.hooks.append(hook)
+        if isinstance(func, staticmethod) or ProfiledHook.is_method(func):
+            # replaced by the original through __set_name__ when the class is created
+            return hook
+        return func
+
+    return decorator
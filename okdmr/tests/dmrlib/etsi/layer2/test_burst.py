@@ -162,6 +162,29 @@ def test_burst_as_bits():
         ), f"Mismatch in {repr(b)} {b.as_bits().tobytes().hex()} {_bytes.hex()}"
 
 
+def test_burst_as_mmdvm():
+    bursts: List[str] = [
+        # voice sync (burst A)
+        "444d5244192807220000090028072290864b516baded847205ae0062959308849047f7d5dd57dfd9537a101efe3ed4206e153827e70139",
+        # CSBK, private call
+        "444d52440223383b2338630006690f632e40c70153df0a83b7a8282c2509625014fdff57d75df5dcadde429028c87ae3341e24191c003c",
+        # voice burst B
+        "444d52440320baef0000090020baef8100000001b9e881526173002a6bb9e8815261303000a0391173002a6bb9e881526173002a6b3334",
+        # rate 1/2 data
+        "444d5244022338630008fd0023383be76f944918117b3090722540f9233581a285ed5d7f77fd75709464602846c3022109c3050079002f",
+    ]
+    for burst_hex in bursts:
+        mmdvm: Mmdvm2020.TypeDmrData = Mmdvm2020.from_bytes(
+            bytes.fromhex(burst_hex)
+        ).command_data
+        burst: Burst = Burst.from_mmdvm(mmdvm=mmdvm)
+        # trailing BER and RSSI are not part of the burst
+        assert burst.as_mmdvm(
+            repeater_id=mmdvm.repeater_id,
+            private_call=mmdvm.call_type == Mmdvm2020.CallTypes.private_call,
+        ) == bytes.fromhex(burst_hex[:106])
+
+
 def test_vocoder_socket():
     bursts: List[Tuple[str, VoiceBursts]] = [
         (
@@ -7,11 +7,18 @@ def test_encode_decode():
     test_str: str = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
 
     utf8_bytes = TalkerAliasDataFormat.UnicodeUTF8.encode(test_str)
-    utf16le_bytes = TalkerAliasDataFormat.UnicodeUTF16LE.encode(test_str)
+    utf16_bytes = TalkerAliasDataFormat.UnicodeUTF16LE.encode(test_str)
     iso8859_bytes = TalkerAliasDataFormat.ISOEightBitCharacters.encode(test_str)
     iec646_bytes = TalkerAliasDataFormat.SevenBitCharacters.encode(test_str)
 
     assert TalkerAliasDataFormat.UnicodeUTF8.decode(utf8_bytes) == test_str
-    assert TalkerAliasDataFormat.UnicodeUTF16LE.decode(utf16le_bytes) == test_str
+    assert TalkerAliasDataFormat.UnicodeUTF16LE.decode(utf16_bytes) == test_str
     assert TalkerAliasDataFormat.ISOEightBitCharacters.decode(iso8859_bytes) == test_str
     assert TalkerAliasDataFormat.SevenBitCharacters.decode(iec646_bytes) == test_str
+
+
+def test_utf16_is_big_endian():
+    # captured Talker Alias header + blocks 1-3 data, 13 characters
+    raw: bytes = bytes.fromhex("0052003400570042005000200044006d0069007400720069006900")
+    assert TalkerAliasDataFormat.UnicodeUTF16LE.decode(raw[:26]) == "R4WBP Dmitrii"
+    assert TalkerAliasDataFormat.UnicodeUTF16LE.encode("R4WBP Dmitrii") == raw[:26]
@@ -53,3 +53,19 @@ def test_reconstruct(do_return: bool = False) -> Optional[UDPIPv4CompressedHeade
     )
     assert pdu0.as_bytes() == msg_bytes
     return pdu0 if do_return else None
+
+
+def test_from_bytes_matches_from_bits():
+    for hexstr in (
+        "d6790062620003bf0007",
+        # single port in extended header
+        "d679006200ffff03bf0007",
+        # both ports in extended header
+        "d67900000000110022",
+    ):
+        data: bytes = bytes.fromhex(hexstr)
+        from_bytes = UDPIPv4CompressedHeader.from_bytes(memoryview(data))
+        from_bits = UDPIPv4CompressedHeader.from_bits(bytes_to_bits(data))
+        assert from_bytes.as_bits() == from_bits.as_bits()
+        assert repr(from_bytes) == repr(from_bits)
+        assert from_bytes.as_bytes() == data
@@ -0,0 +1,188 @@
+import timeit
+from typing import List, Tuple
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.voice_bursts import VoiceBursts
+from okdmr.dmrlib.hytera.hytera_ipsc import HyteraIPSC
+from okdmr.dmrlib.hytera.hytera_ipsc_sync import HyteraIPSCSync
+from okdmr.dmrlib.hytera.ipsc_elements.call_type import CallType
+from okdmr.dmrlib.hytera.ipsc_elements.packet_type import PacketType
+from okdmr.dmrlib.hytera.ipsc_elements.slot_type import SlotType
+from okdmr.dmrlib.hytera.ipsc_mmdvm_translator import IPSCMMDVMTranslator
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
+from okdmr.kaitai.hytera.ip_site_connect_protocol import IpSiteConnectProtocol
+from okdmr.tests.dmrlib.tests_utils import IPSC_VOICE_CALL
+
+# group call 2308092 -> TG 111 on TS2, voice lc header, bursts A-F, terminator
+IPSC_SYNC: str = (
+    "5a5a5a5a0000000042000501010000001111eeee555511114028000000000000000000006f0023003700fa00342a2c10942a2c10f42a2c10835600f0360801006f000000fa372300"
+)
+IPSC_WAKEUP: str = (
+    "5a5a5a5a0000000042000501020000002222dddd555500004000000000000000000000000000020002000000000000000000000000000000b2dd503250380c00000014000000ff01"
+)
+# private call data header TS2
+IPSC_PRIVATE_DATA: str = (
+    "5a5a5a5ad22b00004100050102000000222244445555000040950a391d32802bb93b9221c163bd1557ff5dd7d5f52d5c5211f0218729d34aaa06006d1d3200003b38230063382300"
+)
+
+
+def translate_call(
+    translator: IPSCMMDVMTranslator, frames: List[str]
+) -> List[Mmdvm2020.TypeDmrData]:
+    translated: List[Mmdvm2020.TypeDmrData] = []
+    for frame in frames:
+        dmrd = translator.ipsc_to_dmrd(bytes.fromhex(frame))
+        assert dmrd and len(dmrd) == 53
+        translated.append(Mmdvm2020.from_bytes(dmrd).command_data)
+    return translated
+
+
+def test_ipsc_to_dmrd():
+    translator = IPSCMMDVMTranslator(repeater_id=2308001)
+    dmrds = translate_call(translator, IPSC_VOICE_CALL)
+
+    assert len({d.stream_id for d in dmrds}) == 1
+    assert [d.sequence_no for d in dmrds] == list(range(8))
+    for ipsc_hex, dmrd in zip(IPSC_VOICE_CALL, dmrds):
+        ipsc_burst: Burst = Burst.from_hytera_ipsc(
+            IpSiteConnectProtocol.from_bytes(bytes.fromhex(ipsc_hex))
+        )
+        burst: Burst = Burst.from_mmdvm(dmrd)
+        assert burst.as_bytes() == ipsc_burst.as_bytes()
+        assert (burst.source_radio_id, burst.target_radio_id, burst.timeslot) == (
+            ipsc_burst.source_radio_id,
+            ipsc_burst.target_radio_id,
+            2,
+        )
+        assert dmrd.repeater_id == 2308001
+        assert dmrd.call_type == Mmdvm2020.CallTypes.group_call
+
+    assert [d.frame_type for d in dmrds] == [
+        Mmdvm2020.FrameTypes.data_or_data_sync,
+        Mmdvm2020.FrameTypes.voice_sync,
+    ] + [Mmdvm2020.FrameTypes.voice_data] * 5 + [Mmdvm2020.FrameTypes.data_or_data_sync]
+    assert [d.data_type for d in dmrds] == [1, 0, 1, 2, 3, 4, 5, 2]
+    assert Burst.from_mmdvm(dmrds[3]).voice_burst == VoiceBursts.VoiceBurstC
+
+    # terminator ended the stream
+    assert translate_call(translator, IPSC_VOICE_CALL[:1])[0].stream_id != (
+        dmrds[0].stream_id
+    )
+
+    # private call data
+    data = translate_call(translator, [IPSC_PRIVATE_DATA])[0]
+    assert data.call_type == Mmdvm2020.CallTypes.private_call
+    assert data.data_type == 6
+    assert translator.to_dmrd == 10
+
+
+def test_ipsc_sync_wakeup_start_stream():
+    translator = IPSCMMDVMTranslator(repeater_id=1)
+    first = translate_call(translator, IPSC_VOICE_CALL[1:3])
+    assert first[0].stream_id == first[1].stream_id
+    for frame in (IPSC_SYNC, IPSC_WAKEUP):
+        assert translator.is_ipsc_sync_or_wakeup(bytes.fromhex(frame))
+        assert translator.ipsc_to_dmrd(bytes.fromhex(frame)) is None
+    # wakeup was on TS2, call continues with new stream
+    second = translate_call(translator, IPSC_VOICE_CALL[3:4])
+    assert second[0].stream_id != first[0].stream_id
+    assert second[0].sequence_no == 0
+
+    # not translatable
+    assert translator.ipsc_to_dmrd(bytes.fromhex(IPSC_SYNC)[:60]) is None
+    undefined = bytearray.fromhex(IPSC_VOICE_CALL[2])
+    undefined[18:20] = b"\xff\xff"
+    assert translator.ipsc_to_dmrd(bytes(undefined)) is None
+    assert translator.dropped == 2
+
+
+def test_dmrd_to_ipsc_roundtrip():
+    to_mmdvm = IPSCMMDVMTranslator(repeater_id=2308001, color_code=5)
+    to_ipsc = IPSCMMDVMTranslator(repeater_id=2308001, color_code=5)
+    for ipsc_hex in IPSC_VOICE_CALL + [IPSC_PRIVATE_DATA]:
+        original: bytes = bytes.fromhex(ipsc_hex)
+        frames: Tuple[bytes, ...] = to_ipsc.dmrd_to_ipsc(
+            to_mmdvm.ipsc_to_dmrd(original)
+        )
+        assert len(frames) == 1 and len(frames[0]) == 72
+        expected: HyteraIPSC = HyteraIPSC.from_kaitai(
+            IpSiteConnectProtocol.from_bytes(original)
+        )
+        translated: HyteraIPSC = HyteraIPSC.from_kaitai(
+            IpSiteConnectProtocol.from_bytes(frames[0])
+        )
+        for attr in (
+            "call_type",
+            "packet_type",
+            "slot_type",
+            "timeslot",
+            "color_code",
+            "frame_type",
+            "source_radio_id",
+            "destination_radio_id",
+            "payload",
+        ):
+            assert getattr(translated, attr) == getattr(expected, attr), attr
+        # constant fields are taken from HyteraIPSC defaults
+        assert frames[0][:4] == b"\x5a\x5a\x5a\x5a"
+        assert frames[0][60:62] == HyteraIPSC.DEFAULT_RESERVED_2B
+
+    assert [HyteraIPSC.from_ipsc_bytes(f).sequence_number for f in frames] == [8]
+    assert to_ipsc.to_ipsc == 9
+
+    # not translatable
+    dmrd = bytearray(to_mmdvm.ipsc_to_dmrd(bytes.fromhex(IPSC_VOICE_CALL[0])))
+    assert to_ipsc.dmrd_to_ipsc(bytes(dmrd[:40])) == ()
+    dmrd[15] = (dmrd[15] & 0xF0) | 9  # idle burst
+    assert to_ipsc.dmrd_to_ipsc(bytes(dmrd)) == ()
+    assert to_ipsc.dropped == 2
+
+
+def test_dmrd_to_ipsc_sync_on_stream_start():
+    to_mmdvm = IPSCMMDVMTranslator(repeater_id=1)
+    to_ipsc = IPSCMMDVMTranslator(repeater_id=1, sync_on_stream_start=True)
+    dmrds = [to_mmdvm.ipsc_to_dmrd(bytes.fromhex(f)) for f in IPSC_VOICE_CALL]
+    frames = [to_ipsc.dmrd_to_ipsc(d) for d in dmrds]
+    assert [len(f) for f in frames] == [2] + [1] * 7
+
+    sync_frame: bytes = frames[0][0]
+    sync: Burst = Burst.from_hytera_ipsc(IpSiteConnectProtocol.from_bytes(sync_frame))
+    assert isinstance(sync, HyteraIPSCSync)
+    assert (sync.source_radio_id, sync.target_radio_id, sync.timeslot) == (
+        2308092,
+        111,
+        2,
+    )
+    assert sync.hytera_ipsc.packet_type == PacketType.TypeB
+    assert sync.hytera_ipsc.call_type == CallType.GroupCall
+    # ids in sync payload, same layout as in sampled IPSC Sync
+    assert sync_frame[32:43] == bytes.fromhex("000000006f00230037" "00fc")
+    # sequence numbers continue after sync
+    assert [HyteraIPSC.from_ipsc_bytes(f[-1]).sequence_number for f in frames] == list(
+        range(1, 9)
+    )
+    assert HyteraIPSC.from_ipsc_bytes(frames[1][0]).slot_type == SlotType.VoiceFrameA
+
+
+def benchmark_translation(rounds: int = 10_000) -> Tuple[float, float]:
+    """
+    :return: seconds per frame of ipsc_to_dmrd and dmrd_to_ipsc, best of several runs
+    """
+    translator = IPSCMMDVMTranslator(repeater_id=2308001)
+    ipsc: bytes = bytes.fromhex(IPSC_VOICE_CALL[2])
+    dmrd: bytes = translator.ipsc_to_dmrd(ipsc)
+    to_dmrd: float = min(
+        timeit.repeat(lambda: translator.ipsc_to_dmrd(ipsc), number=rounds, repeat=5)
+    )
+    to_ipsc: float = min(
+        timeit.repeat(lambda: translator.dmrd_to_ipsc(dmrd), number=rounds, repeat=5)
+    )
+    return to_dmrd / rounds, to_ipsc / rounds
+
+
+if __name__ == "__main__":
+    # latency benchmark, python -m okdmr.tests.dmrlib.hytera.test_ipsc_mmdvm_translator
+    per_dmrd, per_ipsc = benchmark_translation()
+    print(
+        f"ipsc_to_dmrd {per_dmrd * 1e6:.2f} us/frame, dmrd_to_ipsc {per_ipsc * 1e6:.2f} us/frame"
+    )
@@ -0,0 +1,74 @@
+import asyncio
+import warnings
+from typing import List
+
+import pytest
+
+from okdmr.dmrlib.hytera.snmp import SNMP
+from okdmr.dmrlib.hytera.snmp_enrichment import SNMPEnrichment
+from okdmr.dmrlib.storage.repeater import Repeater
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.tests.dmrlib.tests_utils import SNMPAgent
+
+
+@pytest.mark.asyncio
+async def test_snmp_enrichment():
+    warnings.filterwarnings(
+        message="Experimental SNMPv1 support", category=UserWarning, action="ignore"
+    )
+    transport, agent = await asyncio.get_running_loop().create_datagram_endpoint(
+        SNMPAgent, local_addr=("127.0.0.1", 0)
+    )
+    try:
+        storage = RepeaterStorage()
+        enrichment = SNMPEnrichment(
+            storage=storage,
+            max_concurrent=2,
+            snmp_community="public",
+            timeout_secs=0.5,
+            port=transport.get_extra_info("sockname")[1],
+        )
+        rpt: Repeater = storage.match_incoming(("127.0.0.1", 50000), auto_create=True)
+
+        finished: List[Repeater] = []
+        task = enrichment.enrich(rpt, callback=finished.append)
+        # does not block, concurrent request shares the read
+        assert not task.done()
+        assert enrichment.enrich(rpt) is task
+        snmp_data = await task
+        await asyncio.sleep(0)
+        assert finished == [rpt]
+
+        # all OIDs in single request, community "public" timed out, then "hytera" was tried
+        assert agent.requests == [
+            (b"public", len(SNMP.ALL_KNOWN)),
+            (b"hytera", len(SNMP.ALL_KNOWN)),
+        ]
+        assert snmp_data[SNMP.OID_RADIO_ALIAS] == "OK1DMR"
+        assert snmp_data[SNMP.OID_PSU_VOLTAGE] == 13800
+        assert snmp_data[SNMP.OID_RADIO_ID] == 2305519
+        assert rpt.attr(SNMP.OID_RADIO_ID) == 2305519
+
+        # cached, callback is called immediately
+        assert enrichment.enrich(rpt, callback=finished.append) is None
+        assert finished == [rpt, rpt]
+        assert len(agent.requests) == 2
+
+        # reads of multiple repeaters are limited by semaphore
+        enrichment.snmp_community = "hytera"
+        repeaters = [
+            storage.match_incoming(("127.0.0.1", 50001 + i), auto_create=True)
+            for i in range(5)
+        ]
+        results = await asyncio.gather(*[enrichment.enrich(r) for r in repeaters])
+        assert all(results)
+        assert agent.max_outstanding == 2
+        assert not enrichment.pending
+
+        # disabled repeater is never read
+        rpt.snmp_enabled = False
+        enrichment.cache.clear()
+        assert enrichment.enrich(rpt) is None
+        await enrichment.close()
+    finally:
+        transport.close()
@@ -0,0 +1,116 @@
+import asyncio
+import warnings
+from time import time
+
+import numpy
+import pytest
+
+from okdmr.dmrlib.hytera.snmp import SNMP
+from okdmr.dmrlib.hytera.snmp_telemetry import TelemetryPoller, TimeSeries
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.tests.dmrlib.tests_utils import SNMPAgent
+
+
+def test_time_series_ring_buffer():
+    series = TimeSeries(capacity=4)
+    assert series.stats() is None
+    for i in range(6):
+        series.append(1000 + i, i * 10)
+    assert len(series) == 4
+    timestamps, values = series.ordered()
+    assert numpy.array_equal(timestamps, [1002, 1003, 1004, 1005])
+    assert numpy.array_equal(values, [20, 30, 40, 50])
+
+    stats = series.stats()
+    assert (stats.count, stats.min, stats.max, stats.avg, stats.last) == (
+        4,
+        20,
+        50,
+        35,
+        50,
+    )
+    assert series.stats(since=1004).count == 2
+    assert series.stats(since=2000) is None
+
+
+@pytest.mark.asyncio
+async def test_telemetry_poller():
+    warnings.filterwarnings(
+        message="Experimental SNMPv1 support", category=UserWarning, action="ignore"
+    )
+    transport, agent = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: SNMPAgent(community=b"public", delay=0.01),
+        local_addr=("127.0.0.1", 0),
+    )
+    try:
+        storage = RepeaterStorage()
+        repeaters = [
+            storage.match_incoming(("127.0.0.1", 50000 + i), auto_create=True)
+            for i in range(3)
+        ]
+        # agent is not listening on this IP
+        unresponsive = storage.match_incoming(("127.0.0.2", 50000), auto_create=True)
+        poller = TelemetryPoller(
+            storage=storage,
+            interval=100,
+            timeout_secs=0.2,
+            port=transport.get_extra_info("sockname")[1],
+        )
+
+        # polls are spread over the interval
+        now: float = time()
+        poller.sync(now=now)
+        initial = {rpt_id: state.due for rpt_id, state in poller.states.items()}
+        dues = sorted(initial.values())
+        assert len(dues) == 4
+        assert now <= dues[0] and dues[-1] < now + 100
+        assert min(numpy.diff(dues)) > 10
+        assert not poller.due(now=now - 1)
+        assert len(poller.due(now=now + 100)) == 4
+
+        results = await asyncio.gather(*[poller.poll(rpt) for rpt in storage.all()])
+        assert results == [True, True, True, False]
+        assert agent.requests[0] == (b"public", len(SNMP.ALL_TELEMETRY))
+
+        stats = poller.stats(repeaters[0], SNMP.OID_RSSI_TS1)
+        assert stats.count == 1 and stats.last == 2305519
+        assert poller.stats(repeaters[0], SNMP.OID_PSU_VOLTAGE).last == 13800
+        assert poller.states[repeaters[0].id].latency > 0
+        # unresponsive repeater is polled less often
+        assert poller.states[unresponsive.id].failures == 1
+        assert poller.stats(unresponsive, SNMP.OID_RSSI_TS1) is None
+        assert poller.states[repeaters[0].id].due == initial[repeaters[0].id] + 100
+        assert poller.states[unresponsive.id].due == initial[unresponsive.id] + 200
+
+        # removed from storage (not SNMP enabled), is no longer polled
+        unresponsive.snmp_enabled = False
+        poller.sync()
+        assert unresponsive.id not in poller.states
+    finally:
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_telemetry_poller_run():
+    warnings.filterwarnings(
+        message="Experimental SNMPv1 support", category=UserWarning, action="ignore"
+    )
+    transport, agent = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: SNMPAgent(community=b"public", delay=0.0),
+        local_addr=("127.0.0.1", 0),
+    )
+    try:
+        storage = RepeaterStorage()
+        rpt = storage.match_incoming(("127.0.0.1", 50000), auto_create=True)
+        poller = TelemetryPoller(
+            storage=storage,
+            interval=0.1,
+            timeout_secs=0.5,
+            port=transport.get_extra_info("sockname")[1],
+        ).start(tick=0.05)
+        await asyncio.sleep(0.5)
+        await poller.close()
+        assert poller.stats(rpt, SNMP.OID_VSWR).count >= 3
+        assert not poller.polls
+    finally:
+        transport.close()
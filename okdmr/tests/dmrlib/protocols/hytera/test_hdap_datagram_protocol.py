@@ -0,0 +1,56 @@
+from typing import List
+
+from okdmr.dmrlib.hytera.pdu.hdap import HyteraServiceType
+from okdmr.dmrlib.hytera.pdu.hstrp import HSTRP
+from okdmr.dmrlib.protocols.hytera.hdap_datagram_protocol import (
+    HDAPDispatcher,
+    HDAPDatagramProtocol,
+    RRSDispatchingDatagramProtocol,
+)
+from okdmr.tests.dmrlib.tests_utils import (
+    option_packet,
+    RecordingTransport,
+    LP_HEX,
+    TMP_HEX,
+    hdap_packet,
+)
+
+
+def test_hdap_dispatch():
+    received: List[HyteraServiceType] = []
+    dispatcher = HDAPDispatcher()
+    dispatcher.register(
+        HyteraServiceType.LP,
+        lambda protocol, pdu, addr: received.append(pdu.payload.get_service_type()),
+    )
+    dispatcher.register(
+        HyteraServiceType.RRS,
+        lambda protocol, pdu, addr: received.append(pdu.payload.get_service_type()),
+    )
+    peer = ("127.0.0.2", 30003)
+    gps = HDAPDatagramProtocol(port=30003, dispatcher=dispatcher, peer=peer)
+    gps.transport = RecordingTransport()
+
+    was_handled, pdu = gps.datagram_received(hdap_packet(1, LP_HEX).as_bytes(), peer)
+    assert was_handled and isinstance(pdu, HSTRP)
+    # no handler for TMP, counted anyway
+    was_handled, _ = gps.datagram_received(hdap_packet(2, TMP_HEX).as_bytes(), peer)
+    assert not was_handled
+    # duplicate is confirmed, but not dispatched again
+    gps.datagram_received(hdap_packet(1, LP_HEX).as_bytes(), peer)
+    # all three were ACKed
+    assert len(gps.transport.sent) == 3
+
+    # RRS endpoint confirms the registration itself and shares the dispatch table
+    rrs = RRSDispatchingDatagramProtocol(port=30001, dispatcher=dispatcher)
+    rrs.transport = RecordingTransport()
+    rrs.datagram_received(option_packet(1).as_bytes(), ("127.0.0.2", 30001))
+    assert len(rrs.registry) == 1
+
+    assert received == [HyteraServiceType.LP, HyteraServiceType.RRS]
+    assert dispatcher.counts == {
+        HyteraServiceType.LP: 1,
+        HyteraServiceType.TMP: 1,
+        HyteraServiceType.RRS: 1,
+    }
+    assert dispatcher.unhandled == 1
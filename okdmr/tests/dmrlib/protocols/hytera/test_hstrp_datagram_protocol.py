@@ -1,7 +1,18 @@
+import asyncio
+from random import Random
+from time import time
+from typing import Dict, List, Optional, Tuple
+
 import pytest
 
 from okdmr.dmrlib.hytera.pdu.hstrp import HSTRP, HSTRPPacketType
+from okdmr.dmrlib.hytera.pdu.radio_registration_service import RadioRegistrationService
 from okdmr.dmrlib.protocols.hytera.hstrp_datagram_protocol import HSTRPDatagramProtocol
+from okdmr.tests.dmrlib.tests_utils import (
+    option_packet,
+    RecordingTransport,
+    wait_until,
+)
 
 
 def test_hstrpdp():
@@ -31,3 +42,228 @@ def test_hstrpdp():
     # passing none to check assert
     with pytest.raises(AssertionError):
         hstrp.connection_made(None)
+
+
+def test_hstrp_reliable_send():
+    hstrp = HSTRPDatagramProtocol(123, window=2, retransmit_timeout=1)
+    hstrp.transport = RecordingTransport()
+    peer = ("127.0.0.1", 123)
+    session = hstrp.hstrp_session(peer)
+    results: List[Tuple[int, bool]] = []
+
+    for _ in range(3):
+        hstrp.hstrp_send_reliable(
+            option_packet(hstrp.hstrp_increment_sn(peer)),
+            addr=peer,
+            callback=lambda pdu, ok: results.append((pdu.sn, ok)),
+        )
+    # third packet waits for free slot in window
+    assert list(session.pending.keys()) == [1, 2]
+    assert len(session.backlog) == 1
+    assert len(hstrp.transport.sent) == 2
+
+    # ACK of S/N 1 frees the slot
+    hstrp.datagram_received(
+        hstrp.hstrp_send_ack(peer, option_packet(1)).as_bytes(), peer
+    )
+    assert results == [(1, True)]
+    assert list(session.pending.keys()) == [2, 3]
+
+    # retransmissions with exponential backoff, then packets are discarded
+    now: float = time()
+    hstrp.transport.sent.clear()
+    for offset in (1.5, 3.5, 7.5):
+        hstrp.hstrp_process_timers(now=now + offset)
+    assert len(hstrp.transport.sent) == 6
+    assert hstrp.transport.sent[0][0] == option_packet(2).as_bytes()
+    hstrp.hstrp_process_timers(now=now + 16)
+    assert sorted(results) == [(1, True), (2, False), (3, False)]
+    assert not session.pending
+    assert list(hstrp.deadlines.entries.keys()) == [(peer, -1)]
+
+
+def test_hstrp_duplicates_and_liveness():
+    hstrp = HSTRPDatagramProtocol(123)
+    hstrp.transport = RecordingTransport()
+    peer = ("127.0.0.1", 123)
+
+    hstrp.datagram_received(HSTRP(HSTRPPacketType(is_connect=True), 0).as_bytes(), peer)
+    assert hstrp.hstrp_session(peer).connected
+    handled, pdu = hstrp.datagram_received(option_packet(5).as_bytes(), peer)
+    assert isinstance(pdu.payload, RadioRegistrationService)
+    # retransmission is confirmed again, but not delivered
+    hstrp.transport.sent.clear()
+    assert hstrp.datagram_received(option_packet(5).as_bytes(), peer) == (True, None)
+    assert HSTRP.from_bytes(hstrp.transport.sent[0][0]).pkt_type.is_ack
+    # reconnected peer starts S/N over
+    hstrp.datagram_received(HSTRP(HSTRPPacketType(is_connect=True), 0).as_bytes(), peer)
+    assert hstrp.datagram_received(option_packet(5).as_bytes(), peer)[1]
+
+    # own heartbeat after T_HEARTBEAT, disconnect after T_NUMBEAT missed heartbeats
+    hstrp.transport.sent.clear()
+    now: float = time()
+    hstrp.hstrp_process_timers(now=now + hstrp.T_HEARTBEAT)
+    assert HSTRP.from_bytes(hstrp.transport.sent[0][0]).pkt_type.is_heartbeat
+    hstrp.hstrp_process_timers(now=now + hstrp.T_HEARTBEAT * (hstrp.T_NUMBEAT + 1))
+    assert peer not in hstrp.sessions
+
+
+def test_hstrp_disconnect_fails_pending_and_backlog():
+    hstrp = HSTRPDatagramProtocol(123, window=1)
+    hstrp.transport = RecordingTransport()
+    peer = ("127.0.0.1", 123)
+    hstrp.hstrp_set_connected(True, addr=peer)
+    results: List[Tuple[int, bool]] = []
+    for _ in range(3):
+        hstrp.hstrp_send_reliable(
+            option_packet(hstrp.hstrp_increment_sn(peer)),
+            addr=peer,
+            callback=lambda pdu, ok: results.append((pdu.sn, ok)),
+        )
+    assert len(hstrp.transport.sent) == 1
+
+    hstrp.hstrp_set_connected(False, addr=peer)
+    # nothing from backlog is sent to the disconnected peer
+    assert len(hstrp.transport.sent) == 1
+    assert results == [(1, False), (2, False), (3, False)]
+    assert peer not in hstrp.sessions
+    assert not hstrp.deadlines
+
+
+def test_hstrp_silent_unconnected_peer_dropped():
+    # retransmissions are not exhausted before the liveness check
+    hstrp = HSTRPDatagramProtocol(123, retransmit_timeout=100)
+    hstrp.transport = RecordingTransport()
+    peer = ("127.0.0.1", 123)
+    results: List[Tuple[int, bool]] = []
+    hstrp.hstrp_send_reliable(
+        option_packet(hstrp.hstrp_increment_sn(peer)),
+        addr=peer,
+        callback=lambda pdu, ok: results.append((pdu.sn, ok)),
+    )
+    now: float = time()
+    for offset in range(0, hstrp.T_HEARTBEAT * (hstrp.T_NUMBEAT + 2), 5):
+        hstrp.hstrp_process_timers(now=now + offset)
+    # session with pending packets is dropped too, instead of being kept forever
+    assert peer not in hstrp.sessions
+    assert results == [(1, False)]
+    assert not hstrp.deadlines
+
+
+class CountingPeer(HSTRPDatagramProtocol):
+    T_HEARTBEAT = 0.05
+
+    def __init__(self, port: int):
+        super().__init__(port=port)
+        self.received: int = 0
+
+    def datagram_received(self, data: bytes, addr):
+        self.received += 1
+        return super().datagram_received(data=data, addr=addr)
+
+
+@pytest.mark.asyncio
+async def test_hstrp_heartbeats_bounded():
+    loop = asyncio.get_running_loop()
+    first_transport, first = await loop.create_datagram_endpoint(
+        lambda: CountingPeer(port=0), local_addr=("127.0.0.1", 0)
+    )
+    second_transport, second = await loop.create_datagram_endpoint(
+        lambda: CountingPeer(port=0), local_addr=("127.0.0.1", 0)
+    )
+    second_addr = second_transport.get_extra_info("sockname")
+    try:
+        first_transport.sendto(
+            HSTRP(HSTRPPacketType(is_connect=True), 0).as_bytes(), second_addr
+        )
+        await wait_until(lambda: first.hstrp_session(second_addr).connected)
+        first.hstrp_send_heartbeat(second_addr)
+        periods: int = 10
+        await asyncio.sleep(CountingPeer.T_HEARTBEAT * periods)
+        assert first.hstrp_session(second_addr).connected
+        # about one heartbeat per period and direction, heartbeats are not echoed back and forth
+        assert 0 < first.received + second.received <= 6 * periods
+    finally:
+        first_transport.close()
+        second_transport.close()
+
+
+class LossyProxy(asyncio.DatagramProtocol):
+    """
+    Forwards datagrams between two endpoints, randomly dropping datagrams in both directions
+    """
+
+    def __init__(self, loss: float, seed: int = 0):
+        self.loss: float = loss
+        self.random: Random = Random(seed)
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.endpoints: Dict[Tuple[str, int], Tuple[str, int]] = {}
+        self.forwarded: int = 0
+        self.dropped: int = 0
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        if self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        self.forwarded += 1
+        self.transport.sendto(data, self.endpoints[addr])
+
+
+class ReceivingPeer(HSTRPDatagramProtocol):
+    def __init__(self, port: int):
+        super().__init__(port=port)
+        self.delivered: List[int] = []
+
+    def datagram_received(self, data: bytes, addr):
+        was_handled, pdu = super().datagram_received(data=data, addr=addr)
+        if pdu:
+            self.delivered.append(pdu.payload.radio_ip.radio_id)
+        return was_handled, pdu
+
+
+@pytest.mark.asyncio
+async def test_hstrp_lossy_loopback():
+    loop = asyncio.get_running_loop()
+    proxy_transport, proxy = await loop.create_datagram_endpoint(
+        lambda: LossyProxy(loss=0.2), local_addr=("127.0.0.1", 0)
+    )
+    proxy_addr = proxy_transport.get_extra_info("sockname")
+    sender_transport, sender = await loop.create_datagram_endpoint(
+        lambda: HSTRPDatagramProtocol(port=0, window=4, retransmit_timeout=0.01),
+        local_addr=("127.0.0.1", 0),
+    )
+    receiver_transport, receiver = await loop.create_datagram_endpoint(
+        lambda: ReceivingPeer(port=0), local_addr=("127.0.0.1", 0)
+    )
+    sender_addr = sender_transport.get_extra_info("sockname")
+    receiver_addr = receiver_transport.get_extra_info("sockname")
+    proxy.endpoints = {sender_addr: receiver_addr, receiver_addr: sender_addr}
+    # with 20% loss in each direction, single attempt fails with ~36% probability
+    sender.T_NUMRETRY = 10
+
+    results: Dict[int, bool] = {}
+    done = asyncio.Event()
+
+    def on_result(pdu: HSTRP, delivered: bool):
+        results[pdu.sn] = delivered
+        if len(results) == 20:
+            done.set()
+
+    try:
+        for radio_id in range(1, 21):
+            sender.hstrp_send_reliable(
+                option_packet(sender.hstrp_increment_sn(), radio_id=radio_id),
+                addr=proxy_addr,
+                callback=on_result,
+            )
+        await asyncio.wait_for(done.wait(), timeout=10)
+        assert proxy.dropped > 0
+        assert all(results.values())
+        # each payload delivered exactly once, regardless of lost packets and ACKs
+        assert sorted(receiver.delivered) == list(range(1, 21))
+    finally:
+        for transport in (sender_transport, receiver_transport, proxy_transport):
+            transport.close()
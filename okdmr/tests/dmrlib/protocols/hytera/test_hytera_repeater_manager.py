@@ -0,0 +1,332 @@
+import asyncio
+import sys
+from asyncio import DatagramProtocol, DatagramTransport
+from time import perf_counter, time
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import pytest
+
+from okdmr.dmrlib.protocols.hytera.hytera_repeater_manager import (
+    HyteraRepeaterManager,
+)
+from okdmr.dmrlib.protocols.hytera.p2p_datagram_protocol import P2PDatagramProtocol
+from okdmr.dmrlib.protocols.hytera.rdac_datagram_protocol import (
+    RDACDatagramProtocol as RDAC,
+)
+from okdmr.dmrlib.storage import ADDRESS_TYPE, ADDRESS_EMPTY
+from okdmr.dmrlib.storage.repeater import Repeater
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+from okdmr.tests.dmrlib.tests_utils import wait_until, IPSC_VOICE_CALL
+
+IPSC_FRAME: bytes = bytes.fromhex(IPSC_VOICE_CALL[2])
+
+
+class NoSNMPStorage(RepeaterStorage):
+    """
+    Simulated repeaters have no SNMP agent
+    """
+
+    def create_repeater(
+        self,
+        dmr_id: int = None,
+        address_in: ADDRESS_TYPE = ADDRESS_EMPTY,
+        address_out: ADDRESS_TYPE = ADDRESS_EMPTY,
+        address_nat: ADDRESS_TYPE = ADDRESS_EMPTY,
+    ) -> Repeater:
+        rpt = super().create_repeater(dmr_id, address_in, address_out, address_nat)
+        rpt.snmp_enabled = False
+        return rpt
+
+
+class RepeaterPort(DatagramProtocol):
+    def __init__(self, handler: Callable[[bytes], None]):
+        self.handler: Callable[[bytes], None] = handler
+        self.transport: Optional[DatagramTransport] = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: ADDRESS_TYPE) -> None:
+        self.handler(data)
+
+
+def p2p_command(packet_type: int) -> bytes:
+    return P2PDatagramProtocol.COMMAND_PREFIX + bytes(17) + bytes([packet_type])
+
+
+class SimulatedRepeater:
+    """
+    Hytera repeater, registers over P2P, passes RDAC identification, then requests DMR startup,
+    each of P2P, RDAC and DMR uses own socket (source port), all on the same IP
+    """
+
+    def __init__(self, ip: str, dmr_id: int, master: ADDRESS_TYPE):
+        self.ip: str = ip
+        self.dmr_id: int = dmr_id
+        self.master: ADDRESS_TYPE = master
+        self.ports: Dict[str, RepeaterPort] = {}
+        self.dmr_port: Optional[int] = None
+        self.rdac_port: Optional[int] = None
+        self.registered: bool = False
+        self.rejected: int = 0
+        self.pongs: int = 0
+        self.dmr_received: int = 0
+        identity = bytearray(216)
+        identity[:4] = RDAC.STEP4_RESPONSE_2
+        identity[88:108] = f"OK{dmr_id % 10000:04d}".encode("utf_16_le").ljust(
+            20, b"\0"
+        )
+        frequencies = bytearray(37)
+        frequencies[:4] = RDAC.STEP7_RESPONSE_2
+        frequencies[29:33] = (438_100_000).to_bytes(4, byteorder="little")
+        self.rdac_responses: Dict[bytes, Tuple[bytes, ...]] = {
+            RDAC.STEP0_REQUEST: (RDAC.STEP0_RESPONSE,),
+            RDAC.STEP1_REQUEST: (
+                RDAC.STEP1_RESPONSE,
+                RDAC.STEP2_RESPONSE
+                + bytes(14)
+                + dmr_id.to_bytes(3, byteorder="little"),
+            ),
+            RDAC.STEP3_REQUEST: (RDAC.STEP3_RESPONSE,),
+            RDAC.STEP4_REQUEST_1: (RDAC.STEP4_RESPONSE_1,),
+            RDAC.STEP4_REQUEST_2: (bytes(identity),),
+            RDAC.STEP6_REQUEST_1: (RDAC.STEP6_RESPONSE,),
+            RDAC.STEP7_REQUEST: (RDAC.STEP7_RESPONSE_1, bytes(frequencies)),
+            RDAC.STEP10_REQUEST: (RDAC.STEP10_RESPONSE_1, RDAC.STEP10_RESPONSE_2),
+            RDAC.STEP12_REQUEST_2: (RDAC.STEP12_RESPONSE,),
+        }
+
+    async def start(self) -> "SimulatedRepeater":
+        loop = asyncio.get_running_loop()
+        for name, handler in (
+            ("p2p", self.p2p_received),
+            ("rdac", self.rdac_received),
+            ("dmr", self.dmr_received_frame),
+        ):
+            _, self.ports[name] = await loop.create_datagram_endpoint(
+                lambda: RepeaterPort(handler), local_addr=(self.ip, 0)
+            )
+        self.send(
+            "p2p", p2p_command(P2PDatagramProtocol.PACKET_TYPE_REQUEST_REGISTRATION)
+        )
+        return self
+
+    def close(self) -> None:
+        for port in self.ports.values():
+            port.transport.close()
+
+    def send(self, port: str, data: bytes, master_port: Optional[int] = None) -> None:
+        self.ports[port].transport.sendto(
+            data, (self.master[0], master_port or self.master[1])
+        )
+
+    def ping(self) -> None:
+        self.send("p2p", bytes(4) + P2PDatagramProtocol.PING_PREFIX + bytes(11))
+
+    def p2p_received(self, data: bytes) -> None:
+        if len(data) == 1:
+            self.rejected += 1
+        elif P2PDatagramProtocol.packet_is_ping(data):
+            self.pongs += data[12] == 0xFF
+        elif data[4] == 0x0B:
+            # redirect, target port is in last 2 bytes
+            port: int = int.from_bytes(data[-2:], byteorder="little")
+            if data[20] == P2PDatagramProtocol.PACKET_TYPE_REQUEST_RDAC_STARTUP:
+                self.rdac_port = port
+                self.send("rdac", RDAC.STEP2_RESPONSE, master_port=port)
+            else:
+                self.dmr_port = port
+        elif data[20] == P2PDatagramProtocol.PACKET_TYPE_REQUEST_REGISTRATION:
+            self.registered = data[13] == 0x01
+            self.send(
+                "p2p", p2p_command(P2PDatagramProtocol.PACKET_TYPE_REQUEST_RDAC_STARTUP)
+            )
+
+    def rdac_received(self, data: bytes) -> None:
+        for response in self.rdac_responses.get(data, ()):
+            self.send("rdac", response, master_port=self.rdac_port)
+        if data == RDAC.STEP12_REQUEST_2:
+            self.send(
+                "p2p", p2p_command(P2PDatagramProtocol.PACKET_TYPE_REQUEST_DMR_STARTUP)
+            )
+
+    def dmr_received_frame(self, data: bytes) -> None:
+        self.dmr_received += 1
+
+
+async def run_repeaters(
+    count: int, frames: int, manager: HyteraRepeaterManager
+) -> Tuple[float, List[SimulatedRepeater]]:
+    """
+    Starts count simulated repeaters (each on own loopback IP), waits until all of them are connected,
+    then each repeater sends frames IPSC frames, at most 100 frames in flight
+
+    :return: (seconds from start until all the frames were received, repeaters)
+    """
+    started: float = perf_counter()
+    repeaters: List[SimulatedRepeater] = []
+    for i in range(count):
+        repeaters.append(
+            await SimulatedRepeater(
+                ip=f"127.0.{1 + i // 250}.{1 + i % 250}",
+                dmr_id=2300000 + i,
+                master=manager.local_addr("p2p"),
+            ).start()
+        )
+        if i % 100 == 99:
+            # do not overflow manager sockets with handshakes, simulated repeaters do not retry
+            await wait_until(lambda: all(r.dmr_port for r in repeaters), timeout=30)
+    await wait_until(lambda: all(r.dmr_port for r in repeaters), timeout=30)
+    expected: int = manager.dmr.received
+    for _ in range(frames):
+        for window in range(0, count, 100):
+            for repeater in repeaters[window : window + 100]:
+                repeater.send("dmr", IPSC_FRAME, master_port=repeater.dmr_port)
+            expected += len(repeaters[window : window + 100])
+            await wait_until(lambda: manager.dmr.received >= expected)
+    return perf_counter() - started, repeaters
+
+
+@pytest.mark.asyncio
+async def test_manager_many_repeaters():
+    rdac_finished: List[UUID] = []
+    frames_by_repeater: Dict[int, int] = {}
+
+    def on_frame(data: bytes, rpt: Repeater) -> None:
+        assert data == IPSC_FRAME
+        frames_by_repeater[rpt.dmr_id] = frames_by_repeater.get(rpt.dmr_id, 0) + 1
+
+    manager = await HyteraRepeaterManager(
+        storage=NoSNMPStorage(),
+        local_ip="127.0.0.1",
+        p2p_port=0,
+        dmr_port=0,
+        rdac_port=0,
+        idle_timeout=30,
+        dmr_callback=on_frame,
+        rdac_callback=rdac_finished.append,
+    ).start()
+    repeaters: List[SimulatedRepeater] = []
+    try:
+        _, repeaters = await run_repeaters(count=50, frames=20, manager=manager)
+
+        # single state per repeater, regardless three source ports
+        assert len(manager.states) == 50 and len(manager.storage) == 50
+        assert len(manager.states.by_address) == 150
+        assert len(rdac_finished) == 50
+        assert frames_by_repeater == {2300000 + i: 20 for i in range(50)}
+        for state in manager.states.all():
+            assert state.registered and state.rdac_done
+            assert state.rpt.callsign == f"OK{state.rpt.dmr_id % 10000:04d}"
+            assert state.rpt.attr(RDAC.STORAGE_ATTR_RX_FREQ) == 438_100_000
+            assert state.dmr_address[0] == state.rpt.address_in[0]
+
+        # pings and DMR data towards repeaters
+        for repeater in repeaters:
+            repeater.ping()
+            assert manager.send_dmr(
+                IPSC_FRAME, manager.storage.match_attr("dmr_id", repeater.dmr_id)
+            )
+        await wait_until(lambda: all(r.pongs and r.dmr_received for r in repeaters))
+
+        # silent repeaters are removed, their frames are not accepted anymore
+        assert len(manager.remove_idle(now=time() + 31)) == 50
+        assert not len(manager.states) and not len(manager.storage)
+        assert not manager.states.by_address
+        repeaters[0].send("dmr", IPSC_FRAME, master_port=repeaters[0].dmr_port)
+        repeaters[0].ping()
+        await wait_until(lambda: manager.dmr.dropped == 1 and repeaters[0].rejected)
+    finally:
+        for repeater in repeaters:
+            repeater.close()
+        await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_manager_repeaters_behind_nat():
+    frames_by_repeater: Dict[int, int] = {}
+
+    def on_frame(data: bytes, rpt: Repeater) -> None:
+        frames_by_repeater[rpt.dmr_id] = frames_by_repeater.get(rpt.dmr_id, 0) + 1
+
+    manager = await HyteraRepeaterManager(
+        storage=NoSNMPStorage(),
+        local_ip="127.0.0.1",
+        p2p_port=0,
+        dmr_port=0,
+        rdac_port=0,
+        dmr_callback=on_frame,
+    ).start()
+    repeaters: List[SimulatedRepeater] = []
+    try:
+        # same IP, each repeater has its own source ports
+        for dmr_id in (2300001, 2300002):
+            repeaters.append(
+                await SimulatedRepeater(
+                    ip="127.0.0.1", dmr_id=dmr_id, master=manager.local_addr("p2p")
+                ).start()
+            )
+            await wait_until(lambda: repeaters[-1].dmr_port)
+        for received, repeater in enumerate(repeaters, start=1):
+            repeater.send("dmr", IPSC_FRAME, master_port=repeater.dmr_port)
+            await wait_until(lambda: manager.dmr.received == received)
+        assert frames_by_repeater == {2300001: 1, 2300002: 1}
+        assert len(manager.states) == 2 and len(manager.storage) == 2
+        for state in manager.states.all():
+            assert state.rdac_done and len(state.addresses) == 3
+    finally:
+        for repeater in repeaters:
+            repeater.close()
+        await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_manager_rejects_unregistered():
+    manager = await HyteraRepeaterManager(
+        storage=NoSNMPStorage(),
+        local_ip="127.0.0.1",
+        p2p_port=0,
+        dmr_port=0,
+        rdac_port=0,
+    ).start()
+    loop = asyncio.get_running_loop()
+    rejected: List[bytes] = []
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: RepeaterPort(rejected.append), local_addr=("127.0.0.1", 0)
+    )
+    try:
+        for packet_type in (
+            P2PDatagramProtocol.PACKET_TYPE_REQUEST_RDAC_STARTUP,
+            P2PDatagramProtocol.PACKET_TYPE_REQUEST_DMR_STARTUP,
+        ):
+            transport.sendto(p2p_command(packet_type), manager.local_addr("p2p"))
+        transport.sendto(IPSC_FRAME, manager.local_addr("dmr"))
+        await wait_until(lambda: len(rejected) == 2 and manager.dmr.dropped == 1)
+        assert rejected == [b"\x00", b"\x00"]
+        assert not len(manager.states)
+    finally:
+        transport.close()
+        await manager.close()
+
+
+if __name__ == "__main__":
+    # load test, python -m okdmr.tests.dmrlib.protocols.hytera.test_hytera_repeater_manager [repeaters]
+
+    async def benchmark(count: int) -> None:
+        manager = await HyteraRepeaterManager(
+            storage=NoSNMPStorage(),
+            local_ip="127.0.0.1",
+            p2p_port=0,
+            dmr_port=0,
+            rdac_port=0,
+        ).start()
+        took, repeaters = await run_repeaters(count=count, frames=100, manager=manager)
+        print(
+            f"{count} repeaters connected, {manager.dmr.received} IPSC frames received in {took:.2f}s"
+        )
+        for repeater in repeaters:
+            repeater.close()
+        await manager.close()
+
+    asyncio.run(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,85 @@
+from time import time
+
+from okdmr.dmrlib.protocols.hytera.hytera_repeater_state import (
+    HyteraRepeaterState,
+    HyteraRepeaterStates,
+)
+from okdmr.dmrlib.storage.repeater_storage import RepeaterStorage
+
+
+def test_states_resolve_by_ip():
+    storage = RepeaterStorage()
+    states = HyteraRepeaterStates(storage=storage)
+
+    assert states.get(("10.0.0.1", 50000)) is None
+    p2p = states.get(("10.0.0.1", 50000), auto_create=True)
+    assert p2p and len(storage) == 1
+    assert p2p.rpt.address_out == ("10.0.0.1", 50000)
+    assert not p2p.registered and p2p.rdac_step == HyteraRepeaterState.RDAC_STEP_START
+
+    # other ports resolve by IP only to registered repeater
+    assert states.get(("10.0.0.1", 50002), service=states.SERVICE_DMR) is None
+    states.register(p2p)
+    assert states.get(("10.0.0.1", 50002), service=states.SERVICE_DMR) is p2p
+    assert states.get(("10.0.0.1", 50001), service=states.SERVICE_RDAC) is p2p
+    assert len(storage) == 1 and len(states) == 1
+    assert p2p.addresses == {
+        ("10.0.0.1", 50000),
+        ("10.0.0.1", 50001),
+        ("10.0.0.1", 50002),
+    }
+
+    # registration is visible through storage
+    assert p2p.rpt.attr(HyteraRepeaterState.STORAGE_ATTR_IS_REGISTERED)
+    assert HyteraRepeaterState(rpt=p2p.rpt).registered
+
+    other = states.get(("10.0.0.2", 50000), auto_create=True)
+    assert other is not p2p and len(states) == 2
+
+
+def test_states_behind_nat():
+    storage = RepeaterStorage()
+    states = HyteraRepeaterStates(storage=storage)
+    first = states.get(("10.0.0.1", 50000), auto_create=True)
+    states.register(first)
+    # second repeater behind the same NAT is created by full address, not merged into first
+    second = states.get(("10.0.0.1", 40000), auto_create=True)
+    assert second is not first and len(storage) == 2
+    states.register(second)
+    assert states.registered_by_ip == {"10.0.0.1": {50000: first, 40000: second}}
+
+    # ambiguous without redirect
+    assert states.get(("10.0.0.1", 50001), service=states.SERVICE_RDAC) is None
+    states.redirect(second, states.SERVICE_RDAC)
+    states.redirect(first, states.SERVICE_DMR)
+    assert states.get(("10.0.0.1", 50001), service=states.SERVICE_RDAC) is second
+    assert states.get(("10.0.0.1", 50002), service=states.SERVICE_DMR) is first
+    assert not states.redirects
+
+    states.redirect(second, states.SERVICE_DMR)
+    states.remove(second)
+    assert not states.redirects
+    assert states.registered_by_ip == {"10.0.0.1": {50000: first}}
+
+
+def test_states_remove_idle():
+    storage = RepeaterStorage()
+    states = HyteraRepeaterStates(storage=storage)
+    first = states.get(("10.0.0.1", 50000), auto_create=True)
+    second = states.get(("10.0.0.2", 50000), auto_create=True)
+    second.last_seen = time() + 100
+
+    assert states.remove_idle(timeout=10, now=time() + 20) == [first]
+    assert states.all() == [second] and len(storage) == 1
+    assert states.get(("10.0.0.1", 50000)) is None
+    assert states.get(("10.0.0.2", 50000)) is second
+
+    states.remove(second)
+    states.remove(second)
+    assert not len(states) and not len(storage) and not states.by_address
+
+    rdac = states.get(("10.0.0.3", 50002), auto_create=True)
+    rdac.rdac_step = HyteraRepeaterState.RDAC_STEP_FINISHED
+    assert rdac.rdac_done
+    rdac.rdac_reset(now=1.0)
+    assert not rdac.rdac_done and rdac.rdac_started == 1.0
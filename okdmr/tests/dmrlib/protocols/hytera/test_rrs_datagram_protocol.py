@@ -0,0 +1,58 @@
+import asyncio
+from typing import List, Tuple
+
+import pytest
+
+from okdmr.dmrlib.hytera.pdu.hstrp import HSTRP, HSTRPPacketType
+from okdmr.dmrlib.hytera.pdu.radio_registration_service import RRSRadioState
+from okdmr.dmrlib.protocols.hytera.hstrp_datagram_protocol import HSTRPDatagramProtocol
+from okdmr.dmrlib.protocols.hytera.rrs_datagram_protocol import RRSDatagramProtocol
+from okdmr.tests.dmrlib.tests_utils import wait_until, option_packet
+
+
+@pytest.mark.asyncio
+async def test_rrs_many_repeaters_single_port():
+    loop = asyncio.get_running_loop()
+    server_transport, server = await loop.create_datagram_endpoint(
+        lambda: RRSDatagramProtocol(port=0, retransmit_timeout=0.1),
+        local_addr=("127.0.0.1", 0),
+    )
+    server_addr = server_transport.get_extra_info("sockname")
+    repeaters: List[Tuple[asyncio.DatagramTransport, HSTRPDatagramProtocol]] = []
+    try:
+        for _ in range(100):
+            repeaters.append(
+                await loop.create_datagram_endpoint(
+                    lambda: HSTRPDatagramProtocol(port=0, retransmit_timeout=0.1),
+                    remote_addr=server_addr,
+                )
+            )
+        for radio_id, (transport, repeater) in enumerate(repeaters, start=1):
+            # connected transport, default peer is the server
+            assert repeater.hstrp_peer == server_addr
+            transport.sendto(HSTRP(HSTRPPacketType(is_connect=True), 0).as_bytes())
+        await wait_until(lambda: all(r.hstrp_connected for _, r in repeaters))
+
+        for radio_id, (transport, repeater) in enumerate(repeaters, start=1):
+            repeater.hstrp_send_reliable(
+                option_packet(repeater.hstrp_increment_sn(), radio_id=radio_id)
+            )
+        await wait_until(lambda: len(server.registry) == 100)
+        # confirmations were ACKed by all the repeaters
+        await wait_until(lambda: not any(s.pending for s in server.sessions.values()))
+        assert all(state == RRSRadioState.Online for state in server.registry.values())
+        assert len(server.sessions) == 100
+        # each repeater has own S/N space
+        assert all(session.sn == 1 for session in server.sessions.values())
+        assert not any(repeater.hstrp_session().pending for _, repeater in repeaters)
+
+        # closed connection takes radios of the repeater offline
+        transport, repeater = repeaters[0]
+        transport.sendto(HSTRP(HSTRPPacketType(is_close=True), 0).as_bytes())
+        await wait_until(lambda: len(server.sessions) == 99)
+        assert server.registry["10.0.0.1"] == RRSRadioState.Offline
+        assert server.registry["10.0.0.2"] == RRSRadioState.Online
+    finally:
+        for transport, _ in repeaters:
+            transport.close()
+        server_transport.close()
@@ -1,12 +1,64 @@
-from asyncio import Queue
-from typing import Callable
+import asyncio
+import os
+from asyncio import Queue, DatagramProtocol
+from hashlib import sha256
+from typing import Callable, Dict, List, Tuple
 
 import pytest
 
+from okdmr.dmrlib.etsi.layer2.burst import Burst
 from okdmr.dmrlib.protocols.mmdvm.mmdvm_client_protocol import (
     MMDVMClientProtocol,
     MMDVMClientConfiguration,
 )
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
+from okdmr.tests.dmrlib.tests_utils import (
+    wait_until,
+    MMDVM_CSBK,
+    MMDVM_VOICE,
+    client_config,
+)
+
+
+class FakeMaster(DatagramProtocol):
+    """
+    Minimal MMDVM/Homebrew master, accepts any repeater knowing the password
+    """
+
+    def __init__(self, password: str = "passw0rd"):
+        self.password: str = password
+        self.transport = None
+        self.challenges: Dict[Tuple[str, int], bytes] = {}
+        self.logged_in: Dict[Tuple[str, int], int] = {}
+        self.commands: List[bytes] = []
+        self.dmrd: List[bytes] = []
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.commands.append(data[:4])
+        repeater_id: bytes = data[4:8]
+        if data[:4] == b"DMRD":
+            self.dmrd.append(data)
+        elif data[:4] == b"RPTL":
+            self.challenges[addr] = os.urandom(4)
+            self.transport.sendto(b"RPTACK" + self.challenges[addr], addr)
+        elif data[:4] == b"RPTK":
+            expected: bytes = sha256(
+                self.challenges.get(addr, b"") + self.password.encode()
+            ).digest()
+            self.transport.sendto(
+                (b"RPTACK" if data[8:40] == expected else b"MSTNAK") + repeater_id,
+                addr,
+            )
+        elif data[:5] == b"RPTCL":
+            self.logged_in.pop(addr, None)
+        elif data[:4] == b"RPTC":
+            self.logged_in[addr] = int.from_bytes(repeater_id, byteorder="big")
+            self.transport.sendto(b"RPTACK" + repeater_id, addr)
+        elif data[:7] == b"RPTPING":
+            self.transport.sendto(b"MSTPONG" + data[7:11], addr)
 
 
 @pytest.mark.asyncio
@@ -26,3 +78,115 @@ async def test_mmdvm_client():
         queue_outgoing=q_out,
         connection_lost_callback=cb_conn_lost,
     )
+
+    # event is created by start(), inside the running loop
+    assert c.logged_in is None
+    c.disconnect()
+
+    configuration = Mmdvm2020.from_bytes(c.configuration_packet())
+    assert isinstance(
+        configuration.command_data.data, Mmdvm2020.TypeRepeaterConfiguration
+    )
+    assert configuration.command_data.data.repeater_id == 2309901
+    assert configuration.command_data.data.call_sign == "OK0DMR T"
+    assert configuration.command_data.data.slots == "3"
+
+    # backoff doubles with each failure, up to backoff_max
+    assert c.backoff() == 0
+    c.failures = 3
+    assert c.backoff() == 4
+    c.failures = 100
+    assert c.backoff() == c.backoff_max
+
+
+@pytest.mark.asyncio
+async def test_mmdvm_client_fake_master():
+    loop = asyncio.get_running_loop()
+    master_transport, master = await loop.create_datagram_endpoint(
+        FakeMaster, local_addr=("127.0.0.1", 0)
+    )
+    port: int = master_transport.get_extra_info("sockname")[1]
+    q_in: Queue = Queue()
+    client = MMDVMClientProtocol(
+        config=client_config(port),
+        connection_lost_callback=None,
+        queue_outgoing=Queue(),
+        queue_incoming=q_in,
+        keepalive_interval=0.05,
+        handshake_timeout=0.5,
+        backoff_initial=0.05,
+        batch_size=16,
+    )
+    csbk: Burst = Burst.from_mmdvm(
+        Mmdvm2020.from_bytes(bytes.fromhex(MMDVM_CSBK)).command_data
+    )
+    try:
+        # frames queued before login are held, not dropped
+        for _ in range(200):
+            client.send_burst(csbk, private_call=True)
+        await client.start()
+        await asyncio.wait_for(client.logged_in.wait(), timeout=5)
+        assert list(master.logged_in.values()) == [2309901]
+
+        await wait_until(lambda: len(master.dmrd) == 200)
+        # frame is built from burst without any re-parsing and matches the original
+        assert set(master.dmrd) == {
+            csbk.as_mmdvm(repeater_id=2309901, private_call=True)
+        }
+        assert (
+            master.dmrd[0]
+            == bytes.fromhex(MMDVM_CSBK)[:4]
+            + bytes.fromhex(MMDVM_CSBK)[4:11]
+            + (2309901).to_bytes(4, byteorder="big")
+            + bytes.fromhex(MMDVM_CSBK)[15:53]
+        )
+
+        # keepalive
+        await wait_until(lambda: b"RPTP" in master.commands)
+
+        # master to repeater traffic
+        master_transport.sendto(bytes.fromhex(MMDVM_VOICE), list(master.logged_in)[0])
+        burst: Burst = await asyncio.wait_for(q_in.get(), timeout=5)
+        assert burst.is_vocoder
+        assert burst.as_mmdvm(repeater_id=0x20BAEF) == bytes.fromhex(MMDVM_VOICE)[:53]
+
+        # master closed connection, client logs in again after backoff
+        addr = list(master.logged_in)[0]
+        master.logged_in.clear()
+        master_transport.sendto(b"MSTCL" + (2309901).to_bytes(4, "big"), addr)
+        await wait_until(lambda: not client.logged_in.is_set())
+        await wait_until(lambda: client.logged_in.is_set() and master.logged_in)
+        assert client.failures == 0
+    finally:
+        await client.close()
+        # logged in client says goodbye
+        await wait_until(lambda: not master.logged_in)
+        master_transport.close()
+
+
+@pytest.mark.asyncio
+async def test_mmdvm_client_wrong_password():
+    loop = asyncio.get_running_loop()
+    master_transport, master = await loop.create_datagram_endpoint(
+        FakeMaster, local_addr=("127.0.0.1", 0)
+    )
+    port: int = master_transport.get_extra_info("sockname")[1]
+    client = MMDVMClientProtocol(
+        config=client_config(port, password="wrong"),
+        connection_lost_callback=None,
+        queue_outgoing=Queue(),
+        queue_incoming=Queue(),
+        backoff_initial=0.05,
+        backoff_max=0.2,
+    )
+    try:
+        await client.start()
+        await wait_until(lambda: client.failures >= 3)
+        assert not client.logged_in.is_set()
+        assert not master.logged_in
+        # every attempt was answered, but delayed by growing backoff
+        assert master.commands.count(b"RPTL") == client.failures
+        assert client.backoff() <= 0.2
+    finally:
+        await client.close()
+        master_transport.close()
@@ -0,0 +1,246 @@
+import asyncio
+import sys
+from asyncio import Queue, DatagramProtocol
+from hashlib import sha256
+from time import perf_counter
+from typing import List, Tuple, Optional
+
+import pytest
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.protocols.mmdvm.mmdvm_client_protocol import MMDVMClientProtocol
+from okdmr.dmrlib.protocols.mmdvm.mmdvm_master_protocol import (
+    MMDVMMasterProtocol,
+    MMDVMPeer,
+)
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
+from okdmr.tests.dmrlib.tests_utils import wait_until, MMDVM_VOICE, client_config
+
+# voice burst, TS2, destination talkgroup 9
+DMRD_TG9_TS2: bytes = bytes.fromhex(MMDVM_VOICE)[:53]
+
+
+class LoadPeer(DatagramProtocol):
+    """
+    Lightweight peer for load generation, logs in and counts received DMRD frames, never parses them
+    """
+
+    def __init__(self, repeater_id: int, password: str = "passw0rd", options: str = ""):
+        self.repeater_id: bytes = repeater_id.to_bytes(4, byteorder="big")
+        self.password: bytes = password.encode()
+        self.options: bytes = options.encode()
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.step: int = 0
+        self.logged_in: asyncio.Event = asyncio.Event()
+        self.received: int = 0
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        transport.sendto(b"RPTL" + self.repeater_id)
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if data[:4] == b"DMRD":
+            self.received += 1
+        elif data[:6] == b"RPTACK":
+            self.step += 1
+            if self.step == 1:
+                self.transport.sendto(
+                    b"RPTK"
+                    + self.repeater_id
+                    + sha256(data[6:10] + self.password).digest()
+                )
+            elif self.step == 2:
+                self.transport.sendto(
+                    b"RPTC"
+                    + self.repeater_id
+                    + b"OK0LOAD ".ljust(8)
+                    + b"0" * 22
+                    + b"01"
+                    + b"0" * 20
+                    + b" " * 39
+                    + b"3"
+                    + b" " * 204
+                )
+            elif self.step == 3 and self.options:
+                self.transport.sendto(b"RPTO" + self.repeater_id + self.options)
+            else:
+                self.logged_in.set()
+
+
+async def run_load(
+    peers: int, subscribers: int, frames: int, window: int = 100
+) -> Tuple[float, MMDVMMasterProtocol, List[LoadPeer]]:
+    """
+    Connects peers to local master, subscribers of them to TG 9 on TS2, first (not subscribed) peer then sends
+    frames, at most window frames are in flight, so local socket buffers do not overflow
+
+    :return: (seconds it took to deliver all the frames to all the subscribers, master, peers)
+    """
+    assert subscribers < peers
+    loop = asyncio.get_running_loop()
+    master = await MMDVMMasterProtocol().start(local_addr=("127.0.0.1", 0))
+    endpoints: List[Tuple[asyncio.DatagramTransport, LoadPeer]] = []
+    try:
+        for i in range(peers):
+            endpoints.append(
+                await loop.create_datagram_endpoint(
+                    lambda: LoadPeer(
+                        repeater_id=100_000 + i,
+                        options="TS2=9" if i >= peers - subscribers else "",
+                    ),
+                    remote_addr=master.local_addr,
+                )
+            )
+            if i % 100 == 99:
+                # do not overflow master socket with logins
+                await wait_until(
+                    lambda: all(p.logged_in.is_set() for _, p in endpoints)
+                )
+        await wait_until(lambda: all(p.logged_in.is_set() for _, p in endpoints))
+        receivers: List[LoadPeer] = [p for _, p in endpoints[peers - subscribers :]]
+        sender: asyncio.DatagramTransport = endpoints[0][0]
+
+        started: float = perf_counter()
+        for sent in range(window, frames + window, window):
+            for _ in range(min(window, frames - sent + window)):
+                sender.sendto(DMRD_TG9_TS2)
+            expected: int = min(sent, frames)
+            while any(r.received < expected for r in receivers):
+                await asyncio.sleep(0)
+        return perf_counter() - started, master, [p for _, p in endpoints]
+    finally:
+        for transport, _ in endpoints:
+            transport.close()
+        await master.close()
+
+
+def test_parse_options():
+    assert MMDVMPeer.parse_options("TS1=2,9;TS2=230, 231;Other=1") == {
+        (2, 1),
+        (9, 1),
+        (230, 2),
+        (231, 2),
+    }
+    assert MMDVMPeer.parse_options("") == set()
+
+
+def test_options_replace_subscriptions():
+    master = MMDVMMasterProtocol(default_subscriptions=[(2, 1)])
+    addr = ("127.0.0.1", 62031)
+    repeater_id: bytes = (2309901).to_bytes(4, byteorder="big")
+    master.datagram_received(b"RPTL" + repeater_id, addr)
+    peer: MMDVMPeer = master.peer(addr)
+    peer.status = MMDVMPeer.STATUS_CONNECTED
+    master.subscribe(peer, master.default_subscriptions)
+
+    master.datagram_received(b"RPTO" + repeater_id + b"TS1=9;TS2=230", addr)
+    assert peer.subscriptions == {(2, 1), (9, 1), (230, 2)}
+    # re-sent options drop talkgroups no longer listed
+    master.datagram_received(b"RPTO" + repeater_id + b"TS2=231", addr)
+    assert peer.subscriptions == {(2, 1), (231, 2)}
+    assert set(master.routes.keys()) == {(2, 1), (231, 2)}
+
+
+@pytest.mark.asyncio
+async def test_master_with_clients():
+    received: List[bytes] = []
+    master = await MMDVMMasterProtocol(
+        dmrd_callback=lambda data, rpt: received.append(data),
+        default_subscriptions=[(2, 1)],
+    ).start(local_addr=("127.0.0.1", 0))
+    port: int = master.local_addr[1]
+
+    def client(repeater_id: int, options: str = "", password: str = "passw0rd"):
+        config = client_config(port, password=password)
+        config.repeater_id = repeater_id
+        config.callsign = f"OK{repeater_id % 1000}"
+        config.options = options
+        return MMDVMClientProtocol(
+            config=config,
+            connection_lost_callback=None,
+            queue_outgoing=Queue(),
+            queue_incoming=Queue(),
+            backoff_initial=0.05,
+        )
+
+    sender = client(2309901, options="TS1=2")
+    listener = client(2309902, options="TS2=9")
+    intruder = client(2309903, password="wrong")
+    try:
+        for c in (sender, listener, intruder):
+            await c.start()
+        await wait_until(lambda: sender.logged_in.is_set())
+        await wait_until(lambda: listener.logged_in.is_set())
+        await wait_until(lambda: intruder.failures >= 1)
+        await wait_until(lambda: (9, 2) in master.routes)
+        assert not intruder.logged_in.is_set()
+
+        # peers are tracked in (indexed) storage
+        assert len(master.peers) == 2
+        assert master.storage.match_attr("callsign", "OK902").dmr_id == 2309902
+        assert master.storage.match_attr("dmr_id", 2309903) is None
+        assert len(master.routes[(2, 1)]) == 2
+
+        sender.send_burst(
+            Burst.from_mmdvm(Mmdvm2020.from_bytes(DMRD_TG9_TS2).command_data)
+        )
+        burst: Burst = await asyncio.wait_for(listener.queue_incoming.get(), 5)
+        assert (burst.target_radio_id, burst.timeslot) == (9, 2)
+        assert burst.source_radio_id == 0x20BAEF
+        # routed only to subscriber, never back to sender
+        assert sender.queue_incoming.empty()
+        assert len(received) == 1 and master.forwarded == 1
+
+        await sender.close()
+        await wait_until(lambda: len(master.peers) == 1)
+        assert master.storage.match_attr("dmr_id", 2309901) is None
+        assert [p.rpt.dmr_id for p in master.routes[(2, 1)]] == [2309902]
+    finally:
+        for c in (sender, listener, intruder):
+            await c.close()
+        await master.close()
+
+
+@pytest.mark.asyncio
+async def test_master_routes_unknown_peer():
+    master = await MMDVMMasterProtocol(peer_timeout=0.1).start(
+        local_addr=("127.0.0.1", 0)
+    )
+    loop = asyncio.get_running_loop()
+    transport, peer = await loop.create_datagram_endpoint(
+        lambda: LoadPeer(repeater_id=1), remote_addr=master.local_addr
+    )
+    try:
+        await wait_until(lambda: peer.logged_in.is_set())
+        assert len(master.storage) == 1
+        master.subscribe(next(iter(master.peers.values())), [(9, 2)])
+        assert len(master.routes[(9, 2)]) == 1
+        # silent peer times out
+        master.check_peers(now=master.peers[next(iter(master.peers))].last_seen + 1)
+        assert not master.peers and not master.routes and not len(master.storage)
+        # frames from peers not logged in are refused
+        transport.sendto(DMRD_TG9_TS2)
+        await wait_until(lambda: master.dropped == 1)
+    finally:
+        transport.close()
+        await master.close()
+
+
+@pytest.mark.asyncio
+async def test_master_forwards_under_load():
+    frames: int = 2000
+    _, master, peers = await run_load(peers=200, subscribers=10, frames=frames)
+    assert master.received == frames
+    assert master.forwarded == frames * 10
+    assert all(p.received == frames for p in peers[-10:])
+    assert not any(p.received for p in peers[:-10])
+
+
+if __name__ == "__main__":
+    # load-generator benchmark, python -m okdmr.tests.dmrlib.protocols.mmdvm.test_mmdvm_master_protocol [peers]
+    count: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    took, stats, _ = asyncio.run(run_load(peers=count, subscribers=1, frames=50_000))
+    print(
+        f"{count} peers, {stats.received} DMRD received, {stats.forwarded} forwarded in {took:.2f}s, "
+        f"{stats.received / took:.0f} received/s"
+    )
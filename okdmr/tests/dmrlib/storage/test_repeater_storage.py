@@ -1,3 +1,4 @@
+import timeit
 import uuid
 
 import pytest
@@ -41,3 +42,77 @@ def test_storage_auto_create(caplog):
     with pytest.raises(SystemError):
         # unknown UUID should not match
         rs.match_uuid(uuid.uuid4())
+
+
+def test_storage_indexes(caplog):
+    rs: RepeaterStorage = RepeaterStorage()
+    rpt = rs.match_incoming(address=("10.0.0.1", 50000), auto_create=True)
+    rs.save(rpt=rpt, patch={"dmr_id": 2305519, "callsign": "OK1DMR"})
+    assert rs.match_attr("dmr_id", 2305519) == rpt
+    assert rs.match_attr("callsign", "OK1DMR") == rpt
+    assert rs.match_attr("id", rpt.id) == rpt
+
+    # patch through storage moves the repeater in all the indexes
+    rs.save(rpt=rpt, patch={"address_in": ("10.0.0.2", 50001), "dmr_id": 2305520})
+    assert not rs.match_incoming(("10.0.0.1", 50000))
+    assert not rs.match_ip_incoming("10.0.0.1")
+    assert not rs.match_attr("dmr_id", 2305519)
+    assert rs.match_incoming(("10.0.0.2", 50001)) == rpt
+    assert rs.match_ip_incoming("10.0.0.2") == rpt
+    assert rs.match_attr("dmr_id", 2305520) == rpt
+
+    # direct modification requires reindex
+    rpt.callsign = "OK2DMR"
+    assert rs.match_attr("callsign", "OK1DMR") == rpt
+    rs.reindex(rpt)
+    assert not rs.match_attr("callsign", "OK1DMR")
+    assert rs.match_attr("callsign", "OK2DMR") == rpt
+
+    # non-indexed attributes still can be matched
+    assert rs.match_attr("nat_enabled", False) == rpt
+    # unhashable value is never matched by index
+    assert not rs.match_attr("address_in", ["10.0.0.2", 50001])
+
+    # duplicate is reported once, when indexed, first stored repeater matches
+    caplog.clear()
+    other = rs.add(rs.create_repeater(dmr_id=2305520))
+    assert "index dmr_id found duplicate" in caplog.text
+    assert rs.match_attr("dmr_id", 2305520) == rpt
+    assert len(rs) == 2
+    assert rs.match_uuid(other.id) == other
+
+    # removed repeater is not matched anymore, duplicate takes its place
+    assert rs.remove(rpt)
+    assert not rs.remove(rpt)
+    assert len(rs) == 1
+    assert not rs.match_incoming(("10.0.0.2", 50001))
+    assert rs.match_attr("dmr_id", 2305520) == other
+
+
+def test_storage_lookup_scales():
+    """
+    per-packet lookup should take the same time for 10 and 10.000 stored repeaters
+    """
+
+    def lookup_time(repeaters_count: int) -> float:
+        rs: RepeaterStorage = RepeaterStorage()
+        for i in range(repeaters_count):
+            rs.save(
+                rs.match_incoming(
+                    address=(f"10.{i >> 8}.{i & 0xFF}.1", 50000), auto_create=True
+                ),
+                patch={"dmr_id": 230000 + i},
+            )
+        last: int = repeaters_count - 1
+        address = (f"10.{last >> 8}.{last & 0xFF}.1", 50000)
+        assert rs.match_incoming(address)
+        # best of several runs, to filter out scheduling noise
+        return min(
+            timeit.timeit(lambda: rs.match_incoming(address), number=1000)
+            for _ in range(5)
+        )
+
+    small: float = lookup_time(10)
+    large: float = lookup_time(10_000)
+    # linear scan would be ~1000x slower, allow generous margin for noisy machines
+    assert large < small * 10, f"10 repeaters {small}s, 10.000 repeaters {large}s"
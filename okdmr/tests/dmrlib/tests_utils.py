@@ -1,4 +1,42 @@
-from typing import Dict
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from okdmr.kaitai.hytera.ip_site_connect_protocol import IpSiteConnectProtocol
+from puresnmp.pdu import GetResponse, PDUContent
+from puresnmp.varbind import VarBind
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.packet import Raw
+from scapy.utils import wrpcap
+from x690 import decode
+from x690.types import Integer, OctetString, Sequence
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.burst_types import BurstTypes
+from okdmr.dmrlib.etsi.layer2.elements.data_types import DataTypes
+from okdmr.dmrlib.etsi.layer2.pdu.data_header import DataHeader
+from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
+from okdmr.dmrlib.etsi.layer2.pdu.slot_type import SlotType
+from okdmr.dmrlib.hytera.pdu.hdap import HDAP
+from okdmr.dmrlib.hytera.pdu.hstrp import (
+    HSTRP,
+    HSTRPPacketType,
+    HSTRPOptions,
+    HSTRPOptionType,
+)
+from okdmr.dmrlib.hytera.pdu.radio_ip import RadioIP
+from okdmr.dmrlib.hytera.pdu.radio_registration_service import (
+    RadioRegistrationService,
+    RRSTypes,
+)
+from okdmr.dmrlib.hytera.snmp import SNMP
+from okdmr.dmrlib.protocols.mmdvm.mmdvm_client_protocol import (
+    MMDVMClientConfiguration,
+)
+from okdmr.dmrlib.transmission.transmission_observer_interface import (
+    TransmissionObserverInterface,
+)
+from okdmr.dmrlib.utils.bits_interface import BitsInterface
 
 
 def assert_expected_attribute_values(obj: object, expectations: Dict[str, any]):
@@ -13,3 +51,249 @@ def assert_expected_attribute_values(obj: object, expectations: Dict[str, any]):
             assert (
                 getattr(obj, attrname) == attrvalue
             ), f"{obj} attribute {attrname} value ({getattr(obj, attrname)}) is incorrect, expected {attrvalue}"
+
+
+async def wait_until(condition, timeout: float = 5) -> None:
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout=timeout)
+
+
+def option_packet(sn: int, radio_id: int = 2305519) -> HSTRP:
+    return HSTRP(
+        pkt_type=HSTRPPacketType(have_options=True),
+        sn=sn,
+        options=HSTRPOptions()
+        .add_option(HSTRPOptionType.DeviceID, (99999).to_bytes(4, byteorder="big"))
+        .add_option(HSTRPOptionType.ChannelID, b"\x01"),
+        payload=RadioRegistrationService(
+            opcode=RRSTypes.RadioRegistrationRequest, radio_ip=RadioIP(radio_id)
+        ),
+    )
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.sent: List[Tuple[bytes, Any]] = []
+
+    def sendto(self, data: bytes, addr=None):
+        self.sent.append((data, addr))
+
+    def is_closing(self) -> bool:
+        return False
+
+
+LP_HEX: str = (
+    "08a0020032000000010a2110dd0000413138333634383236313031354e343731382e383035314530313835342e34333837302e313132310b03"
+)
+
+
+TMP_HEX: str = (
+    "0980a10022000000010a01b2070a03640e4f004c004900560045005200200054004500530054007a03"
+)
+
+
+RCP_HEX: str = "024108050000d20400000e03"
+
+
+def hdap_packet(sn: int, hexdata: str) -> HSTRP:
+    return HSTRP(
+        pkt_type=HSTRPPacketType(),
+        sn=sn,
+        payload=HDAP.from_bytes(bytes.fromhex(hexdata)),
+    )
+
+
+MMDVM_CSBK: str = (
+    "444d52440223383b2338630006690f632e40c70153df0a83b7a8282c2509625014fdff57d75df5dcadde429028c87ae3341e24191c003c"
+)
+
+
+MMDVM_RATE12: str = (
+    "444d5244022338630008fd0023383be76f944918117b3090722540f9233581a285ed5d7f77fd75709464602846c3022109c3050079002f"
+)
+
+
+MMDVM_VOICE: str = (
+    "444d52440320baef0000090020baef8100000001b9e881526173002a6bb9e8815261303000a0391173002a6bb9e881526173002a6b3334"
+)
+
+
+IPSC_VOICE: str = (
+    "5a5a5a5a2003000041000501020000002222777755550000807325ef402209df1b7f9caf6575e774fd55f77d795f9f41364a68ca604641ec96a400b3402201006f000000fa372300"
+)
+
+
+def write_capture(path: str) -> None:
+    packets = []
+    for i, (payload, port) in enumerate(
+        ((MMDVM_CSBK, 62031), (MMDVM_RATE12, 62031), (IPSC_VOICE, 50000), ("00", 53))
+    ):
+        packet = (
+            Ether()
+            / IP(src="10.0.0.1", dst="10.0.0.2")
+            / UDP(sport=port, dport=port)
+            / Raw(load=bytes.fromhex(payload))
+        )
+        packet.time = 1_600_000_000 + i
+        packets.append(packet)
+    wrpcap(path, packets)
+
+
+def client_config(port: int, password: str = "passw0rd") -> MMDVMClientConfiguration:
+    return MMDVMClientConfiguration(
+        repeater_id=2309901,
+        upstream_addr=("127.0.0.1", port),
+        callsign="OK0DMR TEST",
+        password=password,
+        rx_freq=438_000_000,
+        tx_freq=430_400_000,
+        latitude="49.1951",
+        longitude="16.6068",
+    )
+
+
+IPSC_VOICE_CALL: List[str] = [
+    "5a5a5a5a610400004100050102000000222211115555000040b970078009fc078821205220655d5457ff5dd7d8f57854d004d03e003e012a036500f3800901006f000000fc372300",
+    "5a5a5a5a6204000041000501020000002222777755550000401a4abacd1c74706c3af98a7a2957affd55f77d735f8e1e002cd30912a74156e68600c0cd1c01006f000000fc372300",
+    "5a5a5a5a63040000410005010200000022228888555500004031369242a379718a59ca2ad74055daa020f030f3f889fe8a6c99d641c55111ae3b000a42a301006f000000fc372300",
+    "5a5a5a5a64040000410005010200000022229999555500004003ce9167a6a153e49cf648c7997505a06060a0a0667e356eca60c823c0d0234000008267a601006f000000fc372300",
+    "5a5a5a5a6504000041000501020000002222aaaa555500004007858e30e61d73a2dfce6481d4557591607042a5c60e53cea2968c11c71833e4df004430e601006f000000fc372300",
+    "5a5a5a5a6604000041000501020000002222bbbb55550000401568bb16c47955c40abc8ce05e15362341b35290312a9400c829076d9b5157e290008416c401006f000000fc372300",
+    "5a5a5a5a6704000041000501020000002222cccc55550000401325b026a21c13ca5ee10cc5467522c10964d1c13fde50a2ae37b024a23c33ee59000826a201006f000000fc372300",
+    "5a5a5a5ab00400004300050102000000222222225555000040b91f0754094c07f021505280659d5457ff5dd7dff56c01e807b03940320122037c00c0540901006f000000fc372300",
+]
+
+
+class SNMPAgent(asyncio.DatagramProtocol):
+    """
+    Local SNMPv1 stand-in, answers GET requests with given community after delay, silently drops others
+    """
+
+    def __init__(self, community: bytes = b"hytera", delay: float = 0.05):
+        self.community: bytes = community
+        self.delay: float = delay
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.requests: List[Tuple[bytes, int]] = []
+        """ (community, number of requested OIDs) """
+        self.outstanding: int = 0
+        self.max_outstanding: int = 0
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        version, community, pdu = decode(data)[0]
+        self.requests.append((community.value, len(pdu.value.varbinds)))
+        if community.value != self.community:
+            return
+        response = Sequence(
+            [
+                version,
+                community,
+                GetResponse(
+                    PDUContent(
+                        pdu.value.request_id,
+                        [
+                            VarBind(varbind.oid, self.value(str(varbind.oid)))
+                            for varbind in pdu.value.varbinds
+                        ],
+                    )
+                ),
+            ]
+        )
+        self.outstanding += 1
+        self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        asyncio.get_running_loop().call_later(self.delay, self.respond, response, addr)
+
+    def respond(self, response: Sequence, addr) -> None:
+        self.outstanding -= 1
+        self.transport.sendto(bytes(response), addr)
+
+    @staticmethod
+    def value(oid: str):
+        if oid == SNMP.OID_RADIO_ALIAS:
+            return OctetString(b"OK1DMR\x00")
+        if oid == SNMP.OID_PSU_VOLTAGE:
+            return OctetString((13800).to_bytes(4, byteorder="big"))
+        if oid in SNMP.ALL_STRINGS:
+            return OctetString(b"test")
+        return Integer(2305519)
+
+
+SMS_BURST: List[str] = [
+    "55e105fbbde427040a68305294fdff57d75df5dcae42369824097da3bedb329255",
+    "5585057bbcfc273c0e0938f094fdff57d75df5dcae8a163824c97d63b65b281251",
+    "55c505f9bde025240c38b4b094fdff57d75df5dcaefa360864297ec3b39b211267",
+    "45a10577bcf026340c69bcf294fdff57d75df5dcae2e579865b978c1b39f299a42",
+    "45e105f5bdec242c0e5830b294fdff57d75df5dcae5e77a825597b61b65f209a74",
+    "45850575bcf424140a39381094fdff57d75df5dcae96570825997ba1bedf3a1a70",
+    "45c505f7bde8260c0808b45094fdff57d75df5dcaee6773865797801bb1f331a46",
+    "45c4053dbcfc263c0839b0d294fdff57d75df5dcaeb216a8e5d97881b75b331a65",
+    "458405bfbde024240a083c9294fdff57d75df5dcaec23698a5397b21b29b3a1a53",
+    "45e0053fbcf8241c0e69343094fdff57d75df5dcae0a1638a5f97be1ba1b209a57",
+    "45a005bdbde426040c58b87094fdff57d75df5dcae7a3608e5197841bfdb299a61",
+    "45a7053fbd6c26240e19b4d294fdff57d75df5dcaeb25690e7987aa1bb1f381257",
+    "45e705bdbc70243c0c28389294fdff57d75df5dcaec276a0a7787901bedf311261",
+    "4583053dbd6824040849303094fdff57d75df5dcae0a5600a7b879c1b65f2b9265",
+    "45c305bfbc74261c0a78bc7094fdff57d75df5dcae7a7630e7587a61b39f229253",
+    "45c20575bd60262c0a49b8f294fdff57d75df5dcae2e17a067f87ae1bfdb229270",
+    # header
+    "7abc3520240678e3a3436a8b55bdff57d75df5d55ed179b2304122624d0589a7bc",
+    # rate 1/2 unconfirmed data
+    "430d22106233407c00b0219a55ddff57d75df5d6f1492a46d43d20c20b8291214b",
+    # rate 1/2 unconfirmed data last fragment
+    "008a00da01b401400330180015ddff57d75df5d6f104025802700ae0250010001e",
+]
+
+
+VOICE_LC_HEADER: str = (
+    "5a5a5a5a610400004100050102000000222211115555000040b970078009fc078821205220655d5457ff5dd7d8f57854d004d03e003e012a036500f3800901006f000000fc372300"
+)
+
+
+class VoiceEndedCounter(TransmissionObserverInterface):
+    def __init__(self):
+        self.ended: List[FullLinkControl] = []
+        self.data_ended: List[DataHeader] = []
+
+    def voice_transmission_ended(
+        self, voice_header: FullLinkControl, blocks: List[BitsInterface]
+    ):
+        self.ended.append(voice_header)
+
+    def data_transmission_ended(
+        self, transmission_header: DataHeader, blocks: List[BitsInterface]
+    ):
+        self.data_ended.append(transmission_header)
+
+
+def voice_header_burst(target: int, timestamp: float = 0) -> Burst:
+    burst: Burst = Burst.from_hytera_ipsc(
+        IpSiteConnectProtocol.from_bytes(bytes.fromhex(VOICE_LC_HEADER))
+    ).set_timestamp(timestamp)
+    burst.target_radio_id = target
+    return burst
+
+
+def terminator_burst(header: Burst) -> Burst:
+    header.slot_type = SlotType(
+        colour_code=header.colour_code, data_type=DataTypes.TerminatorWithLC
+    )
+    burst: Burst = Burst.from_bits(header.as_bits(), BurstTypes.DataAndControl)
+    burst.timeslot = header.timeslot
+    burst.source_radio_id = header.source_radio_id
+    burst.target_radio_id = header.target_radio_id
+    return burst.set_timestamp(header.timestamp)
+
+
+def voice_burst(sequence_no: int) -> Burst:
+    return (
+        Burst.from_hytera_ipsc(
+            IpSiteConnectProtocol.from_bytes(bytes.fromhex(IPSC_VOICE))
+        )
+        .set_network_sequence_no(sequence_no)
+        .set_peer("10.0.0.1:50000")
+    )
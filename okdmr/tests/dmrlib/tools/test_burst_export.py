@@ -0,0 +1,125 @@
+import os
+import tempfile
+
+import numpy
+import pytest
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.packet import Raw
+from scapy.utils import wrpcap
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.burst_types import BurstTypes
+from okdmr.dmrlib.tools.burst_export import (
+    BURST_EXPORT_DTYPE,
+    BurstExportWriter,
+    NumpyBurstExportWriter,
+    crc_ok,
+    fec_corrected_bits,
+)
+from okdmr.dmrlib.tools.pcap_tool import PcapTool
+from okdmr.tests.dmrlib.tests_utils import (
+    MMDVM_CSBK,
+    MMDVM_RATE12,
+    MMDVM_VOICE,
+    IPSC_VOICE,
+)
+
+
+def test_fec_and_crc_columns():
+    csbk: Burst = Burst.from_mmdvm(
+        Mmdvm2020.from_bytes(bytes.fromhex(MMDVM_CSBK)).command_data
+    )
+    assert fec_corrected_bits(csbk) == 0
+    assert crc_ok(csbk) == 1
+
+    corrupted_bits = csbk.full_bits.copy()
+    corrupted_bits[5] ^= 1
+    corrupted: Burst = Burst.from_bits(corrupted_bits, BurstTypes.DataAndControl)
+    assert fec_corrected_bits(corrupted) == 1
+
+    # unconfirmed rate 1/2 data do not carry CRC9
+    rate12: Burst = Burst.from_mmdvm(
+        Mmdvm2020.from_bytes(bytes.fromhex(MMDVM_RATE12)).command_data
+    )
+    assert fec_corrected_bits(rate12) == 0
+    assert crc_ok(rate12) == -1
+
+    voice: Burst = Burst.from_mmdvm(
+        Mmdvm2020.from_bytes(bytes.fromhex(MMDVM_VOICE)).command_data
+    )
+    assert fec_corrected_bits(voice) == -1
+    assert crc_ok(voice) == -1
+
+
+def test_numpy_writer_batches():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path: str = os.path.join(tmpdir, "bursts.npy")
+        writer = NumpyBurstExportWriter(path=path, batch_size=3)
+        row = numpy.zeros(1, dtype=BURST_EXPORT_DTYPE)[0].item()
+        for i in range(10):
+            writer.append(row[:-1] + (i,))
+            # only the fixed size batch is held in memory
+            assert writer.batch_rows < 3
+        assert writer.rows_written == 9
+        writer.close()
+        writer.close()
+        assert writer.rows_written == 10
+
+        loaded = numpy.load(path, mmap_mode="r")
+        assert loaded.dtype == BURST_EXPORT_DTYPE
+        assert list(loaded["stream_id"]) == list(range(10))
+
+    with pytest.raises(ValueError):
+        BurstExportWriter.create(path="-", export_format="xml")
+
+
+def test_pcap_tool_export():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pcap_file: str = os.path.join(tmpdir, "capture.pcap")
+        export_file: str = os.path.join(tmpdir, "bursts.npy")
+        packets = []
+        for i, payload in enumerate((MMDVM_CSBK, MMDVM_RATE12, IPSC_VOICE)):
+            packet = (
+                Ether()
+                / IP(src="10.0.0.1", dst="10.0.0.2")
+                / UDP(sport=62031, dport=62031)
+                / Raw(load=bytes.fromhex(payload))
+            )
+            packet.time = 1_600_000_000 + i
+            packets.append(packet)
+        wrpcap(pcap_file, packets)
+
+        PcapTool.main(
+            ["-q", "--export", export_file, "--export-batch-size", "2", pcap_file]
+        )
+
+        rows = numpy.load(export_file, mmap_mode="r")
+        assert len(rows) == 3
+        assert list(rows["timestamp"]) == [1_600_000_000, 1_600_000_001, 1_600_000_002]
+        assert list(rows["protocol"]) == [b"MMDVM", b"MMDVM", b"IPSC"]
+        assert rows[0]["src_ip"] == b"10.0.0.1"
+        assert rows[0]["dst_port"] == 62031
+        assert rows[0]["data_type"] == b"CSBK"
+        assert rows[0]["colour_code"] == 5
+        assert rows[0]["crc_ok"] == 1
+        assert rows[0]["fec_corrected_bits"] == 0
+        assert rows[2]["voice_burst"] == b"VoiceBurstA"
+        assert rows[2]["target"] == 111
+
+        # export is combined with other modes
+        PcapTool.main(["-q", "-o", "--export", export_file, pcap_file])
+        assert len(numpy.load(export_file, mmap_mode="r")) == 3
+
+
+def test_chain_callbacks():
+    calls = []
+    chained = PcapTool.chain_callbacks(
+        lambda x: calls.append(("first", x)) or "result",
+        None,
+        lambda x: calls.append(("second", x)),
+    )
+    assert chained(1) == "result"
+    assert calls == [("first", 1), ("second", 1)]
+    assert PcapTool.chain_callbacks(None)() is None
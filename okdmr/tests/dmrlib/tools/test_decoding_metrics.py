@@ -0,0 +1,109 @@
+import os
+import tempfile
+
+from okdmr.kaitai.homebrew.mmdvm2020 import Mmdvm2020
+from scapy.layers.inet import IP, UDP
+from scapy.packet import Raw
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.tools.decoding_metrics import DecodingMetrics
+from okdmr.dmrlib.tools.pcap_tool import PcapTool
+from okdmr.dmrlib.transmission.queued_observer import QueuedObserver
+from okdmr.dmrlib.transmission.transmission_observer_interface import (
+    TransmissionObserverInterface,
+)
+from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
+from okdmr.tests.dmrlib.tests_utils import (
+    MMDVM_CSBK,
+    MMDVM_RATE12,
+    write_capture,
+    voice_burst,
+)
+
+
+def mmdvm_burst(hexdata: str) -> Burst:
+    return Burst.from_mmdvm(
+        Mmdvm2020.from_bytes(bytes.fromhex(hexdata)).command_data
+    ).set_peer("10.0.0.2:62031")
+
+
+def test_burst_counters():
+    metrics = DecodingMetrics()
+    watcher = TransmissionWatcher()
+    metrics.watch_transmission_watcher(watcher)
+    for burst, protocol in (
+        (voice_burst(1), "IPSC"),
+        (voice_burst(2), "IPSC"),
+        (mmdvm_burst(MMDVM_CSBK), "MMDVM"),
+        (mmdvm_burst(MMDVM_RATE12), "MMDVM"),
+    ):
+        watcher.process_burst(metrics.process_burst(burst, protocol))
+
+    exposition: str = metrics.registry.exposition()
+    assert 'dmr_packets_total{protocol="IPSC"} 2' in exposition
+    assert 'dmr_packets_total{protocol="MMDVM"} 2' in exposition
+    assert (
+        'dmr_bursts_total{peer="10.0.0.1:50000",timeslot="2",data_type="Voice"} 2'
+        in exposition
+    )
+    assert (
+        'dmr_bursts_total{peer="10.0.0.2:62031",timeslot="1",data_type="CSBK"} 1'
+        in exposition
+    )
+    assert f"dmr_terminals {len(watcher.terminals)}" in exposition
+    assert "dmr_active_transmissions " in exposition
+
+
+def test_instrument_and_queue_depth():
+    metrics = DecodingMetrics(fec_statistics=False)
+    calls = []
+    callback = metrics.instrument(lambda data, packet: calls.append(data))
+    callback(data=b"\x00", packet=None)
+    assert calls == [b"\x00"]
+    assert metrics.latency.count == 1
+
+    observer = QueuedObserver(TransmissionObserverInterface())
+    metrics.watch_queued_observer("test", observer)
+    assert 'dmr_observer_queue_depth{name="test"} 0' in metrics.registry.exposition()
+    observer.close()
+
+
+def test_pcap_tool_metrics():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pcap_file: str = os.path.join(tmpdir, "capture.pcap")
+        write_capture(pcap_file)
+        for arguments in (
+            [],
+            ["-o", "--demultiplex-streams"],
+            ["--extract-embedded-lc", "-o", "--demultiplex-streams"],
+            ["--metrics-fec", "--export", os.path.join(tmpdir, "bursts.npy")],
+        ):
+            PcapTool.main(
+                arguments
+                + [
+                    "-q",
+                    "--output-format",
+                    "none",
+                    "--metrics-port",
+                    "0",
+                    "--metrics-listen",
+                    "127.0.0.1",
+                    pcap_file,
+                ]
+            )
+
+
+def test_watcher_burst_listener():
+    metrics = DecodingMetrics()
+    watcher = TransmissionWatcher(burst_listener=metrics.process_burst)
+    for payload in (MMDVM_CSBK, MMDVM_RATE12):
+        watcher.process_packet(
+            data=bytes.fromhex(payload),
+            packet=IP(src="10.0.0.2", dst="10.0.0.1")
+            / UDP(sport=62031, dport=62031)
+            / Raw(load=bytes.fromhex(payload)),
+        )
+    exposition: str = metrics.registry.exposition()
+    assert 'dmr_packets_total{protocol="MMDVM"} 2' in exposition
+    # fec statistics are opt-in
+    assert not metrics.fec_statistics
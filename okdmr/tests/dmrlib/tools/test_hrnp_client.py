@@ -1,4 +1,20 @@
+import asyncio
+import socket
+from typing import Dict, List, Tuple
+
+import pytest
+
+from okdmr.dmrlib.hytera.pdu.hdap import HyteraServiceType
+from okdmr.dmrlib.protocols.hytera.hdap_datagram_protocol import HDAPDispatcher
+from okdmr.dmrlib.protocols.hytera.hstrp_datagram_protocol import HSTRPDatagramProtocol
 from okdmr.dmrlib.tools.hrnp_client import HRNPClient, HRNPClientConfiguration
+from okdmr.tests.dmrlib.tests_utils import (
+    wait_until,
+    LP_HEX,
+    TMP_HEX,
+    RCP_HEX,
+    hdap_packet,
+)
 
 
 def test_hrnp_client():
@@ -8,3 +24,134 @@ def test_hrnp_client():
     assert not hc.is_running
     hc.stop()
     assert not hc.is_running
+    # telemetry of both timeslots is logged too, not counted as unhandled
+    for service_type in (
+        HyteraServiceType.LP,
+        HyteraServiceType.TMP,
+        HyteraServiceType.RCP,
+        HyteraServiceType.RRS,
+        HyteraServiceType.TP,
+    ):
+        assert hc.dispatcher.handlers[service_type] == [hc.log_pdu]
+
+
+def free_udp_ports(count: int) -> List[int]:
+    sockets: List[socket.socket] = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("127.0.0.1", 0))
+            sockets.append(sock)
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+@pytest.mark.asyncio
+async def test_hrnp_client_serves_all_services():
+    messages: int = 200
+    ports: List[int] = free_udp_ports(16)
+    parsed = HRNPClient.args().parse_args(
+        ["127.0.0.2", "--local-ip", "127.0.0.1"]
+        + [
+            arg
+            for name, port in zip(HRNPClient.SERVICES.keys(), ports)
+            for arg in (f"--{name}", str(port))
+        ]
+    )
+    config = HRNPClientConfiguration(**vars(parsed))
+
+    received: Dict[HyteraServiceType, int] = {}
+
+    def count(protocol, pdu, addr) -> None:
+        service_type: HyteraServiceType = pdu.payload.get_service_type()
+        received[service_type] = received.get(service_type, 0) + 1
+
+    dispatcher = HDAPDispatcher()
+    for service_type in (
+        HyteraServiceType.LP,
+        HyteraServiceType.TMP,
+        HyteraServiceType.RCP,
+    ):
+        dispatcher.register(service_type, count)
+
+    loop = asyncio.get_running_loop()
+    # repeater side of each HSTRP service
+    repeaters: Dict[str, Tuple[asyncio.DatagramTransport, HSTRPDatagramProtocol]] = {}
+    for name in HRNPClient.SERVICES.keys():
+        if name in HRNPClient.NOT_HSTRP_SERVICES:
+            continue
+        port: int = getattr(config, name)
+        repeaters[name] = await loop.create_datagram_endpoint(
+            lambda: HSTRPDatagramProtocol(
+                port=port, window=32, retransmit_timeout=0.2, peer=("127.0.0.1", port)
+            ),
+            local_addr=("127.0.0.2", port),
+        )
+
+    client = HRNPClient(config=config, dispatcher=dispatcher, retransmit_timeout=0.2)
+    serving: asyncio.Task = loop.create_task(client.go())
+    try:
+        await wait_until(lambda: client.is_running and len(client.services) == 14)
+        await wait_until(
+            lambda: all(p.hstrp_connected for p in client.services.values())
+        )
+        assert all(r.hstrp_connected for _, r in repeaters.values())
+
+        for name, payload in (
+            ("gps1", LP_HEX),
+            ("gps2", LP_HEX),
+            ("tms1", TMP_HEX),
+            ("tms2", TMP_HEX),
+            ("rcc1", RCP_HEX),
+            ("rcc2", RCP_HEX),
+        ):
+            _, repeater = repeaters[name]
+            for _ in range(messages):
+                repeater.hstrp_send_reliable(
+                    hdap_packet(repeater.hstrp_increment_sn(), payload)
+                )
+        await wait_until(lambda: sum(received.values()) == 6 * messages, timeout=10)
+
+        assert received == {
+            HyteraServiceType.LP: 2 * messages,
+            HyteraServiceType.TMP: 2 * messages,
+            HyteraServiceType.RCP: 2 * messages,
+        }
+        await wait_until(
+            lambda: not any(r.hstrp_session().pending for _, r in repeaters.values())
+        )
+    finally:
+        client.stop()
+        await asyncio.wait_for(serving, timeout=5)
+        for transport, _ in repeaters.values():
+            transport.close()
+
+    assert not client.is_running
+    assert not client.services and not client.tasks
+
+
+@pytest.mark.asyncio
+async def test_hrnp_client_start_failure_cleanup():
+    ports: List[int] = free_udp_ports(16)
+    parsed = HRNPClient.args().parse_args(
+        ["127.0.0.2", "--local-ip", "127.0.0.1"]
+        + [
+            arg
+            for name, port in zip(HRNPClient.SERVICES.keys(), ports)
+            for arg in (f"--{name}", str(port))
+        ]
+    )
+    config = HRNPClientConfiguration(**vars(parsed))
+    # last service port is taken by other socket (without SO_REUSEPORT), so binding it fails
+    blocker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    blocker.bind(("127.0.0.1", config.rcc2))
+    client = HRNPClient(config=config)
+    try:
+        with pytest.raises(OSError):
+            await asyncio.wait_for(client.go(), timeout=5)
+    finally:
+        blocker.close()
+    assert not client.is_running
+    assert not client.services and not client.transports and not client.tasks
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import socket
+import tempfile
+from typing import List, Tuple
+
+import pytest
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.packet import Raw
+
+from okdmr.dmrlib.tools.live_capture import LiveCapture, RollingPcapWriter
+from okdmr.dmrlib.tools.pcap_tool import PcapTool
+
+
+class LiveCounterHelper:
+    def __init__(self):
+        self.received: List[Tuple[bytes, IP]] = []
+
+    def packet_callback(self, data: bytes, packet: IP):
+        self.received.append((data, packet))
+
+
+@pytest.mark.asyncio
+async def test_live_capture_udp():
+    helper = LiveCounterHelper()
+    capture = LiveCapture(
+        callback=helper.packet_callback,
+        listen_ports=[0],
+        listen_ip="127.0.0.1",
+        batch_size=4,
+        queue_size=2,
+    )
+    task = asyncio.create_task(capture.run(duration=5))
+    # wait for sockets to be bound
+    while not capture.bound_addresses:
+        await asyncio.sleep(0.01)
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for i in range(20):
+            sender.sendto(bytes([i]) * 10, capture.bound_addresses[0])
+        while len(helper.received) < 20:
+            await asyncio.sleep(0.01)
+    finally:
+        sender.close()
+
+    capture.stop()
+    stats = await task
+
+    assert [data[0] for data, _ in helper.received] == list(range(20))
+    data, packet = helper.received[0]
+    assert packet.src == "127.0.0.1"
+    assert packet.getlayer(UDP).dport == capture.bound_addresses[0][1]
+    assert packet.getlayer(UDP).load == data
+    assert packet.time > 0
+    assert stats.get(capture.bound_addresses[0][1]) == 20
+    assert not capture.sockets
+
+
+@pytest.mark.asyncio
+async def test_live_capture_duration():
+    capture = LiveCapture(
+        callback=PcapTool.void_packet_callback,
+        listen_ports=[0],
+        listen_ip="127.0.0.1",
+        ports_whitelist=[1],
+    )
+    # nothing received, capture must stop after duration
+    assert await capture.run(duration=0.05) == {}
+
+    with pytest.raises(AssertionError):
+        LiveCapture(callback=PcapTool.void_packet_callback)
+
+
+@pytest.mark.asyncio
+async def test_live_capture_tick():
+    ticks: List[float] = []
+    capture = LiveCapture(
+        callback=PcapTool.void_packet_callback,
+        listen_ports=[0],
+        listen_ip="127.0.0.1",
+        tick=ticks.append,
+        tick_interval=0.01,
+    )
+    # ticks come even when no packet is received
+    await capture.run(duration=0.1)
+    assert len(ticks) >= 3
+    assert ticks == sorted(ticks)
+
+
+def test_rolling_pcap_writer():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        writer = RollingPcapWriter(
+            path_prefix=os.path.join(tmpdir, "capture"), max_packets=2, max_files=2
+        )
+        for i in range(5):
+            writer.write(
+                Ether()
+                / IP(src="10.0.0.1", dst="10.0.0.2")
+                / UDP(sport=50001, dport=50001)
+                / Raw(load=bytes([i]))
+            )
+        writer.close()
+
+        # 3 files were created, only 2 newest kept
+        assert writer.file_index == 3
+        assert len(writer.files) == 2
+        assert sorted(os.listdir(tmpdir)) == ["capture.1.pcap", "capture.2.pcap"]
+
+        helper = LiveCounterHelper()
+        stats = PcapTool.iter_pcap(files=writer.files, callback=helper.packet_callback)
+        assert stats.get(50001) == 6
+        assert [data for data, _ in helper.received] == [b"\x02", b"\x03", b"\x04"]
+
+
+def test_pcap_tool_requires_files_or_live():
+    with pytest.raises(SystemExit):
+        PcapTool.main(["-q"])
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import pytest
+from okdmr.kaitai.hytera.ip_site_connect_protocol import IpSiteConnectProtocol
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.tools.pipeline import (
+    StageStatistics,
+    UdpPayload,
+    async_process,
+    batched,
+    consume,
+    dsd_bursts,
+    live_payloads,
+    measure,
+    parse_bursts,
+    pcap_payloads,
+    prefetch,
+    process_bursts,
+    unbatched,
+)
+from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
+from okdmr.tests.dmrlib.tests_utils import MMDVM_CSBK, IPSC_VOICE, write_capture
+
+
+def test_pcap_pipeline():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pcap_file: str = os.path.join(tmpdir, "capture.pcap")
+        write_capture(pcap_file)
+
+        statistics: Dict[int, int] = {}
+        payloads: List[UdpPayload] = list(
+            pcap_payloads(
+                files=[pcap_file], statistics=statistics, ports_blacklist=[53]
+            )
+        )
+        assert len(payloads) == 3
+        assert statistics == {62031: 4, 50000: 2, 53: 2}
+        assert payloads[0].data == bytes.fromhex(MMDVM_CSBK)
+        assert payloads[2].packet.time == 1_600_000_002
+
+        # stages are lazy, nothing is read before iteration
+        stats = StageStatistics("parse")
+        bursts = measure(parse_bursts(pcap_payloads(files=[pcap_file])), stats)
+        assert stats.items == 0
+        assert [b.timestamp for b in bursts] == [
+            1_600_000_000,
+            1_600_000_001,
+            1_600_000_002,
+        ]
+        assert stats.items == 3
+        assert stats.seconds > 0
+        assert "[parse]" in repr(stats)
+
+        watcher = TransmissionWatcher()
+        processed = list(
+            process_bursts(
+                parse_bursts(pcap_payloads(files=[pcap_file])),
+                watcher.process_burst,
+                lambda burst: burst if burst.is_vocoder else None,
+            )
+        )
+        assert len(processed) == 1
+        assert processed[0].is_vocoder
+
+
+def test_dsd_bursts():
+    voice: Burst = Burst.from_hytera_ipsc(
+        IpSiteConnectProtocol.from_bytes(bytes.fromhex(IPSC_VOICE))
+    )
+    lines: List[str] = [
+        f"2 10 {voice.as_bytes().hex()}\n",
+        "1 98 00\n",
+        "malformed line\n",
+        "1 10 zz\n",
+    ]
+    errors: List[Exception] = []
+    bursts: List[Burst] = list(dsd_bursts(lines, on_error=errors.append))
+    assert len(bursts) == 1
+    assert bursts[0].timeslot == 2
+    assert bursts[0].is_vocoder
+    assert len(errors) == 1
+
+    with pytest.raises(ValueError):
+        consume(dsd_bursts(lines))
+
+
+def test_batching_and_prefetch():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(unbatched(batched(range(5), 2))) == list(range(5))
+    with pytest.raises(AssertionError):
+        list(batched(range(5), 0))
+
+    assert list(prefetch(range(1000), queue_size=2, batch_size=7)) == list(range(1000))
+    assert consume(prefetch(iter(()))) == 0
+
+    def failing():
+        yield 1
+        raise RuntimeError("upstream failed")
+
+    with pytest.raises(RuntimeError):
+        list(prefetch(failing()))
+
+
+def test_prefetch_consumer_stops_early():
+    produced: List[int] = []
+
+    def upstream():
+        for i in range(100_000):
+            produced.append(i)
+            yield i
+
+    for item in prefetch(upstream(), queue_size=1, batch_size=1):
+        if item == 3:
+            break
+    # producer blocked on full queue notices the consumer is gone
+    deadline: float = time.time() + 2
+    while time.time() < deadline and any(
+        t.name == "PipelinePrefetch" for t in threading.enumerate()
+    ):
+        time.sleep(0.01)
+    assert not any(t.name == "PipelinePrefetch" for t in threading.enumerate())
+    assert len(produced) < 10
+
+
+@pytest.mark.asyncio
+async def test_live_payloads():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(("127.0.0.1", 0))
+    port: int = probe.getsockname()[1]
+    probe.close()
+
+    received: List[bytes] = []
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        payloads = live_payloads(listen_ports=[port], listen_ip="127.0.0.1")
+
+        async def send():
+            await asyncio.sleep(0.05)
+            for i in range(5):
+                sender.sendto(bytes([i]) * 4, ("127.0.0.1", port))
+
+        sending = asyncio.create_task(send())
+        async for data in async_process(payloads, lambda payload: payload.data):
+            received.append(data)
+            if len(received) == 5:
+                break
+        await payloads.aclose()
+        await sending
+    finally:
+        sender.close()
+    assert received == [bytes([i]) * 4 for i in range(5)]
+
+    # capture with duration ends the iteration
+    assert [
+        payload
+        async for payload in live_payloads(
+            duration=0.05, listen_ports=[0], listen_ip="127.0.0.1"
+        )
+    ] == []
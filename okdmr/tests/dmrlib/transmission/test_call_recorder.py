@@ -0,0 +1,137 @@
+import json
+import os
+import tempfile
+from time import time
+from typing import List
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.transmission.call_recorder import (
+    RECORD_BURST,
+    RECORD_END,
+    RECORD_METADATA,
+    RECORD_TERMINATOR,
+    CallRecord,
+    CallRecorder,
+    find_calls,
+    read_call_file,
+)
+from okdmr.dmrlib.transmission.queued_observer import QueuedObserver
+from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
+from okdmr.tests.dmrlib.tests_utils import (
+    VoiceEndedCounter,
+    voice_header_burst,
+    terminator_burst,
+    voice_burst,
+)
+
+
+def test_record_call():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        recorder = CallRecorder(directory=tmpdir, fsync="batch")
+        watcher = TransmissionWatcher(observers=[recorder])
+        watcher.process_burst(voice_header_burst(111, 1_600_000_000))
+        for i in range(6):
+            watcher.process_burst(
+                voice_burst(i).set_timestamp(1_600_000_000 + 0.06 * i)
+            )
+        watcher.process_burst(terminator_burst(voice_header_burst(111, 1_600_000_001)))
+        # duplicate terminator is not recorded
+        watcher.process_burst(terminator_burst(voice_header_burst(111, 1_600_000_001)))
+        recorder.close()
+
+        calls = find_calls(recorder.index_path, target=111)
+        assert len(calls) == 1
+        assert calls[0]["source"] == 2308092
+        assert calls[0]["is_group"]
+        assert calls[0]["bursts"] == 8
+        assert calls[0]["reason"] == "terminator"
+        assert find_calls(recorder.index_path, target=222) == []
+        assert find_calls(recorder.index_path, since=1_600_000_002) == []
+
+        records: List[CallRecord] = list(
+            read_call_file(os.path.join(tmpdir, calls[0]["file"]))
+        )
+        assert [r.record_type for r in records] == [RECORD_METADATA] + [
+            RECORD_BURST
+        ] * 7 + [RECORD_TERMINATOR, RECORD_END]
+        assert json.loads(records[0].payload)["target"] == 111
+        assert records[2].payload == voice_burst(0).as_bytes()
+
+
+def test_record_late_entry_calls():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        recorder = CallRecorder(directory=tmpdir, fsync="never")
+        counter = VoiceEndedCounter()
+        watcher = TransmissionWatcher(observers=[recorder, counter])
+        # two consecutive calls, voice headers of both were missed
+        for start in (1_600_000_000, 1_600_000_010):
+            for i in range(6):
+                watcher.process_burst(voice_burst(i).set_timestamp(start + 0.06 * i))
+            watcher.process_burst(terminator_burst(voice_header_burst(111, start + 1)))
+        recorder.close()
+
+        calls = find_calls(recorder.index_path)
+        assert len(calls) == 2
+        assert calls[0]["file"] != calls[1]["file"]
+        assert [c["reason"] for c in calls] == ["terminator", "terminator"]
+        assert [c["bursts"] for c in calls] == [7, 7]
+        for call in calls:
+            records: List[CallRecord] = list(
+                read_call_file(os.path.join(tmpdir, call["file"]))
+            )
+            assert [r.record_type for r in records] == [RECORD_METADATA] + [
+                RECORD_BURST
+            ] * 6 + [RECORD_TERMINATOR, RECORD_END]
+            assert json.loads(records[0].payload)["late_entry"]
+        # link control of the terminator replaces the missed header
+        assert [h.group_address for h in counter.ended] == [111, 111]
+
+
+def test_concurrent_calls_and_timeout():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        recorder = CallRecorder(directory=tmpdir, fsync="never", call_timeout=2)
+        # observer is called from other thread, so the recorder does not block on the producer
+        queued = QueuedObserver(recorder)
+        for target in range(1, 201):
+            burst: Burst = voice_burst(0).set_timestamp(1_600_000_000)
+            burst.target_radio_id = target
+            queued.voice_burst_received(
+                stream_no=target.to_bytes(4, byteorder="big"),
+                voice_header=None,
+                burst=burst,
+            )
+        queued.voice_burst_received(
+            stream_no=b"\xff" * 4,
+            voice_header=None,
+            burst=voice_burst(0).set_timestamp(1_600_000_005),
+        )
+        queued.close()
+        assert len(recorder.calls) == 1
+        recorder.close()
+
+        calls = find_calls(recorder.index_path)
+        assert len(calls) == 201
+        assert sum(call["reason"] == "timeout" for call in calls) == 200
+        assert find_calls(recorder.index_path, target=150)[0]["bursts"] == 1
+        truncated: str = os.path.join(tmpdir, calls[0]["file"])
+        with open(truncated, "ab") as f:
+            f.write(b"\x02\x00")
+        assert len(list(read_call_file(truncated))) == 3
+
+
+def test_finish_idle_calls_without_traffic():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        recorder = CallRecorder(directory=tmpdir, fsync="never", call_timeout=2)
+        queued = QueuedObserver(recorder)
+        queued.voice_burst_received(
+            stream_no=b"\x00\x00\x00\x01",
+            voice_header=None,
+            burst=voice_burst(0).set_timestamp(time()),
+        )
+        # periodic tick goes through the observer queue, no burst follows
+        queued.enqueue("finish_idle_calls", now=time())
+        queued.enqueue("finish_idle_calls", now=time() + 3)
+        queued.close()
+        assert not recorder.calls
+        recorder.close()
+        assert [c["reason"] for c in find_calls(recorder.index_path)] == ["timeout"]
@@ -0,0 +1,70 @@
+from threading import Event
+from typing import List
+
+import pytest
+
+from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
+from okdmr.dmrlib.transmission.queued_observer import QueuedObserver
+from okdmr.dmrlib.transmission.transmission_observer_interface import (
+    TransmissionObserverInterface,
+    WithObservers,
+)
+from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
+from okdmr.dmrlib.utils.bits_interface import BitsInterface
+
+
+class SlowObserver(TransmissionObserverInterface):
+    def __init__(self):
+        self.release: Event = Event()
+        self.started: List[TransmissionTypes] = []
+        self.blocks: List[List[BitsInterface]] = []
+
+    def transmission_started(self, transmission_type: TransmissionTypes):
+        self.release.wait(timeout=5)
+        self.started.append(transmission_type)
+
+    def voice_transmission_ended(
+        self, voice_header: FullLinkControl, blocks: List[BitsInterface]
+    ):
+        self.blocks.append(blocks)
+        raise ValueError("observer failure must not stop the worker")
+
+
+def test_queued_observer_drop_policy():
+    slow = SlowObserver()
+    queued = QueuedObserver(observer=slow, queue_size=2, policy="drop")
+    source = WithObservers(observers=[queued])
+
+    # the worker is blocked on first event, 2 more fit the queue, the rest is dropped
+    for _ in range(10):
+        source.transmission_started(TransmissionTypes.VoiceTransmission)
+    assert queued.events_dropped >= 7
+
+    slow.release.set()
+    queued.close()
+    stats = queued.get_statistics()
+    assert stats["events_delivered"] == stats["events_queued"] == len(slow.started)
+    assert stats["events_queued"] + stats["events_dropped"] == 10
+    assert stats["max_queue_depth"] <= 2
+    assert stats["queue_depth"] == 0
+    assert stats["max_latency"] >= stats["avg_latency"] > 0
+
+
+def test_queued_observer_snapshot():
+    slow = SlowObserver()
+    slow.release.set()
+    queued = QueuedObserver(observer=slow)
+    blocks: List[BitsInterface] = []
+    for _ in range(3):
+        queued.voice_transmission_ended(voice_header=None, blocks=blocks)
+        # transmission reuses its list
+        blocks.append(None)
+    queued.close()
+    assert slow.blocks == [(), (None,), (None, None)]
+    assert queued.events_delivered == 3
+
+    with pytest.raises(ValueError):
+        QueuedObserver(observer=slow, policy="unknown")
+    with pytest.raises(ValueError):
+        # noinspection PyTypeChecker
+        QueuedObserver(observer=object())
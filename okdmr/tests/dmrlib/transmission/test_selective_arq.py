@@ -0,0 +1,152 @@
+from typing import List
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.burst_types import BurstTypes
+from okdmr.dmrlib.etsi.layer2.elements.data_packet_formats import DataPacketFormats
+from okdmr.dmrlib.etsi.layer2.elements.full_message_flag import FullMessageFlag
+from okdmr.dmrlib.etsi.layer2.elements.response_types import ResponseTypes
+from okdmr.dmrlib.etsi.layer2.elements.resynchronize_flag import ResynchronizeFlag
+from okdmr.dmrlib.etsi.layer2.elements.sap_identifier import SAPIdentifier
+from okdmr.dmrlib.etsi.layer2.pdu.data_header import DataHeader
+from okdmr.dmrlib.etsi.layer2.pdu.rate12_data import Rate12Data, Rate12DataTypes
+from okdmr.dmrlib.transmission.selective_arq import (
+    SelectiveARQReceiver,
+    SelectiveARQSender,
+)
+
+USERDATA: bytes = bytes(range(50))
+
+
+def confirmed_header() -> DataHeader:
+    return DataHeader(
+        dpf=DataPacketFormats.DataPacketConfirmed,
+        is_response_requested=True,
+        pad_octet_count=6,
+        sap_identifier=SAPIdentifier.UDP_IP_compression,
+        llid_destination=2308092,
+        llid_source=2308094,
+        full_message_flag=FullMessageFlag.FirstTryToCompletePacket,
+        blocks_to_follow=6,
+        resynchronize_flag=ResynchronizeFlag.DoNotSync,
+        send_sequence_number=3,
+    )
+
+
+def air(
+    bursts: List[Burst], receiver: SelectiveARQReceiver, lost: List[int] = ()
+) -> None:
+    """
+    Parse bursts as received from the air, data blocks are typed by position in the try, blocks at indexes in
+    lost are corrupted
+    """
+    header: DataHeader = Burst.from_bytes(
+        bursts[0].as_bytes(), BurstTypes.DataAndControl
+    ).data
+    receiver.process_header(header)
+    for i, burst in enumerate(bursts[1:]):
+        bits = Burst.from_bytes(burst.as_bytes(), BurstTypes.DataAndControl).data
+        bits = bits.as_bits()
+        if i in lost:
+            bits[40] ^= 1
+        receiver.process_block(
+            Rate12Data.from_bits_typed(
+                bits,
+                Rate12DataTypes.resolve(
+                    confirmed=True, last=i == header.blocks_to_follow - 1
+                ),
+            )
+        )
+
+
+def response(bursts: List[Burst]) -> (DataHeader, List[Rate12Data]):
+    header: DataHeader = Burst.from_bytes(
+        bursts[0].as_bytes(), BurstTypes.DataAndControl
+    ).data
+    blocks: List[Rate12Data] = [
+        Burst.from_bytes(burst.as_bytes(), BurstTypes.DataAndControl).data
+        for burst in bursts[1:]
+    ]
+    return header, blocks
+
+
+def test_response_types():
+    assert ResponseTypes(0b10000) == ResponseTypes.SACK
+    assert ResponseTypes.NACK_PacketCRCError.response_class == 1
+    assert ResponseTypes.NACK_PacketCRCError.response_type == 1
+
+
+def test_selective_retransmission():
+    sender = SelectiveARQSender(
+        data_header=confirmed_header(), userdata=USERDATA, packet_type=Rate12Data
+    )
+    receiver = SelectiveARQReceiver()
+
+    # first try, blocks 1 and 5 (last, carrying CRC32) are corrupted
+    air(sender.initial_bursts(), receiver, lost=[1, 5])
+    assert receiver.missing_blocks() == [1, 5]
+    assert not receiver.is_complete()
+    assert receiver.blocks_rejected == 2
+    assert receiver.get_response_type() == ResponseTypes.SACK
+
+    rsp_header, bitmap = response(receiver.generate_response())
+    assert rsp_header.data_packet_format == DataPacketFormats.ResponsePacket
+    assert rsp_header.llid_destination == 2308094
+    assert rsp_header.response_status == 3
+    assert rsp_header.blocks_to_follow == len(bitmap) == 1
+
+    # only the two missing blocks are sent again, block 1 is the last one in the retry
+    retry: List[Burst] = sender.process_response(rsp_header, bitmap)
+    assert len(retry) == 3
+    assert retry[0].data.full_message_flag == FullMessageFlag.SubsequentTry
+    assert retry[0].data.blocks_to_follow == 2
+    air(retry, receiver, lost=[0])
+    assert receiver.retransmissions == 1
+    assert receiver.missing_blocks() == [1]
+
+    air(sender.process_response(*response(receiver.generate_response())), receiver)
+    assert receiver.missing_blocks() == []
+    assert receiver.is_complete()
+    assert receiver.payload() == USERDATA
+    assert sender.blocks_sent == 6 + 2 + 1
+
+    rsp_header, bitmap = response(receiver.generate_response())
+    assert len(bitmap) == 0
+    assert ResponseTypes.ACK.response_type == rsp_header.response_type
+    assert sender.process_response(rsp_header, bitmap) == []
+    assert sender.acknowledged
+
+
+def test_nack_and_retries():
+    sender = SelectiveARQSender(
+        data_header=confirmed_header(),
+        userdata=USERDATA,
+        packet_type=Rate12Data,
+        max_retries=1,
+    )
+    receiver = SelectiveARQReceiver()
+    air(sender.initial_bursts(), receiver)
+    assert receiver.is_complete()
+
+    # response for other transfer is ignored
+    other = receiver.generate_response()[0].data
+    other.response_status = 5
+    assert sender.process_response(other) == []
+
+    nack = DataHeader(
+        dpf=DataPacketFormats.ResponsePacket,
+        sap_identifier=SAPIdentifier.UDP_IP_compression,
+        llid_destination=2308094,
+        llid_source=2308092,
+        full_message_flag=FullMessageFlag.FirstTryToCompletePacket,
+        response_class=ResponseTypes.NACK_MemoryFull.response_class,
+        response_type=ResponseTypes.NACK_MemoryFull.response_type,
+        response_status=3,
+    )
+    assert len(sender.process_response(nack)) == 7
+    assert sender.process_response(nack) == []
+    assert sender.failed and not sender.acknowledged
+
+    # first try of new transfer resets the receiver
+    air(sender.initial_bursts()[:3], receiver)
+    assert receiver.retransmissions == 0
+    assert receiver.missing_blocks() == [2, 3, 4, 5]
@@ -0,0 +1,111 @@
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.transmission.stream_demultiplexer import (
+    StreamDemultiplexer,
+    StreamKey,
+)
+from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
+from okdmr.tests.dmrlib.tests_utils import (
+    VoiceEndedCounter,
+    voice_burst,
+    voice_header_burst,
+    terminator_burst,
+)
+
+
+def stream_burst(burst: Burst, peer: str, stream_no: bytes) -> Burst:
+    return burst.set_peer(peer).set_stream_no(stream_no)
+
+
+def test_concurrent_streams_to_same_target():
+    counter = VoiceEndedCounter()
+    demux = StreamDemultiplexer(observers=[counter])
+
+    a = stream_burst(voice_header_burst(9, 1000), "10.0.0.1:50000", b"\x00\x00\x00\x01")
+    b = stream_burst(voice_header_burst(9, 1000), "10.0.0.2:50000", b"\x00\x00\x00\x02")
+    demux.process_burst(a)
+    demux.process_burst(b)
+
+    assert len(demux.streams) == 2
+    assert len(demux.streams_to_target(9)) == 2
+    assert len(demux.streams_from_source(2308092)) == 2
+    key_a: StreamKey = StreamKey.from_burst(a)
+    assert key_a == StreamKey(peer="10.0.0.1:50000", stream_no=1, timeslot=2)
+    assert (
+        demux.get_stream(key_a).transmission.type == TransmissionTypes.VoiceTransmission
+    )
+
+    # terminator of one stream does not affect the other one
+    demux.process_burst(
+        stream_burst(
+            terminator_burst(voice_header_burst(9, 1001)),
+            "10.0.0.1:50000",
+            b"\x00\x00\x00\x01",
+        )
+    )
+    assert len(counter.ended) == 1
+    assert demux.get_stream(key_a) is None
+    assert [s.key.peer for s in demux.streams_to_target(9)] == ["10.0.0.2:50000"]
+
+    # the other stream ends after hang time
+    assert demux.expire_streams(now=1002) == 0
+    assert demux.expire_streams(now=1003) == 1
+    assert len(counter.ended) == 2
+    assert demux.by_target == {} and demux.by_source == {}
+    assert demux.get_statistics() == {
+        "streams_live": 0,
+        "streams_created": 2,
+        "streams_ended": 2,
+        "streams_timed_out": 1,
+    }
+
+
+def test_end_all_streams():
+    counter = VoiceEndedCounter()
+    demux = StreamDemultiplexer(observers=[counter])
+    for target in (1, 2, 3):
+        demux.process_burst(
+            stream_burst(
+                voice_header_burst(target, 1000),
+                "10.0.0.1:50000",
+                target.to_bytes(4, byteorder="big"),
+            )
+        )
+    assert len(demux.streams) == 3
+    # packet clock starting at 0.0 is not replaced by wall clock
+    assert demux.expire_streams(now=0.0) == 0
+    demux.end_all_streams()
+    assert len(demux.streams) == 0
+    assert len(counter.ended) == 3
+
+
+def test_repeated_terminator_and_sequence_numbers():
+    counter = VoiceEndedCounter()
+    demux = StreamDemultiplexer(observers=[counter])
+    peer: str = "10.0.0.1:50000"
+    stream_no: bytes = b"\x00\x00\x00\x01"
+
+    demux.process_burst(stream_burst(voice_header_burst(9, 1000), peer, stream_no))
+    for sequence_no in (1, 2, 5):
+        burst: Burst = stream_burst(
+            voice_burst(sequence_no).set_timestamp(1000), peer, stream_no
+        )
+        # network sequence number is not replaced by stream counter
+        assert demux.process_burst(burst).sequence_no == sequence_no
+
+    terminator: Burst = stream_burst(
+        terminator_burst(voice_header_burst(9, 1001)), peer, stream_no
+    )
+    demux.process_burst(terminator)
+    assert len(counter.ended) == 1
+    assert not demux.streams
+
+    # terminators are often sent repeatedly, those must not open new stream, which would later time out
+    assert demux.process_burst(terminator) is terminator
+    assert not demux.streams
+    assert demux.expire_streams(now=1010) == 0
+    assert demux.get_statistics() == {
+        "streams_live": 0,
+        "streams_created": 1,
+        "streams_ended": 1,
+        "streams_timed_out": 0,
+    }
@@ -0,0 +1,211 @@
+from typing import List
+
+import pytest
+from bitarray import bitarray
+
+from okdmr.dmrlib.etsi.fec.vbptc_128_72 import VBPTC12873
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.burst_types import BurstTypes
+from okdmr.dmrlib.etsi.layer2.elements.feature_set_ids import FeatureSetIDs
+from okdmr.dmrlib.etsi.layer2.elements.flcos import FLCOs
+from okdmr.dmrlib.etsi.layer2.elements.lcss import LCSS
+from okdmr.dmrlib.etsi.layer2.pdu.embedded_signalling import EmbeddedSignalling
+from okdmr.dmrlib.etsi.layer2.pdu.full_link_control import FullLinkControl
+from okdmr.dmrlib.etsi.layer3.elements.talker_alias_data_format import (
+    TalkerAliasDataFormat,
+)
+from okdmr.dmrlib.etsi.layer3.elements.service_options import ServiceOptions
+from okdmr.dmrlib.transmission.stream_demultiplexer import StreamKey
+from okdmr.dmrlib.transmission.talker_alias import (
+    TalkerAliasAssembler,
+    TalkerAliasCache,
+    TalkerAliasCollector,
+    decode_talker_alias,
+    encode_talker_alias,
+    talker_alias_blocks_needed,
+)
+from okdmr.dmrlib.utils.bits_bytes import bytes_to_bits
+from okdmr.tests.dmrlib.tests_utils import voice_burst
+
+
+def voice_lc(source: int) -> FullLinkControl:
+    return FullLinkControl(
+        protect_flag=0,
+        flco=FLCOs.GroupVoiceChannelUser,
+        fid=FeatureSetIDs.StandardizedFID,
+        crc=bitarray([0] * 24),
+        source_address=source,
+        group_address=9,
+        service_options=ServiceOptions(),
+    )
+
+
+def embedded_bursts(lc: FullLinkControl) -> List[Burst]:
+    fragments: bitarray = VBPTC12873.encode(lc.as_bits()[:72])
+    lcss: List[LCSS] = [
+        LCSS.FirstFragmentLC,
+        LCSS.ContinuationFragmentLCorCSBK,
+        LCSS.ContinuationFragmentLCorCSBK,
+        LCSS.LastFragmentLCorCSBK,
+    ]
+    bursts: List[Burst] = []
+    for i, start_stop in enumerate(lcss):
+        bits: bitarray = voice_burst(i + 1).as_bits()
+        emb: bitarray = EmbeddedSignalling(
+            colour_code=1,
+            preemption_and_power_control_indicator=0,
+            link_control_start_stop=start_stop,
+        ).as_bits()
+        bits[108:156] = emb[:8] + fragments[i * 32 : (i + 1) * 32] + emb[8:]
+        bursts.append(
+            Burst.from_bits(bits, BurstTypes.Vocoder).set_peer("10.0.0.1:50000")
+        )
+    return bursts
+
+
+def test_decode_real_talker_alias():
+    lcs: List[FullLinkControl] = [
+        FullLinkControl.from_bits(bytes_to_bits(bytes.fromhex(hexmsg))[:-3])
+        for hexmsg in (
+            "0400da00520034005748",
+            "050000420050002000e0",
+            "060044006d0069007408",
+            "070000720069006900a8",
+        )
+    ]
+    assert talker_alias_blocks_needed(lcs[0]) == 3
+    assert (
+        decode_talker_alias(lcs[0], [lc.talker_alias_data for lc in lcs[1:]])
+        == "R4WBP Dmitrii"
+    )
+
+
+@pytest.mark.parametrize(
+    "data_format,alias,blocks",
+    [
+        (TalkerAliasDataFormat.SevenBitCharacters, "OK1ABC", 0),
+        (TalkerAliasDataFormat.SevenBitCharacters, "OK1ABC Novak", 1),
+        (TalkerAliasDataFormat.ISOEightBitCharacters, "OK1ABC Jan Novák", 2),
+        (TalkerAliasDataFormat.UnicodeUTF8, "OK1ABC Jan Novák", 2),
+        (TalkerAliasDataFormat.UnicodeUTF16LE, "OK1ABC Novák", 3),
+    ],
+)
+def test_encode_decode(data_format: TalkerAliasDataFormat, alias: str, blocks: int):
+    lcs: List[FullLinkControl] = encode_talker_alias(alias, data_format)
+    assert len(lcs) == blocks + 1
+    # LCs survive serialization
+    lcs = [FullLinkControl.from_bits(lc.as_bits()) for lc in lcs]
+    assert lcs[0].talker_alias_data_format == data_format
+    assert talker_alias_blocks_needed(lcs[0]) == blocks
+    assert (
+        decode_talker_alias(lcs[0], [lc.talker_alias_data for lc in lcs[1:]]) == alias
+    )
+
+
+def test_encode_too_long():
+    with pytest.raises(ValueError):
+        encode_talker_alias("OK1ABC Jan Novak", TalkerAliasDataFormat.UnicodeUTF16LE)
+
+
+def test_assembler_out_of_order():
+    assembler = TalkerAliasAssembler()
+    lcs: List[FullLinkControl] = encode_talker_alias("OK1ABC Jan Novak")
+    assert len(lcs) == 3
+
+    assert assembler.process_lc(voice_lc(2300001)) is None
+    assert assembler.process_lc(lcs[2]) is None
+    assert assembler.process_lc(lcs[0]) is None
+    assert assembler.process_lc(lcs[1]) == "OK1ABC Jan Novak"
+    # repeated blocks do not report the alias again
+    assert assembler.process_lc(lcs[1]) is None
+
+    # talker changed, previous alias is forgotten
+    assembler.process_lc(voice_lc(2300002))
+    assert assembler.alias is None
+    assert not assembler.blocks
+
+
+def test_assembler_requires_source():
+    assembler = TalkerAliasAssembler()
+    lcs: List[FullLinkControl] = encode_talker_alias("OK1ABC")
+    assert assembler.process_lc(lcs[0]) is None
+    # alias is completed once the source becomes known from voice LC
+    assembler.process_lc(voice_lc(2300001))
+    assert assembler.process_lc(lcs[0]) == "OK1ABC"
+
+
+def test_cache_lru_and_ttl():
+    cache = TalkerAliasCache(max_size=2, ttl=10)
+    cache.put(1, "ONE", now=100)
+    cache.put(2, "TWO", now=100)
+    # 1 becomes most recently used, so 2 is evicted
+    assert cache.get(1, now=101) == "ONE"
+    cache.put(3, "THREE", now=101)
+    assert len(cache) == 2
+    assert cache.get(2, now=101) is None
+    assert cache.get(3, now=102) == "THREE"
+    # expired
+    assert cache.get(1, now=111) is None
+    assert len(cache) == 1
+
+    with pytest.raises(AssertionError):
+        TalkerAliasCache(max_size=0)
+
+
+def test_collector_cross_call_cache():
+    collector = TalkerAliasCollector()
+    first = StreamKey(peer="10.0.0.1:50000", stream_no=1, timeslot=1)
+    collector.process_lc(first, voice_lc(2300001), now=100)
+    for lc in encode_talker_alias("OK1ABC Jan Novak"):
+        collector.process_lc(first, lc, now=100)
+    assert collector.aliases_decoded == 1
+    collector.end_stream(first)
+    assert not collector.assemblers
+
+    # alias is known immediately in the next call of the same source
+    assert collector.lookup(2300001, now=200) == "OK1ABC Jan Novak"
+    assert collector.lookup(2300002, now=200) is None
+
+
+def test_collector_embedded_lc():
+    collector = TalkerAliasCollector()
+    bursts: List[Burst] = embedded_bursts(voice_lc(2300001)) + embedded_bursts(
+        encode_talker_alias("OK1ABC")[0]
+    )
+    for burst in bursts:
+        collector.process_burst(burst)
+    assert collector.aliases_decoded == 1
+    assert collector.lookup(2300001) == "OK1ABC"
+
+
+def test_collector_embedded_lc_incomplete():
+    collector = TalkerAliasCollector()
+    bursts: List[Burst] = embedded_bursts(voice_lc(2300001))
+    # first fragment missing, superframe is ignored
+    for burst in bursts[1:]:
+        collector.process_burst(burst)
+    assert not collector.embedded
+    key: StreamKey = StreamKey.from_burst(bursts[0])
+    assert key not in collector.assemblers or not (
+        collector.assemblers[key].source_radio_id
+    )
+
+
+def test_collector_streams_without_terminator_expire():
+    collector = TalkerAliasCollector(cache=TalkerAliasCache(max_size=2, ttl=10))
+    keys: List[StreamKey] = [
+        StreamKey(peer="10.0.0.1:50000", stream_no=i, timeslot=1) for i in range(3)
+    ]
+    collector.process_lc(keys[0], voice_lc(2300001), now=100)
+    collector.process_lc(keys[1], voice_lc(2300002), now=105)
+    assert collector.expire_streams(now=110) == 0
+    # first stream is inactive for longer than cache ttl
+    assert collector.expire_streams(now=111) == 1
+    assert list(collector.assemblers) == [keys[1]]
+
+    # above max_size, least recently active stream is forgotten
+    collector.process_lc(keys[2], voice_lc(2300003), now=112)
+    collector.process_lc(keys[0], voice_lc(2300001), now=112)
+    assert collector.expire_streams(now=112) == 1
+    assert sorted(k.stream_no for k in collector.assemblers) == [0, 2]
+    assert list(collector.streams) == [keys[2], keys[0]]
@@ -39,34 +39,10 @@ from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
 from okdmr.dmrlib.utils.bits_bytes import bits_to_bytes, bytes_to_bits
 from okdmr.dmrlib.utils.bits_interface import BitsInterface
 from scapy.config import conf
+from okdmr.tests.dmrlib.tests_utils import SMS_BURST
 
 conf.use_pcap = True
 
-SMS_BURST: List[str] = [
-    "55e105fbbde427040a68305294fdff57d75df5dcae42369824097da3bedb329255",
-    "5585057bbcfc273c0e0938f094fdff57d75df5dcae8a163824c97d63b65b281251",
-    "55c505f9bde025240c38b4b094fdff57d75df5dcaefa360864297ec3b39b211267",
-    "45a10577bcf026340c69bcf294fdff57d75df5dcae2e579865b978c1b39f299a42",
-    "45e105f5bdec242c0e5830b294fdff57d75df5dcae5e77a825597b61b65f209a74",
-    "45850575bcf424140a39381094fdff57d75df5dcae96570825997ba1bedf3a1a70",
-    "45c505f7bde8260c0808b45094fdff57d75df5dcaee6773865797801bb1f331a46",
-    "45c4053dbcfc263c0839b0d294fdff57d75df5dcaeb216a8e5d97881b75b331a65",
-    "458405bfbde024240a083c9294fdff57d75df5dcaec23698a5397b21b29b3a1a53",
-    "45e0053fbcf8241c0e69343094fdff57d75df5dcae0a1638a5f97be1ba1b209a57",
-    "45a005bdbde426040c58b87094fdff57d75df5dcae7a3608e5197841bfdb299a61",
-    "45a7053fbd6c26240e19b4d294fdff57d75df5dcaeb25690e7987aa1bb1f381257",
-    "45e705bdbc70243c0c28389294fdff57d75df5dcaec276a0a7787901bedf311261",
-    "4583053dbd6824040849303094fdff57d75df5dcae0a5600a7b879c1b65f2b9265",
-    "45c305bfbc74261c0a78bc7094fdff57d75df5dcae7a7630e7587a61b39f229253",
-    "45c20575bd60262c0a49b8f294fdff57d75df5dcae2e17a067f87ae1bfdb229270",
-    # header
-    "7abc3520240678e3a3436a8b55bdff57d75df5d55ed179b2304122624d0589a7bc",
-    # rate 1/2 unconfirmed data
-    "430d22106233407c00b0219a55ddff57d75df5d6f1492a46d43d20c20b8291214b",
-    # rate 1/2 unconfirmed data last fragment
-    "008a00da01b401400330180015ddff57d75df5d6f104025802700ae0250010001e",
-]
-
 
 def test_single_csbk_preamble():
     orig: bytes = bytes.fromhex(SMS_BURST[0])
@@ -392,3 +368,40 @@ class TestTransmissionObserverInterface(TransmissionObserverInterface):
         assert caplog.records[0].levelname == "ERROR"
         assert caplog.records[0].exc_info[0] == ModuleNotFoundError
         caplog.clear()
+
+
+class PayloadObserver(TransmissionObserverInterface):
+    def __init__(self):
+        self.blocks_data: bytes = b""
+        self.payload: bytes = b""
+
+    def data_transmission_ended(
+        self, transmission_header: DataHeader, blocks: List[BitsInterface]
+    ):
+        self.blocks_data = b"".join(
+            block.data for block in blocks if isinstance(block, Rate12Data)
+        )
+
+    def data_transmission_payload(
+        self, transmission_header: DataHeader, payload: memoryview
+    ):
+        assert isinstance(payload, memoryview)
+        self.payload = bytes(payload)
+
+
+def test_data_transmission_payload():
+    observer = PayloadObserver()
+    watcher: TransmissionWatcher = TransmissionWatcher(observers=[observer])
+    for orig_burst in SMS_BURST:
+        b = Burst.from_bytes(
+            data=bytes.fromhex(orig_burst), burst_type=BurstTypes.DataAndControl
+        )
+        b.target_radio_id = 111
+        watcher.process_burst(burst=b)
+
+    # header announced 2 blocks, rate 1/2 unconfirmed (12 bytes) and last block (8 bytes)
+    assert len(observer.payload) == 20
+    assert observer.payload == observer.blocks_data
+    assert UDPIPv4CompressedHeader.from_bytes(observer.payload).as_bytes() == (
+        observer.payload
+    )
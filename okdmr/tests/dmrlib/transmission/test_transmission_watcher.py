@@ -0,0 +1,122 @@
+from time import time
+
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.etsi.layer2.elements.burst_types import BurstTypes
+from okdmr.dmrlib.transmission.transmission_types import TransmissionTypes
+from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
+from okdmr.tests.dmrlib.tests_utils import (
+    SMS_BURST,
+    VoiceEndedCounter,
+    voice_header_burst,
+)
+
+
+def test_idle_timeout_eviction():
+    counter = VoiceEndedCounter()
+    watcher = TransmissionWatcher(observers=[counter], idle_timeout=10)
+    watcher.process_burst(voice_header_burst(111))
+    watcher.process_burst(voice_header_burst(222))
+    terminal = watcher.terminals[111]
+    assert (
+        terminal.timeslots[2].transmission.type == TransmissionTypes.VoiceTransmission
+    )
+
+    # not yet idle
+    assert watcher.evict_idle_terminals(now=time() + 5) == 0
+    # terminal 222 was active since it was scheduled
+    watcher.terminals[222].timeslots[2].last_packet_received = time() + 30
+    assert watcher.evict_idle_terminals(now=time() + 20) == 1
+    assert list(watcher.terminals.keys()) == [222]
+    # open voice call was ended and observers notified
+    assert len(counter.ended) == 1
+    assert terminal.timeslots[2].transmission.type == TransmissionTypes.Idle
+
+    assert watcher.evict_idle_terminals(now=time() + 50) == 1
+    assert watcher.get_statistics() == {
+        "terminals_live": 0,
+        "terminals_created": 2,
+        "terminals_evicted": 2,
+        "transmissions_timed_out": 0,
+    }
+
+
+def test_max_terminals_eviction():
+    watcher = TransmissionWatcher(max_terminals=2)
+    watcher.process_burst(voice_header_burst(1))
+    watcher.process_burst(voice_header_burst(2))
+    # terminal 1 becomes the most recently active
+    watcher.terminals[1].timeslots[1].last_packet_received = time() + 10
+    watcher.process_burst(voice_header_burst(3))
+    assert sorted(watcher.terminals.keys()) == [1, 3]
+    assert watcher.terminals_evicted == 1
+
+    # without limits, nothing is evicted or tracked
+    unlimited = TransmissionWatcher()
+    for target in range(1, 10):
+        unlimited.process_burst(voice_header_burst(target))
+    assert len(unlimited.terminals) == 9
+    assert len(unlimited.deadlines) == 0
+    assert unlimited.evict_idle_terminals() == 0
+
+
+def test_voice_hang_time():
+    counter = VoiceEndedCounter()
+    watcher = TransmissionWatcher(observers=[counter], voice_hang_time=1)
+    # timestamps far in the past, as with pcap replay, wall clock must not matter
+    watcher.process_burst(voice_header_burst(111, timestamp=1000))
+    watcher.process_burst(voice_header_burst(222, timestamp=1000.5))
+    # call to 111 is kept alive by bursts within hang time
+    watcher.process_burst(voice_header_burst(111, timestamp=1000.9))
+    watcher.process_burst(voice_header_burst(333, timestamp=1001.8))
+    assert len(counter.ended) == 1
+    assert watcher.terminals[111].timeslots[2].transmission.type == (
+        TransmissionTypes.VoiceTransmission
+    )
+    assert watcher.terminals[222].timeslots[2].transmission.type == (
+        TransmissionTypes.Idle
+    )
+
+    assert watcher.expire_transmissions(now=1010) == 2
+    assert len(counter.ended) == 3
+    assert watcher.get_statistics()["transmissions_timed_out"] == 3
+    assert len(watcher.transmission_deadlines) == 0
+
+
+def test_expire_without_traffic():
+    counter = VoiceEndedCounter()
+    watcher = TransmissionWatcher(
+        observers=[counter], voice_hang_time=1, idle_timeout=10
+    )
+    watcher.process_burst(voice_header_burst(111, timestamp=time()))
+    # capture went silent, periodic tick ends the call and evicts the terminal
+    assert watcher.expire() == 0
+    assert watcher.expire(now=time() + 2) == 1
+    assert len(counter.ended) == 1
+    assert watcher.expire(now=time() + 20) == 1
+    assert not watcher.terminals
+
+    # timestamp 0.0 is valid clock value, not a missing one
+    watcher.ensure_terminal(222, now=0.0)
+    assert watcher.deadlines.peek() == (10.0, 222)
+    assert watcher.evict_idle_terminals(now=0.0) == 0
+
+
+def test_data_timeout():
+    counter = VoiceEndedCounter()
+    watcher = TransmissionWatcher(observers=[counter], data_timeout=5)
+    # csbk preambles and data header, but data blocks were lost
+    for idx, burst_hex in enumerate(SMS_BURST[:17]):
+        burst = Burst.from_bytes(
+            data=bytes.fromhex(burst_hex), burst_type=BurstTypes.DataAndControl
+        ).set_timestamp(100 + idx * 0.06)
+        burst.target_radio_id = 111
+        watcher.process_burst(burst)
+
+    transmission = watcher.terminals[111].timeslots[1].transmission
+    assert transmission.type == TransmissionTypes.DataTransmission
+    watcher.process_burst(voice_header_burst(222, timestamp=110))
+    # incomplete data transmission is discarded, not delivered to observers
+    assert transmission.type == TransmissionTypes.Idle
+    assert len(counter.data_ended) == 0
+    assert watcher.transmissions_timed_out == 1
@@ -0,0 +1,107 @@
+from typing import List
+
+import numpy
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.tools.pipeline import process_bursts
+from okdmr.dmrlib.transmission.stream_demultiplexer import StreamDemultiplexer
+from okdmr.dmrlib.transmission.transmission_watcher import TransmissionWatcher
+from okdmr.dmrlib.transmission.voice_assembler import (
+    VoiceFrameAssembler,
+    VoiceFrameBatch,
+    extract_ambe_frames,
+)
+from okdmr.tests.dmrlib.tests_utils import (
+    voice_header_burst,
+    terminator_burst,
+    voice_burst,
+)
+
+
+def test_extract_ambe_frames():
+    burst: Burst = voice_burst(0)
+    frames = extract_ambe_frames(
+        numpy.frombuffer(burst.full_bits.tobytes(), dtype=numpy.uint8).reshape(1, -1)
+    )
+    assert frames.shape == (3, 9)
+    assert frames.tobytes() == burst.voice_bits.tobytes()
+
+
+def test_batches_and_missing_bursts():
+    batches: List[VoiceFrameBatch] = []
+    assembler = VoiceFrameAssembler(callback=batches.append, batch_size=6)
+
+    # bursts with sequence numbers 3 and 4 were lost, 255 -> 0 wraps around
+    for sequence_no in (254, 255, 0, 1, 2, 5, 6, 7):
+        assembler.process_burst(voice_burst(sequence_no))
+    assert len(batches) == 1
+    assert batches[0].frames.shape == (18, 9)
+    assert list(batches[0].missing) == [False] * 15 + [True] * 3
+    assert batches[0].target_radio_id == 111
+
+    terminator: Burst = terminator_burst(voice_header_burst(111))
+    terminator.set_peer("10.0.0.1:50000").set_network_sequence_no(8)
+    assembler.process_burst(terminator)
+    assert len(batches) == 2
+    assert batches[1].frames.shape == (12, 9)
+    assert list(batches[1].missing) == [True] * 3 + [False] * 9
+    assert not batches[1].frames[:3].any()
+    assert batches[1].frames[3:6].tobytes() == voice_burst(5).voice_bits.tobytes()
+    assert assembler.streams == {}
+    assert assembler.frames_emitted == 30
+    assert assembler.frames_missing == 6
+
+    # large gap is resynchronization, not loss
+    assembler.process_burst(voice_burst(10))
+    assembler.process_burst(voice_burst(100))
+    assembler.close()
+    assert batches[2].frames.shape == (6, 9)
+    assert not batches[2].missing.any()
+
+
+def test_stream_without_terminator_expires():
+    batches: List[VoiceFrameBatch] = []
+    assembler = VoiceFrameAssembler(
+        callback=batches.append, batch_size=6, voice_hang_time=1
+    )
+    for sequence_no in range(3):
+        assembler.process_burst(voice_burst(sequence_no).set_timestamp(1000.5))
+    assert not batches
+
+    # kept alive by bursts within hang time
+    assert assembler.expire_streams(now=1001) == 0
+    assembler.process_burst(voice_burst(3).set_timestamp(1001))
+    assert assembler.expire_streams(now=1001.9) == 0
+    # terminator lost, partial batch is emitted after hang time
+    assert assembler.expire_streams(now=1002.1) == 1
+    assert batches[0].frames.shape == (12, 9)
+    assert assembler.streams == {} and len(assembler.deadlines) == 0
+    assert assembler.streams_timed_out == 1
+
+
+def test_missing_bursts_after_renumbering_stages():
+    batches: List[VoiceFrameBatch] = []
+    assembler = VoiceFrameAssembler(callback=batches.append, batch_size=6)
+    demux = StreamDemultiplexer()
+    watcher = TransmissionWatcher()
+
+    # bursts 3 and 4 were lost, stages before the assembler must not hide the gap
+    bursts: List[Burst] = [
+        voice_burst(sequence_no).set_timestamp(1000)
+        for sequence_no in (1, 2, 5, 6, 7, 8)
+    ]
+    processed: List[Burst] = list(
+        process_bursts(
+            bursts,
+            demux.process_burst,
+            watcher.process_burst,
+            assembler.process_burst,
+        )
+    )
+    assert len(processed) == 6
+    assembler.close()
+    assert (
+        list(numpy.concatenate([b.missing for b in batches]))
+        == [False] * 6 + [True] * 6 + [False] * 12
+    )
+    assert assembler.frames_missing == 6
@@ -0,0 +1,38 @@
+from okdmr.dmrlib.utils.deadline_queue import DeadlineQueue
+
+
+def test_deadline_queue():
+    queue: DeadlineQueue[str] = DeadlineQueue()
+    assert queue.peek() is None
+    assert queue.pop() is None
+
+    queue.schedule("a", 10)
+    queue.schedule("b", 5)
+    queue.schedule("c", 7)
+    assert len(queue) == 3
+    assert "a" in queue
+    assert queue.peek() == (5, "b")
+
+    # reschedule and cancel leave stale heap entries, that must be skipped
+    queue.schedule("b", 20)
+    assert queue.cancel("c")
+    assert not queue.cancel("c")
+    assert queue.get("b") == 20
+    assert queue.get("c") is None
+    assert queue.peek() == (10, "a")
+
+    assert queue.pop_expired(now=9) == []
+    assert queue.pop_expired(now=20) == ["a", "b"]
+    assert len(queue) == 0
+    assert queue.peek() is None
+
+
+def test_deadline_queue_compact():
+    queue: DeadlineQueue[int] = DeadlineQueue()
+    for deadline in range(1000):
+        queue.schedule(1, deadline)
+        queue.schedule(2, deadline + 0.5)
+    # heap does not grow unbounded with rescheduled keys
+    assert len(queue.heap) < 100
+    assert queue.pop() == (999, 1)
+    assert queue.pop() == (999.5, 2)
@@ -0,0 +1,86 @@
+import asyncio
+import urllib.request
+
+import pytest
+
+from okdmr.dmrlib.utils.metrics import MetricsRegistry, MetricsServer
+
+
+def registry_with_samples() -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.counter("test_packets_total", "Packets", ("protocol",)).labels("IPSC").inc(
+        3
+    )
+    registry.gauge("test_terminals", "Terminals").set_function(lambda: 7)
+    histogram = registry.histogram("test_latency_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+    return registry
+
+
+def test_exposition():
+    exposition: str = registry_with_samples().exposition()
+    assert "# TYPE test_packets_total counter\n" in exposition
+    assert 'test_packets_total{protocol="IPSC"} 3\n' in exposition
+    assert "test_terminals 7\n" in exposition
+    # buckets are cumulative, value equal to upper bound belongs to the bucket
+    assert 'test_latency_seconds_bucket{le="0.1"} 2\n' in exposition
+    assert 'test_latency_seconds_bucket{le="1"} 3\n' in exposition
+    assert 'test_latency_seconds_bucket{le="+Inf"} 4\n' in exposition
+    assert "test_latency_seconds_sum 5.65\n" in exposition
+    assert "test_latency_seconds_count 4\n" in exposition
+
+
+def test_registry_validation():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Test", ("a", "b"))
+    # children are cached
+    assert counter.labels("x", 1) is counter.labels("x", "1")
+    with pytest.raises(ValueError):
+        counter.labels("x")
+    with pytest.raises(ValueError):
+        registry.counter("test_total", "Duplicate")
+
+    gauge = registry.gauge("test_gauge", "Gauge", ("name",))
+    gauge.labels('quote"d').set(1)
+    assert 'test_gauge{name="quote\\"d"} 1' in registry.exposition()
+    registry.unregister("test_gauge")
+    assert "test_gauge" not in registry.exposition()
+
+
+@pytest.mark.asyncio
+async def test_metrics_server():
+    server = await MetricsServer(
+        registry=registry_with_samples(), host="127.0.0.1", port=0
+    ).start()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.bound_port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response: bytes = await reader.read()
+        writer.close()
+        assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert b'test_packets_total{protocol="IPSC"} 3' in response
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.bound_port)
+        writer.write(b"GET /other HTTP/1.1\r\n\r\n")
+        assert (await reader.read()).startswith(b"HTTP/1.1 404")
+        writer.close()
+        assert server.scrapes == 1
+    finally:
+        await server.close()
+
+
+def test_metrics_server_thread():
+    server = MetricsServer(
+        registry=registry_with_samples(), host="127.0.0.1", port=0
+    ).start_in_thread()
+    try:
+        with urllib.request.urlopen(
+            f"http://127.0.0.1:{server.bound_port}/metrics", timeout=5
+        ) as response:
+            assert response.status == 200
+            assert "text/plain" in response.headers["Content-Type"]
+            assert "test_terminals 7" in response.read().decode()
+    finally:
+        server.stop_thread()
+    assert server.thread is None
@@ -0,0 +1,134 @@
+import io
+import json
+import os
+import tempfile
+
+import pytest
+from okdmr.kaitai.hytera.ip_site_connect_protocol import IpSiteConnectProtocol
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.packet import Raw
+from scapy.utils import wrpcap
+
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.tools.pcap_tool import PcapTool
+from okdmr.dmrlib.utils.background_writer import BackgroundWriter
+from okdmr.dmrlib.utils.output_sink import (
+    OutputSink,
+    NDJSONSink,
+    CSVSink,
+    TextSink,
+    NullSink,
+    PrintSink,
+    get_output_sink,
+    set_output_sink,
+)
+from okdmr.tests.dmrlib.tests_utils import IPSC_VOICE
+
+
+class NonClosingStringIO(io.StringIO):
+    def close(self):
+        pass
+
+
+def test_buffered_sinks():
+    burst: Burst = Burst.from_hytera_ipsc(
+        IpSiteConnectProtocol.from_bytes(bytes.fromhex(IPSC_VOICE))
+    )
+
+    stream = NonClosingStringIO()
+    sink = NDJSONSink(stream=stream)
+    for _ in range(3):
+        sink.write(burst, src="127.0.0.1:50001", protocol="IPSC")
+    sink.write("some string record")
+    sink.close()
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 4
+    record = json.loads(lines[0])
+    assert record["record"] == "Burst"
+    assert record["src"] == "127.0.0.1:50001"
+    assert record["source"] == 2308090
+    assert record["target"] == 111
+    assert json.loads(lines[3])["repr"] == "'some string record'"
+
+    stream = NonClosingStringIO()
+    sink = CSVSink(stream=stream)
+    sink.write(burst, protocol="IPSC")
+    sink.close()
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert lines[0] == ",".join(CSVSink.COLUMNS)
+
+    stream = NonClosingStringIO()
+    sink = TextSink(stream=stream)
+    sink.write(burst, src="a", dst="b", protocol="IPSC", timeslot=1, sequence_no=2)
+    sink.close()
+    assert stream.getvalue().startswith("a\t-> b\t IPSC TS:1 SEQ: 2 BURST[")
+
+    stream = NonClosingStringIO()
+    sink = TextSink(stream=stream)
+    sink.write(burst, hex_dump=True)
+    sink.close()
+    assert stream.getvalue().splitlines()[1] == burst.as_bytes().hex()
+
+    stream = NonClosingStringIO()
+    sink = NDJSONSink(stream=stream)
+    sink.write(burst, hex_dump=True)
+    sink.close()
+    assert "hex_dump" not in json.loads(stream.getvalue())
+
+
+def test_sink_selection(capsys):
+    assert isinstance(OutputSink.create("none"), NullSink)
+    assert isinstance(OutputSink.create("text"), PrintSink)
+    assert isinstance(OutputSink.create("text", "-"), PrintSink)
+    with pytest.raises(ValueError):
+        OutputSink.create("xml", "-")
+
+    previous = set_output_sink(NullSink())
+    assert isinstance(get_output_sink(), NullSink)
+    get_output_sink().write("nothing")
+    set_output_sink(None)
+    assert isinstance(get_output_sink(), PrintSink)
+    set_output_sink(previous)
+
+    PrintSink().write("printed")
+    assert capsys.readouterr().out == "'printed'\n"
+
+
+def test_background_writer_batches():
+    batches = []
+    writer = BackgroundWriter(handler=batches.append, batch_size=10, queue_size=100)
+    for i in range(100):
+        writer.submit(i)
+    writer.start()
+    writer.close()
+    assert [i for batch in batches for i in batch] == list(range(100))
+    assert max(len(batch) for batch in batches) <= 10
+    assert writer.items_written == 100
+
+
+def test_pcap_tool_output():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pcap_file: str = os.path.join(tmpdir, "ipsc.pcap")
+        out_file: str = os.path.join(tmpdir, "out.ndjson")
+        wrpcap(
+            pcap_file,
+            [
+                Ether()
+                / IP(src="10.0.0.1", dst="10.0.0.2")
+                / UDP(sport=50001, dport=50001)
+                / Raw(load=bytes.fromhex(IPSC_VOICE))
+            ]
+            * 5,
+        )
+        PcapTool.main(
+            ["-q", "--output", out_file, "--output-format", "ndjson", pcap_file]
+        )
+        with open(out_file) as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 5
+        assert records[0]["protocol"] == "IPSC"
+        assert records[0]["src"] == "10.0.0.1:50001"
+        # default sink restored
+        assert isinstance(get_output_sink(), PrintSink)
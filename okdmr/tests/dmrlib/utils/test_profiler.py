@@ -0,0 +1,113 @@
+import os
+import tempfile
+import threading
+
+from _pytest.capture import CaptureFixture
+
+from okdmr.dmrlib.etsi.fec.trellis import Trellis34
+from okdmr.dmrlib.etsi.layer2.burst import Burst
+from okdmr.dmrlib.tools import pcap_tool
+from okdmr.dmrlib.tools.pcap_tool import PcapTool
+from okdmr.dmrlib.utils.parsing import try_parse_packet
+from okdmr.dmrlib.utils.profiler import (
+    PROFILER,
+    Profiler,
+    ProfileSnapshot,
+    StageTimings,
+    profiled,
+)
+from okdmr.tests.dmrlib.tests_utils import write_capture
+
+
+@profiled("test.outer")
+def outer(depth: int) -> int:
+    return depth if not depth else outer(depth - 1) + 1
+
+
+def test_disabled_profiler_records_nothing():
+    PROFILER.disable().reset()
+    assert outer(3) == 3
+    PROFILER.count("test.counter")
+    snapshot: ProfileSnapshot = PROFILER.snapshot()
+    assert not snapshot.stages
+    assert not snapshot.counters
+
+
+def test_profiled_stages():
+    PROFILER.reset().enable()
+    try:
+        assert outer(3) == 3
+        assert try_parse_packet(b"\xff\xff\xff") is None
+        PROFILER.count("test.counter", 2)
+    finally:
+        PROFILER.disable()
+    snapshot: ProfileSnapshot = PROFILER.snapshot()
+    # nested calls of the same stage are timed only once
+    assert snapshot.stages["test.outer"].calls == 1
+    assert snapshot.stages["test.outer"].total_ns > 0
+    assert snapshot.stages["parse"].calls == 1
+    assert snapshot.counters == {"test.counter": 2, "parse.failed": 1}
+    assert not PROFILER.active
+
+    report: str = PROFILER.format_report()
+    assert "test.outer" in report
+    assert "1 packets in" in report
+    PROFILER.reset()
+
+
+def test_hooks_swapped_only_when_enabled():
+    PROFILER.disable()
+    # disabled profiler leaves the original functions on the call path
+    for func in (Burst.__init__, Trellis34.decode, pcap_tool.try_parse_packet, outer):
+        assert not hasattr(func, "__wrapped__")
+    PROFILER.enable()
+    try:
+        # including methods, staticmethods and module functions imported elsewhere
+        for func in (
+            Burst.__init__,
+            Trellis34.decode,
+            pcap_tool.try_parse_packet,
+            outer,
+        ):
+            assert hasattr(func, "__wrapped__")
+    finally:
+        PROFILER.disable()
+    assert not hasattr(pcap_tool.try_parse_packet, "__wrapped__")
+    assert not hasattr(Trellis34.decode, "__wrapped__")
+    PROFILER.reset()
+
+
+def test_active_stages_per_thread():
+    PROFILER.active.add("test.stage")
+    other: list = []
+    thread = threading.Thread(target=lambda: other.append(set(PROFILER.active)))
+    thread.start()
+    thread.join()
+    assert other == [set()]
+    PROFILER.active.discard("test.stage")
+
+
+def test_stage_timings_ring_buffer():
+    timings = StageTimings(max_samples=4)
+    for duration in range(1, 11):
+        timings.record(duration)
+    assert timings.calls == 10
+    assert timings.total_ns == sum(range(1, 11))
+    # only the last 4 samples are kept
+    assert sorted(timings.samples) == [7, 8, 9, 10]
+    assert timings.snapshot().p50_ns == 8.5
+
+    assert Profiler().snapshot().elapsed_ns == 0
+
+
+def test_pcap_tool_profile(capsys: CaptureFixture):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pcap_file: str = os.path.join(tmpdir, "capture.pcap")
+        write_capture(pcap_file)
+        PcapTool.main(["-q", "-o", "--output-format", "none", "--profile", pcap_file])
+    out: str = capsys.readouterr().out
+    for stage in ("parse", "burst", "transmission", "crc"):
+        assert f"| {stage} " in out
+    assert "packets/s" in out
+    assert not PROFILER.enabled
+    PROFILER.reset()